@@ -0,0 +1,131 @@
+"""
+Startup time of the proxy handlers, with lazy and eager loading of the backends.
+
+Synthetic backends are generated and registered in the HandlerRegistry, then a fresh interpreter
+measures the time needed to import the Factory and create the `ollama` handler, either importing
+only this handler (lazy, the current behaviour) or every registered backend (eager):
+
+    python -m benchmarks.handler_startup --backends 0 5 10 20 --repeat 5
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE = """
+import sys
+import time
+
+start = time.perf_counter()
+from src.handlers.Factory import Factory
+from src.handlers.HandlerRegistry import HandlerRegistry
+
+for index in range({backends}):
+    HandlerRegistry.register(f"synthetic{{index}}", f"synthetic_{{index}}:SyntheticHandler")
+if {eager}:
+    for name in HandlerRegistry.names():
+        HandlerRegistry.get_handler_class(name)
+Factory.create_handler("ollama")
+print(time.perf_counter() - start)
+"""
+
+
+def write_backend(directory: str, index: int, functions: int, models: int):
+    """
+    Writes a synthetic backend module, whose import cost is close to a handler using an SDK.
+    """
+    lines = [
+        "from pydantic import BaseModel",
+        "from src.handlers.BaseHandler import BaseHandler",
+        "",
+    ]
+    for function in range(functions):
+        lines += [
+            f"def function_{function}(value):",
+            f"    return [item * {function} for item in value if item % 2]",
+            "",
+        ]
+    for model in range(models):
+        lines += [
+            f"class Model{model}(BaseModel):",
+            "    name: str",
+            "    value: int = 0",
+            "    tags: list[str] = []",
+            "",
+        ]
+    lines += [
+        "class SyntheticHandler(BaseHandler):",
+        "    def __init__(self):",
+        f'        super().__init__("synthetic{index}")',
+        "",
+    ]
+    with open(os.path.join(directory, f"synthetic_{index}.py"), "w") as file:
+        file.write("\n".join(lines))
+
+
+def measure(directory: str, backends: int, eager: bool) -> float:
+    """
+    Measures the startup time in a fresh interpreter, in seconds.
+    """
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join([ROOT, directory])
+    environment["PYTHONDONTWRITEBYTECODE"] = "1"
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE.format(backends=backends, eager=eager)],
+        cwd=ROOT,
+        env=environment,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def parse_arguments(arguments: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--backends", type=int, nargs="+", default=[0, 5, 10, 20])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--functions", type=int, default=300, help="Per synthetic backend."
+    )
+    parser.add_argument("--models", type=int, default=20, help="Per synthetic backend.")
+    parser.add_argument("--output", help="Write the report to this file.")
+    return parser.parse_args(arguments)
+
+
+def main(arguments: list[str] = None) -> int:
+    options = parse_arguments(arguments)
+    report = {"python": sys.version.split()[0], "results": []}
+
+    with tempfile.TemporaryDirectory() as directory:
+        for index in range(max(options.backends)):
+            write_backend(directory, index, options.functions, options.models)
+
+        for backends in options.backends:
+            lazy = [measure(directory, backends, False) for _ in range(options.repeat)]
+            eager = [measure(directory, backends, True) for _ in range(options.repeat)]
+            report["results"].append(
+                {
+                    "backends": backends + 2,
+                    "lazyMs": round(statistics.median(lazy) * 1000, 1),
+                    "eagerMs": round(statistics.median(eager) * 1000, 1),
+                }
+            )
+
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+Load test of the proxy against the Ollama and Gemini stubs.
+
+The proxy is started with hypercorn, configured to use the stubs, then every scenario is
+run at the given concurrency. The report is printed (or written) as JSON, to compare builds:
+
+    python -m benchmarks.load_test --concurrency 8 --requests 200 --latency lognormal:-1.6,0.5
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import tempfile
+import argparse
+import platform
+import subprocess
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+from benchmarks.stubs import (
+    GeminiStubHandler,
+    OllamaStubHandler,
+    StubServer,
+    StubSettings,
+)
+
+DECRYPTION_KEY = "benchmark-key"
+
+GEMINI_PLUGIN = "@benchmark/gemini-plugin"
+
+FILES = [
+    {"path": f"main_{index}.tf", "content": 'resource "aws_instance" "web" {}\n' * 50}
+    for index in range(10)
+]
+
+SCENARIOS = {
+    "diagram_ollama": (
+        "/api/diagram",
+        {"pluginName": "@ditrit/kubernator-plugin", "description": "nginx pod"},
+    ),
+    "diagram_gemini": (
+        "/api/diagram",
+        {"pluginName": GEMINI_PLUGIN, "description": "nginx pod"},
+    ),
+    "message_ollama": (
+        "/api/message",
+        {
+            "pluginName": "@ditrit/kubernator-plugin",
+            "message": "What does it do?",
+            "files": FILES,
+        },
+    ),
+    "message_gemini": (
+        "/api/message",
+        {
+            "pluginName": GEMINI_PLUGIN,
+            "message": "What does it do?",
+            "files": FILES,
+        },
+    ),
+    "initialize": ("/api/configurations/initialize", None),
+}
+
+
+def encrypt(key: str, plain_text: str) -> bytes:
+    """
+    Encrypts the given text the same way as Leto-Modelizer-Admin (AES-GCM, IV + encrypted text + tag).
+    """
+    iv = get_random_bytes(12)
+    key_bytes = hashlib.sha256(key.encode("utf-8")).digest()[:16]
+    cipher = AES.new(key_bytes, AES.MODE_GCM, nonce=iv)
+    encrypted, tag = cipher.encrypt_and_digest(plain_text.encode("utf-8"))
+    return iv + encrypted + tag
+
+
+def build_configuration(ollama_url: str, gemini_url: str) -> dict:
+    """
+    Returns the configuration of the proxy, with dotted keys as sent by Leto-Modelizer-Admin.
+    """
+    system_instruction = json.dumps(
+        {"system_instruction": {"parts": {"text": "You generate diagrams."}}}
+    )
+    return {
+        "plugin.preferences.default": "ollama",
+        f"plugin.preferences.{GEMINI_PLUGIN}": "gemini",
+        "ollama.base_url": f"{ollama_url}/api",
+        "ollama.defaultModel": "mistral",
+        "ollama.modelFiles.generate.default": "FROM mistral",
+        "ollama.modelFiles.message.default": "FROM mistral",
+        "gemini.base_url": f"{gemini_url}/v1beta/models/gemini-stub:generateContent",
+        "gemini.key": "stub-key",
+        "gemini.system_instruction.generate.default": system_instruction,
+        "gemini.system_instruction.message.default": system_instruction,
+        "gemini.context_cache_min_tokens": "1024",
+    }
+
+
+def get_free_port() -> int:
+    """
+    Returns a free local port.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_process_tree(pid: int) -> list[int]:
+    """
+    Returns the given process and all its descendants (the hypercorn workers), read from /proc.
+    """
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as children_file:
+            children = [int(child) for child in children_file.read().split()]
+    except OSError:
+        children = []
+    for child in children:
+        pids.extend(get_process_tree(child))
+    return pids
+
+
+def get_process_usage(pid: int) -> dict:
+    """
+    Returns the CPU time and resident memory of a process and its descendants, read from /proc (Linux only).
+
+    Returns:
+        dict: The `cpuSeconds` and `rssBytes` of the processes, or None values if they are not available.
+    """
+    cpu_ticks = 0
+    rss_pages = 0
+    try:
+        for process_id in get_process_tree(pid):
+            with open(f"/proc/{process_id}/stat") as stat_file:
+                fields = stat_file.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{process_id}/statm") as statm_file:
+                rss_pages += int(statm_file.read().split()[1])
+            cpu_ticks += int(fields[11]) + int(fields[12])
+    except OSError:
+        return {"cpuSeconds": None, "rssBytes": None}
+
+    return {
+        "cpuSeconds": cpu_ticks / os.sysconf("SC_CLK_TCK"),
+        "rssBytes": rss_pages * os.sysconf("SC_PAGE_SIZE"),
+    }
+
+
+def percentile(values: list[float], ratio: float) -> float:
+    """
+    Returns the percentile of the given values (nearest rank).
+    """
+    ordered = sorted(values)
+    index = min(max(int(round(ratio * len(ordered) + 0.5)) - 1, 0), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_scenario(base_url: str, path: str, body, concurrency: int, count: int) -> dict:
+    """
+    Sends `count` requests to the proxy, `concurrency` at a time.
+
+    Returns:
+        dict: The throughput, latency percentiles and errors of the scenario.
+    """
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def send(_):
+        start = time.perf_counter()
+        try:
+            response = session.post(f"{base_url}{path}", json=body, timeout=300)
+            ok = response.status_code < 400
+        except requests.exceptions.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(send, range(count)))
+    duration = time.perf_counter() - start
+
+    latencies = [latency for latency, _ in results]
+    return {
+        "requests": count,
+        "errors": sum(1 for _, ok in results if not ok),
+        "durationSeconds": duration,
+        "throughput": count / duration,
+        "latencySeconds": {
+            "mean": statistics.fmean(latencies),
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies),
+        },
+    }
+
+
+def wait_until_up(base_url: str, process: subprocess.Popen, timeout: float = 30):
+    """
+    Waits for the proxy to answer on its health endpoint.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The proxy exited before being ready")
+        try:
+            requests.get(f"{base_url}/health", timeout=1)
+            return
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError("The proxy did not start in time")
+
+
+def wait_until_configured(base_url: str, timeout: float = 30, checks: int = 20):
+    """
+    Waits for the workers of the proxy to be ready, i.e to have read the configuration from the store.
+    As every request may reach any worker, the proxy must answer it is ready `checks` times in a row.
+    """
+    deadline = time.monotonic() + timeout
+    ready = 0
+    while ready < checks:
+        if time.monotonic() > deadline:
+            raise RuntimeError("The workers of the proxy were not configured in time")
+        if requests.get(f"{base_url}/ready", timeout=1).ok:
+            ready += 1
+        else:
+            ready = 0
+            time.sleep(0.1)
+
+
+def parse_arguments(arguments: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="Per scenario.")
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Comma separated list among: {', '.join(SCENARIOS)}.",
+    )
+    parser.add_argument(
+        "--latency",
+        default="constant:0.05",
+        help="Latency distribution of the stubs, e.g `lognormal:-1.6,0.5`.",
+    )
+    parser.add_argument(
+        "--token-rate", type=float, default=0, help="Tokens per second of the stubs."
+    )
+    parser.add_argument("--output-tokens", type=int, default=50)
+    parser.add_argument(
+        "--proxy-args",
+        default="",
+        help="Additional arguments given to hypercorn, e.g `--workers 2`.",
+    )
+    parser.add_argument("--output", help="File to write the report to.")
+    return parser.parse_args(arguments)
+
+
+def main(arguments: list[str] = None) -> int:
+    options = parse_arguments(arguments)
+    settings = StubSettings(options.latency, options.token_rate, options.output_tokens)
+    port = get_free_port()
+    base_url = f"http://127.0.0.1:{port}"
+
+    with StubServer(OllamaStubHandler, settings) as ollama, StubServer(
+        GeminiStubHandler, settings
+    ) as gemini, tempfile.TemporaryDirectory() as directory:
+        # The configuration is shared through the store, so that every worker gets it (e.g with `--workers 2`)
+        process = subprocess.Popen(
+            [sys.executable, "-m", "hypercorn", "src.main:app"]
+            + ["--bind", f"127.0.0.1:{port}"]
+            + options.proxy_args.split(),
+            env={
+                **os.environ,
+                "DECRYPTION_KEY": DECRYPTION_KEY,
+                "LOG_LEVEL": "WARNING",
+                "MAX_CONCURRENT_REQUESTS": str(options.concurrency),
+                "CONFIGURATION_STORE_PATH": os.path.join(
+                    directory, "configuration.bin"
+                ),
+                "CONFIGURATION_POLL_INTERVAL": "0.1",
+            },
+        )
+        try:
+            wait_until_up(base_url, process)
+            configuration = build_configuration(ollama.url, gemini.url)
+            requests.post(
+                f"{base_url}/api/configurations",
+                data=encrypt(DECRYPTION_KEY, json.dumps(configuration)),
+            ).raise_for_status()
+            wait_until_configured(base_url)
+
+            report = {
+                "python": platform.python_version(),
+                "settings": vars(options),
+                "scenarios": {},
+            }
+            for name in options.scenarios.split(","):
+                path, body = SCENARIOS[name]
+                usage_before = get_process_usage(process.pid)
+                result = run_scenario(
+                    base_url, path, body, options.concurrency, options.requests
+                )
+                usage_after = get_process_usage(process.pid)
+                if usage_before["cpuSeconds"] is not None:
+                    result["proxyCpuSeconds"] = (
+                        usage_after["cpuSeconds"] - usage_before["cpuSeconds"]
+                    )
+                    result["proxyRssBytes"] = usage_after["rssBytes"]
+                report["scenarios"][name] = result
+        finally:
+            process.terminate()
+            process.wait(10)
+
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w") as output_file:
+            output_file.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
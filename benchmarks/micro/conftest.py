@@ -0,0 +1,79 @@
+import json
+import pytest
+
+from benchmarks.load_test import encrypt
+
+DECRYPTION_KEY = "benchmark-key"
+
+PLUGINS = [f"@benchmark/plugin-{index}" for index in range(200)]
+
+MODEL_FILE = (
+    'FROM mistral\nSYSTEM """\n' + "You are an infrastructure expert. " * 120 + '"""'
+)
+
+
+@pytest.fixture(scope="session")
+def dotted_configuration() -> dict:
+    """
+    A large configuration, with dotted keys as sent by Leto-Modelizer-Admin:
+    200 plugins, each with its own model files and system instructions (~4KB each).
+    """
+    system_instruction = json.dumps(
+        {"system_instruction": {"parts": {"text": MODEL_FILE}}}
+    )
+    configuration = {
+        "plugin.preferences.default": "ollama",
+        "ollama.base_url": "http://localhost:11434/api",
+        "ollama.defaultModel": "mistral",
+        "gemini.base_url": "http://localhost/v1beta/models/gemini:generateContent",
+        "gemini.key": "key",
+    }
+    for plugin in ["default"] + PLUGINS:
+        configuration[f"plugin.preferences.{plugin}"] = "ollama"
+        for mode in ("generate", "message"):
+            configuration[f"ollama.modelFiles.{mode}.{plugin}"] = MODEL_FILE
+            configuration[f"gemini.system_instruction.{mode}.{plugin}"] = (
+                system_instruction
+            )
+    return configuration
+
+
+@pytest.fixture(scope="session")
+def encrypted_configuration(dotted_configuration) -> bytes:
+    """
+    The large configuration, encrypted as sent by Leto-Modelizer-Admin.
+    """
+    return encrypt(DECRYPTION_KEY, json.dumps(dotted_configuration))
+
+
+@pytest.fixture(scope="session")
+def files() -> list[dict]:
+    """
+    A 1MB set of files: 100 files of 10KB.
+    """
+    content = 'resource "aws_instance" "web" {\n  ami = "ami-123456"\n}\n' * 200
+    return [
+        {"path": f"infra/module_{index}/main.tf", "content": content[:10240]}
+        for index in range(100)
+    ]
+
+
+@pytest.fixture(scope="session")
+def model_output() -> str:
+    """
+    A 200KB model output: some prose, then the diagram in a fenced JSON block.
+    """
+    resources = [
+        {"kind": "Deployment", "metadata": {"name": f"app-{index}"}, "replicas": 3}
+        for index in range(2500)
+    ]
+    diagram = json.dumps({"resources": resources}, indent=2)
+    return f"Here is the diagram you asked for:\n```json\n{diagram}\n```\nEnjoy!"
+
+
+@pytest.fixture(scope="session")
+def context() -> str:
+    """
+    A 32k-token Ollama context, as sent back to the client.
+    """
+    return str(list(range(32768)))
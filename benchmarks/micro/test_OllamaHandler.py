@@ -0,0 +1,35 @@
+import json
+import pytest
+
+from src.handlers.Ollama.OllamaHandler import OllamaHandler, extract_diagram
+from src.models.Message import FileModel
+
+
+@pytest.fixture
+def handler() -> OllamaHandler:
+    handler = OllamaHandler()
+    handler.configuration = {"base_url": "http://localhost", "defaultModel": "mistral"}
+    return handler
+
+
+@pytest.mark.benchmark(group="ollama")
+def test_extract_diagram(benchmark, model_output):
+    result = benchmark(extract_diagram, model_output, False, False)
+    assert len(result["resources"]) == 2500
+
+
+@pytest.mark.benchmark(group="ollama")
+def test_build_files_prompt(benchmark, handler, files):
+    file_models = [FileModel(**file) for file in files]
+    prompt = benchmark(
+        lambda: "".join(handler._OllamaHandler__iter_files_prompt(file_models))
+    )
+    assert len(prompt) > 1_000_000
+
+
+@pytest.mark.benchmark(group="ollama")
+def test_context_round_trip(benchmark, context):
+    """
+    The context is parsed from the message before being sent to Ollama, and formatted from the Ollama response.
+    """
+    benchmark(lambda: str(json.loads(context)))
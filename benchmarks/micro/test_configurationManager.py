@@ -0,0 +1,33 @@
+import json
+import asyncio
+import pytest
+
+from benchmarks.micro.conftest import DECRYPTION_KEY
+from src.configuration.configurationManager import ConfigurationManager
+
+
+@pytest.mark.benchmark(group="configuration")
+def test_decrypt(benchmark, encrypted_configuration):
+    benchmark(ConfigurationManager().decrypt, DECRYPTION_KEY, encrypted_configuration)
+
+
+@pytest.mark.benchmark(group="configuration")
+def test_create_nested_dict(benchmark, dotted_configuration):
+    benchmark(
+        ConfigurationManager()._ConfigurationManager__create_nested_dict,
+        dotted_configuration,
+    )
+
+
+@pytest.mark.benchmark(group="configuration")
+def test_set_configuration(benchmark, encrypted_configuration):
+    configuration_manager = ConfigurationManager()
+
+    def set_configuration():
+        asyncio.run(
+            configuration_manager.set_configuration(
+                encrypted_configuration, DECRYPTION_KEY
+            )
+        )
+
+    benchmark(set_configuration)
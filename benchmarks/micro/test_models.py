@@ -0,0 +1,34 @@
+import json
+import pytest
+
+from src.models.Diagram import Diagram
+from src.models.Message import Message
+
+
+@pytest.mark.benchmark(group="models")
+def test_validate_diagram(benchmark):
+    body = {"pluginName": "@ditrit/kubernator-plugin", "description": "nginx pod " * 50}
+    benchmark(Diagram.model_validate, body)
+
+
+@pytest.mark.benchmark(group="models")
+def test_validate_message_with_files(benchmark, files):
+    body = {
+        "pluginName": "@ditrit/kubernator-plugin",
+        "message": "Why?",
+        "files": files,
+    }
+    benchmark(Message.model_validate, body)
+
+
+@pytest.mark.benchmark(group="models")
+def test_validate_message_json_with_context(benchmark, files, context):
+    body = json.dumps(
+        {
+            "pluginName": "@ditrit/kubernator-plugin",
+            "message": "Why?",
+            "files": files,
+            "context": context,
+        }
+    )
+    benchmark(Message.model_validate_json, body)
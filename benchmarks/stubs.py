@@ -0,0 +1,323 @@
+"""
+Stub servers speaking the Ollama and Gemini protocols, used to benchmark the proxy without GPU nor API key.
+
+The stubs answer after a latency drawn from a configurable distribution, then "generate" tokens
+at a configurable rate, optionally streaming them.
+"""
+
+import json
+import time
+import uuid
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DIAGRAM = {
+    "apiVersion": "v1",
+    "kind": "Pod",
+    "metadata": {"name": "nginx"},
+    "spec": {"containers": [{"name": "nginx", "image": "nginx:latest"}]},
+}
+
+
+class LatencyDistribution:
+    """
+    A distribution of latencies, in seconds.
+
+    The distribution is described as `name:param1,param2`:
+        - `constant:0.1`: always 0.1 second.
+        - `uniform:0.1,0.5`: between 0.1 and 0.5 second.
+        - `normal:0.2,0.05`: mean of 0.2 second, standard deviation of 0.05 second.
+        - `lognormal:-1.6,0.5`: log-normal distribution, with the mean and deviation of the underlying normal distribution.
+    """
+
+    def __init__(self, description: str = "constant:0"):
+        """
+        Initializes the distribution from its description.
+
+        Parameters:
+            description (str, optional): The description of the distribution. Defaults to no latency.
+        """
+        name, _, params = description.partition(":")
+        self.name = name
+        self.params = [float(param) for param in params.split(",") if param]
+
+    def sample(self) -> float:
+        """
+        Returns a latency drawn from the distribution, never negative.
+        """
+        if self.name == "constant":
+            value = self.params[0]
+        elif self.name == "uniform":
+            value = random.uniform(*self.params)
+        elif self.name == "normal":
+            value = random.gauss(*self.params)
+        elif self.name == "lognormal":
+            value = random.lognormvariate(*self.params)
+        else:
+            raise ValueError(f"Unknown latency distribution: {self.name}")
+        return max(value, 0)
+
+
+class StubSettings:
+    """
+    The behavior of a stub server.
+    """
+
+    def __init__(
+        self,
+        latency: str = "constant:0",
+        token_rate: float = 0,
+        output_tokens: int = 50,
+    ):
+        """
+        Initializes the settings.
+
+        Parameters:
+            latency (str, optional): The description of the latency distribution, before the first token.
+            token_rate (float, optional): The number of tokens generated per second. 0 means instantly.
+            output_tokens (int, optional): The number of tokens generated per response.
+        """
+        self.latency = LatencyDistribution(latency)
+        self.token_rate = token_rate
+        self.output_tokens = output_tokens
+
+    def tokens(self, text: str) -> list[str]:
+        """
+        Splits the given text in `output_tokens` tokens, padding it with spaces if needed.
+        """
+        size = max(len(text) // self.output_tokens, 1)
+        tokens = [text[index : index + size] for index in range(0, len(text), size)]
+        return tokens + [" "] * (self.output_tokens - len(tokens))
+
+    def wait_for_token(self):
+        """
+        Waits for the time needed to generate one token.
+        """
+        if self.token_rate:
+            time.sleep(1 / self.token_rate)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Base class of the request handlers of the stubs.
+    """
+
+    protocol_version = "HTTP/1.1"
+    settings = StubSettings()
+    # Shared by the requests of a server
+    state = {}
+
+    def log_message(self, format, *args):
+        # Keep the benchmark output clean
+        pass
+
+    def read_json(self) -> dict:
+        """
+        Reads the JSON body of the request, sent with a Content-Length or chunked.
+        """
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    # Skip the trailers, up to the empty line ending the body
+                    while self.rfile.readline().strip():
+                        pass
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return json.loads(b"".join(chunks) or b"{}")
+
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, body: dict, status: int = 200):
+        """
+        Sends a JSON response.
+        """
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def start_stream(self, content_type: str):
+        """
+        Starts a chunked response.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def send_chunk(self, data: bytes):
+        """
+        Sends one chunk of a chunked response. An empty chunk ends the response.
+        """
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class OllamaStubHandler(StubHandler):
+    """
+    Request handler speaking the Ollama `/api/generate` and `/api/create` protocols.
+    """
+
+    def do_POST(self):
+        body = self.read_json()
+        if self.path == "/api/create":
+            time.sleep(self.settings.latency.sample())
+            self.send_json({"status": "success"})
+        elif self.path == "/api/generate":
+            self.generate(body)
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def generate(self, body: dict):
+        start = time.perf_counter()
+        load_duration = self.settings.latency.sample()
+        time.sleep(load_duration)
+
+        if "generate" in body.get("model", ""):
+            text = f"```json\n{json.dumps(DIAGRAM)}\n```"
+        else:
+            text = "The pod runs nginx. " * 5
+        tokens = self.settings.tokens(text)
+
+        def statistics():
+            total = time.perf_counter() - start
+            return {
+                "done": True,
+                "context": [1, 2, 3],
+                "total_duration": int(total * 1e9),
+                "load_duration": int(load_duration * 1e9),
+                "prompt_eval_count": len(body.get("prompt") or "") // 4,
+                "prompt_eval_duration": 0,
+                "eval_count": len(tokens),
+                "eval_duration": int((total - load_duration) * 1e9),
+            }
+
+        if body.get("stream", True):
+            self.start_stream("application/x-ndjson")
+            for token in tokens:
+                self.settings.wait_for_token()
+                line = {"model": body["model"], "response": token, "done": False}
+                self.send_chunk(json.dumps(line).encode("utf-8") + b"\n")
+            last_line = {"model": body["model"], "response": "", **statistics()}
+            self.send_chunk(json.dumps(last_line).encode("utf-8") + b"\n")
+            self.send_chunk(b"")
+        else:
+            for _ in tokens:
+                self.settings.wait_for_token()
+            self.send_json({"model": body["model"], "response": text, **statistics()})
+
+
+class GeminiStubHandler(StubHandler):
+    """
+    Request handler speaking the Gemini `generateContent`, `streamGenerateContent` and `cachedContents` protocols.
+    The number of tokens of every cached content is kept in `state`, to report them as cached in the usage.
+    """
+
+    def create_cache(self, body: dict):
+        name = f"cachedContents/{uuid.uuid4().hex}"
+        self.state[name] = len(json.dumps(body.get("contents", ""))) // 4
+        self.send_json(
+            {
+                "name": name,
+                "model": body.get("model"),
+                "usageMetadata": {"totalTokenCount": self.state[name]},
+            }
+        )
+
+    def do_POST(self):
+        body = self.read_json()
+        path = self.path.split("?")[0]
+        if path.endswith("/cachedContents"):
+            self.create_cache(body)
+        elif path.endswith(":generateContent"):
+            self.generate(body, stream=False)
+        elif path.endswith(":streamGenerateContent"):
+            self.generate(body, stream=True)
+        else:
+            self.send_json({"error": {"code": 404, "message": "not found"}}, 404)
+
+    def generate(self, body: dict, stream: bool):
+        cached_tokens = 0
+        if "cachedContent" in body:
+            if body["cachedContent"] not in self.state:
+                self.send_json({"error": {"code": 404, "message": "not found"}}, 404)
+                return
+            cached_tokens = self.state[body["cachedContent"]]
+
+        time.sleep(self.settings.latency.sample())
+
+        text = json.dumps(DIAGRAM)
+        tokens = self.settings.tokens(text)
+        usage = {
+            "promptTokenCount": len(json.dumps(body.get("contents", ""))) // 4
+            + cached_tokens,
+            "cachedContentTokenCount": cached_tokens,
+            "candidatesTokenCount": len(tokens),
+        }
+
+        def chunk(token_text: str) -> dict:
+            return {"candidates": [{"content": {"parts": [{"text": token_text}]}}]}
+
+        if stream:
+            self.start_stream("text/event-stream")
+            for index, token in enumerate(tokens):
+                self.settings.wait_for_token()
+                # Like Gemini, every chunk gives the number of tokens generated so far
+                running = {
+                    **chunk(token),
+                    "usageMetadata": {**usage, "candidatesTokenCount": index + 1},
+                }
+                self.send_chunk(f"data: {json.dumps(running)}\r\n\r\n".encode())
+            last_chunk = {**chunk(""), "usageMetadata": usage}
+            self.send_chunk(f"data: {json.dumps(last_chunk)}\r\n\r\n".encode())
+            self.send_chunk(b"")
+        else:
+            for _ in tokens:
+                self.settings.wait_for_token()
+            self.send_json({**chunk(text), "usageMetadata": usage})
+
+
+class StubServer:
+    """
+    Runs a stub in a background thread.
+    """
+
+    def __init__(self, handler_class: type, settings: StubSettings):
+        """
+        Initializes the server on a free local port.
+
+        Parameters:
+            handler_class (type): The request handler of the stub.
+            settings (StubSettings): The behavior of the stub.
+        """
+        handler = type(
+            handler_class.__name__,
+            (handler_class,),
+            {"settings": settings, "state": {}},
+        )
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """
+        Returns the base url of the server.
+        """
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,217 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from src.cache.ResponseStore import ResponseStore
+from src.configuration.configurationManager import ConfigurationManager
+from src.configuration.configurationSnapshot import ConfigurationSnapshot
+from src.models.Diagram import Diagram
+from src.monitoring.Logger import get_logger
+from src.monitoring.Metrics import RESPONSE_CACHE_REQUESTS
+
+logger = get_logger(__name__)
+
+
+class ResponseCache:
+    """
+    A Singleton class caching the generated diagrams by description, in two tiers.
+
+    The first tier is an in-process LRU dictionary of `RESPONSE_CACHE_SIZE` entries.
+    The second tier is a `ResponseStore` in the `RESPONSE_CACHE_PATH` SQLite file, shared by the workers of a host
+    and kept between restarts, bounded to `RESPONSE_CACHE_MAX_SIZE` bytes. On a miss of the first tier,
+    the second one is read, and fills the first one.
+
+    The keys include the version and the content of the configuration, so that a new configuration
+    never returns a diagram generated with the previous one.
+    An error of the SQLite file (locked, full or corrupted) is logged, and the diagram is generated as on a miss.
+    The cache is disabled when neither `RESPONSE_CACHE_SIZE` nor `RESPONSE_CACHE_PATH` is set.
+    """
+
+    _instance = None
+
+    DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Create the unique instance of the class, with the tiers given by the environment.
+
+        Returns:
+            ResponseCache: The unique instance of the class.
+        """
+        if not cls._instance:
+            cls._instance = super().__new__(cls)
+            cls._instance.memory_size = int(os.environ.get("RESPONSE_CACHE_SIZE", 0))
+            path = os.environ.get("RESPONSE_CACHE_PATH")
+            cls._instance.store = (
+                ResponseStore(
+                    path,
+                    int(
+                        os.environ.get("RESPONSE_CACHE_MAX_SIZE", cls.DEFAULT_MAX_SIZE)
+                    ),
+                )
+                if path
+                else None
+            )
+            cls._instance._memory = OrderedDict()
+            cls._instance._fingerprints = {}
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    def reset(cls):
+        """
+        Resets the class by setting the `_instance` attribute to `None`.
+
+        Parameters:
+            cls (type): The class object.
+        """
+        type(cls)._instance = None
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Returns whether at least one tier of the cache is enabled.
+        """
+        return self.memory_size > 0 or self.store is not None
+
+    def __get_fingerprint(self, snapshot: ConfigurationSnapshot) -> str:
+        """
+        Returns the version and the hash of the content of a configuration, computed once per version.
+        """
+        with self._lock:
+            fingerprint = self._fingerprints.get(snapshot.version)
+        if fingerprint is None:
+            digest = hashlib.sha256(
+                json.dumps(snapshot.configuration, sort_keys=True).encode("utf-8")
+            ).hexdigest()
+            fingerprint = f"{snapshot.version}:{digest}"
+            with self._lock:
+                self._fingerprints = {snapshot.version: fingerprint}
+        return fingerprint
+
+    def get_key(self, snapshot: ConfigurationSnapshot, diagram: Diagram) -> str:
+        """
+        Returns the key of a diagram.
+
+        Parameters:
+            snapshot (ConfigurationSnapshot): The configuration the diagram is generated with.
+            diagram (Diagram): The diagram object containing the description of the diagram.
+
+        Returns:
+            str: The key, a SHA-256 hash of the configuration fingerprint, the plugin and the description.
+        """
+        return hashlib.sha256(
+            json.dumps(
+                [
+                    self.__get_fingerprint(snapshot),
+                    diagram.plugin_name,
+                    diagram.description,
+                ]
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """
+        Reads a cached diagram, from the in-process tier, else from the persistent one.
+
+        Parameters:
+            key (str): The key of the diagram.
+
+        Returns:
+            str | None: The diagram as JSON, or None if it is not cached.
+        """
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+        if value is not None:
+            RESPONSE_CACHE_REQUESTS.inc(tier="memory", result="hit")
+            return value
+        if self.memory_size > 0:
+            RESPONSE_CACHE_REQUESTS.inc(tier="memory", result="miss")
+
+        if self.store is None:
+            return None
+
+        try:
+            value = self.store.get(key)
+        except sqlite3.Error as e:
+            logger.warning(
+                "Failed to read the response cache",
+                extra={"fields": {"path": self.store.path, "error": str(e)}},
+            )
+            value = None
+        RESPONSE_CACHE_REQUESTS.inc(
+            tier="disk", result="miss" if value is None else "hit"
+        )
+        if value is not None:
+            self.__remember(key, value)
+        return value
+
+    def set(self, key: str, value: str):
+        """
+        Caches a diagram in both tiers.
+
+        Parameters:
+            key (str): The key of the diagram.
+            value (str): The diagram as JSON.
+        """
+        self.__remember(key, value)
+        if self.store is None:
+            return
+        try:
+            self.store.set(key, value)
+        except sqlite3.Error as e:
+            logger.warning(
+                "Failed to write the response cache",
+                extra={"fields": {"path": self.store.path, "error": str(e)}},
+            )
+
+    def __remember(self, key: str, value: str):
+        """
+        Adds a diagram to the in-process tier, removing the least recently used one if it is full.
+        """
+        if self.memory_size <= 0:
+            return
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def generate(self, diagram: Diagram, generate: Callable[[], Any]):
+        """
+        Returns the cached diagram, or generates it and caches it.
+
+        Parameters:
+            diagram (Diagram): The diagram object containing the description of the diagram.
+            generate (Callable[[], Any]): Generates the diagram, returning a JSONResponse or the diagram itself.
+
+        Returns:
+            The response of `generate`, or a JSONResponse with the cached diagram.
+        """
+        if not self.enabled:
+            return generate()
+
+        try:
+            key = self.get_key(ConfigurationManager().get_snapshot(), diagram)
+        except HTTPException:
+            return generate()
+
+        value = self.get(key)
+        if value is not None:
+            return JSONResponse(content=json.loads(value))
+
+        response = generate()
+        if isinstance(response, JSONResponse):
+            if response.status_code == 200:
+                self.set(key, response.body.decode("utf-8"))
+        else:
+            self.set(key, json.dumps(response))
+        return response
@@ -0,0 +1,131 @@
+import time
+import sqlite3
+import threading
+
+
+class ResponseStore:
+    """
+    A persistent store of generated responses, in a SQLite database on the local disk.
+
+    The database can be shared by all the workers of a host, and survives restarts.
+    The total size of the responses is bounded: once it is exceeded, the least recently read responses are removed.
+    The total is kept up to date by triggers in the `responses_size` table, so that it is not summed on every write.
+    """
+
+    def __init__(self, path: str, max_size: int):
+        """
+        Opens the database and creates its table if needed.
+
+        Parameters:
+            path (str): The path of the database file.
+            max_size (int): The maximum total size of the responses, in bytes.
+        """
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=10, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                read_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_read_at ON responses (read_at);
+            CREATE TABLE IF NOT EXISTS responses_size (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                total INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO responses_size
+                SELECT 0, COALESCE(SUM(size), 0) FROM responses;
+            CREATE TRIGGER IF NOT EXISTS responses_inserted AFTER INSERT ON responses BEGIN
+                UPDATE responses_size SET total = total + new.size;
+            END;
+            CREATE TRIGGER IF NOT EXISTS responses_updated AFTER UPDATE OF size ON responses BEGIN
+                UPDATE responses_size SET total = total + new.size - old.size;
+            END;
+            CREATE TRIGGER IF NOT EXISTS responses_deleted AFTER DELETE ON responses BEGIN
+                UPDATE responses_size SET total = total - old.size;
+            END;
+            COMMIT;
+            """
+        )
+
+    def get(self, key: str) -> str | None:
+        """
+        Reads a response, and marks it as recently read.
+
+        Parameters:
+            key (str): The key of the response.
+
+        Returns:
+            str | None: The response, or None if it is not stored.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._connection.execute(
+                    "UPDATE responses SET read_at = ? WHERE key = ?", (time.time(), key)
+                )
+        return row[0] if row is not None else None
+
+    def set(self, key: str, value: str):
+        """
+        Stores a response, then removes the least recently read ones while the store is too big.
+
+        Parameters:
+            key (str): The key of the response.
+            value (str): The response.
+        """
+        size = len(value.encode("utf-8"))
+        if size > self.max_size:
+            return
+
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # An upsert rather than a replace, whose deletion would not fire the trigger of the total
+                self._connection.execute(
+                    "INSERT INTO responses VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                    "value = excluded.value, size = excluded.size, read_at = excluded.read_at",
+                    (key, value, size, time.time()),
+                )
+                total = self.__total()
+                if total > self.max_size:
+                    evicted = []
+                    for evicted_key, evicted_size in self._connection.execute(
+                        "SELECT key, size FROM responses ORDER BY read_at"
+                    ):
+                        if total <= self.max_size:
+                            break
+                        evicted.append((evicted_key,))
+                        total -= evicted_size
+                    self._connection.executemany(
+                        "DELETE FROM responses WHERE key = ?", evicted
+                    )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def size(self) -> int:
+        """
+        Returns the total size of the stored responses, in bytes.
+        """
+        with self._lock:
+            return self.__total()
+
+    def __total(self) -> int:
+        """
+        Returns the total size of the stored responses, kept by the triggers.
+        """
+        return self._connection.execute(
+            "SELECT total FROM responses_size WHERE id = 0"
+        ).fetchone()[0]
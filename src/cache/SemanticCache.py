@@ -0,0 +1,188 @@
+import json
+import time
+import importlib.util
+import threading
+from typing import Any, Callable
+
+import requests
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from src.configuration.configurationManager import ConfigurationManager
+from src.configuration.configurationSnapshot import ConfigurationSnapshot
+from src.handlers.Factory import Factory
+from src.models.Diagram import Diagram
+from src.monitoring.Logger import get_logger
+from src.monitoring.Metrics import (
+    SEMANTIC_CACHE_REQUESTS,
+    SEMANTIC_CACHE_SAVED_SECONDS,
+    SEMANTIC_CACHE_SIMILARITY,
+)
+from src.monitoring.RequestContext import timed_phase
+
+logger = get_logger(__name__)
+
+
+class SemanticCache:
+    """
+    A Singleton class returning the diagrams already generated for similar descriptions.
+
+    The descriptions are embedded with the Ollama embedding model set in `ollama.semanticCache.embeddingModel`,
+    and kept in a bounded in-memory vector index per plugin (see `VectorIndex`). A diagram is returned from
+    the cache when the cosine similarity of its description with a cached one is at least
+    `ollama.semanticCache.threshold`.
+
+    The cache is disabled when no embedding model is set, or when NumPy is not installed.
+    It is emptied when a new configuration is published, the diagrams depending on it.
+    """
+
+    _instance = None
+
+    DEFAULT_THRESHOLD = 0.95
+    DEFAULT_MAX_ENTRIES = 1000
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Create the unique instance of the class.
+
+        Returns:
+            SemanticCache: The unique instance of the class.
+        """
+        if not cls._instance:
+            cls._instance = super().__new__(cls)
+            cls._instance.available = importlib.util.find_spec("numpy") is not None
+            cls._instance._lock = threading.Lock()
+            cls._instance._indexes = {}
+            cls._instance._version = None
+            cls._instance._warned_version = None
+        return cls._instance
+
+    def reset(cls):
+        """
+        Resets the class by setting the `_instance` attribute to `None`.
+
+        Parameters:
+            cls (type): The class object.
+        """
+        type(cls)._instance = None
+
+    def get_settings(self, snapshot: ConfigurationSnapshot) -> dict | None:
+        """
+        Reads the settings of the cache from the configuration.
+
+        Parameters:
+            snapshot (ConfigurationSnapshot): The configuration snapshot.
+
+        Returns:
+            dict: The `embeddingModel`, `threshold` and `maxEntries` settings, or None if the cache is disabled.
+        """
+        settings = snapshot.configuration.get("ollama", {}).get("semanticCache", {})
+        if not settings.get("embeddingModel"):
+            return None
+        if not self.available:
+            if self._warned_version != snapshot.version:
+                self._warned_version = snapshot.version
+                logger.warning(
+                    "Semantic cache disabled, NumPy is not installed",
+                    extra={"fields": {"version": snapshot.version}},
+                )
+            return None
+
+        return {
+            "embeddingModel": settings["embeddingModel"],
+            "threshold": float(settings.get("threshold", self.DEFAULT_THRESHOLD)),
+            "maxEntries": int(settings.get("maxEntries", self.DEFAULT_MAX_ENTRIES)),
+        }
+
+    def __get_index(self, snapshot: ConfigurationSnapshot, plugin_name: str, size: int):
+        """
+        Returns the index of a plugin, emptying all the indexes if the configuration changed.
+        Must be called with the lock held.
+        """
+        from src.cache.VectorIndex import VectorIndex
+
+        if self._version != snapshot.version:
+            self._indexes = {}
+            self._version = snapshot.version
+
+        if plugin_name not in self._indexes:
+            self._indexes[plugin_name] = VectorIndex(size)
+        return self._indexes[plugin_name]
+
+    def __embed(
+        self, snapshot: ConfigurationSnapshot, settings: dict, diagram: Diagram
+    ) -> list[float]:
+        """
+        Computes the embedding of the description of a diagram with Ollama.
+        """
+        handler = Factory.create_handler("ollama")
+        handler.initialize_configuration(snapshot)
+
+        with timed_phase("embed"):
+            return handler.embed(
+                [diagram.description], settings["embeddingModel"], diagram.plugin_name
+            )[0]
+
+    def generate(self, diagram: Diagram, generate: Callable[[], Any]):
+        """
+        Returns the cached diagram of the most similar description, or generates it and caches it.
+
+        The cache never fails a generation: if the embedding can not be computed, the diagram is only generated.
+
+        Parameters:
+            diagram (Diagram): The diagram object containing the description of the diagram.
+            generate (Callable[[], Any]): Generates the diagram, returning a JSONResponse or the diagram itself.
+
+        Returns:
+            The response of `generate`, or a JSONResponse with the cached diagram.
+        """
+        try:
+            snapshot = ConfigurationManager().get_snapshot()
+        except HTTPException:
+            return generate()
+
+        settings = self.get_settings(snapshot)
+        if settings is None:
+            return generate()
+
+        try:
+            vector = self.__embed(snapshot, settings, diagram)
+        except (requests.exceptions.RequestException, HTTPException, KeyError) as e:
+            logger.warning(
+                "Semantic cache skipped, the description could not be embedded",
+                extra={"fields": {"plugin": diagram.plugin_name, "error": str(e)}},
+            )
+            return generate()
+
+        plugin_name = diagram.plugin_name
+        with self._lock:
+            index = self.__get_index(snapshot, plugin_name, settings["maxEntries"])
+            similarity, entry = index.search([vector], settings["threshold"])[0]
+
+        if entry is not None:
+            SEMANTIC_CACHE_SIMILARITY.observe(similarity, plugin=plugin_name)
+            if similarity >= settings["threshold"]:
+                SEMANTIC_CACHE_REQUESTS.inc(plugin=plugin_name, result="hit")
+                SEMANTIC_CACHE_SAVED_SECONDS.inc(entry["duration"], plugin=plugin_name)
+                return JSONResponse(content=entry["diagram"])
+
+        SEMANTIC_CACHE_REQUESTS.inc(plugin=plugin_name, result="miss")
+
+        start = time.perf_counter()
+        response = generate()
+        duration = time.perf_counter() - start
+
+        if isinstance(response, JSONResponse):
+            if response.status_code != 200:
+                return response
+            content = json.loads(response.body)
+        else:
+            content = response
+
+        with self._lock:
+            # Do not cache a diagram generated with an outdated configuration
+            if self._version == snapshot.version:
+                index = self.__get_index(snapshot, plugin_name, settings["maxEntries"])
+                index.add(vector, {"diagram": content, "duration": duration})
+
+        return response
@@ -0,0 +1,100 @@
+from typing import Any
+
+import numpy
+
+
+class VectorIndex:
+    """
+    A bounded in-memory index of vectors, searched by cosine similarity.
+
+    The vectors are normalized and kept as the rows of a preallocated NumPy matrix, so that a search
+    is a single matrix product over all the entries, for one or several queries at once.
+    When the index is full, the least recently used entry is replaced.
+    """
+
+    def __init__(self, max_entries: int):
+        """
+        Initializes an empty index.
+
+        Parameters:
+            max_entries (int): The maximum number of entries of the index.
+        """
+        self.max_entries = max_entries
+        self._vectors = None
+        self._values = []
+        self._last_used = numpy.zeros(max_entries, dtype=numpy.int64)
+        self._clock = 0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __normalize(self, vectors) -> numpy.ndarray:
+        """
+        Returns the given vectors as a matrix of unit rows.
+        """
+        vectors = numpy.atleast_2d(numpy.asarray(vectors, dtype=numpy.float32))
+        norms = numpy.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / numpy.where(norms == 0, 1, norms)
+
+    def __touch(self, position: int):
+        self._clock += 1
+        self._last_used[position] = self._clock
+
+    def add(self, vector, value: Any):
+        """
+        Adds an entry to the index, replacing the least recently used one if the index is full.
+        A vector of another dimension (e.g. from another embedding model) empties the index first.
+
+        Parameters:
+            vector: The vector of the entry.
+            value (Any): The value of the entry.
+        """
+        row = self.__normalize(vector)[0]
+        if self._vectors is None or self._vectors.shape[1] != row.shape[0]:
+            self._vectors = numpy.zeros(
+                (self.max_entries, row.shape[0]), dtype=numpy.float32
+            )
+            self._values = []
+            self._last_used = numpy.zeros(self.max_entries, dtype=numpy.int64)
+            self._clock = 0
+
+        if len(self._values) < self.max_entries:
+            position = len(self._values)
+            self._values.append(value)
+        else:
+            position = int(numpy.argmin(self._last_used))
+            self._values[position] = value
+
+        self._vectors[position] = row
+        self.__touch(position)
+
+    def search(self, vectors, threshold: float = 0.0) -> list[tuple[float, Any]]:
+        """
+        Finds the most similar entry of every query.
+
+        Only the entries found with a similarity of at least `threshold` count as used, so that the entries
+        only found by misses are still the first to be replaced.
+
+        Parameters:
+            vectors: The query vectors, as a list of vectors or a matrix.
+            threshold (float, optional): The similarity from which an entry found is a hit.
+
+        Returns:
+            list[tuple[float, Any]]: For every query, the cosine similarity and the value of the most similar entry,
+            or `(0.0, None)` if the index is empty.
+        """
+        queries = self.__normalize(vectors)
+        size = len(self._values)
+        if size == 0 or queries.shape[1] != self._vectors.shape[1]:
+            return [(0.0, None)] * len(queries)
+
+        scores = queries @ self._vectors[:size].T
+        best = numpy.argmax(scores, axis=1)
+
+        results = []
+        for query, position in enumerate(best):
+            similarity = float(scores[query, position])
+            if similarity >= threshold:
+                self.__touch(position)
+            results.append((similarity, self._values[position]))
+        return results
@@ -0,0 +1,38 @@
+from fastapi import HTTPException
+
+from src.monitoring.Metrics import ERRORS
+from src.monitoring.RequestContext import RequestContext
+
+# Non-standard status code of the requests whose client disconnected, as logged by nginx
+CLIENT_CLOSED_REQUEST = 499
+
+
+def client_disconnected(handler: str = "proxy") -> HTTPException:
+    """
+    Counts a request dropped because its client disconnected, and returns the error to end it with.
+
+    Parameters:
+        handler (str, optional): The handler of the request, if known.
+
+    Returns:
+        HTTPException: The 499 error, that the client will not read.
+    """
+    ERRORS.inc(handler=handler, type="client_disconnected")
+    return HTTPException(
+        status_code=CLIENT_CLOSED_REQUEST, detail="The client closed the request."
+    )
+
+
+def check_disconnected(handler: str = "proxy"):
+    """
+    Drops the request being processed if its client disconnected, before starting more work.
+
+    Parameters:
+        handler (str, optional): The handler of the request, if known.
+
+    Raises:
+        HTTPException: If the client of the request disconnected.
+    """
+    context = RequestContext.current()
+    if context is not None and context.disconnected:
+        raise client_disconnected(handler)
@@ -0,0 +1,174 @@
+import os
+import threading
+from contextlib import contextmanager
+from http import HTTPStatus
+
+from fastapi import HTTPException
+
+from src.concurrency.Cancellation import check_disconnected, client_disconnected
+from src.concurrency.Deadline import bound_timeout, check_deadline, deadline_exceeded
+from src.monitoring.RequestContext import RequestContext, timed_phase
+
+
+class ConcurrencyLimiter:
+    """
+    A Singleton class bounding the number of requests sent concurrently to the AI backends.
+
+    The limit is read from the `MAX_CONCURRENT_REQUESTS` environment variable.
+    Requests over the limit wait in a queue until a slot is released, until their deadline,
+    or until their client disconnects.
+    Once closed, for instance when the proxy shuts down, new requests are rejected.
+    """
+
+    _instance = None
+
+    DEFAULT_LIMIT = 4
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Create the unique instance of the class, sized from the environment.
+
+        Returns:
+            ConcurrencyLimiter: The unique instance of the class.
+        """
+        if not cls._instance:
+            cls._instance = super().__new__(cls)
+            cls._instance.limit = int(
+                os.environ.get("MAX_CONCURRENT_REQUESTS", cls.DEFAULT_LIMIT)
+            )
+            cls._instance._condition = threading.Condition()
+            cls._instance._active = 0
+            cls._instance._waiting = 0
+            cls._instance._closed = False
+            cls._instance._idle_waiters = 0
+        return cls._instance
+
+    def reset(cls):
+        """
+        Resets the class by setting the `_instance` attribute to `None`.
+
+        Parameters:
+            cls (type): The class object.
+        """
+        type(cls)._instance = None
+
+    @property
+    def active(self) -> int:
+        """
+        Returns the number of requests currently holding a slot.
+        """
+        return self._active
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Returns the number of requests waiting for a slot.
+        """
+        return self._waiting
+
+    @property
+    def closed(self) -> bool:
+        """
+        Returns whether new requests are rejected.
+        """
+        return self._closed
+
+    def close(self):
+        """
+        Rejects the new requests and the requests waiting for a slot.
+        The requests holding a slot are not interrupted.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def open(self):
+        """
+        Accepts new requests again, after the limiter was closed.
+        """
+        with self._condition:
+            self._closed = False
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """
+        Waits until no request holds a slot.
+
+        Parameters:
+            timeout (float, optional): The maximum time to wait, in seconds. Defaults to None (no limit).
+
+        Returns:
+            bool: True if no request holds a slot, False if the timeout expired before.
+        """
+        with self._condition:
+            self._idle_waiters += 1
+            try:
+                return self._condition.wait_for(lambda: self._active == 0, timeout)
+            finally:
+                self._idle_waiters -= 1
+
+    def __wake_all(self):
+        """
+        Wakes the queued requests up, so that the ones whose client disconnected leave the queue.
+        """
+        with self._condition:
+            self._condition.notify_all()
+
+    @contextmanager
+    def acquire(self, timeout: float = None):
+        """
+        Holds a slot for the duration of the `with` block.
+        A request whose deadline has expired is dropped instead of waiting, and its wait is bounded by its deadline.
+        A request whose client disconnects is dropped from the queue.
+
+        Parameters:
+            timeout (float, optional): The maximum time to wait for a slot, in seconds. Defaults to None (no limit).
+
+        Raises:
+            HTTPException: If no slot was released before the timeout or the deadline, or if the limiter is closed.
+        """
+        check_deadline()
+        check_disconnected()
+        bounded_timeout = bound_timeout(timeout)
+        context = RequestContext.current()
+        if context is not None:
+            context.on_disconnect(self.__wake_all)
+
+        with timed_phase("queue"), self._condition:
+            self._waiting += 1
+            try:
+                acquired = self._condition.wait_for(
+                    lambda: self._closed
+                    or self._active < self.limit
+                    or (context is not None and context.disconnected),
+                    bounded_timeout,
+                )
+            finally:
+                self._waiting -= 1
+            if context is not None and context.disconnected:
+                raise client_disconnected()
+            if self._closed:
+                raise HTTPException(
+                    status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                    detail="The proxy is shutting down, please try again later.",
+                )
+            if not acquired and bounded_timeout != timeout:
+                raise deadline_exceeded(
+                    "The deadline of the request expired while waiting for a slot."
+                )
+            if not acquired:
+                raise HTTPException(
+                    status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                    detail="Too many concurrent requests, please try again later.",
+                )
+            self._active += 1
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                # Waiters for idleness share the condition, so they must not steal the wake-up of a queued request
+                if self._idle_waiters:
+                    self._condition.notify_all()
+                else:
+                    self._condition.notify()
@@ -0,0 +1,67 @@
+from http import HTTPStatus
+
+from fastapi import HTTPException
+
+from src.monitoring.Metrics import ERRORS
+from src.monitoring.RequestContext import RequestContext
+
+
+def remaining_time() -> float | None:
+    """
+    Returns the time left before the deadline of the request being processed.
+
+    Returns:
+        float | None: The time left in seconds, or None if the request has no deadline (or outside of a request).
+    """
+    context = RequestContext.current()
+    if context is None:
+        return None
+    return context.remaining()
+
+
+def bound_timeout(timeout: float | None) -> float | None:
+    """
+    Bounds a timeout by the time left before the deadline of the request being processed.
+
+    Parameters:
+        timeout (float | None): The timeout, in seconds, or None for no limit.
+
+    Returns:
+        float | None: The smallest of the timeout and the time left, or None if there is no limit.
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    if timeout is None:
+        return max(remaining, 0)
+    return max(min(timeout, remaining), 0)
+
+
+def deadline_exceeded(detail: str, handler: str = "proxy") -> HTTPException:
+    """
+    Counts a request dropped because of its deadline, and returns the error to answer it with.
+
+    Parameters:
+        detail (str): The description of the error.
+        handler (str, optional): The handler of the request, if known.
+
+    Returns:
+        HTTPException: The 504 error.
+    """
+    ERRORS.inc(handler=handler, type="deadline_exceeded")
+    return HTTPException(status_code=HTTPStatus.GATEWAY_TIMEOUT, detail=detail)
+
+
+def check_deadline(handler: str = "proxy"):
+    """
+    Drops the request being processed if its deadline has expired, before starting more work.
+
+    Parameters:
+        handler (str, optional): The handler of the request, if known.
+
+    Raises:
+        HTTPException: If the deadline of the request has expired.
+    """
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise deadline_exceeded("The deadline of the request has expired.", handler)
@@ -0,0 +1,176 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from src.monitoring.Metrics import PROCESSING_QUEUE_TIME, PROCESSING_TASKS
+
+
+def _run_task(submitted_at: float, function: Callable, args: tuple) -> tuple:
+    """
+    Runs a task in a worker of the pool, measuring the time it waited for the worker.
+
+    Parameters:
+        submitted_at (float): The time the task was submitted, as a timestamp.
+        function (Callable): The function of the task.
+        args (tuple): The arguments of the function.
+
+    Returns:
+        tuple: The time waited, in seconds, and the result of the function.
+    """
+    return time.time() - submitted_at, function(*args)
+
+
+class ProcessingPool:
+    """
+    A Singleton class running the CPU-heavy steps of the requests out of the event loop,
+    so that a large input does not stall the other requests of the worker.
+
+    The executor is chosen with the `PROCESSING_POOL` environment variable, `thread` (default) or `process`,
+    and sized with `PROCESSING_POOL_WORKERS` (default: the number of CPUs).
+    Tasks on inputs smaller than `PROCESSING_INLINE_THRESHOLD` bytes (default: 65536) are run inline,
+    as handing them over would cost more than running them.
+
+    Only portable tasks, i.e. functions and arguments that can be pickled, are run by processes.
+    The other ones are run by threads, which frees the event loop but still shares the GIL.
+    """
+
+    _instance = None
+
+    DEFAULT_INLINE_THRESHOLD = 64 * 1024
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Create the unique instance of the class, configured from the environment.
+
+        Returns:
+            ProcessingPool: The unique instance of the class.
+        """
+        if not cls._instance:
+            cls._instance = super().__new__(cls)
+            cls._instance.kind = os.environ.get("PROCESSING_POOL", "thread")
+            cls._instance.workers = int(
+                os.environ.get("PROCESSING_POOL_WORKERS", os.cpu_count() or 1)
+            )
+            cls._instance.inline_threshold = int(
+                os.environ.get(
+                    "PROCESSING_INLINE_THRESHOLD", cls.DEFAULT_INLINE_THRESHOLD
+                )
+            )
+            cls._instance._executors = {}
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    def reset(cls):
+        """
+        Resets the class by shutting down its executors and setting the `_instance` attribute to `None`.
+
+        Parameters:
+            cls (type): The class object.
+        """
+        cls.shutdown()
+        type(cls)._instance = None
+
+    def shutdown(self):
+        """
+        Shuts down the executors, once their running tasks are done.
+        """
+        with self._lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def __get_executor(self, kind: str) -> Executor:
+        """
+        Returns the executor of the given kind, created on first use.
+
+        Parameters:
+            kind (str): `thread` or `process`.
+
+        Returns:
+            Executor: The executor.
+        """
+        with self._lock:
+            if kind not in self._executors:
+                if kind == "process":
+                    # Forking a process running threads can copy locked locks
+                    self._executors[kind] = ProcessPoolExecutor(
+                        self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    self._executors[kind] = ThreadPoolExecutor(
+                        self.workers, thread_name_prefix="processing"
+                    )
+            return self._executors[kind]
+
+    def __submit(self, task: str, kind: str, function: Callable, args: tuple):
+        PROCESSING_TASKS.inc(task=task, execution=kind)
+        return self.__get_executor(kind).submit(_run_task, time.time(), function, args)
+
+    def __record(self, task: str, kind: str, outcome: tuple) -> Any:
+        queue_time, result = outcome
+        PROCESSING_QUEUE_TIME.observe(max(queue_time, 0), task=task, executor=kind)
+        return result
+
+    async def run_async(
+        self,
+        task: str,
+        function: Callable,
+        *args,
+        size: int = 0,
+        portable: bool = False,
+    ) -> Any:
+        """
+        Runs a task from the event loop, in the pool if its input is large enough.
+
+        Parameters:
+            task (str): The name of the task, to label the metrics.
+            function (Callable): The function of the task.
+            *args: The arguments of the function.
+            size (int, optional): The size of the input of the task, in bytes.
+            portable (bool, optional): Whether the task can be run by another process.
+
+        Returns:
+            The result of the function.
+        """
+        if size < self.inline_threshold:
+            PROCESSING_TASKS.inc(task=task, execution="inline")
+            return function(*args)
+
+        kind = "process" if self.kind == "process" and portable else "thread"
+        future = self.__submit(task, kind, function, args)
+        return self.__record(task, kind, await asyncio.wrap_future(future))
+
+    def run(
+        self,
+        task: str,
+        function: Callable,
+        *args,
+        size: int = 0,
+        portable: bool = False,
+    ) -> Any:
+        """
+        Runs a task from a worker thread, for instance in a sync route.
+
+        Such a thread does not block the event loop, so a large task is only handed over to the process pool,
+        to run without holding the GIL of this process. It is run inline otherwise.
+
+        Parameters:
+            task (str): The name of the task, to label the metrics.
+            function (Callable): The function of the task.
+            *args: The arguments of the function.
+            size (int, optional): The size of the input of the task, in bytes.
+            portable (bool, optional): Whether the task can be run by another process.
+
+        Returns:
+            The result of the function.
+        """
+        if size < self.inline_threshold or self.kind != "process" or not portable:
+            PROCESSING_TASKS.inc(task=task, execution="inline")
+            return function(*args)
+
+        future = self.__submit(task, "process", function, args)
+        return self.__record(task, "process", future.result())
@@ -1,20 +1,42 @@
 import os
-import asyncio
 import json
 import hashlib
+import threading
 from Crypto.Cipher import AES
 from fastapi import HTTPException
 from http import HTTPStatus
 
+from src.configuration.configurationSnapshot import ConfigurationSnapshot
+from src.configuration.configurationStore import ConfigurationStore
+from src.configuration.generationProfile import GenerationProfile, ProfileError
+from src.concurrency.ProcessingPool import ProcessingPool
+from src.monitoring.Logger import get_logger
+from src.monitoring.Metrics import registry
+from src.validation.JsonSchema import JsonSchema, SchemaError
+
+logger = get_logger(__name__)
+
+CONFIGURATION_VERSION = registry.gauge(
+    "leto_ai_proxy_configuration_version",
+    "Version of the active configuration.",
+)
+
 
 class ConfigurationManager:
     """
     A Singleton class for managing configuration settings.
+
+    The configuration is exposed as immutable versioned snapshots (see `ConfigurationSnapshot`).
+    Readers get the current snapshot without any lock, writers build a new snapshot and swap it atomically.
+
+    If a ConfigurationStore is defined (see `CONFIGURATION_STORE_PATH`), every set configuration is also written
+    in it, so that the other workers can load it.
     """
 
     _instance = None
-    _configuration = {}
-    _lock = asyncio.Lock()
+    _snapshot = None
+    _last_version = 0
+    _publish_lock = threading.Lock()
 
     # Constants for AES decryption
     IV_SIZE = 12  # Adjust according to the Java constant IV_SIZE
@@ -43,8 +65,10 @@ class ConfigurationManager:
 
         if not cls._instance:
             cls._instance = super().__new__(cls)
-            print(
-                f"Creating new ConfigurationManager instance with id: {id(cls._instance)}"
+            cls._instance._store = ConfigurationStore.from_environment()
+            logger.info(
+                "Creating new ConfigurationManager instance",
+                extra={"fields": {"instanceId": id(cls._instance)}},
             )
         return cls._instance
 
@@ -56,9 +80,10 @@ class ConfigurationManager:
             cls (type): The class object.
         """
         cls._instance = None
-        cls._configuration = {}
+        cls._snapshot = None
 
-    def decrypt(self, key: str, encrypted_iv_text_bytes: bytes) -> str:
+    @classmethod
+    def decrypt(cls, key: str, encrypted_iv_text_bytes: bytes) -> str:
         """
         Decrypts the given encrypted data using AES in GCM mode with the given key.
 
@@ -69,44 +94,146 @@ class ConfigurationManager:
         """
         try:
             # Extract IV
-            iv = encrypted_iv_text_bytes[: self.IV_SIZE]
+            iv = encrypted_iv_text_bytes[: cls.IV_SIZE]
 
             # Extract encrypted part
-            encrypted_bytes = encrypted_iv_text_bytes[self.IV_SIZE :]
+            encrypted_bytes = encrypted_iv_text_bytes[cls.IV_SIZE :]
 
             # Hash key
-            key_bytes = hashlib.sha256(key.encode("utf-8")).digest()[: self.KEY_SIZE]
+            key_bytes = hashlib.sha256(key.encode("utf-8")).digest()[: cls.KEY_SIZE]
 
             # Decrypt using AES in GCM mode
             cipher = AES.new(
-                key_bytes, AES.MODE_GCM, nonce=iv, mac_len=self.GCM_TAG_LENGTH
+                key_bytes, AES.MODE_GCM, nonce=iv, mac_len=cls.GCM_TAG_LENGTH
             )
             decrypted_bytes = cipher.decrypt_and_verify(
-                encrypted_bytes[: -self.GCM_TAG_LENGTH],
-                encrypted_bytes[-self.GCM_TAG_LENGTH :],
+                encrypted_bytes[: -cls.GCM_TAG_LENGTH],
+                encrypted_bytes[-cls.GCM_TAG_LENGTH :],
             )
 
             return decrypted_bytes.decode("utf-8")
         except Exception:
             raise Exception("Failed to decrypt")
 
-    def get_configuration(self):
+    def get_snapshot(self) -> ConfigurationSnapshot:
         """
-        Gets the remote configuration.
+        Gets the current snapshot of the remote configuration.
+        It should be read once per request, so that the whole request uses the same configuration.
 
-        :return: The remote configuration as a json object.
-        :raises Exception: If the remote configuration is not set.
+        :return: The current snapshot.
+        :raises HTTPException: If the remote configuration is not set.
         """
+        snapshot = self._snapshot
 
-        if not self._configuration:
+        if snapshot is None or not snapshot.configuration:
             raise HTTPException(
                 status_code=HTTPStatus.SERVICE_UNAVAILABLE,
                 detail="The required configuration is not set. Please set up the configuration and try again.",
             )
 
-        return self._configuration
+        return snapshot
+
+    @property
+    def current_version(self) -> int:
+        """
+        Returns the version of the active configuration, or 0 if no configuration is set.
+        """
+        snapshot = self._snapshot
+        return snapshot.version if snapshot is not None else 0
+
+    def get_configuration(self):
+        """
+        Gets the remote configuration, from the current snapshot.
+
+        :return: The remote configuration as a json object.
+        :raises HTTPException: If the remote configuration is not set.
+        """
+        return self.get_snapshot().configuration
+
+    def compile_schemas(self, configuration: dict) -> dict:
+        """
+        Compiles the JSON schemas of the generated diagrams, set in `pluginSchemas.<plugin name>` as JSON strings.
+
+        :param configuration: The nested configuration.
+        :return: The compiled schemas (see `JsonSchema`), by plugin name.
+        :raises HTTPException: If a schema is invalid.
+        """
+        schemas = {}
+        for plugin_name, schema in configuration.get("pluginSchemas", {}).items():
+            try:
+                if isinstance(schema, str):
+                    schemas[plugin_name] = JsonSchema.from_json(schema)
+                else:
+                    schemas[plugin_name] = JsonSchema(schema)
+            except SchemaError as e:
+                raise HTTPException(
+                    status_code=HTTPStatus.BAD_REQUEST,
+                    detail=f"Invalid schema for the plugin {plugin_name}: {e}",
+                )
+        return schemas
+
+    def compile_profiles(self, configuration: dict) -> dict:
+        """
+        Compiles the generation profiles, set in `generationProfiles.<mode>.<plugin name>` as JSON objects.
+
+        :param configuration: The nested configuration.
+        :return: The compiled profiles (see `GenerationProfile`), by mode then plugin name.
+        :raises HTTPException: If a profile is invalid.
+        """
+        profiles = {}
+        for mode, plugins in configuration.get("generationProfiles", {}).items():
+            for plugin_name, profile in plugins.items():
+                try:
+                    profiles.setdefault(mode, {})[plugin_name] = (
+                        GenerationProfile.from_json(profile)
+                    )
+                except ProfileError as e:
+                    raise HTTPException(
+                        status_code=HTTPStatus.BAD_REQUEST,
+                        detail=f"Invalid generation profile for the plugin {plugin_name} in {mode} mode: {e}",
+                    )
+        return profiles
+
+    def publish(
+        self,
+        configuration: dict,
+        version: int = None,
+        schemas: dict = None,
+        profiles: dict = None,
+    ) -> ConfigurationSnapshot:
+        """
+        Publishes the given configuration as the new current snapshot.
+
+        :param configuration: The nested configuration, that must not be modified afterward.
+        :param version: The version of the configuration (e.g. read from the store). Defaults to the next version.
+        If it is not greater than the active version, the configuration is outdated and is not published.
+        :param schemas: The compiled schemas of the configuration. Compiled from the configuration if not given.
+        :param profiles: The compiled generation profiles of the configuration. Compiled from the configuration if not given.
+        :return: The published snapshot, or the active one if the configuration is outdated.
+        :raises HTTPException: If a schema or a generation profile of the configuration is invalid.
+        """
+        if schemas is None:
+            schemas = self.compile_schemas(configuration)
+        if profiles is None:
+            profiles = self.compile_profiles(configuration)
+
+        with self._publish_lock:
+            if version is None:
+                version = self._last_version + 1
+            elif version <= self.current_version:
+                return self._snapshot
+            self._last_version = max(self._last_version, version)
+            snapshot = ConfigurationSnapshot(version, configuration, schemas, profiles)
+            self._snapshot = snapshot
+
+        CONFIGURATION_VERSION.set(snapshot.version)
+        logger.info(
+            "Configuration published", extra={"fields": {"version": snapshot.version}}
+        )
+        return snapshot
 
-    def __create_nested_dict(self, data):
+    @staticmethod
+    def __create_nested_dict(data):
         """
         Creates a nested dictionary from a dictionary with dotted keys.
 
@@ -128,27 +255,109 @@ class ConfigurationManager:
             current_dict[keys[-1]] = value  # Set the value at the deepest level
         return nested_dict
 
+    @classmethod
+    def decode_configuration(
+        cls, encrypted_configuration: bytes, decryption_key: str
+    ) -> dict:
+        """
+        Decrypts the given configuration using the provided key and then converts it to a nested dictionary.
+        It only uses the class, so that it can be run by another process of the ProcessingPool.
+
+        :param encrypted_configuration: The configuration to decrypt.
+        :param decryption_key: The key to use for decryption.
+        :return: The nested configuration.
+        :raises json.decoder.JSONDecodeError: If the decrypted configuration is not a valid json.
+        """
+        decrypted_configuration = cls.decrypt(decryption_key, encrypted_configuration)
+        try:
+            decrypted_configuration = json.loads(decrypted_configuration)
+            return cls.__create_nested_dict(decrypted_configuration)
+        except json.decoder.JSONDecodeError:
+            raise json.decoder.JSONDecodeError("Not a valid json")
+
+    def decrypt_configuration(
+        self, encrypted_configuration: bytes, decryption_key: str = None
+    ) -> dict:
+        """
+        Decrypts the given configuration using the provided key and then converts it to a nested dictionary.
+        A large configuration is decoded by the ProcessingPool, when it runs processes.
+
+        :param encrypted_configuration: The configuration to decrypt.
+        :param decryption_key: The key to use for decryption. Defaults to the `DECRYPTION_KEY` environment variable.
+        :return: The nested configuration.
+        :raises json.decoder.JSONDecodeError: If the decrypted configuration is not a valid json.
+        """
+        return ProcessingPool().run(
+            "configuration_decryption",
+            self.decode_configuration,
+            encrypted_configuration,
+            decryption_key or os.environ.get("DECRYPTION_KEY"),
+            size=len(encrypted_configuration),
+            portable=True,
+        )
+
+    def __compile(self, configuration: dict) -> tuple[dict, dict]:
+        """
+        Compiles the schemas and the generation profiles of the given configuration.
+
+        :param configuration: The nested configuration.
+        :return: The compiled schemas and profiles.
+        :raises HTTPException: If a schema or a generation profile is invalid.
+        """
+        return self.compile_schemas(configuration), self.compile_profiles(configuration)
+
+    def load_from_store(self):
+        """
+        Loads the configuration from the store (if any), when it is newer than the active one.
+        It is used at startup to get the last accepted configuration back, and to get the configurations set on other workers.
+
+        :return: The published snapshot, or None if there is nothing newer to load.
+        :raises Exception: If the stored configuration can not be decrypted.
+        """
+        if self._store is None:
+            return None
+
+        stored = self._store.read()
+        if stored is None or stored[0] <= self.current_version:
+            return None
+
+        version, encrypted_configuration = stored
+        configuration = self.decrypt_configuration(encrypted_configuration)
+        return self.publish(configuration, version)
+
     async def set_configuration(
         self, encrypted_configuration: bytes, decryption_key: str = None
     ):
         """
         Sets the remote configuration.
-        The configuration is decrypted using the provided key and then converted to a nested dictionary.
+        The configuration is decrypted, converted to a nested dictionary, and its schemas and generation profiles
+        are compiled without holding any lock, by the ProcessingPool when the configuration is large,
+        so that the event loop is not blocked.
+        It is then written in the store (if any) and published as a new snapshot.
 
         :param encrypted_configuration: The configuration to set encrypted.
         :param decryption_key: The key to use for decryption.
+        :return: The published snapshot.
         :raises json.decoder.JSONDecodeError: If the decrypted configuration is not a valid json.
+        :raises HTTPException: If a schema or a generation profile of the configuration is invalid,
+        before it is written in the store.
         """
-        async with self._lock:
-            decryption_key = decryption_key or os.environ.get("DECRYPTION_KEY")
-            decrypted_configuration = self.decrypt(
-                decryption_key, encrypted_configuration
-            )
-            try:
-                decrypted_configuration = json.loads(decrypted_configuration)
-                decrypted_configuration_to_dict = self.__create_nested_dict(
-                    decrypted_configuration
-                )
-            except json.decoder.JSONDecodeError:
-                raise json.decoder.JSONDecodeError("Not a valid json")
-            self._configuration = decrypted_configuration_to_dict
+        pool = ProcessingPool()
+        size = len(encrypted_configuration)
+        configuration = await pool.run_async(
+            "configuration_decryption",
+            self.decode_configuration,
+            encrypted_configuration,
+            decryption_key or os.environ.get("DECRYPTION_KEY"),
+            size=size,
+            portable=True,
+        )
+        schemas, profiles = await pool.run_async(
+            "schema_compilation", self.__compile, configuration, size=size
+        )
+
+        version = None
+        if self._store is not None:
+            version = self._store.write(encrypted_configuration, self._last_version)
+
+        return self.publish(configuration, version, schemas, profiles)
@@ -0,0 +1,51 @@
+from dataclasses import dataclass, field
+
+from src.configuration.generationProfile import GenerationProfile
+
+
+@dataclass(frozen=True)
+class ConfigurationSnapshot:
+    """
+    An immutable version of the configuration.
+
+    A snapshot is never modified once published: a new configuration is published as a new snapshot,
+    with a greater version. So a request reading the snapshot once always sees a consistent configuration.
+
+    The version is a monotonically increasing number, usable in cache keys and metrics.
+    The configuration is the nested dictionary built from the decrypted configuration, and must only be read.
+    The schemas are the JSON schemas of the generated diagrams (`pluginSchemas.<plugin name>`),
+    compiled once when the configuration is published, by plugin name.
+    The profiles are the options of the generations (`generationProfiles.<mode>.<plugin name>`),
+    compiled once when the configuration is published, by mode then plugin name.
+    """
+
+    version: int
+    configuration: dict = field(default_factory=dict)
+    schemas: dict = field(default_factory=dict)
+    profiles: dict = field(default_factory=dict)
+
+    def get_schema(self, plugin_name: str):
+        """
+        Gets the compiled schema of the diagrams of a plugin, or the `default` one.
+
+        Parameters:
+            plugin_name (str): The name of the plugin.
+
+        Returns:
+            JsonSchema: The compiled schema, or None if the plugin has no schema.
+        """
+        return self.schemas.get(plugin_name, self.schemas.get("default"))
+
+    def get_profile(self, plugin_name: str, mode: str) -> GenerationProfile:
+        """
+        Gets the generation profile of a plugin in a mode, or the `default` one of the mode.
+
+        Parameters:
+            plugin_name (str): The name of the plugin.
+            mode (str): The kind of request, "generate" or "message".
+
+        Returns:
+            GenerationProfile: The profile, without any option if none is set.
+        """
+        profiles = self.profiles.get(mode, {})
+        return profiles.get(plugin_name, profiles.get("default", GenerationProfile()))
@@ -0,0 +1,106 @@
+import os
+import fcntl
+from contextlib import contextmanager
+
+
+class ConfigurationStore:
+    """
+    A file storing the last accepted encrypted configuration, shared by all the workers of a host.
+
+    The file holds the version of the configuration (8 bytes, big-endian) followed by the encrypted configuration,
+    so the configuration is never written in clear on the disk. Writes are serialized between processes with a lock
+    file, and the file is replaced atomically, so readers never see a partially written configuration.
+    """
+
+    VERSION_SIZE = 8
+
+    def __init__(self, path: str):
+        """
+        Initializes the ConfigurationStore.
+
+        Parameters:
+            path (str): The path of the file storing the configuration.
+        """
+        self.path = path
+
+    @staticmethod
+    def from_environment():
+        """
+        Creates the store from the `CONFIGURATION_STORE_PATH` environment variable.
+
+        Returns:
+            ConfigurationStore: The store, or None if the variable is not set.
+        """
+        path = os.environ.get("CONFIGURATION_STORE_PATH")
+        return ConfigurationStore(path) if path else None
+
+    @contextmanager
+    def __lock(self):
+        """
+        Holds the inter-process lock of the store for the duration of the `with` block.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def signature(self):
+        """
+        Returns a value that changes every time the file is replaced.
+
+        Returns:
+            tuple: The inode, modification time and size of the file, or None if the file does not exist.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def read(self):
+        """
+        Reads the stored configuration.
+
+        Returns:
+            tuple[int, bytes]: The version and the encrypted configuration, or None if nothing is stored.
+        """
+        try:
+            with open(self.path, "rb") as store_file:
+                content = store_file.read()
+        except FileNotFoundError:
+            return None
+        if len(content) <= self.VERSION_SIZE:
+            return None
+        version = int.from_bytes(content[: self.VERSION_SIZE], "big")
+        return version, content[self.VERSION_SIZE :]
+
+    def write(self, encrypted_configuration: bytes, minimum_version: int = 0) -> int:
+        """
+        Stores the given encrypted configuration, with a version greater than the stored one and the given one.
+
+        Parameters:
+            encrypted_configuration (bytes): The encrypted configuration.
+            minimum_version (int, optional): The version the new one must be greater than (e.g. the active one).
+
+        Returns:
+            int: The version of the stored configuration.
+        """
+        with self.__lock():
+            stored = self.read()
+            version = max(stored[0] if stored else 0, minimum_version) + 1
+
+            temporary_path = f"{self.path}.{os.getpid()}.tmp"
+            descriptor = os.open(
+                temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600
+            )
+            with os.fdopen(descriptor, "wb") as store_file:
+                store_file.write(version.to_bytes(self.VERSION_SIZE, "big"))
+                store_file.write(encrypted_configuration)
+                store_file.flush()
+                os.fsync(store_file.fileno())
+            os.replace(temporary_path, self.path)
+
+        return version
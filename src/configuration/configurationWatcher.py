@@ -0,0 +1,101 @@
+import os
+import threading
+
+from src.configuration.configurationManager import ConfigurationManager
+from src.configuration.configurationStore import ConfigurationStore
+from src.monitoring.Logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ConfigurationWatcher:
+    """
+    Watches the ConfigurationStore, and publishes any newer configuration written by another worker.
+
+    The store is polled every `interval` seconds, so a configuration set on any worker
+    is active on all the workers of the host within this delay.
+    """
+
+    DEFAULT_INTERVAL = 1.0
+
+    def __init__(self, store: ConfigurationStore, interval: float = DEFAULT_INTERVAL):
+        """
+        Initializes the ConfigurationWatcher.
+
+        Parameters:
+            store (ConfigurationStore): The store to watch.
+            interval (float, optional): The delay between two checks of the store, in seconds.
+        """
+        self.store = store
+        self.interval = interval
+        self._signature = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def from_environment():
+        """
+        Creates the watcher of the store defined by the `CONFIGURATION_STORE_PATH` environment variable,
+        polling every `CONFIGURATION_POLL_INTERVAL` seconds.
+
+        Returns:
+            ConfigurationWatcher: The watcher, or None if no store is defined.
+        """
+        store = ConfigurationStore.from_environment()
+        if store is None:
+            return None
+        return ConfigurationWatcher(
+            store,
+            float(
+                os.environ.get(
+                    "CONFIGURATION_POLL_INTERVAL", ConfigurationWatcher.DEFAULT_INTERVAL
+                )
+            ),
+        )
+
+    def poll(self):
+        """
+        Checks the store once, and publishes its configuration if it is newer than the active one.
+
+        Returns:
+            ConfigurationSnapshot: The published snapshot, or None if nothing was published.
+        """
+        signature = self.store.signature()
+        if signature is None or signature == self._signature:
+            return None
+        self._signature = signature
+
+        try:
+            return ConfigurationManager().load_from_store()
+        except Exception:
+            logger.exception(
+                "Failed to load the stored configuration",
+                extra={"fields": {"path": self.store.path}},
+            )
+            return None
+
+    def __run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Failed to check the configuration store")
+
+    def start(self):
+        """
+        Starts watching the store in a background thread.
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self.__run, name="configuration-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops watching the store.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
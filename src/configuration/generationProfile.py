@@ -0,0 +1,93 @@
+import json
+from dataclasses import dataclass
+
+
+class ProfileError(Exception):
+    """
+    Raised when a generation profile is invalid.
+    """
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """
+    The options of the generations of a plugin, in a mode (`generate` or `message`), common to every AI.
+
+    A profile is set as a JSON object, with any of the following options:
+    - `maxOutputTokens`: the maximum number of generated tokens (`num_predict` for Ollama),
+    - `contextSize`: the size of the context window, in tokens (`num_ctx` for Ollama, ignored by Gemini),
+    - `temperature`, `topP` and `topK`: the sampling options.
+
+    The options not set are left to the AI.
+    """
+
+    max_output_tokens: int | None = None
+    context_size: int | None = None
+    temperature: float | None = None
+    top_p: float | None = None
+    top_k: int | None = None
+
+    # Setting name: (attribute, type, Ollama option, Gemini option)
+    OPTIONS = {
+        "maxOutputTokens": ("max_output_tokens", int, "num_predict", "maxOutputTokens"),
+        "contextSize": ("context_size", int, "num_ctx", None),
+        "temperature": ("temperature", float, "temperature", "temperature"),
+        "topP": ("top_p", float, "top_p", "topP"),
+        "topK": ("top_k", int, "top_k", "topK"),
+    }
+
+    @classmethod
+    def from_json(cls, value: str | dict) -> "GenerationProfile":
+        """
+        Creates a profile from its JSON object.
+
+        Parameters:
+            value (str | dict): The JSON object, or its string.
+
+        Returns:
+            GenerationProfile: The profile.
+
+        Raises:
+            ProfileError: If the value is not a JSON object, or if an option is unknown or invalid.
+        """
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except json.JSONDecodeError as e:
+                raise ProfileError(f"Invalid JSON: {e}")
+        if not isinstance(value, dict):
+            raise ProfileError("The profile must be a JSON object")
+
+        attributes = {}
+        for name, option in value.items():
+            if name not in cls.OPTIONS:
+                raise ProfileError(f"Unknown option {name}")
+            attribute, option_type = cls.OPTIONS[name][:2]
+            try:
+                option = option_type(option)
+            except (TypeError, ValueError):
+                raise ProfileError(f"The option {name} must be a number")
+            if option < 0:
+                raise ProfileError(f"The option {name} must be positive")
+            attributes[attribute] = option
+
+        return cls(**attributes)
+
+    def __get_options(self, index: int) -> dict:
+        return {
+            option[index]: getattr(self, option[0])
+            for option in self.OPTIONS.values()
+            if option[index] is not None and getattr(self, option[0]) is not None
+        }
+
+    def ollama_options(self) -> dict:
+        """
+        Returns the `options` of an Ollama request.
+        """
+        return self.__get_options(2)
+
+    def gemini_config(self) -> dict:
+        """
+        Returns the options of the `generationConfig` of a Gemini request.
+        """
+        return self.__get_options(3)
@@ -1,11 +1,45 @@
 import os
 import json
+import math
+import time
 import inspect
+import requests
 from abc import ABC, abstractmethod
+from contextlib import closing
+from http import HTTPStatus
+from typing import Any, Callable, Iterator
+
+from fastapi import HTTPException
+from fastapi.responses import Response
 
 from src.configuration.configurationManager import ConfigurationManager
+from src.configuration.configurationSnapshot import ConfigurationSnapshot
+from src.configuration.generationProfile import GenerationProfile
+from src.concurrency.Cancellation import check_disconnected, client_disconnected
+from src.concurrency.Deadline import check_deadline, deadline_exceeded, remaining_time
+from src.handlers.UpstreamSession import (
+    UpstreamCall,
+    upstream_connections,
+    upstream_deadlines,
+    upstream_session,
+)
 from src.models.Diagram import Diagram
 from src.models.Message import Message
+from src.monitoring.Logger import get_logger
+from src.monitoring.Metrics import (
+    ABANDONED_GENERATIONS,
+    ERRORS,
+    GENERATION_DURATION,
+    UPSTREAM_TIME_TO_FIRST_BYTE,
+)
+from src.monitoring.RequestContext import RequestContext, timed_phase
+from src.validation.DiagramStreamValidator import (
+    DiagramStreamValidator,
+    InvalidOutputError,
+)
+from src.validation.JsonSchema import JsonSchema, ValidationError
+
+logger = get_logger(__name__)
 
 
 class BaseHandler(ABC):
@@ -13,6 +47,10 @@ class BaseHandler(ABC):
     Base class for all handler classes.
     """
 
+    DEFAULT_CONNECT_TIMEOUT = 10
+    DEFAULT_FIRST_BYTE_TIMEOUT = 300
+    DEFAULT_TOTAL_TIMEOUT = 900
+
     def __init__(self, ai_name: str):
         """
         Initializes the BaseHandler by setting the `configuration` from the user configuration.
@@ -22,9 +60,393 @@ class BaseHandler(ABC):
         """
         self.ai_name = ai_name
         self.configuration = None
+        self.configuration_version = None
+        self.snapshot = None
+
+    def initialize_configuration(self, snapshot: ConfigurationSnapshot = None):
+        """
+        Sets the `configuration` of the handler from a configuration snapshot.
+
+        Parameters:
+            snapshot (ConfigurationSnapshot, optional): The snapshot to read the configuration from.
+            If None, the current snapshot is used.
+        """
+        snapshot = snapshot or ConfigurationManager().get_snapshot()
+        self.configuration = snapshot.configuration[self.ai_name]
+        self.configuration_version = snapshot.version
+        self.snapshot = snapshot
+
+    def get_schema(self, plugin_name: str) -> JsonSchema | None:
+        """
+        Returns the compiled JSON schema of the diagrams of a plugin, set in the configuration.
+
+        Parameters:
+            plugin_name (str): The name of the plugin.
+
+        Returns:
+            JsonSchema: The schema, or None if the plugin has no schema.
+        """
+        if self.snapshot is None:
+            return None
+        return self.snapshot.get_schema(plugin_name)
+
+    def get_profile(self, plugin_name: str, mode: str) -> GenerationProfile:
+        """
+        Returns the generation profile of a plugin in a mode, set in the configuration.
+
+        Parameters:
+            plugin_name (str): The name of the plugin.
+            mode (str): The kind of request, "generate" or "message".
+
+        Returns:
+            GenerationProfile: The profile, without any option if none is set.
+        """
+        if self.snapshot is None:
+            return GenerationProfile()
+        return self.snapshot.get_profile(plugin_name, mode)
+
+    def get_timeouts(self) -> dict:
+        """
+        Returns the timeouts of the calls to the AI, set in the `timeouts` settings of the handler, in seconds.
+        A timeout set to 0 disables it, and an invalid timeout (not a positive number) is replaced by its default.
+
+        Returns:
+            dict: The `connect`, `firstByte` and `total` timeouts, None if disabled.
+        """
+        timeouts = (self.configuration or {}).get("timeouts", {})
+        defaults = {
+            "connect": self.DEFAULT_CONNECT_TIMEOUT,
+            "firstByte": self.DEFAULT_FIRST_BYTE_TIMEOUT,
+            "total": self.DEFAULT_TOTAL_TIMEOUT,
+        }
+        values = {}
+        for name, default in defaults.items():
+            value = timeouts.get(name)
+            try:
+                timeout = float(default if value in (None, "") else value)
+            except (TypeError, ValueError):
+                timeout = math.nan
+            if not math.isfinite(timeout) or timeout < 0:
+                logger.warning(
+                    "Invalid timeout of the AI, using the default one",
+                    extra={
+                        "fields": {
+                            "handler": self.ai_name,
+                            "timeout": name,
+                            "value": str(value),
+                        }
+                    },
+                )
+                timeout = default
+            values[name] = float(timeout) or None
+        return values
+
+    def validate_diagram(self, plugin_name: str, diagram):
+        """
+        Validates a generated diagram against the JSON schema of its plugin, if it has one.
+
+        Parameters:
+            plugin_name (str): The name of the plugin.
+            diagram: The parsed diagram.
+
+        Raises:
+            HTTPException: If the diagram does not match the schema.
+        """
+        schema = self.get_schema(plugin_name)
+        if schema is None:
+            return
+
+        try:
+            with timed_phase("validate"):
+                schema.validate(diagram)
+        except ValidationError as e:
+            ERRORS.inc(handler=self.ai_name, type="schema_mismatch")
+            raise HTTPException(
+                status_code=530,
+                detail=f"The generated diagram does not match the schema of the plugin: {e}",
+            )
+
+    def send_request(
+        self, url: str, model: str, plugin_name: str, mode: str, **kwargs
+    ) -> requests.Response:
+        """
+        Sends a POST request to the AI, through the shared upstream session, and records its latency and errors.
+        The ID of the request being processed is given to the AI in the `X-Request-ID` header.
+
+        With `stream=True`, the function returns as soon as the headers are received,
+        and the duration of the generation is recorded by `iter_lines` once the response is read.
+
+        The call is bounded by the `timeouts` of the handler and by the deadline of the request:
+        it is not sent if the deadline has expired, and its connection is shut down when the total timeout
+        or the deadline expires, even while the response is streamed.
+        Likewise, the call is not sent if the client of the request disconnected, and is cancelled if it disconnects
+        while the call is running, which stops the generation.
+
+        Parameters:
+            url (str): The url to send the request to.
+            model (str): The name of the model targeted by the request.
+            plugin_name (str): The name of the plugin the request is made for.
+            mode (str): The kind of request (for instance "generate", "message" or "create").
+            **kwargs: The arguments given to `requests.Session.post`.
+
+        Returns:
+            requests.Response: The response of the AI.
+
+        Raises:
+            HTTPException: If the request was cancelled because the proxy is shutting down,
+            if it timed out or its deadline expired, if its client disconnected,
+            or with a 502 status code if there is an error while making the API request.
+        """
+        context = RequestContext.current()
+        if context is not None:
+            kwargs["headers"] = {
+                **kwargs.get("headers", {}),
+                RequestContext.REQUEST_ID_HEADER: context.request_id,
+            }
+
+        check_deadline(self.ai_name)
+        check_disconnected(self.ai_name)
+        timeouts = self.get_timeouts()
+        limits = [
+            limit
+            for limit in (timeouts["total"], remaining_time())
+            if limit is not None
+        ]
+        total = min(limits) if limits else None
+        first_byte = timeouts["firstByte"]
+        if total is not None:
+            first_byte = min(first_byte, total) if first_byte else total
+        kwargs.setdefault("timeout", (timeouts["connect"], first_byte))
+
+        start = time.perf_counter()
+        call = UpstreamCall(start + total if total is not None else None)
+        if call.deadline is not None:
+            upstream_deadlines.watch(call)
+        if context is not None:
+            context.on_disconnect(lambda: self.__abandon(call, mode))
+        token = call.activate()
+        try:
+            with timed_phase("upstream"):
+                response = upstream_session.post(url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            call.finish()
+            self.__raise_call_error(e, call)
+        finally:
+            UpstreamCall.deactivate(token)
+
+        if kwargs.get("stream"):
+            # The call goes on while the response is read, see `iter_lines`
+            response.upstream_call = call
+        else:
+            call.finish()
+
+        UPSTREAM_TIME_TO_FIRST_BYTE.observe(
+            response.elapsed.total_seconds(), handler=self.ai_name, model=model
+        )
+        if not kwargs.get("stream"):
+            GENERATION_DURATION.observe(
+                time.perf_counter() - start,
+                handler=self.ai_name,
+                model=model,
+                plugin=plugin_name,
+                mode=mode,
+            )
+        if not response.ok:
+            ERRORS.inc(handler=self.ai_name, type=f"http_{response.status_code}")
+
+        return response
+
+    def __abandon(self, call: UpstreamCall, mode: str):
+        """
+        Cancels a call whose client disconnected, and counts it if it was still running.
+
+        Parameters:
+            call (UpstreamCall): The call.
+            mode (str): The kind of request.
+        """
+        if call.abandon():
+            ABANDONED_GENERATIONS.inc(handler=self.ai_name, mode=mode)
+
+    def __raise_call_error(
+        self, error: requests.exceptions.RequestException, call: UpstreamCall
+    ):
+        """
+        Counts a failed call to the AI, and raises the error to answer the request with.
+
+        Parameters:
+            error (requests.exceptions.RequestException): The error of the call.
+            call (UpstreamCall): The call, or None if unknown.
+
+        Raises:
+            HTTPException: If the call was cancelled because the proxy is shutting down or the client disconnected,
+            if it timed out, or with a 502 status code if it failed otherwise.
+        """
+        if call is not None and call.abandoned:
+            raise client_disconnected(self.ai_name)
+        if upstream_connections.cancelled:
+            ERRORS.inc(handler=self.ai_name, type=error.__class__.__name__)
+            raise HTTPException(
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                detail="The request was cancelled because the proxy is shutting down.",
+            )
+        if (call is not None and call.expired) or isinstance(
+            error, requests.exceptions.Timeout
+        ):
+            raise deadline_exceeded(
+                f"The {self.ai_name} API did not answer in time.", self.ai_name
+            )
+        ERRORS.inc(handler=self.ai_name, type=error.__class__.__name__)
+        logger.warning(
+            "Failed to call the AI",
+            extra={"fields": {"handler": self.ai_name, "error": str(error)}},
+        )
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_GATEWAY,
+            detail=f"Failed to call the {self.ai_name} API: {error.__class__.__name__}",
+        )
+
+    def iter_lines(
+        self, response, model: str, plugin_name: str, mode: str
+    ) -> Iterator[bytes]:
+        """
+        Yields the lines of a streamed response of the AI as they arrive, then records the duration of the generation.
+        The response is closed when the iteration ends, even if it is interrupted.
+
+        Parameters:
+            response (requests.Response): The response, sent with `stream=True`.
+            model (str): The name of the model targeted by the request.
+            plugin_name (str): The name of the plugin the request is made for.
+            mode (str): The kind of request.
+
+        Returns:
+            Iterator[bytes]: The lines of the response.
+        """
+        start = time.perf_counter() - response.elapsed.total_seconds()
+        call = getattr(response, "upstream_call", None)
+        try:
+            yield from response.iter_lines()
+        except requests.exceptions.RequestException as e:
+            self.__raise_call_error(e, call)
+        finally:
+            response.close()
+            if call is not None:
+                call.finish()
+
+        GENERATION_DURATION.observe(
+            time.perf_counter() - start,
+            handler=self.ai_name,
+            model=model,
+            plugin=plugin_name,
+            mode=mode,
+        )
+
+    def check_response(self, response):
+        """
+        Checks the status of a response of the AI, before reading it.
+
+        Parameters:
+            response (requests.Response): The response, streamed or not.
+
+        Raises:
+            HTTPException: If the AI answered with an error.
+        """
+        if not response.ok:
+            detail = response.text
+            response.close()
+            raise HTTPException(
+                status_code=HTTPStatus.BAD_GATEWAY,
+                detail=f"Error {response.status_code} from the AI: {detail}",
+            )
+
+    def stream_diagram(
+        self,
+        stream_text: Callable[[], Iterator[tuple[str, int]]],
+        parse: Callable[[str], Any],
+        mode: str = "json",
+        max_tokens: int = None,
+    ) -> Iterator[dict]:
+        """
+        Streams the generation of a diagram, checking the generated text as it arrives.
 
-    def initialize_configuration(self):
-        self.configuration = ConfigurationManager().get_configuration()[self.ai_name]
+        As soon as the text can no longer hold a valid diagram (see `DiagramStreamValidator`), the upstream response
+        is closed, which stops the generation. The generation is then started again up to `STREAM_RETRIES` times,
+        after a `{"type": "retry", "reason": ...}` event telling the client to drop the text received so far.
+        The generation is also stopped when it exceeds the `maxOutputTokens` of its profile, even if the AI ignores it.
+
+        Parameters:
+            stream_text (Callable[[], Iterator[tuple[str, int]]]): Starts a generation, returning the parts of the
+            generated text with their number of tokens, as counted by the AI.
+            parse (Callable[[str], Any]): Parses the whole generated text into the diagram.
+            mode (str): The mode of the validator, `json`, `fenced` or `text`.
+            max_tokens (int, optional): The maximum number of tokens of the generated text.
+
+        Returns:
+            Iterator[dict]: The token events, then the done event with the parsed diagram.
+
+        Raises:
+            HTTPException: If the last generation was aborted.
+        """
+        retries = int(os.environ.get("STREAM_RETRIES", 0))
+
+        for attempt in range(retries + 1):
+            validator = DiagramStreamValidator.from_environment(mode, max_tokens)
+            parts = []
+            try:
+                with closing(stream_text()) as texts:
+                    for text, tokens in texts:
+                        validator.feed(text, tokens)
+                        parts.append(text)
+                        yield {"type": "token", "text": text}
+            except InvalidOutputError as e:
+                ERRORS.inc(handler=self.ai_name, type="aborted_generation")
+                if attempt < retries:
+                    yield {"type": "retry", "reason": str(e)}
+                    continue
+                raise HTTPException(
+                    status_code=530,
+                    detail=f"The generation was aborted after {validator.tokens} tokens: {e}",
+                )
+
+            yield {"type": "done", "response": parse("".join(parts))}
+            return
+
+    def collect_diagram(self, events: Iterator[dict]):
+        """
+        Runs a generation streamed by `stream_diagram` to its end, for the requests answered at once.
+        The generation is checked as it arrives all the same, and stopped as soon as its output is invalid.
+
+        Parameters:
+            events (Iterator[dict]): The events of `stream_diagram`.
+
+        Returns:
+            The parsed diagram.
+
+        Raises:
+            HTTPException: If the last generation was aborted.
+        """
+        with closing(events):
+            for event in events:
+                if event["type"] == "done":
+                    return event["response"]
+
+    def check_output_tokens(self, tokens: int, max_tokens: int = None):
+        """
+        Checks the number of tokens of a generated answer against the `maxOutputTokens` of its profile,
+        for the generations whose output is not checked by `stream_diagram`, like the messages.
+
+        Parameters:
+            tokens (int): The number of tokens of the answer received so far, as counted by the AI.
+            max_tokens (int, optional): The maximum number of tokens of the answer.
+
+        Raises:
+            HTTPException: If the answer exceeds the maximum number of tokens.
+        """
+        if max_tokens is not None and tokens > max_tokens:
+            ERRORS.inc(handler=self.ai_name, type="aborted_generation")
+            raise HTTPException(
+                status_code=530,
+                detail=f"The generation was aborted after {tokens} tokens: The output exceeds {max_tokens} tokens",
+            )
 
     @abstractmethod
     def initialize(self):
@@ -54,6 +476,55 @@ class BaseHandler(ABC):
         """
         pass
 
+    def generate_stream(self, diagram: Diagram) -> Iterator[dict]:
+        """
+        Generates code based on the provided `diagram` object, yielding the generated text as it arrives.
+
+        The events are `{"type": "token", "text": ...}` for every part of the generated text,
+        then `{"type": "done", "response": ...}` with the parsed diagram.
+        Handlers that cannot stream only yield the last event, once the diagram is generated.
+
+        Parameters:
+            diagram (Diagram): The diagram object containing the description of the diagram to generate.
+
+        Returns:
+            Iterator[dict]: The events of the generation.
+        """
+        yield {"type": "done", "response": self.__get_content(self.generate(diagram))}
+
+    def send_message_stream(self, message: Message) -> Iterator[dict]:
+        """
+        Sends a message to the AI, yielding the answer as it arrives.
+
+        The events are `{"type": "token", "text": ...}` for every part of the answer,
+        then `{"type": "done", "message": ..., "context": ...}` with the whole answer and the new context.
+        Handlers that cannot stream only yield the last event, once the answer is received.
+
+        Parameters:
+            message (Message): The message object containing the message to send to the AI.
+
+        Returns:
+            Iterator[dict]: The events of the answer.
+        """
+        yield {
+            "type": "done",
+            **self.__get_content(self.send_message(message=message)),
+        }
+
+    def __get_content(self, response):
+        """
+        Returns the content of a response of `generate` or `send_message`.
+
+        Parameters:
+            response: The response, either a `Response` with a JSON body or the content itself.
+
+        Returns:
+            The content of the response.
+        """
+        if isinstance(response, Response):
+            return json.loads(response.body)
+        return response
+
     def get_configuration_description(self, file_name: str = None):
         """
         Returns the description of the configuration fields that are used by the handler.
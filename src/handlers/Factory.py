@@ -1,22 +1,66 @@
+from http import HTTPStatus
+
+from fastapi import HTTPException
+
 from src.configuration.configurationManager import ConfigurationManager
-from src.handlers.Ollama.OllamaHandler import OllamaHandler
-from src.handlers.Gemini.GeminiHandler import GeminiHandler
+from src.handlers.HandlerRegistry import HandlerRegistry
+from src.monitoring.RequestContext import timed_phase
 
 
 class Factory:
     """
     Factory class for handling adequate handler objects.
+
+    Handlers are resolved by name through the HandlerRegistry, so only the modules of the
+    handlers actually used are imported.
     """
 
+    @staticmethod
+    def create_handler(handler_name: str):
+        """
+        Creates a new handler object, importing its module on first use.
+
+        Parameters:
+            handler_name (str): The name of the handler, as registered in the HandlerRegistry.
+
+        Returns:
+            BaseHandler: The new handler object.
+
+        Raises:
+            HTTPException: If no handler is registered under this name.
+        """
+        try:
+            handler_class = HandlerRegistry.get_handler_class(handler_name)
+        except KeyError:
+            raise HTTPException(
+                status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+                detail=f"Unknown handler: {handler_name}",
+            )
+        return handler_class()
+
     @staticmethod
     def get_all_handlers():
         """
-        Retrieves all the names of the handlers that are available.
+        Retrieves all the handlers that are available.
+        This imports every registered handler, so it should only be used when all of them are needed.
 
         Returns:
             dict: A dictionary with the handler names as keys and the handler objects as values.
         """
-        return {"ollama": OllamaHandler(), "gemini": GeminiHandler()}
+        return {name: Factory.create_handler(name) for name in HandlerRegistry.names()}
+
+    @staticmethod
+    def get_configured_handler_names(configuration: dict) -> list[str]:
+        """
+        Retrieves the names of the registered handlers that are referenced by the configuration.
+
+        Parameters:
+            configuration (dict): The configuration.
+
+        Returns:
+            list[str]: The names of the handlers having a configuration section.
+        """
+        return [name for name in HandlerRegistry.names() if name in configuration]
 
     @staticmethod
     def get_handler(plugin_name: str):
@@ -30,18 +74,20 @@ class Factory:
             OllamaHandler: The handler object for the specified plugin name, or None if the plugin name is not found or the configuration value is not "ollama".
         """
 
-        configuration_manager = ConfigurationManager()
+        with timed_phase("handler"):
+            configuration_manager = ConfigurationManager()
 
-        # Retrieve the configuration after ensuring it is set
-        configuration = configuration_manager.get_configuration()
+            # Retrieve the configuration snapshot once, after ensuring it is set
+            snapshot = configuration_manager.get_snapshot()
+            configuration = snapshot.configuration
 
-        handler_name = (
-            configuration.get("plugin", {}).get("preferences", {}).get(plugin_name)
-            or configuration.get("plugin", {}).get("preferences", {}).get("default")
-            or "ollama"
-        )
-        handler = Factory.get_all_handlers().get(handler_name)
-        handler.initialize_configuration()
+            handler_name = (
+                configuration.get("plugin", {}).get("preferences", {}).get(plugin_name)
+                or configuration.get("plugin", {}).get("preferences", {}).get("default")
+                or "ollama"
+            )
+            handler = Factory.create_handler(handler_name)
+            handler.initialize_configuration(snapshot)
 
         return handler
 
@@ -49,6 +95,7 @@ class Factory:
     def initialize_models(handlers: set[str] | None = None):
         """
         Initializes all the models defined in the configuration file.
+        Without given handlers, only the handlers having a section in the configuration are initialized.
 
         Parameters:
             handlers (set[str] | None, optional): The handler names to initialize. Defaults to None.
@@ -58,11 +105,14 @@ class Factory:
             for handler in handlers:
                 handler_instance = Factory.get_handler(handler)
                 if handler_instance:
-                    handler_instance.initialize_configuration()
                     responses.append(handler_instance.initialize())
         else:
-            for handler_instance in Factory.get_all_handlers().values():
-                handler_instance.initialize_configuration()
+            snapshot = ConfigurationManager().get_snapshot()
+            for handler_name in Factory.get_configured_handler_names(
+                snapshot.configuration
+            ):
+                handler_instance = Factory.create_handler(handler_name)
+                handler_instance.initialize_configuration(snapshot)
                 responses.append(handler_instance.initialize())
         return responses
 
@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+
+
+@dataclass(frozen=True)
+class Conversation:
+    """
+    A Gemini conversation.
+
+    The prefix is the stable beginning of the conversation (the files it is about), sent once to
+    the context-caching API when `cached_content` is set, and inline with every turn otherwise.
+    The history holds the turns of the conversation, in the Gemini `contents` format.
+    The cached content belongs to the project of the API key that created it, whose ID is `key_id` (see `KeyPool`).
+    """
+
+    conversation_id: str
+    plugin_name: str
+    prefix: str = None
+    cached_content: str = None
+    cache_expires_at: float = None
+    history: list = field(default_factory=list)
+    key_id: str = None
+
+
+class ConversationStore:
+    """
+    A Singleton class keeping the Gemini conversations server-side.
+
+    Conversations are kept in a SQLite database, in memory by default, or in the
+    `GEMINI_CONVERSATION_STORE_PATH` file so that all the workers share them.
+    Conversations unused for `GEMINI_CONVERSATION_TTL` seconds are removed.
+    """
+
+    _instance = None
+
+    DEFAULT_TTL = 3600
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Create the unique instance of the class, opening the database given by the environment.
+
+        Returns:
+            ConversationStore: The unique instance of the class.
+        """
+        if not cls._instance:
+            cls._instance = super().__new__(cls)
+            cls._instance.ttl = float(
+                os.environ.get("GEMINI_CONVERSATION_TTL", cls.DEFAULT_TTL)
+            )
+            cls._instance._lock = threading.Lock()
+            cls._instance._connection = cls._instance.__connect(
+                os.environ.get("GEMINI_CONVERSATION_STORE_PATH", ":memory:")
+            )
+        return cls._instance
+
+    def reset(cls):
+        """
+        Resets the class by setting the `_instance` attribute to `None`.
+
+        Parameters:
+            cls (type): The class object.
+        """
+        type(cls)._instance = None
+
+    def __connect(self, path: str) -> sqlite3.Connection:
+        """
+        Opens the database and creates its tables if needed.
+
+        Parameters:
+            path (str): The path of the database file, or ":memory:".
+
+        Returns:
+            sqlite3.Connection: The connection to the database, shared by all the threads.
+        """
+        connection = sqlite3.connect(
+            path, timeout=10, check_same_thread=False, isolation_level=None
+        )
+        if path != ":memory:":
+            connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                conversation_id TEXT PRIMARY KEY,
+                plugin_name TEXT NOT NULL,
+                prefix TEXT,
+                cached_content TEXT,
+                cache_expires_at REAL,
+                updated_at REAL NOT NULL,
+                key_id TEXT
+            );
+            CREATE TABLE IF NOT EXISTS turns (
+                conversation_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (conversation_id, position)
+            );
+            CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at);
+            """
+        )
+        return connection
+
+    def create(
+        self,
+        plugin_name: str,
+        prefix: str = None,
+        cached_content: str = None,
+        cache_expires_at: float = None,
+        key_id: str = None,
+    ) -> Conversation:
+        """
+        Creates a new conversation, and removes the expired ones.
+
+        Parameters:
+            plugin_name (str): The name of the plugin the conversation is about.
+            prefix (str, optional): The stable beginning of the conversation.
+            cached_content (str, optional): The name of the Gemini cached content holding the prefix.
+            cache_expires_at (float, optional): The expiration time of the cached content, as a timestamp.
+            key_id (str, optional): The ID of the API key that created the cached content.
+
+        Returns:
+            Conversation: The new conversation.
+        """
+        conversation = Conversation(
+            uuid.uuid4().hex,
+            plugin_name,
+            prefix,
+            cached_content,
+            cache_expires_at,
+            key_id=key_id,
+        )
+        now = time.time()
+        with self._lock:
+            self.__purge(now)
+            self._connection.execute(
+                "INSERT INTO conversations (conversation_id, plugin_name, prefix, cached_content, "
+                "cache_expires_at, updated_at, key_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    conversation.conversation_id,
+                    plugin_name,
+                    prefix,
+                    cached_content,
+                    cache_expires_at,
+                    now,
+                    key_id,
+                ),
+            )
+        return conversation
+
+    def get(self, conversation_id: str) -> Conversation | None:
+        """
+        Retrieves a conversation with its history.
+
+        Parameters:
+            conversation_id (str): The ID of the conversation.
+
+        Returns:
+            Conversation | None: The conversation, or None if it does not exist or has expired.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT plugin_name, prefix, cached_content, cache_expires_at, updated_at, key_id "
+                "FROM conversations WHERE conversation_id = ?",
+                (conversation_id,),
+            ).fetchone()
+            if row is None or row[4] < time.time() - self.ttl:
+                return None
+            turns = self._connection.execute(
+                "SELECT content FROM turns WHERE conversation_id = ? ORDER BY position",
+                (conversation_id,),
+            ).fetchall()
+
+        return Conversation(
+            conversation_id,
+            row[0],
+            row[1],
+            row[2],
+            row[3],
+            [json.loads(turn[0]) for turn in turns],
+            row[5],
+        )
+
+    def set_cache(
+        self,
+        conversation_id: str,
+        cached_content: str,
+        cache_expires_at: float,
+        key_id: str = None,
+    ):
+        """
+        Sets the Gemini cached content holding the prefix of a conversation.
+
+        Parameters:
+            conversation_id (str): The ID of the conversation.
+            cached_content (str): The name of the cached content, or None if the prefix is not cached.
+            cache_expires_at (float): The expiration time of the cached content, as a timestamp.
+            key_id (str, optional): The ID of the API key that created the cached content.
+        """
+        with self._lock:
+            self._connection.execute(
+                "UPDATE conversations SET cached_content = ?, cache_expires_at = ?, key_id = ? "
+                "WHERE conversation_id = ?",
+                (cached_content, cache_expires_at, key_id, conversation_id),
+            )
+
+    def add_turns(self, conversation_id: str, turns: list[dict]):
+        """
+        Appends turns to the history of a conversation, and marks it as used.
+
+        Parameters:
+            conversation_id (str): The ID of the conversation.
+            turns (list[dict]): The turns, in the Gemini `contents` format.
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                (position,) = self._connection.execute(
+                    "SELECT COUNT(*) FROM turns WHERE conversation_id = ?",
+                    (conversation_id,),
+                ).fetchone()
+                self._connection.executemany(
+                    "INSERT INTO turns VALUES (?, ?, ?)",
+                    [
+                        (conversation_id, position + index, json.dumps(turn))
+                        for index, turn in enumerate(turns)
+                    ],
+                )
+                self._connection.execute(
+                    "UPDATE conversations SET updated_at = ? WHERE conversation_id = ?",
+                    (time.time(), conversation_id),
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def __purge(self, now: float):
+        """
+        Removes the conversations unused for longer than the TTL.
+
+        Parameters:
+            now (float): The current time, as a timestamp.
+        """
+        limit = now - self.ttl
+        self._connection.execute(
+            "DELETE FROM turns WHERE conversation_id IN "
+            "(SELECT conversation_id FROM conversations WHERE updated_at < ?)",
+            (limit,),
+        )
+        self._connection.execute(
+            "DELETE FROM conversations WHERE updated_at < ?", (limit,)
+        )
@@ -1,14 +1,31 @@
 import os
-import requests
 import json
+import math
 import re
+import time
+from contextlib import closing
+from http import HTTPStatus
+from typing import Iterator
 
 from fastapi import HTTPException
 from fastapi.responses import JSONResponse
 
-from src.models.Message import Message
+from src.models.Message import FileModel, Message
 from src.models.Diagram import Diagram
+from src.concurrency.ProcessingPool import ProcessingPool
 from src.handlers.BaseHandler import BaseHandler
+from src.handlers.Gemini.ConversationStore import Conversation, ConversationStore
+from src.handlers.Gemini.KeyPool import KeyPool
+from src.monitoring.Logger import get_logger
+from src.monitoring.Metrics import (
+    CACHED_PROMPT_TOKENS,
+    ERRORS,
+    OUTPUT_TOKENS,
+    PROMPT_TOKENS,
+)
+from src.monitoring.RequestContext import timed_phase
+
+logger = get_logger(__name__)
 
 
 class GeminiHandler(BaseHandler):
@@ -17,9 +34,27 @@ class GeminiHandler(BaseHandler):
 
     This class is used to generate code using the Gemini API.
 
-    Note: Gemini does not handle context as we want, so chats with a context is not supported.
+    Conversations are kept server-side in the ConversationStore, the context returned to the client
+    being the ID of the conversation. The files of a conversation, with the system instruction, are sent
+    once to the Gemini context-caching API when they are large enough, so that the next turns do not send them again.
     """
 
+    DEFAULT_CACHE_MIN_TOKENS = 4096
+    DEFAULT_CACHE_TTL = 3600
+
+    # A cached content expiring sooner is created again before being used
+    CACHE_REFRESH_MARGIN = 60
+
+    # Rough number of characters per token, to decide whether a prefix is large enough to be cached
+    CHARACTERS_PER_TOKEN = 4
+
+    # Status codes of a request whose cached content no longer exists (expired, deleted, or of another project)
+    CACHE_GONE_STATUSES = (
+        HTTPStatus.BAD_REQUEST,
+        HTTPStatus.FORBIDDEN,
+        HTTPStatus.NOT_FOUND,
+    )
+
     def __init__(self):
         """
         Initializes the GeminiHandler by setting the `configuration` from the user configuration.
@@ -34,22 +69,37 @@ class GeminiHandler(BaseHandler):
         """
         return [{"status": "success"}]
 
-    def __send_request_with_system_instructions(
-        self, plugin_name: str, text: str, instruction: str = "generate"
-    ):
+    def __get_model_name(self):
         """
-        Sends a request to the Gemini API to generate code based on the provided plugin name and text.
+        Returns the name of the Gemini model, extracted from the configured url.
 
-        Parameters:
-            plugin_name (str): The name of the plugin to use for code generation.
-            text (str): The text to use as input for code generation.
-            instruction (str, optional): The instruction type of request to send. Defaults to "generate".
+        Returns:
+            str: The name of the model (e.g `gemini-1.5-flash-latest`), or "gemini" if it is not in the url.
+        """
+        model_match = re.search(r"models/([^:/]+)", self.configuration["base_url"])
+        return model_match.group(1) if model_match else "gemini"
+
+    def __get_api_root(self):
+        """
+        Returns the root of the Gemini API, extracted from the configured url.
 
         Returns:
-            JSONResponse: The generated code from the Gemini API.
+            str: The root of the API (e.g `https://generativelanguage.googleapis.com/v1beta`), or None if it is not in the url.
+        """
+        root_match = re.match(r"(.+)/models/[^/]+$", self.configuration["base_url"])
+        return root_match.group(1) if root_match else None
+
+    def __get_system_instruction(self, plugin_name: str, instruction: str) -> dict:
         """
+        Returns the system instruction configured for the plugin, or the default one.
 
-        body = {}
+        Parameters:
+            plugin_name (str): The name of the plugin.
+            instruction (str): The instruction type, "generate" or "message".
+
+        Returns:
+            dict: The system instruction, in the Gemini format.
+        """
         if plugin_name in self.configuration["system_instruction"][instruction]:
             instruction_description = self.configuration["system_instruction"][
                 instruction
@@ -59,25 +109,486 @@ class GeminiHandler(BaseHandler):
                 instruction
             ]["default"]
 
-        instruction_description = json.loads(instruction_description)
-        body.update(instruction_description)
+        return json.loads(instruction_description)
 
-        body["contents"] = {"parts": {"text": f"{text}"}}
-        body["generationConfig"] = {"response_mime_type": "application/json"}
+    def __record_usage(self, model: str, plugin_name: str, usage: dict):
+        """
+        Records the token usage returned by the Gemini API.
 
-        query_params = {"key": self.configuration["key"]}
-        response = requests.post(
-            f"{self.configuration['base_url']}",
-            json=body,
-            params=query_params,
+        Parameters:
+            model (str): The name of the model.
+            plugin_name (str): The name of the plugin the request was made for.
+            usage (dict): The `usageMetadata` of the response.
+        """
+        PROMPT_TOKENS.inc(
+            usage.get("promptTokenCount", 0),
+            handler="gemini",
+            model=model,
+            plugin=plugin_name,
         )
+        CACHED_PROMPT_TOKENS.inc(
+            usage.get("cachedContentTokenCount", 0),
+            handler="gemini",
+            model=model,
+            plugin=plugin_name,
+        )
+        OUTPUT_TOKENS.inc(
+            usage.get("candidatesTokenCount", 0),
+            handler="gemini",
+            model=model,
+            plugin=plugin_name,
+        )
+
+    def __get_generation_config(self, plugin_name: str, instruction: str) -> dict:
+        """
+        Returns the generation configuration of a request: the answer is always JSON,
+        and a generated diagram must match the schema of its plugin, if it has one.
+        The options of the generation profile of the plugin are added.
 
-        return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+        Parameters:
+            plugin_name (str): The name of the plugin the request is made for.
+            instruction (str): The instruction type of request to send.
+
+        Returns:
+            dict: The `generationConfig` of the request body.
+        """
+        config = {
+            "response_mime_type": "application/json",
+            **self.get_profile(plugin_name, instruction).gemini_config(),
+        }
+
+        schema = self.get_schema(plugin_name) if instruction == "generate" else None
+        if schema is not None:
+            config["response_schema"] = schema.openapi_schema
+
+        return config
+
+    def __post(
+        self,
+        url: str,
+        model: str,
+        plugin_name: str,
+        mode: str,
+        body: dict,
+        params: dict = None,
+        key_id: str = None,
+        stream: bool = False,
+    ):
+        """
+        Sends a request to the Gemini API with a key of the pool (see `KeyPool`).
+
+        A key answered with a 429 status code is parked, and the request is sent again with another key,
+        until every key was tried once.
+
+        Parameters:
+            url (str): The url to send the request to.
+            model (str): The name of the model targeted by the request.
+            plugin_name (str): The name of the plugin the request is made for.
+            mode (str): The kind of request.
+            body (dict): The body of the request.
+            params (dict, optional): The query parameters of the request, without the key.
+            key_id (str, optional): The ID of the key to use if it is available.
+            stream (bool, optional): Whether to stream the response.
+
+        Returns:
+            tuple: The response of the Gemini API, and the ID of the key it was sent with.
+
+        Raises:
+            HTTPException: If every key was answered with a 429 status code, or no key is available in time.
+        """
+        pool = KeyPool.get(self.configuration)
+        estimated_tokens = len(json.dumps(body)) // self.CHARACTERS_PER_TOKEN
+
+        for _ in range(len(pool)):
+            key = pool.acquire(estimated_tokens, key_id)
+            response = self.send_request(
+                url,
+                model,
+                plugin_name,
+                mode,
+                json=body,
+                params={**(params or {}), "key": key.value},
+                stream=stream,
+            )
+            if response.status_code != HTTPStatus.TOO_MANY_REQUESTS:
+                break
+            pool.park(key, response)
+            response.close()
+            key_id = None
+        else:
+            # Every key was answered with a 429 status code
+            raise pool.rate_limited(pool.retry_after(estimated_tokens))
+
+        if response.ok and not stream:
+            pool.record_usage(
+                key,
+                estimated_tokens,
+                response.json()
+                .get("usageMetadata", {})
+                .get("promptTokenCount", estimated_tokens),
+            )
+        elif response.ok:
+            # Recorded from the last chunk of the stream (see `__iter_stream_text`)
+            response.key_usage = (pool, key, estimated_tokens)
+
+        return response, key.id
+
+    def __stream_content(
+        self, plugin_name: str, instruction: str, body: dict, key_id: str = None
+    ):
+        """
+        Sends a `streamGenerateContent` request to the Gemini API, receiving the answer as server-sent events.
+
+        Parameters:
+            plugin_name (str): The name of the plugin the request is made for.
+            instruction (str): The instruction type of request to send.
+            body (dict): The body of the request.
+            key_id (str, optional): The ID of the API key to use if it is available.
+
+        Returns:
+            requests.Response: The streamed response of the Gemini API, to read with `__iter_stream_text`.
+        """
+        body["generationConfig"] = self.__get_generation_config(
+            plugin_name, instruction
+        )
+        response, _ = self.__post(
+            self.configuration["base_url"].replace(
+                ":generateContent", ":streamGenerateContent"
+            ),
+            self.__get_model_name(),
+            plugin_name,
+            instruction,
+            body,
+            params={"alt": "sse"},
+            key_id=key_id,
+            stream=True,
+        )
+        return response
+
+    def __iter_stream_text(
+        self, response, plugin_name: str, instruction: str
+    ) -> Iterator[tuple[str, int]]:
+        """
+        Yields the parts of the text of a streamed Gemini response as they arrive, then records the token usage,
+        in the metrics and in the budget of the key the request was sent with.
+
+        A chunk holds many tokens: their number is given by the `candidatesTokenCount` of the chunk,
+        the total generated so far, or estimated from the length of the text when the chunk has no usage.
+
+        Parameters:
+            response (requests.Response): The streamed response.
+            plugin_name (str): The name of the plugin the request was made for.
+            instruction (str): The instruction type of the request.
+
+        Returns:
+            Iterator[tuple[str, int]]: The parts of the generated text, and their number of tokens.
+        """
+        self.check_response(response)
+
+        model = self.__get_model_name()
+        usage = {}
+        generated = 0
+        for line in self.iter_lines(response, model, plugin_name, instruction):
+            if not line.startswith(b"data:"):
+                continue
+            chunk = json.loads(line[len(b"data:") :])
+            usage = chunk.get("usageMetadata", usage)
+            texts = [
+                part["text"]
+                for candidate in chunk.get("candidates", [])[:1]
+                for part in candidate.get("content", {}).get("parts", [])
+                if part.get("text")
+            ]
+            if not texts:
+                continue
+
+            counted = chunk.get("usageMetadata", {}).get("candidatesTokenCount")
+            if counted is None:
+                counted = generated + sum(
+                    math.ceil(len(text) / self.CHARACTERS_PER_TOKEN) for text in texts
+                )
+            tokens = max(counted - generated, 0)
+            generated = max(counted, generated)
+            # The tokens of the chunk are given with its first part
+            for index, text in enumerate(texts):
+                yield text, tokens if index == 0 else 0
+
+        self.__record_usage(model, plugin_name, usage)
+        key_usage = getattr(response, "key_usage", None)
+        if key_usage is not None:
+            pool, key, estimated_tokens = key_usage
+            pool.record_usage(
+                key, estimated_tokens, usage.get("promptTokenCount", estimated_tokens)
+            )
+
+    def __build_files_prompt(self, files: list[FileModel]) -> str:
+        """
+        Builds the prompt giving the files to the model, before asking questions about them.
+
+        Parameters:
+            files (list[FileModel]): The files to give to the model.
+
+        Returns:
+            str: The prompt, with the path and the content of every file.
+        """
+        return "\n ".join(
+            ["I'm going to ask you questions about the following files:"]
+            + [f"{file.path}: {file.read_content()}" for file in files]
+        )
+
+    def __create_cache(self, plugin_name: str, prefix: str):
+        """
+        Sends the system instruction and the prefix of a conversation to the Gemini context-caching API.
+
+        The prefix is not cached if it is smaller than the minimum size accepted by Gemini
+        (`context_cache_min_tokens`), or if the url of the API is unknown.
+
+        Parameters:
+            plugin_name (str): The name of the plugin the conversation is about.
+            prefix (str): The prefix of the conversation.
+
+        Returns:
+            tuple: The name of the cached content, its expiration time as a timestamp and the ID of the API key owning it,
+            or (None, None, None) if it is not cached.
+        """
+        api_root = self.__get_api_root()
+        min_tokens = int(
+            self.configuration.get(
+                "context_cache_min_tokens", self.DEFAULT_CACHE_MIN_TOKENS
+            )
+        )
+        if api_root is None or len(prefix) // self.CHARACTERS_PER_TOKEN < min_tokens:
+            return None, None, None
+
+        ttl = int(self.configuration.get("context_cache_ttl", self.DEFAULT_CACHE_TTL))
+        model = self.__get_model_name()
+        body = {
+            "model": f"models/{model}",
+            "contents": [{"role": "user", "parts": [{"text": prefix}]}],
+            "ttl": f"{ttl}s",
+        }
+        body.update(self.__get_system_instruction(plugin_name, "message"))
+
+        response, key_id = self.__post(
+            f"{api_root}/cachedContents", model, plugin_name, "cache", body
+        )
+        if not response.ok:
+            logger.warning(
+                "Failed to cache the conversation prefix, it is sent with every turn",
+                extra={"fields": {"status": response.status_code}},
+            )
+            return None, None, None
+
+        return response.json()["name"], time.time() + ttl, key_id
+
+    def __start_conversation(self, message: Message) -> Conversation:
+        """
+        Starts a new conversation, caching its files if they are large enough.
+
+        Parameters:
+            message (Message): The message starting the conversation.
+
+        Returns:
+            Conversation: The new conversation.
+        """
+        prefix = None
+        cached_content = cache_expires_at = key_id = None
+        if message.files:
+            prefix = self.__build_files_prompt(message.files)
+            cached_content, cache_expires_at, key_id = self.__create_cache(
+                message.plugin_name, prefix
+            )
+
+        return ConversationStore().create(
+            message.plugin_name, prefix, cached_content, cache_expires_at, key_id
+        )
+
+    def __refresh_cache(self, conversation: Conversation) -> Conversation:
+        """
+        Creates again the cached content of a conversation if it expired, or is about to.
+
+        Parameters:
+            conversation (Conversation): The conversation.
+
+        Returns:
+            Conversation: The conversation, with its new cached content.
+        """
+        if (
+            conversation.cached_content is None
+            or conversation.cache_expires_at > time.time() + self.CACHE_REFRESH_MARGIN
+        ):
+            return conversation
+
+        cached_content, cache_expires_at, key_id = self.__create_cache(
+            conversation.plugin_name, conversation.prefix
+        )
+        ConversationStore().set_cache(
+            conversation.conversation_id, cached_content, cache_expires_at, key_id
+        )
+        return ConversationStore().get(conversation.conversation_id)
+
+    def __build_turn_body(self, conversation: Conversation, text: str) -> dict:
+        """
+        Builds the body of the request sending a new turn of a conversation.
+
+        Parameters:
+            conversation (Conversation): The conversation.
+            text (str): The message of the user.
+
+        Returns:
+            dict: The body of the `generateContent` request.
+        """
+        contents = conversation.history + [{"role": "user", "parts": [{"text": text}]}]
+        if conversation.cached_content is not None:
+            return {"cachedContent": conversation.cached_content, "contents": contents}
+
+        body = self.__get_system_instruction(conversation.plugin_name, "message")
+        if conversation.prefix is not None:
+            contents = [
+                {"role": "user", "parts": [{"text": conversation.prefix}]}
+            ] + contents
+        body["contents"] = contents
+        return body
+
+    def __forget_cache(self, conversation: Conversation) -> Conversation:
+        """
+        Stops using the cached content of a conversation, whose prefix is then sent inline.
+
+        Parameters:
+            conversation (Conversation): The conversation.
+
+        Returns:
+            Conversation: The conversation, without cached content.
+        """
+        ConversationStore().set_cache(conversation.conversation_id, None, None)
+        return ConversationStore().get(conversation.conversation_id)
+
+    def __add_turn(self, conversation: Conversation, text: str, answer: str):
+        """
+        Adds a message of the user and the answer of the model to the history of a conversation.
+
+        Parameters:
+            conversation (Conversation): The conversation.
+            text (str): The message of the user.
+            answer (str): The answer of the model.
+        """
+        ConversationStore().add_turns(
+            conversation.conversation_id,
+            [
+                {"role": "user", "parts": [{"text": text}]},
+                {"role": "model", "parts": [{"text": answer}]},
+            ],
+        )
+
+    def __send_turn(self, conversation: Conversation, text: str) -> str:
+        """
+        Sends a new turn of a conversation to the Gemini API, and adds it to the history.
+        The answer is streamed all the same (see `__stream_turn`), to enforce the `maxOutputTokens` of the plugin.
+
+        Parameters:
+            conversation (Conversation): The conversation.
+            text (str): The message of the user.
+
+        Returns:
+            str: The answer of the model.
+        """
+        with closing(self.__stream_turn(conversation, text)) as parts:
+            return "".join(parts)
+
+    def __stream_turn(self, conversation: Conversation, text: str) -> Iterator[str]:
+        """
+        Sends a new turn of a conversation to the Gemini API, yielding the answer as it arrives,
+        and adds it to the history once complete.
+
+        If the cached content of the conversation is gone (for instance because it was deleted),
+        the prefix is sent inline instead. The other errors (such as a rate limit, retried with another key)
+        keep the cached content. The answer is stopped as soon as it exceeds the `maxOutputTokens` of the plugin.
+
+        Parameters:
+            conversation (Conversation): The conversation.
+            text (str): The message of the user.
+
+        Returns:
+            Iterator[str]: The parts of the answer of the model.
+
+        Raises:
+            HTTPException: If the generation failed, or its output exceeds `maxOutputTokens`.
+        """
+        conversation = self.__refresh_cache(conversation)
+        response = self.__stream_content(
+            conversation.plugin_name,
+            "message",
+            self.__build_turn_body(conversation, text),
+            conversation.key_id,
+        )
+        if (
+            response.status_code in self.CACHE_GONE_STATUSES
+            and conversation.cached_content is not None
+        ):
+            response.close()
+            conversation = self.__forget_cache(conversation)
+            response = self.__stream_content(
+                conversation.plugin_name,
+                "message",
+                self.__build_turn_body(conversation, text),
+                conversation.key_id,
+            )
+
+        max_tokens = self.get_profile(
+            conversation.plugin_name, "message"
+        ).max_output_tokens
+
+        parts = []
+        generated = 0
+        with closing(
+            self.__iter_stream_text(response, conversation.plugin_name, "message")
+        ) as texts:
+            for part, tokens in texts:
+                parts.append(part)
+                generated += tokens
+                self.check_output_tokens(generated, max_tokens)
+                yield part
+
+        self.__add_turn(conversation, text, "".join(parts))
+
+    def __parse_diagram(self, plugin_name: str, json_code: str):
+        """
+        Parses the generated diagram, and validates it against the schema of the plugin if it has one.
+
+        Parameters:
+            plugin_name (str): The name of the plugin.
+            json_code (str): The generated text.
+
+        Returns:
+            The parsed diagram.
+
+        Raises:
+            HTTPException: If the generated text is not valid JSON, or if it does not match the schema.
+        """
+        try:
+            with timed_phase("parse"):
+                diagram = ProcessingPool().run(
+                    "json_extraction",
+                    json.loads,
+                    json_code,
+                    size=len(json_code),
+                    portable=True,
+                )
+        except json.JSONDecodeError:
+            ERRORS.inc(handler="gemini", type="invalid_response")
+            raise HTTPException(
+                status_code=530, detail="Invalid response from Gemini API"
+            )
+        self.validate_diagram(plugin_name, diagram)
+        return diagram
 
     def generate(self, diagram: Diagram):
         """
         Generates code based on the provided `diagram` object.
 
+        The generation is streamed from Gemini and checked as it arrives (see `stream_diagram`),
+        so that an invalid output is stopped without waiting for its end.
+
         Parameters:
             diagram (Diagram): The diagram object containing the description of the
 
@@ -86,39 +597,102 @@ class GeminiHandler(BaseHandler):
 
         Raises:
             KeyError: If the configuration file does not contain the required keys.
-            requests.exceptions.RequestException: If there is an error while making the API request.
+            HTTPException: If the generation failed, or its output is invalid.
+        """
+        return JSONResponse(content=self.collect_diagram(self.generate_stream(diagram)))
+
+    def generate_stream(self, diagram: Diagram) -> Iterator[dict]:
+        """
+        Generates code based on the provided `diagram` object, yielding the generated text as it arrives.
+
+        Parameters:
+            diagram (Diagram): The diagram object containing the description of the diagram.
+
+        Returns:
+            Iterator[dict]: The token events, then the done event with the parsed diagram.
         """
-        json_code = self.__send_request_with_system_instructions(
-            diagram.plugin_name, diagram.description, "generate"
+        body = self.__get_system_instruction(diagram.plugin_name, "generate")
+        body["contents"] = {"parts": {"text": f"{diagram.description}"}}
+
+        yield from self.stream_diagram(
+            lambda: self.__iter_stream_text(
+                self.__stream_content(diagram.plugin_name, "generate", dict(body)),
+                diagram.plugin_name,
+                "generate",
+            ),
+            lambda text: self.__parse_diagram(diagram.plugin_name, text),
+            max_tokens=self.get_profile(
+                diagram.plugin_name, "generate"
+            ).max_output_tokens,
         )
-        try:
-            json_code = json.loads(json_code)
-            return JSONResponse(content=json_code)
-        except json.JSONDecodeError:
-            raise HTTPException(
-                status_code=530, detail="Invalid response from Gemini API"
+
+    def __get_conversation(self, message: Message) -> Conversation:
+        """
+        Returns the conversation of a message.
+
+        Given files start a new conversation about them. Otherwise, the message continues the conversation
+        whose ID is given as context, or starts a new one if there is no context (or if it has expired).
+
+        Parameters:
+            message (Message): The message.
+
+        Returns:
+            Conversation: The conversation.
+        """
+        if message.files is None and message.context is not None:
+            conversation = ConversationStore().get(message.context)
+            if conversation is not None:
+                return conversation
+            logger.warning(
+                "Unknown or expired Gemini conversation, starting a new one",
+                extra={"fields": {"context": message.context}},
             )
+        return self.__start_conversation(message)
 
     def send_message(self, message: Message):
         """
-        Sends a message to the Gemini API to generate code based on the provided message.
-
-        Gemini does not handle context as we want, so chats with a context is not supported.
-        Even if files are given, it will not be used.
+        Sends a message of a conversation to the Gemini API.
 
         Parameters:
             message (Message): The message object containing the description of the code to be generated.
 
         Returns:
-            JSONResponse: The generated response from the Gemini API.
+            JSONResponse: The generated response from the Gemini API, with the ID of the conversation as context.
         """
-        if message.files is not None:
-            return JSONResponse(content={"context": "no context"})
+        conversation = self.__get_conversation(message)
+
+        # If no message was provided, return only the context
+        if message.message is None:
+            return JSONResponse(content={"context": conversation.conversation_id})
 
-        response = self.__send_request_with_system_instructions(
-            message.plugin_name, message.message, "message"
+        answer = self.__send_turn(conversation, message.message)
+        return JSONResponse(
+            content={"message": answer, "context": conversation.conversation_id}
         )
-        json_code = {"message": response}
-        json_code["context"] = "no context"
 
-        return JSONResponse(content=json_code)
+    def send_message_stream(self, message: Message) -> Iterator[dict]:
+        """
+        Sends a message of a conversation to the Gemini API, yielding the answer as it arrives.
+
+        Parameters:
+            message (Message): The message object containing the message to send to the AI.
+
+        Returns:
+            Iterator[dict]: The token events, then the done event with the whole answer and the ID of the conversation as context.
+        """
+        conversation = self.__get_conversation(message)
+
+        if message.message is None:
+            yield {"type": "done", "context": conversation.conversation_id}
+            return
+
+        parts = []
+        for part in self.__stream_turn(conversation, message.message):
+            parts.append(part)
+            yield {"type": "token", "text": part}
+
+        yield {
+            "type": "done",
+            "message": "".join(parts),
+            "context": conversation.conversation_id,
+        }
@@ -0,0 +1,363 @@
+import os
+import re
+import math
+import json
+import time
+import hashlib
+import threading
+
+from fastapi import HTTPException
+from http import HTTPStatus
+
+from src.concurrency.Deadline import bound_timeout, check_deadline, deadline_exceeded
+from src.monitoring.Logger import get_logger
+from src.monitoring.Metrics import ERRORS
+
+logger = get_logger(__name__)
+
+
+class TokenBucket:
+    """
+    A token bucket, refilled continuously with a budget per minute, and holding at most one minute of budget.
+
+    A bucket without budget never runs out.
+    """
+
+    def __init__(self, per_minute: float = None):
+        """
+        Initializes a full bucket.
+
+        Parameters:
+            per_minute (float, optional): The budget per minute. None for an unlimited bucket.
+        """
+        self.per_minute = per_minute
+        self.tokens = per_minute
+        self.updated_at = time.monotonic()
+
+    def __refill(self, now: float):
+        if self.per_minute is not None:
+            self.tokens = min(
+                self.per_minute,
+                self.tokens + (now - self.updated_at) * self.per_minute / 60,
+            )
+        self.updated_at = now
+
+    def headroom(self, now: float) -> float:
+        """
+        Returns the ratio of the budget that is available, 1 for an unlimited bucket.
+        """
+        self.__refill(now)
+        if self.per_minute is None:
+            return 1
+        return self.tokens / self.per_minute
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Returns the time to wait, in seconds, before the given amount is available.
+        An amount over the budget only waits for a full bucket.
+        """
+        self.__refill(now)
+        if self.per_minute is None:
+            return 0
+        missing = min(amount, self.per_minute) - self.tokens
+        return max(0, missing * 60 / self.per_minute)
+
+    def take(self, amount: float, now: float):
+        """
+        Takes an amount from the bucket, that can go negative to give back a late correction.
+        """
+        self.__refill(now)
+        if self.per_minute is not None:
+            self.tokens -= amount
+
+
+class ApiKey:
+    """
+    A Gemini API key, with its request and token budgets.
+
+    The `id` is a hash of the key, that can be logged or stored without revealing it.
+    """
+
+    def __init__(
+        self,
+        value: str,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+    ):
+        self.value = value
+        self.id = hashlib.sha256(value.encode("utf-8")).hexdigest()[:12]
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.parked_until = 0
+
+    def wait_time(self, tokens: float, now: float) -> float:
+        """
+        Returns the time to wait, in seconds, before the key can send a request of the given number of tokens.
+        """
+        return max(
+            self.parked_until - now,
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(tokens, now),
+        )
+
+    def headroom(self, now: float) -> float:
+        """
+        Returns the ratio of the most used budget of the key that is still available.
+        """
+        return min(self.requests.headroom(now), self.tokens.headroom(now))
+
+
+class KeyPool:
+    """
+    A pool of Gemini API keys, spreading the requests on the keys with a local rate limit per key.
+
+    The keys are read from the Gemini configuration: `keys`, a JSON list of keys or of objects with
+    a `key` and optionally its `requests_per_minute` and `tokens_per_minute`, and the single `key`.
+    The `requests_per_minute` and `tokens_per_minute` settings of the configuration apply to the keys without their own.
+
+    Every request is sent with the available key having the most headroom. When every key is out of budget,
+    the request waits for the first one to be available, up to `key_wait_timeout` seconds.
+    A key answered with a 429 status code is parked for the delay asked by Gemini.
+
+    The pool is shared by the handlers: the state of the keys is kept when a new configuration is published.
+    The budgets are kept by every worker process, so they are divided by the number of workers (`WORKERS`):
+    the workers together never spend more than the budget of a key.
+    """
+
+    DEFAULT_WAIT_TIMEOUT = 10
+    DEFAULT_PARK_DURATION = 60
+
+    _pool = None
+    _lock = threading.Lock()
+
+    def __init__(self, keys: list[ApiKey], wait_timeout: float):
+        """
+        Initializes the pool.
+
+        Parameters:
+            keys (list[ApiKey]): The keys of the pool.
+            wait_timeout (float): The maximum time to wait for an available key, in seconds.
+        """
+        self.keys = keys
+        self.wait_timeout = wait_timeout
+        self._condition = threading.Condition()
+        self._signature = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @staticmethod
+    def __parse_budget(value) -> float | None:
+        return float(value) if value not in (None, "") else None
+
+    @classmethod
+    def read_keys(cls, configuration: dict) -> list[dict]:
+        """
+        Reads the keys and their budgets from the Gemini configuration.
+
+        Parameters:
+            configuration (dict): The Gemini configuration.
+
+        Returns:
+            list[dict]: The `key`, `requests_per_minute` and `tokens_per_minute` of every key.
+        """
+        keys = configuration.get("keys") or []
+        if isinstance(keys, str):
+            keys = json.loads(keys)
+        if configuration.get("key"):
+            keys = [configuration["key"]] + keys
+
+        specifications = {}
+        for key in keys:
+            key = key if isinstance(key, dict) else {"key": key}
+            specifications.setdefault(
+                key["key"],
+                {
+                    "key": key["key"],
+                    "requests_per_minute": cls.__parse_budget(
+                        key.get(
+                            "requests_per_minute",
+                            configuration.get("requests_per_minute"),
+                        )
+                    ),
+                    "tokens_per_minute": cls.__parse_budget(
+                        key.get(
+                            "tokens_per_minute", configuration.get("tokens_per_minute")
+                        )
+                    ),
+                },
+            )
+        return list(specifications.values())
+
+    @classmethod
+    def get(cls, configuration: dict) -> "KeyPool":
+        """
+        Returns the pool of the Gemini configuration, built again only if its keys or budgets changed.
+
+        Parameters:
+            configuration (dict): The Gemini configuration.
+
+        Returns:
+            KeyPool: The pool.
+
+        Raises:
+            KeyError: If the configuration has no key.
+        """
+        specifications = cls.read_keys(configuration)
+        if not specifications:
+            raise KeyError("key")
+        wait_timeout = float(
+            configuration.get("key_wait_timeout", cls.DEFAULT_WAIT_TIMEOUT)
+        )
+        workers = max(int(os.environ.get("WORKERS", 1)), 1)
+        signature = json.dumps([specifications, wait_timeout, workers])
+
+        with cls._lock:
+            if cls._pool is not None and cls._pool._signature == signature:
+                return cls._pool
+
+            previous = {key.id: key for key in cls._pool.keys} if cls._pool else {}
+            keys = []
+            for specification in specifications:
+                key = ApiKey(
+                    specification["key"],
+                    *(
+                        budget / workers if budget is not None else None
+                        for budget in (
+                            specification["requests_per_minute"],
+                            specification["tokens_per_minute"],
+                        )
+                    ),
+                )
+                # Keep the parking of a key whose budgets changed
+                if key.id in previous:
+                    key.parked_until = previous[key.id].parked_until
+                keys.append(key)
+
+            pool = cls(keys, wait_timeout)
+            pool._signature = signature
+            cls._pool = pool
+            return pool
+
+    @classmethod
+    def reset(cls):
+        """
+        Forgets the shared pool.
+        """
+        with cls._lock:
+            cls._pool = None
+
+    def acquire(self, tokens: float, preferred_id: str = None) -> ApiKey:
+        """
+        Takes the budget of a request from the key with the most headroom, waiting for one if needed.
+
+        Parameters:
+            tokens (float): The estimated number of tokens of the request.
+            preferred_id (str, optional): The ID of the key to use if it is available (e.g. the key owning a cached content).
+
+        Returns:
+            ApiKey: The key to send the request with.
+
+        Raises:
+            HTTPException: If no key is available within `key_wait_timeout` seconds, or before the deadline of the request.
+        """
+        check_deadline("gemini")
+        wait_timeout = bound_timeout(self.wait_timeout)
+        deadline = time.monotonic() + wait_timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                available = [
+                    key for key in self.keys if key.wait_time(tokens, now) <= 0
+                ]
+                if available:
+                    key = next(
+                        (key for key in available if key.id == preferred_id),
+                        None,
+                    ) or max(available, key=lambda key: key.headroom(now))
+                    key.requests.take(1, now)
+                    key.tokens.take(tokens, now)
+                    return key
+
+                wait = min(key.wait_time(tokens, now) for key in self.keys)
+                if now + wait > deadline:
+                    if wait_timeout < self.wait_timeout:
+                        raise deadline_exceeded(
+                            "No Gemini API key is available before the deadline of the request.",
+                            "gemini",
+                        )
+                    raise self.rate_limited(wait)
+                self._condition.wait(wait)
+
+    def retry_after(self, tokens: float) -> float:
+        """
+        Returns the time to wait, in seconds, before a key of the pool can send a request of the given number of tokens.
+
+        Parameters:
+            tokens (float): The estimated number of tokens of the request.
+        """
+        with self._condition:
+            now = time.monotonic()
+            return min(key.wait_time(tokens, now) for key in self.keys)
+
+    def rate_limited(self, wait: float) -> HTTPException:
+        """
+        Counts a request rejected because every key is rate limited, and returns the error to answer it with.
+
+        Parameters:
+            wait (float): The time to wait before a key is available, in seconds.
+
+        Returns:
+            HTTPException: The 429 error, with the delay in its `Retry-After` header.
+        """
+        ERRORS.inc(handler="gemini", type="rate_limited")
+        return HTTPException(
+            status_code=HTTPStatus.TOO_MANY_REQUESTS,
+            detail="All the Gemini API keys are rate limited, please try again later.",
+            headers={"Retry-After": str(max(math.ceil(wait), 1))},
+        )
+
+    def record_usage(self, key: ApiKey, estimated_tokens: float, tokens: float):
+        """
+        Corrects the token budget of a key with the actual number of tokens of a request.
+
+        Parameters:
+            key (ApiKey): The key the request was sent with.
+            estimated_tokens (float): The number of tokens taken when the key was acquired.
+            tokens (float): The actual number of tokens.
+        """
+        with self._condition:
+            key.tokens.take(tokens - estimated_tokens, time.monotonic())
+
+    def park(self, key: ApiKey, response):
+        """
+        Parks a key answered with a 429 status code, for the delay given by Gemini (`RetryInfo` or `Retry-After`).
+
+        Parameters:
+            key (ApiKey): The key.
+            response (requests.Response): The 429 response.
+        """
+        delay = self.get_retry_delay(response)
+        with self._condition:
+            key.parked_until = max(key.parked_until, time.monotonic() + delay)
+        ERRORS.inc(handler="gemini", type="key_parked")
+        logger.warning(
+            "Gemini API key parked", extra={"fields": {"key": key.id, "delay": delay}}
+        )
+
+    def get_retry_delay(self, response) -> float:
+        """
+        Returns the delay asked by a 429 response, in seconds.
+        """
+        try:
+            for detail in response.json().get("error", {}).get("details", []):
+                match = re.fullmatch(r"([\d.]+)s", str(detail.get("retryDelay", "")))
+                if match:
+                    return float(match.group(1))
+        except ValueError:
+            pass
+
+        try:
+            return float(response.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return self.DEFAULT_PARK_DURATION
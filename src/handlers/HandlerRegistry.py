@@ -0,0 +1,151 @@
+import importlib
+import threading
+import time
+from importlib.metadata import EntryPoint, entry_points
+
+from src.monitoring.Logger import get_logger
+from src.monitoring.Metrics import HANDLER_IMPORT_DURATION
+
+logger = get_logger(__name__)
+
+
+class HandlerRegistry:
+    """
+    Registry of the available handlers.
+
+    Handlers are declared by name, with the `"module:Class"` path of their class, either in
+    `BUILTIN_HANDLERS` or through the `leto_modelizer_ai_proxy.handlers` entry point group of an
+    installed package. The module of a handler is only imported the first time the handler is used.
+    """
+
+    ENTRY_POINT_GROUP = "leto_modelizer_ai_proxy.handlers"
+    BUILTIN_HANDLERS = {
+        "ollama": "src.handlers.Ollama.OllamaHandler:OllamaHandler",
+        "gemini": "src.handlers.Gemini.GeminiHandler:GeminiHandler",
+    }
+
+    _targets = dict(BUILTIN_HANDLERS)
+    _classes = {}
+    _discovered = False
+    _lock = threading.Lock()
+
+    @classmethod
+    def register(cls, name: str, target: str | type):
+        """
+        Registers a handler.
+
+        Parameters:
+            name (str): The name of the handler, as used in the configuration.
+            target (str | type): The `"module:Class"` path of the handler class, or the class itself.
+        """
+        with cls._lock:
+            cls._targets[name] = target
+            cls._classes.pop(name, None)
+
+    @classmethod
+    def names(cls) -> list[str]:
+        """
+        Retrieves the names of all the registered handlers, without importing them.
+
+        Returns:
+            list[str]: The names of the handlers.
+        """
+        cls.__discover()
+        return list(cls._targets)
+
+    @classmethod
+    def is_loaded(cls, name: str) -> bool:
+        """
+        Checks whether the class of a handler has already been imported.
+
+        Parameters:
+            name (str): The name of the handler.
+
+        Returns:
+            bool: True if the handler class has been imported, False otherwise.
+        """
+        return name in cls._classes
+
+    @classmethod
+    def get_handler_class(cls, name: str) -> type:
+        """
+        Retrieves the class of a handler, importing its module on first use.
+
+        Parameters:
+            name (str): The name of the handler.
+
+        Returns:
+            type: The handler class.
+
+        Raises:
+            KeyError: If no handler is registered under this name.
+        """
+        handler_class = cls._classes.get(name)
+        if handler_class is not None:
+            return handler_class
+
+        cls.__discover()
+        with cls._lock:
+            if name in cls._classes:
+                return cls._classes[name]
+
+            target = cls._targets[name]
+            start = time.perf_counter()
+            handler_class = cls.__load(target)
+            duration = time.perf_counter() - start
+
+            cls._classes[name] = handler_class
+
+        HANDLER_IMPORT_DURATION.set(duration, handler=name)
+        logger.info(
+            "Handler loaded",
+            extra={
+                "fields": {"handler": name, "durationMs": round(duration * 1000, 3)}
+            },
+        )
+        return handler_class
+
+    @classmethod
+    def reset(cls):
+        """
+        Restores the builtin handlers and forgets all the imported classes.
+        """
+        with cls._lock:
+            cls._targets = dict(cls.BUILTIN_HANDLERS)
+            cls._classes = {}
+            cls._discovered = False
+
+    @classmethod
+    def __discover(cls):
+        """
+        Adds the handlers declared through entry points, once.
+        Handlers registered explicitly take precedence over entry points with the same name.
+        """
+        if cls._discovered:
+            return
+
+        with cls._lock:
+            if cls._discovered:
+                return
+            for entry_point in entry_points(group=cls.ENTRY_POINT_GROUP):
+                cls._targets.setdefault(entry_point.name, entry_point)
+            cls._discovered = True
+
+    @staticmethod
+    def __load(target: str | type | EntryPoint) -> type:
+        """
+        Imports a handler class from its registration target.
+
+        Parameters:
+            target (str | type | EntryPoint): The registration target.
+
+        Returns:
+            type: The handler class.
+        """
+        if isinstance(target, type):
+            return target
+        if isinstance(target, EntryPoint):
+            return target.load()
+
+        module_name, _, class_name = target.partition(":")
+        return getattr(importlib.import_module(module_name), class_name)
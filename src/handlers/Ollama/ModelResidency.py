@@ -0,0 +1,250 @@
+import os
+import time
+import threading
+from collections import deque
+
+import requests
+from fastapi import HTTPException
+
+from src.configuration.configurationManager import ConfigurationManager
+from src.monitoring.Logger import get_logger
+from src.monitoring.Metrics import MODEL_REQUESTS
+
+logger = get_logger(__name__)
+
+
+class ModelResidency:
+    """
+    A Singleton class keeping the most used Ollama models loaded.
+
+    The requests of every model (e.g. `{plugin}_{category}`) are tracked over the last `residency.window` seconds,
+    and every request asks Ollama to keep its model loaded (`keep_alive`) for three times the mean delay
+    between the requests of the model, between `residency.minKeepAlive` and `residency.maxKeepAlive` seconds.
+    A model used less often than every `residency.maxKeepAlive` seconds is only kept `residency.minKeepAlive` seconds.
+
+    The hot models, having at least `residency.hotRequests` requests in the window, are loaded again
+    (warmed up) after the initialization of the handler, and every `OLLAMA_WARMUP_INTERVAL` seconds if Ollama unloaded them.
+
+    The requests hitting a model that had to be loaded first are counted as cold, per model.
+    """
+
+    _instance = None
+
+    DEFAULT_WINDOW = 3600
+    DEFAULT_MIN_KEEP_ALIVE = 300
+    DEFAULT_MAX_KEEP_ALIVE = 3600
+    DEFAULT_HOT_REQUESTS = 3
+    DEFAULT_WARMUP_INTERVAL = 60
+    # A load longer than this means the model was not in memory
+    COLD_LOAD_DURATION = 0.5
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Create the unique instance of the class.
+
+        Returns:
+            ModelResidency: The unique instance of the class.
+        """
+        if not cls._instance:
+            cls._instance = super().__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._requests = {}
+            cls._instance._stop_event = threading.Event()
+            cls._instance._thread = None
+        return cls._instance
+
+    def reset(cls):
+        """
+        Resets the class by setting the `_instance` attribute to `None`.
+
+        Parameters:
+            cls (type): The class object.
+        """
+        type(cls)._instance = None
+
+    @classmethod
+    def get_settings(cls, configuration: dict) -> dict:
+        """
+        Reads the residency settings from the Ollama configuration.
+
+        Parameters:
+            configuration (dict): The Ollama configuration.
+
+        Returns:
+            dict: The `window`, `minKeepAlive`, `maxKeepAlive` and `hotRequests` settings.
+        """
+        settings = configuration.get("residency", {})
+        return {
+            "window": float(settings.get("window", cls.DEFAULT_WINDOW)),
+            "minKeepAlive": int(
+                settings.get("minKeepAlive", cls.DEFAULT_MIN_KEEP_ALIVE)
+            ),
+            "maxKeepAlive": int(
+                settings.get("maxKeepAlive", cls.DEFAULT_MAX_KEEP_ALIVE)
+            ),
+            "hotRequests": int(settings.get("hotRequests", cls.DEFAULT_HOT_REQUESTS)),
+        }
+
+    def __prune(self, model: str, window: float, now: float) -> deque:
+        """
+        Returns the times of the requests of a model, without the ones out of the window.
+        Must be called with the lock held.
+        """
+        times = self._requests.setdefault(model, deque())
+        while times and times[0] < now - window:
+            times.popleft()
+        return times
+
+    def track(self, model: str, configuration: dict) -> str:
+        """
+        Records a request of a model, and returns how long Ollama should keep it loaded.
+
+        Parameters:
+            model (str): The name of the model.
+            configuration (dict): The Ollama configuration.
+
+        Returns:
+            str: The `keep_alive` of the request, e.g. `"900s"`.
+        """
+        settings = self.get_settings(configuration)
+        now = time.time()
+        with self._lock:
+            times = self.__prune(model, settings["window"], now)
+            times.append(now)
+            return self.__get_keep_alive(times, settings)
+
+    def __get_keep_alive(self, times: deque, settings: dict) -> str:
+        minimum, maximum = settings["minKeepAlive"], settings["maxKeepAlive"]
+        if len(times) < 2:
+            return f"{minimum}s"
+
+        interval = (times[-1] - times[0]) / (len(times) - 1)
+        if interval > maximum:
+            return f"{minimum}s"
+        return f"{int(min(maximum, max(minimum, 3 * interval)))}s"
+
+    def record_load(self, model: str, load_duration: float):
+        """
+        Counts a request as cold if Ollama had to load its model first, warm otherwise.
+
+        Parameters:
+            model (str): The name of the model.
+            load_duration (float): The time spent by Ollama loading the model, in seconds.
+        """
+        MODEL_REQUESTS.inc(
+            handler="ollama",
+            model=model,
+            residency="cold" if load_duration > self.COLD_LOAD_DURATION else "warm",
+        )
+
+    def get_hot_models(self, configuration: dict) -> list[tuple[str, str]]:
+        """
+        Returns the hot models, the most used first, with their `keep_alive`.
+
+        Parameters:
+            configuration (dict): The Ollama configuration.
+
+        Returns:
+            list[tuple[str, str]]: The name and the `keep_alive` of every hot model.
+        """
+        settings = self.get_settings(configuration)
+        now = time.time()
+        with self._lock:
+            counts = {
+                model: self.__prune(model, settings["window"], now)
+                for model in list(self._requests)
+            }
+            hot = [
+                (model, self.__get_keep_alive(times, settings))
+                for model, times in sorted(
+                    counts.items(), key=lambda item: len(item[1]), reverse=True
+                )
+                if len(times) >= settings["hotRequests"]
+            ]
+        return hot
+
+    def warm_up(self, handler) -> list[str]:
+        """
+        Loads the hot models that are not loaded in Ollama, or the default generation model if no model is hot yet.
+        Errors are logged, so that a warm-up never fails the caller.
+
+        Parameters:
+            handler (OllamaHandler): The handler, initialized with the configuration.
+
+        Returns:
+            list[str]: The names of the loaded models.
+        """
+        models = self.get_hot_models(handler.configuration)
+        if not models:
+            models = [
+                (
+                    handler.get_model("default", "generate"),
+                    f"{self.get_settings(handler.configuration)['minKeepAlive']}s",
+                )
+            ]
+
+        warmed = []
+        try:
+            loaded = handler.get_loaded_models()
+            for model, keep_alive in models:
+                if model not in loaded:
+                    handler.preload(model, keep_alive)
+                    warmed.append(model)
+        except (requests.exceptions.RequestException, HTTPException, KeyError) as e:
+            logger.warning(
+                "Failed to warm up the Ollama models",
+                extra={"fields": {"error": str(e)}},
+            )
+
+        if warmed:
+            logger.info("Ollama models warmed up", extra={"fields": {"models": warmed}})
+        return warmed
+
+    def __warm_up_configured(self):
+        """
+        Warms up the models of the current configuration, if Ollama is configured.
+        """
+        from src.handlers.Factory import Factory
+
+        try:
+            snapshot = ConfigurationManager().get_snapshot()
+        except HTTPException:
+            return
+        if "ollama" not in snapshot.configuration:
+            return
+
+        handler = Factory.create_handler("ollama")
+        handler.initialize_configuration(snapshot)
+        self.warm_up(handler)
+
+    def __run(self, interval: float):
+        while not self._stop_event.wait(interval):
+            try:
+                self.__warm_up_configured()
+            except Exception:
+                logger.exception("Failed to warm up the Ollama models")
+
+    def start(self):
+        """
+        Starts warming up the models every `OLLAMA_WARMUP_INTERVAL` seconds in a background thread (0 to disable).
+        """
+        interval = float(
+            os.environ.get("OLLAMA_WARMUP_INTERVAL", self.DEFAULT_WARMUP_INTERVAL)
+        )
+        if interval <= 0:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self.__run, args=(interval,), name="ollama-warmup", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops warming up the models.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,184 @@
+import json
+import threading
+from functools import lru_cache
+
+from src.concurrency.ConcurrencyLimiter import ConcurrencyLimiter
+from src.monitoring.Logger import get_logger
+from src.monitoring.Metrics import MODEL_ROUTES
+
+logger = get_logger(__name__)
+
+RULE_CONDITIONS = ("maxPromptLength", "minQueueDepth", "maxLatency")
+
+
+@lru_cache(maxsize=64)
+def parse_rules(value: str) -> tuple[dict, ...]:
+    """
+    Parses a JSON list of routing rules.
+
+    Parameters:
+        value (str): The JSON list of rules.
+
+    Returns:
+        tuple[dict, ...]: The rules, with their conditions converted to numbers.
+
+    Raises:
+        ValueError: If the value is not a list of rules with a `model`.
+    """
+    rules = json.loads(value)
+    if not isinstance(rules, list):
+        raise ValueError("The routing rules must be a JSON list")
+
+    parsed = []
+    for rule in rules:
+        if not isinstance(rule, dict) or not rule.get("model"):
+            raise ValueError(f"Every routing rule must have a model: {rule}")
+        parsed.append(
+            {
+                "model": rule["model"],
+                **{
+                    condition: float(rule[condition])
+                    for condition in RULE_CONDITIONS
+                    if condition in rule
+                },
+            }
+        )
+    return tuple(parsed)
+
+
+class ModelRouter:
+    """
+    A Singleton class choosing the Ollama model of a generation with the routing rules of its plugin.
+
+    The rules are set in the `routing.<plugin>` setting (or `routing.default`), as a JSON list.
+    Every rule has a `model` and optional conditions, that must all be met:
+    - `maxPromptLength`: the prompt has at most this number of characters,
+    - `minQueueDepth`: at least this number of requests are waiting for the concurrency limiter,
+    - `maxLatency`: the observed mean duration of the generations of the model is at most this number of seconds.
+
+    The first matching rule gives the model, or the model of the plugin is used if no rule matches.
+    """
+
+    _instance = None
+
+    # Weight of the last generation in the observed latency of a model
+    LATENCY_SMOOTHING = 0.2
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Create the unique instance of the class.
+
+        Returns:
+            ModelRouter: The unique instance of the class.
+        """
+        if not cls._instance:
+            cls._instance = super().__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._latencies = {}
+        return cls._instance
+
+    def reset(cls):
+        """
+        Resets the class by setting the `_instance` attribute to `None`.
+
+        Parameters:
+            cls (type): The class object.
+        """
+        type(cls)._instance = None
+
+    def observe(self, model: str, duration: float):
+        """
+        Records the duration of a generation of a model.
+
+        Parameters:
+            model (str): The name of the model.
+            duration (float): The duration of the generation, in seconds.
+        """
+        with self._lock:
+            latency = self._latencies.get(model)
+            self._latencies[model] = (
+                duration
+                if latency is None
+                else latency + self.LATENCY_SMOOTHING * (duration - latency)
+            )
+
+    def get_latency(self, model: str) -> float | None:
+        """
+        Returns the observed mean duration of the generations of a model.
+
+        Parameters:
+            model (str): The name of the model.
+
+        Returns:
+            float | None: The duration in seconds, or None if the model was never used.
+        """
+        return self._latencies.get(model)
+
+    def get_rules(self, configuration: dict, plugin_name: str) -> tuple[dict, ...]:
+        """
+        Returns the routing rules of a plugin, or the `default` ones.
+        Invalid rules are logged and ignored.
+
+        Parameters:
+            configuration (dict): The Ollama configuration.
+            plugin_name (str): The name of the plugin.
+
+        Returns:
+            tuple[dict, ...]: The rules, empty if the plugin has none.
+        """
+        routing = configuration.get("routing", {})
+        value = routing.get(plugin_name, routing.get("default"))
+        if not value:
+            return ()
+        if not isinstance(value, str):
+            value = json.dumps(value)
+
+        try:
+            return parse_rules(value)
+        except (ValueError, TypeError) as e:
+            logger.warning(
+                "Invalid routing rules, using the model of the plugin",
+                extra={"fields": {"plugin": plugin_name, "error": str(e)}},
+            )
+            return ()
+
+    def __matches(self, rule: dict, prompt_length: int, queue_depth: int) -> bool:
+        if "maxPromptLength" in rule and prompt_length > rule["maxPromptLength"]:
+            return False
+        if "minQueueDepth" in rule and queue_depth < rule["minQueueDepth"]:
+            return False
+        if "maxLatency" in rule:
+            latency = self.get_latency(rule["model"])
+            if latency is not None and latency > rule["maxLatency"]:
+                return False
+        return True
+
+    def select(
+        self, configuration: dict, plugin_name: str, prompt_length: int, model: str
+    ) -> str:
+        """
+        Chooses the model of a generation.
+
+        Parameters:
+            configuration (dict): The Ollama configuration.
+            plugin_name (str): The name of the plugin.
+            prompt_length (int): The number of characters of the prompt of the generation.
+            model (str): The model of the plugin, used if no rule matches.
+
+        Returns:
+            str: The name of the chosen model.
+        """
+        rules = self.get_rules(configuration, plugin_name)
+        if rules:
+            queue_depth = ConcurrencyLimiter().queue_depth
+            model = next(
+                (
+                    rule["model"]
+                    for rule in rules
+                    if self.__matches(rule, prompt_length, queue_depth)
+                ),
+                model,
+            )
+
+        MODEL_ROUTES.inc(handler="ollama", plugin=plugin_name, model=model)
+        return model
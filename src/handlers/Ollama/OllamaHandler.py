@@ -1,13 +1,64 @@
-import requests
 import json
 import re
+from contextlib import closing
+from typing import Iterator
 
 from fastapi import HTTPException
 from fastapi.responses import JSONResponse
 
-from src.models.Message import Message
+from src.models.Message import FileModel, Message
 from src.models.Diagram import Diagram
+from src.concurrency.ProcessingPool import ProcessingPool
 from src.handlers.BaseHandler import BaseHandler
+from src.handlers.Ollama.ModelResidency import ModelResidency
+from src.handlers.Ollama.ModelRouter import ModelRouter
+from src.handlers.UpstreamSession import upstream_session
+from src.monitoring.Metrics import (
+    ERRORS,
+    MODEL_LOAD_DURATION,
+    OUTPUT_TOKENS,
+    PROMPT_EVAL_DURATION,
+    PROMPT_TOKENS,
+    TOKENS_PER_SECOND,
+)
+from src.monitoring.Logger import get_logger
+from src.monitoring.RequestContext import RequestContext, timed_phase
+
+logger = get_logger(__name__)
+
+
+def extract_diagram(response_text: str, constrained: bool, allow_raw_results: bool):
+    """
+    Extracts the JSON diagram from the text generated by Ollama.
+    It is a function of the module, so that it can be run by another process of the ProcessingPool.
+
+    Parameters:
+        response_text (str): The generated text.
+        constrained (bool): Whether Ollama was constrained to answer raw JSON, that is then parsed first.
+        allow_raw_results (bool): Whether to return the text when it does not hold valid JSON.
+
+    Returns:
+        The parsed diagram, the raw text if it is allowed, otherwise None.
+    """
+    if constrained:
+        try:
+            return json.loads(response_text)
+        except json.JSONDecodeError:
+            pass
+
+    json_match = re.search(
+        r"```(?:\w+)?\s*([\s\S]+?)```",  # NOSONAR: Sonar do not want the + in the regexp, but it is required
+        response_text,
+        re.DOTALL,
+    )
+    if json_match:
+        json_data = json_match.group(1)
+        try:
+            return json.loads(json_data)
+        except json.JSONDecodeError:
+            return json_data if allow_raw_results else None
+    else:
+        return response_text if allow_raw_results else None
 
 
 class OllamaHandler(BaseHandler):
@@ -17,8 +68,11 @@ class OllamaHandler(BaseHandler):
     This class is used to generate code using the Ollama API.
 
     The handler must be initialized with the `configuration` from the user configuration, using the `initialize_configuration` method.
+    The model used by a request is sent back in the `X-Model` response header.
     """
 
+    MODEL_HEADER = "X-Model"
+
     def __init__(self):
         """
         Initializes the OllamaHandler by setting the `configuration` from the user configuration.
@@ -29,7 +83,8 @@ class OllamaHandler(BaseHandler):
         """
         This method is used to initialize everything the handler needs in order to work.
 
-        For Ollama, this method will load all the ModelFiles defined in the configuration file.
+        For Ollama, this method will load all the ModelFiles defined in the configuration file,
+        then warm up the hot models.
         """
 
         reponses = []
@@ -38,8 +93,14 @@ class OllamaHandler(BaseHandler):
                 "modelFiles"
             ].items():
                 for plugin_name, model_file_content in model_files.items():
-                    print(
-                        f"Loading Ollama model file for {plugin_name} ({model_file_category})"
+                    logger.info(
+                        "Loading Ollama model file",
+                        extra={
+                            "fields": {
+                                "plugin": plugin_name,
+                                "category": model_file_category,
+                            }
+                        },
                     )
 
                     body = {
@@ -48,137 +109,584 @@ class OllamaHandler(BaseHandler):
                         "stream": False,
                     }
 
-                    response = requests.post(
+                    response = self.send_request(
                         f"{self.configuration['base_url']}/create",
+                        body["name"],
+                        plugin_name,
+                        "create",
                         json=body,
                     )
 
                     reponses.append(response.json())
 
+        ModelResidency().warm_up(self)
+
         return reponses
 
-    def __parse_response(self, response_text):
+    def get_loaded_models(self) -> set[str]:
         """
-        Parse the response text to extract JSON data.
-
-        Parameters:
-            response_text (str): The text containing the JSON data.
+        Returns the models currently loaded in memory by Ollama.
 
         Returns:
-            str: The extracted JSON data if successfully parsed, otherwise None.
+            set[str]: The names of the loaded models, without the `:latest` tag.
+
+        Raises:
+            requests.exceptions.RequestException: If there is an error while making the API request.
         """
-        allow_raw_results = (
-            True if self.configuration.get("allowRawResults") == "true" else False
+        response = upstream_session.get(
+            f"{self.configuration['base_url']}/ps", timeout=10
         )
+        response.raise_for_status()
+
+        return {
+            model["name"].removesuffix(":latest")
+            for model in response.json().get("models", [])
+        }
+
+    def preload(self, model: str, keep_alive: str):
+        """
+        Loads a model in memory, by sending a generation request without prompt.
+
+        Parameters:
+            model (str): The name of the model.
+            keep_alive (str): How long Ollama should keep the model loaded, e.g. `"300s"`.
 
-        json_match = re.search(
-            r"```(?:\w+)?\s*([\s\S]+?)```",  # NOSONAR: Sonar do not want the + in the regexp, but it is required
-            response_text,
-            re.DOTALL,
+        Raises:
+            requests.exceptions.RequestException: If there is an error while making the API request.
+        """
+        response = self.send_request(
+            f"{self.configuration['base_url']}/generate",
+            model,
+            "",
+            "preload",
+            json={"model": model, "keep_alive": keep_alive, "stream": False},
         )
-        if json_match:
-            json_data = json_match.group(1)
-            try:
-                return json.loads(json_data)
-            except json.JSONDecodeError:
-                return json_match if allow_raw_results else None
-        else:
-            return response_text if allow_raw_results else None
+        response.raise_for_status()
 
-    def generate(self, diagram: Diagram):
+    def __get_keep_alive(self, model: str) -> str:
         """
-        Generates code based on the provided `diagram` object.
+        Records a request of the model, and returns how long Ollama should keep it loaded afterwards.
 
         Parameters:
-            diagram (Diagram): The diagram object containing the description of the diagram.
+            model (str): The name of the model.
 
         Returns:
-            str: The generated response from the Ollama API.
+            str: The `keep_alive` of the request.
+        """
+        return ModelResidency().track(model, self.configuration)
 
-        Raises:
-            KeyError: If the configuration file does not contain the required keys.
-            requests.exceptions.RequestException: If there is an error while making the API request.
+    def __record_statistics(self, model: str, plugin_name: str, data: dict):
+        """
+        Records the statistics returned by Ollama at the end of a generation.
+
+        Ollama gives all the durations in nanoseconds.
+        The model loading, prompt evaluation and generation durations are also added to the phases of the request.
+
+        Parameters:
+            model (str): The name of the model used for the generation.
+            plugin_name (str): The name of the plugin the generation was made for.
+            data (dict): The body of the Ollama response.
+        """
+        if "load_duration" in data:
+            MODEL_LOAD_DURATION.observe(
+                data["load_duration"] / 1e9, handler="ollama", model=model
+            )
+            ModelResidency().record_load(model, data["load_duration"] / 1e9)
+        if "total_duration" in data:
+            ModelRouter().observe(model, data["total_duration"] / 1e9)
+        if "prompt_eval_duration" in data:
+            PROMPT_EVAL_DURATION.observe(
+                data["prompt_eval_duration"] / 1e9, handler="ollama", model=model
+            )
+        if "prompt_eval_count" in data:
+            PROMPT_TOKENS.inc(
+                data["prompt_eval_count"],
+                handler="ollama",
+                model=model,
+                plugin=plugin_name,
+            )
+        if "eval_count" in data:
+            OUTPUT_TOKENS.inc(
+                data["eval_count"], handler="ollama", model=model, plugin=plugin_name
+            )
+            if data.get("eval_duration"):
+                TOKENS_PER_SECOND.observe(
+                    data["eval_count"] / (data["eval_duration"] / 1e9),
+                    handler="ollama",
+                    model=model,
+                )
+
+        context = RequestContext.current()
+        if context is not None:
+            for phase, key in (
+                ("load", "load_duration"),
+                ("prompt", "prompt_eval_duration"),
+                ("generation", "eval_duration"),
+            ):
+                if key in data:
+                    context.add_phase(phase, data[key] / 1e9)
+
+    def __iter_files_prompt(self, files: list[FileModel]) -> Iterator[str]:
+        """
+        Yields the prompt giving the files to the model, before asking questions about them, in parts.
+
+        Parameters:
+            files (list[FileModel]): The files to give to the model.
+
+        Returns:
+            Iterator[str]: The parts of the prompt, with the path and the content of every file.
+        """
+        yield "I'm going to ask you questions about the following files (you can forget all previous files):"
+
+        for file in files:
+            yield f"\n {file.path}: "
+            yield from file.iter_content()
+
+    def __stream_body(self, body: dict, prompt: Iterator[str]) -> Iterator[bytes]:
+        """
+        Yields the JSON body of a request whose prompt is given in parts, so that the whole body is never in memory.
+
+        Parameters:
+            body (dict): The body of the request, without its prompt.
+            prompt (Iterator[str]): The parts of the prompt.
+
+        Returns:
+            Iterator[bytes]: The parts of the JSON body.
         """
+        yield f'{json.dumps(body)[:-1]}, "prompt": "'.encode()
+        for part in prompt:
+            # Strip the quotes of the JSON string, to keep only the escaped text
+            yield json.dumps(part)[1:-1].encode()
+        yield b'"}'
+
+    def get_model(self, plugin_name: str, mode: str) -> str:
+        """
+        Returns the model to use for the plugin, created from its model file if there is one.
+
+        Parameters:
+            plugin_name (str): The name of the plugin.
+            mode (str): The kind of request, "generate" or "message".
 
+        Returns:
+            str: The name of the model.
+        """
         if "modelFiles" not in self.configuration:
-            model = self.configuration["defaultModel"]
-        elif diagram.plugin_name in self.configuration["modelFiles"]["generate"]:
-            model = f"{diagram.plugin_name}_generate"
+            return self.configuration["defaultModel"]
+        elif plugin_name in self.configuration["modelFiles"][mode]:
+            return f"{plugin_name}_{mode}"
         else:
-            model = "default_generate"
+            return f"default_{mode}"
+
+    def __parse_diagram(self, plugin_name: str, response_text: str):
+        """
+        Parses the generated diagram, and validates it against the schema of the plugin if it has one.
+
+        With a schema, Ollama is constrained to answer raw JSON, so the text is parsed directly,
+        before looking for a fenced block.
+
+        Parameters:
+            plugin_name (str): The name of the plugin.
+            response_text (str): The generated text.
+
+        Returns:
+            The parsed diagram.
+
+        Raises:
+            HTTPException: If the generated text does not hold a diagram, or if it does not match the schema.
+        """
+        with timed_phase("parse"):
+            json_code = ProcessingPool().run(
+                "json_extraction",
+                extract_diagram,
+                response_text,
+                self.get_schema(plugin_name) is not None,
+                self.configuration.get("allowRawResults") == "true",
+                size=len(response_text),
+                portable=True,
+            )
+        if json_code is None:
+            ERRORS.inc(handler="ollama", type="invalid_response")
+            raise HTTPException(
+                status_code=530, detail="Invalid response from Ollama API"
+            )
+        self.validate_diagram(plugin_name, json_code)
+        return json_code
+
+    def __get_generation_body(self, diagram: Diagram) -> dict:
+        """
+        Builds the body of a generation request, without the `stream` field.
+        The model is chosen with the routing rules of the plugin, if it has some.
+        If the plugin has a schema, it is given as the `format` of the answer, so that Ollama only generates matching JSON.
+
+        Parameters:
+            diagram (Diagram): The diagram object containing the description of the diagram.
 
+        Returns:
+            dict: The body of the request.
+        """
+        model = ModelRouter().select(
+            self.configuration,
+            diagram.plugin_name,
+            len(diagram.description),
+            self.get_model(diagram.plugin_name, "generate"),
+        )
         body = {
             "model": model,
             "prompt": diagram.description,
+            "keep_alive": self.__get_keep_alive(model),
+        }
+
+        schema = self.get_schema(diagram.plugin_name)
+        if schema is not None:
+            body["format"] = schema.schema
+
+        return self.__add_options(body, diagram.plugin_name, "generate")
+
+    def __add_options(self, body: dict, plugin_name: str, mode: str) -> dict:
+        """
+        Adds the options of the generation profile of the plugin to the body of a request, if it has some.
+
+        Parameters:
+            body (dict): The body of the request.
+            plugin_name (str): The name of the plugin.
+            mode (str): The kind of request, "generate" or "message".
+
+        Returns:
+            dict: The body of the request.
+        """
+        options = self.get_profile(plugin_name, mode).ollama_options()
+        if options:
+            body["options"] = options
+        return body
+
+    def __send_files(self, message: Message, model: str, context: list | None) -> list:
+        """
+        Gives the files of the message to the model.
+        The body of the request is streamed, reading the contents of the files as it is sent.
+
+        Parameters:
+            message (Message): The message object containing the files.
+            model (str): The name of the model.
+            context (list | None): The context of Ollama, None to start a conversation.
+
+        Returns:
+            list: The context of Ollama holding the files.
+        """
+        body = {
+            "model": model,
             "stream": False,
+            "keep_alive": self.__get_keep_alive(model),
         }
 
-        response = requests.post(
+        if context is not None:
+            body["context"] = context
+        self.__add_options(body, message.plugin_name, "message")
+
+        response = self.send_request(
             f"{self.configuration['base_url']}/generate",
-            json=body,
+            model,
+            message.plugin_name,
+            "message",
+            data=self.__stream_body(body, self.__iter_files_prompt(message.files)),
+            headers={"Content-Type": "application/json"},
+        )
+        self.__record_statistics(model, message.plugin_name, response.json())
+
+        return response.json().get("context", [])
+
+    def __stream_generation(
+        self, body: dict, plugin_name: str, mode: str
+    ) -> Iterator[dict]:
+        """
+        Sends a streamed generation request, yielding a token event for every part of the generated text.
+
+        Parameters:
+            body (dict): The body of the request, without the `stream` field.
+            plugin_name (str): The name of the plugin the request is made for.
+            mode (str): The kind of request, "generate" or "message".
+
+        Returns:
+            Iterator[dict]: The token events, the last element being the last line of the Ollama response.
+        """
+        model = body["model"]
+        response = self.send_request(
+            f"{self.configuration['base_url']}/generate",
+            model,
+            plugin_name,
+            mode,
+            json={**body, "stream": True},
+            stream=True,
+        )
+        self.check_response(response)
+
+        data = {}
+        for line in self.iter_lines(response, model, plugin_name, mode):
+            if not line:
+                continue
+            data = json.loads(line)
+            if data.get("response"):
+                yield {"type": "token", "text": data["response"]}
+
+        self.__record_statistics(model, plugin_name, data)
+        yield data
+
+    def __stream_text(
+        self, body: dict, plugin_name: str, mode: str
+    ) -> Iterator[tuple[str, int]]:
+        """
+        Sends a streamed generation request, yielding the parts of the generated text with their number of tokens.
+        Ollama streams the generated text one token per line.
+
+        Parameters:
+            body (dict): The body of the request, without the `stream` field.
+            plugin_name (str): The name of the plugin the request is made for.
+            mode (str): The kind of request, "generate" or "message".
+
+        Returns:
+            Iterator[tuple[str, int]]: The parts of the generated text, and their number of tokens.
+        """
+        with closing(self.__stream_generation(body, plugin_name, mode)) as events:
+            for event in events:
+                if event.get("type") == "token":
+                    yield event["text"], 1
+
+    def embed(
+        self, texts: list[str], model: str, plugin_name: str
+    ) -> list[list[float]]:
+        """
+        Computes the embeddings of the given texts, in a single request.
+
+        Parameters:
+            texts (list[str]): The texts to embed.
+            model (str): The name of the embedding model.
+            plugin_name (str): The name of the plugin the request is made for.
+
+        Returns:
+            list[list[float]]: The embedding of every text.
+
+        Raises:
+            requests.exceptions.RequestException: If there is an error while making the API request.
+        """
+        response = self.send_request(
+            f"{self.configuration['base_url']}/embed",
+            model,
+            plugin_name,
+            "embed",
+            json={"model": model, "input": texts},
+        )
+        response.raise_for_status()
+
+        return response.json()["embeddings"]
+
+    def generate(self, diagram: Diagram):
+        """
+        Generates code based on the provided `diagram` object.
+
+        The generation is streamed from Ollama and checked as it arrives (see `stream_diagram`),
+        so that an invalid output is stopped without waiting for its end.
+
+        Parameters:
+            diagram (Diagram): The diagram object containing the description of the diagram.
+
+        Returns:
+            str: The generated response from the Ollama API.
+
+        Raises:
+            KeyError: If the configuration file does not contain the required keys.
+            HTTPException: If the generation failed, or its output is invalid.
+        """
+        body = self.__get_generation_body(diagram)
+
+        return JSONResponse(
+            content=self.collect_diagram(self.__stream_diagram(diagram, body)),
+            headers={self.MODEL_HEADER: body["model"]},
         )
 
-        json_code = self.__parse_response(response.json()["response"])
-        if json_code is not None:
-            return JSONResponse(content=json_code)
+    def generate_stream(self, diagram: Diagram) -> Iterator[dict]:
+        """
+        Generates code based on the provided `diagram` object, yielding the generated text as it arrives.
+
+        Parameters:
+            diagram (Diagram): The diagram object containing the description of the diagram.
+
+        Returns:
+            Iterator[dict]: The `{"type": "model", "model": ...}` event giving the chosen model,
+            the token events, then the done event with the parsed diagram.
+        """
+        body = self.__get_generation_body(diagram)
+
+        yield {"type": "model", "model": body["model"]}
+        yield from self.__stream_diagram(diagram, body)
+
+    def __stream_diagram(self, diagram: Diagram, body: dict) -> Iterator[dict]:
+        """
+        Streams the generation of a diagram, checked as it arrives.
+
+        Parameters:
+            diagram (Diagram): The diagram object containing the description of the diagram.
+            body (dict): The body of the generation request, without the `stream` field.
+
+        Returns:
+            Iterator[dict]: The events of `stream_diagram`.
+        """
+        if self.get_schema(diagram.plugin_name) is not None:
+            mode = "json"
+        elif self.configuration.get("allowRawResults") == "true":
+            mode = "text"
         else:
-            raise HTTPException(
-                status_code=530, detail="Invalid response from Ollama API"
-            )
+            mode = "fenced"
+
+        return self.stream_diagram(
+            lambda: self.__stream_text(body, diagram.plugin_name, "generate"),
+            lambda text: self.__parse_diagram(diagram.plugin_name, text),
+            mode,
+            self.get_profile(diagram.plugin_name, "generate").max_output_tokens,
+        )
 
     def send_message(self, message: Message):
+        """
+        Sends a message to Ollama.
 
-        if "modelFiles" not in self.configuration:
-            model = self.configuration["defaultModel"]
-        elif message.plugin_name in self.configuration["modelFiles"]["message"]:
-            model = f"{message.plugin_name}_message"
-        else:
-            model = "default_message"
+        The answer is streamed from Ollama all the same (see `send_message_stream`),
+        so that it is stopped as soon as it exceeds the `maxOutputTokens` of the plugin.
 
-        # If there are files, add them to the prompt in order to
-        # provide more context to the model
-        if message.files is not None:
-            body = {
-                "model": model,
-                "prompt": "I'm going to ask you questions about the following files (you can forget all previous files):",
-                "stream": False,
-            }
+        Parameters:
+            message (Message): The message object containing the message to send to the AI.
+
+        Returns:
+            JSONResponse: The answer, with the new context.
 
-            for file in message.files:
-                body["prompt"] = f"{body['prompt']}\n {file.path}: {file.content}"
+        Raises:
+            HTTPException: If the generation failed, or its output exceeds `maxOutputTokens`.
+        """
+        model, context = self.__get_conversation(message)
 
-            if message.context is not None:
-                body["context"] = message.context
+        with closing(self.__stream_message(message, model, context)) as events:
+            for event in events:
+                if event["type"] == "done":
+                    response = {
+                        key: value for key, value in event.items() if key != "type"
+                    }
 
-            response = requests.post(
-                f"{self.configuration['base_url']}/generate",
-                json=body,
-            )
+        return JSONResponse(content=response, headers={self.MODEL_HEADER: model})
+
+    def send_message_stream(self, message: Message) -> Iterator[dict]:
+        """
+        Sends a message to Ollama, yielding the answer as it arrives.
+        The files of the message are given to the model first, without streaming.
+
+        Parameters:
+            message (Message): The message object containing the message to send to the AI.
+
+        Returns:
+            Iterator[dict]: The `{"type": "model", "model": ...}` event giving the model of the conversation,
+            the token events, then the done event with the whole answer and the new context.
+        """
+        model, context = self.__get_conversation(message)
+
+        yield {"type": "model", "model": model}
+        yield from self.__stream_message(message, model, context)
+
+    def __get_conversation(self, message: Message) -> tuple[str, list | None]:
+        """
+        Returns the model and the context of the conversation of a message.
 
-            if "context" in response.json():
-                message.context = str(response.json()["context"])
-            else:
-                message.context = str([])
+        The context of Ollama is only valid for the model that returned it: a new conversation gets its model
+        from the routing rules of the plugin, and the next messages go on with this model, kept in the context.
+
+        Parameters:
+            message (Message): The message.
+
+        Returns:
+            tuple[str, list | None]: The model, and the context of Ollama if the message continues a conversation.
+        """
+        model = self.get_model(message.plugin_name, "message")
+        if message.context is not None:
+            context = json.loads(message.context)
+            if isinstance(context, dict):
+                return context["model"], context["context"]
+            return model, context
+
+        prompt_length = len(message.message or "") + sum(
+            len(file.content) for file in message.files or []
+        )
+        return (
+            ModelRouter().select(
+                self.configuration, message.plugin_name, prompt_length, model
+            ),
+            None,
+        )
+
+    def __format_context(self, message: Message, model: str, context: list) -> str:
+        """
+        Returns the context sent back to the client, holding the model of the conversation if it was routed.
+
+        Parameters:
+            message (Message): The message.
+            model (str): The model of the conversation.
+            context (list): The context returned by Ollama.
+
+        Returns:
+            str: The context, as a JSON list, or a JSON object with the `model` and the `context`.
+        """
+        if model == self.get_model(message.plugin_name, "message"):
+            return str(context)
+        return json.dumps({"model": model, "context": context})
+
+    def __stream_message(
+        self, message: Message, model: str, context: list | None
+    ) -> Iterator[dict]:
+        """
+        Sends a message to a model of Ollama, yielding the answer as it arrives.
+        The answer is stopped as soon as it exceeds the `maxOutputTokens` of the plugin.
+
+        Parameters:
+            message (Message): The message object containing the message to send to the AI.
+            model (str): The model to send the message to.
+            context (list | None): The context of Ollama, None to start a conversation.
+
+        Returns:
+            Iterator[dict]: The token events, then the done event with the whole answer and the new context.
+        """
+        # If there are files, add them to the prompt in order to
+        # provide more context to the model
+        if message.files is not None:
+            context = self.__send_files(message, model, context)
 
             # If no message was provided, return only the context
             if message.message is None:
-                response_context = {"context": message.context}
-                return JSONResponse(content=response_context)
+                yield {
+                    "type": "done",
+                    "context": self.__format_context(message, model, context),
+                }
+                return
 
         body = {
             "model": model,
             "prompt": message.message,
-            "stream": False,
+            "keep_alive": self.__get_keep_alive(model),
+        }
+        if context is not None:
+            body["context"] = context
+        self.__add_options(body, message.plugin_name, "message")
+        max_tokens = self.get_profile(message.plugin_name, "message").max_output_tokens
+
+        parts = []
+        data = {}
+        with closing(
+            self.__stream_generation(body, message.plugin_name, "message")
+        ) as events:
+            for event in events:
+                if event.get("type") == "token":
+                    parts.append(event["text"])
+                    # Ollama streams the generated text one token per line
+                    self.check_output_tokens(len(parts), max_tokens)
+                    yield event
+                else:
+                    data = event
+
+        yield {
+            "type": "done",
+            "message": "".join(parts),
+            "context": self.__format_context(message, model, data.get("context", [])),
         }
-
-        if message.context is not None:
-            body["context"] = json.loads(message.context)
-
-        response = requests.post(
-            f"{self.configuration['base_url']}/generate",
-            json=body,
-        )
-
-        json_code = {"message": response.json()["response"]}
-        json_code["context"] = str(response.json()["context"])
-        return JSONResponse(content=json_code)
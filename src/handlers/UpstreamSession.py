@@ -0,0 +1,328 @@
+import heapq
+import socket
+import threading
+import time
+import weakref
+import contextvars
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+_current_call = contextvars.ContextVar("upstream_call", default=None)
+
+
+class UpstreamCall:
+    """
+    A call to an AI backend, owning the connections it takes while it is the current call.
+
+    The call has an optional deadline, after which its connections are shut down (see `UpstreamDeadlines`).
+    It can also be abandoned, when the client of the request disconnects.
+    """
+
+    def __init__(self, deadline: float = None):
+        """
+        Initializes the UpstreamCall.
+
+        Parameters:
+            deadline (float, optional): The `time.perf_counter()` time after which the call is cancelled. Defaults to None (no deadline).
+        """
+        self.deadline = deadline
+        self.expired = False
+        self.abandoned = False
+        self.finished = False
+        self.watcher = None
+
+    def activate(self):
+        """
+        Sets the call as the current one, so that the connections taken are owned by it.
+
+        Returns:
+            contextvars.Token: The token to give to `deactivate` to restore the previous call.
+        """
+        return _current_call.set(self)
+
+    @staticmethod
+    def deactivate(token):
+        """
+        Restores the call that was current before `activate`.
+        """
+        _current_call.reset(token)
+
+    def finish(self):
+        """
+        Marks the call as finished, so that it is no longer cancelled at its deadline.
+        """
+        if self.finished:
+            return
+        self.finished = True
+        if self.watcher is not None:
+            self.watcher.forget(self)
+
+    def abandon(self) -> bool:
+        """
+        Cancels the call because nobody will read its response, by shutting down its connections.
+
+        Returns:
+            bool: True if the call was still running, False if it was already finished.
+        """
+        if self.finished:
+            return False
+        self.abandoned = True
+        upstream_connections.cancel_call(self)
+        return True
+
+
+class UpstreamConnections:
+    """
+    Tracks the connections to the AI backends that are currently used by a request, and the call owning them.
+
+    Once cancelled, the sockets of the connections in use are shut down, which makes the pending
+    calls fail immediately, and no new connection can be used until the tracker is reset.
+    The connections of a single call can also be shut down, when its deadline expires.
+    """
+
+    def __init__(self):
+        """
+        Initializes the UpstreamConnections with no connection in use.
+        """
+        self._lock = threading.Lock()
+        self._in_use = weakref.WeakKeyDictionary()
+        self._cancelled = False
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        Returns whether the upstream calls have been cancelled.
+        """
+        return self._cancelled
+
+    @property
+    def in_use(self) -> int:
+        """
+        Returns the number of connections currently used by a request.
+        """
+        return len(self._in_use)
+
+    def track(self, connection):
+        """
+        Marks a connection as used by a request, and owned by the current call.
+
+        Parameters:
+            connection: The urllib3 connection.
+
+        Raises:
+            requests.exceptions.ConnectionError: If the upstream calls have been cancelled.
+        """
+        with self._lock:
+            if self._cancelled:
+                raise requests.exceptions.ConnectionError(
+                    "The upstream calls have been cancelled."
+                )
+            self._in_use[connection] = _current_call.get()
+
+    def untrack(self, connection):
+        """
+        Marks a connection as no longer used by a request.
+
+        Parameters:
+            connection: The urllib3 connection, or None if it was discarded.
+        """
+        if connection is not None:
+            with self._lock:
+                self._in_use.pop(connection, None)
+
+    def cancel(self) -> int:
+        """
+        Cancels the upstream calls, by shutting down the sockets of the connections in use.
+
+        Returns:
+            int: The number of calls that were cancelled.
+        """
+        with self._lock:
+            self._cancelled = True
+            connections = list(self._in_use)
+
+        return self.__shutdown(connections)
+
+    def cancel_call(self, call: UpstreamCall) -> int:
+        """
+        Cancels a single call, by shutting down the sockets of its connections.
+
+        Parameters:
+            call (UpstreamCall): The call to cancel.
+
+        Returns:
+            int: The number of connections that were shut down.
+        """
+        with self._lock:
+            connections = [
+                connection
+                for connection, owner in self._in_use.items()
+                if owner is call
+            ]
+
+        return self.__shutdown(connections)
+
+    @staticmethod
+    def __shutdown(connections: list) -> int:
+        cancelled = 0
+        for connection in connections:
+            sock = getattr(connection, "sock", None)
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+                cancelled += 1
+            except OSError:
+                pass
+        return cancelled
+
+    def reset(self):
+        """
+        Allows the upstream calls again, after a cancellation.
+        """
+        with self._lock:
+            self._cancelled = False
+
+
+upstream_connections = UpstreamConnections()
+
+
+class UpstreamDeadlines:
+    """
+    Cancels the calls to the AI backends that are still running at their deadline, from a single background thread.
+
+    Finished calls are only counted when they finish, and removed from the queue all at once
+    when they make up half of it, so that long deadlines do not keep the finished calls in memory.
+    """
+
+    def __init__(self):
+        """
+        Initializes the UpstreamDeadlines with no call to watch. The thread is started on the first call.
+        """
+        self._condition = threading.Condition()
+        self._calls = []
+        self._counter = 0
+        self._finished = 0
+        self._thread = None
+
+    def watch(self, call: UpstreamCall):
+        """
+        Cancels the call at its deadline, unless it is finished before.
+
+        Parameters:
+            call (UpstreamCall): The call, with a deadline.
+        """
+        with self._condition:
+            self._counter += 1
+            call.watcher = self
+            heapq.heappush(self._calls, (call.deadline, self._counter, call))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self.__run, name="upstream-deadlines", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def forget(self, call: UpstreamCall):
+        """
+        Counts a finished call, and removes the finished calls from the queue once they make up half of it.
+
+        Parameters:
+            call (UpstreamCall): The finished call.
+        """
+        with self._condition:
+            if call.watcher is not self:
+                return
+            self._finished += 1
+            if self._finished * 2 >= len(self._calls):
+                self._calls = [entry for entry in self._calls if not entry[2].finished]
+                heapq.heapify(self._calls)
+                self._finished = 0
+
+    def __run(self):
+        while True:
+            with self._condition:
+                while not self._calls:
+                    self._condition.wait()
+                deadline, _, call = self._calls[0]
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._calls)
+                call.watcher = None
+
+            if not call.finished:
+                call.expired = True
+                upstream_connections.cancel_call(call)
+
+
+upstream_deadlines = UpstreamDeadlines()
+
+
+class TrackedHTTPConnectionPool(HTTPConnectionPool):
+    """
+    An HTTP connection pool registering its connections in `upstream_connections` while they are used.
+    """
+
+    def _get_conn(self, timeout=None):
+        connection = super()._get_conn(timeout)
+        try:
+            upstream_connections.track(connection)
+        except requests.exceptions.ConnectionError:
+            super()._put_conn(connection)
+            raise
+        return connection
+
+    def _put_conn(self, conn):
+        upstream_connections.untrack(conn)
+        super()._put_conn(conn)
+
+
+class TrackedHTTPSConnectionPool(TrackedHTTPConnectionPool, HTTPSConnectionPool):
+    """
+    An HTTPS connection pool registering its connections in `upstream_connections` while they are used.
+    """
+
+
+class TrackedHTTPAdapter(HTTPAdapter):
+    """
+    A transport adapter using the tracked connection pools.
+    """
+
+    POOL_CLASSES = {
+        "http": TrackedHTTPConnectionPool,
+        "https": TrackedHTTPSConnectionPool,
+    }
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = self.POOL_CLASSES
+
+    def proxy_manager_for(self, *args, **kwargs):
+        manager = super().proxy_manager_for(*args, **kwargs)
+        manager.pool_classes_by_scheme = self.POOL_CLASSES
+        return manager
+
+
+class UpstreamSession(requests.Session):
+    """
+    The session shared by the handlers to send requests to the AI backends.
+
+    Connections are kept alive and reused between requests, and the connections in use are tracked,
+    so that the calls still running when the proxy shuts down can be cancelled.
+    """
+
+    def __init__(self):
+        """
+        Initializes the UpstreamSession with the tracked transport adapters.
+        """
+        super().__init__()
+        self.mount("http://", TrackedHTTPAdapter())
+        self.mount("https://", TrackedHTTPAdapter())
+
+
+upstream_session = UpstreamSession()
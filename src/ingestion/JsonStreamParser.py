@@ -0,0 +1,299 @@
+import re
+import json
+import codecs
+from typing import Callable
+
+from src.ingestion.SpooledContent import SpoolBudget, SpooledContent
+
+ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+STRING_SPECIAL = re.compile(r'["\\]')
+LITERAL_END = re.compile(r"[\s,:\]}]")
+WHITESPACE = re.compile(r"\s*")
+
+
+class JsonStreamError(ValueError):
+    """
+    Raised when a streamed JSON document is invalid.
+    """
+
+
+class JsonStreamParser:
+    """
+    Parses a JSON document fed in parts, as it is received, into Python values like `json.loads`.
+
+    Chosen strings, for instance the contents of the files of a message, are not kept in memory:
+    they are decoded as they arrive into a SpooledContent, which is put in the parsed document instead of a string.
+    So the memory used to parse a document does not grow with the size of these strings:
+    they share one SpoolBudget, beyond which they are written to disk.
+    """
+
+    MAX_DEPTH = 64
+
+    def __init__(
+        self,
+        spool_path: Callable[[tuple], bool] = None,
+        spool_budget: SpoolBudget = None,
+    ):
+        """
+        Initializes the parser.
+
+        Parameters:
+            spool_path (Callable[[tuple], bool], optional): Tells whether the string at a path must be spooled.
+            A path is the tuple of the keys and indexes leading to the value, e.g. `("files", 0, "content")`.
+            spool_budget (SpoolBudget, optional): The memory shared by the spooled strings. Defaults to a new budget.
+        """
+        self.spool_path = spool_path or (lambda path: False)
+        self.spool_budget = spool_budget if spool_budget is not None else SpoolBudget()
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._position = 0
+        # The open containers, with the key of the value being parsed in objects
+        self._stack = []
+        self._keys = []
+        self._expect = "value"
+        self._string = None
+        self._string_is_key = False
+        self._result = None
+        self._spools = []
+
+    def feed(self, data: bytes):
+        """
+        Parses the next part of the document.
+
+        Parameters:
+            data (bytes): The part of the document, encoded in UTF-8.
+
+        Raises:
+            JsonStreamError: If the document is invalid.
+        """
+        self.__parse(self._decoder.decode(data), False)
+
+    def finish(self):
+        """
+        Ends the parsing of the document.
+
+        Returns:
+            The parsed document.
+
+        Raises:
+            JsonStreamError: If the document is invalid or incomplete.
+        """
+        self.__parse(self._decoder.decode(b"", True), True)
+        if self._expect != "end":
+            self.close()
+            raise JsonStreamError("Unexpected end of the JSON document")
+        return self._result
+
+    def close(self):
+        """
+        Closes the spooled strings, for instance when the document is invalid.
+        """
+        for spool in self._spools:
+            spool.close()
+
+    def __parse(self, text: str, eof: bool):
+        self._buffer = self._buffer[self._position :] + text
+        self._position = 0
+        try:
+            while self.__step(eof):
+                pass
+        except JsonStreamError:
+            self.close()
+            raise
+
+    def __path(self) -> tuple:
+        return tuple(
+            key if isinstance(container, dict) else len(container)
+            for container, key in zip(self._stack, self._keys)
+        )
+
+    def __add_value(self, value):
+        if not self._stack:
+            self._result = value
+            self._expect = "end"
+            return
+        container = self._stack[-1]
+        if isinstance(container, dict):
+            container[self._keys[-1]] = value
+        else:
+            container.append(value)
+        self._expect = "separator"
+
+    def __step(self, eof: bool) -> bool:
+        """
+        Parses the next token of the buffer.
+
+        Returns:
+            bool: False if more data is needed to go on.
+        """
+        if self._string is not None:
+            return self.__step_string(eof)
+
+        self._position = WHITESPACE.match(self._buffer, self._position).end()
+        if self._position >= len(self._buffer):
+            return False
+        character = self._buffer[self._position]
+
+        if self._expect == "end":
+            raise JsonStreamError(f"Unexpected {character!r} after the JSON document")
+
+        if self._expect == "colon":
+            if character != ":":
+                raise JsonStreamError(f"Expected ':' but found {character!r}")
+            self._position += 1
+            self._expect = "value"
+            return True
+
+        if self._expect == "separator":
+            self._position += 1
+            closing = "}" if isinstance(self._stack[-1], dict) else "]"
+            if character == ",":
+                self._expect = "key" if closing == "}" else "value"
+            elif character == closing:
+                self.__close_container()
+            else:
+                raise JsonStreamError(
+                    f"Expected ',' or {closing!r} but found {character!r}"
+                )
+            return True
+
+        if self._expect in ("key", "key_or_end"):
+            self._position += 1
+            if character == "}" and self._expect == "key_or_end":
+                self.__close_container()
+            elif character == '"':
+                self._string = []
+                self._string_is_key = True
+            else:
+                raise JsonStreamError(f"Expected a key but found {character!r}")
+            return True
+
+        if character == "]" and self._expect == "value_or_end":
+            self._position += 1
+            self.__close_container()
+            return True
+
+        return self.__start_value(character, eof)
+
+    def __start_value(self, character: str, eof: bool) -> bool:
+        if character in "{[":
+            if len(self._stack) >= self.MAX_DEPTH:
+                raise JsonStreamError("The JSON document is too deep")
+            self._position += 1
+            self._stack.append({} if character == "{" else [])
+            self._keys.append(None)
+            self._expect = "key_or_end" if character == "{" else "value_or_end"
+            return True
+
+        if character == '"':
+            self._position += 1
+            if self.spool_path(self.__path()):
+                self._string = SpooledContent(budget=self.spool_budget)
+                self._spools.append(self._string)
+            else:
+                self._string = []
+            self._string_is_key = False
+            return True
+
+        match = LITERAL_END.search(self._buffer, self._position)
+        if match is None and not eof:
+            return False
+        end = match.start() if match else len(self._buffer)
+        literal = self._buffer[self._position : end]
+        try:
+            value = json.loads(literal)
+        except json.JSONDecodeError:
+            raise JsonStreamError(f"Invalid value {literal[:32]!r}")
+        if isinstance(value, (dict, list, str)):
+            raise JsonStreamError(f"Invalid value {literal[:32]!r}")
+        self._position = end
+        self.__add_value(value)
+        return True
+
+    def __close_container(self):
+        container = self._stack.pop()
+        self._keys.pop()
+        self.__add_value(container)
+
+    def __write(self, text: str):
+        if isinstance(self._string, list):
+            self._string.append(text)
+        else:
+            self._string.write(text)
+
+    def __step_string(self, eof: bool) -> bool:
+        match = STRING_SPECIAL.search(self._buffer, self._position)
+        end = match.start() if match else len(self._buffer)
+        if end > self._position:
+            self.__write(self._buffer[self._position : end])
+            self._position = end
+        if match is None:
+            return False
+
+        if match.group() == '"':
+            self._position += 1
+            value = self._string
+            self._string = None
+            if isinstance(value, list):
+                value = "".join(value)
+            if self._string_is_key:
+                self._keys[-1] = value
+                self._expect = "colon"
+            else:
+                self.__add_value(value)
+            return True
+
+        return self.__step_escape(eof)
+
+    def __step_escape(self, eof: bool) -> bool:
+        escape = self._buffer[self._position : self._position + 12]
+        if len(escape) < 2:
+            return self.__need_more(eof)
+        if escape[1] != "u":
+            if escape[1] not in ESCAPES:
+                raise JsonStreamError(f"Invalid escape {escape[:2]!r}")
+            self.__write(ESCAPES[escape[1]])
+            self._position += 2
+            return True
+
+        if len(escape) < 6:
+            return self.__need_more(eof)
+        code = self.__parse_code(escape[2:6])
+        if 0xD800 <= code < 0xDC00:
+            # A high surrogate, that must be followed by the escaped low surrogate
+            if len(escape) < 12 and not eof:
+                return False
+            if escape[6:8] == "\\u" and len(escape) == 12:
+                low = self.__parse_code(escape[8:12])
+                if 0xDC00 <= low < 0xE000:
+                    self.__write(chr(0x10000 + ((code - 0xD800) << 10) + low - 0xDC00))
+                    self._position += 12
+                    return True
+            code = 0xFFFD
+        elif 0xDC00 <= code < 0xE000:
+            code = 0xFFFD
+        self.__write(chr(code))
+        self._position += 6
+        return True
+
+    @staticmethod
+    def __parse_code(digits: str) -> int:
+        try:
+            return int(digits, 16)
+        except ValueError:
+            raise JsonStreamError(f"Invalid escape '\\u{digits}'")
+
+    @staticmethod
+    def __need_more(eof: bool) -> bool:
+        if eof:
+            raise JsonStreamError("Unexpected end of the JSON document")
+        return False
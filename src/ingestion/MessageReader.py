@@ -0,0 +1,104 @@
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+
+from src.concurrency.ProcessingPool import ProcessingPool
+from src.ingestion.JsonStreamParser import JsonStreamError, JsonStreamParser
+from src.ingestion.SpooledContent import SpoolBudget
+from src.models.Message import Message
+
+
+def is_file_content(path: tuple) -> bool:
+    """
+    Tells whether a path of the body of a message leads to the content of a file, that is spooled.
+
+    Parameters:
+        path (tuple): The keys and indexes leading to a value of the body.
+
+    Returns:
+        bool: True for the `files[i].content` paths.
+    """
+    return len(path) == 3 and path[0] == "files" and path[2] == "content"
+
+
+async def read_message(request: Request) -> Message:
+    """
+    Parses the body of a request into a Message, as it is received.
+
+    The contents of the files are spooled instead of being kept in memory, see `SpooledContent`:
+    they share the `SPOOL_MAX_MEMORY_SIZE` budget of the request, so the memory used does not grow
+    with the size or the number of the files. The message must be closed once handled.
+    Large parts of the body are parsed by the ProcessingPool, out of the event loop.
+
+    Parameters:
+        request (Request): The request, whose body is the JSON message.
+
+    Returns:
+        Message: The parsed message.
+
+    Raises:
+        RequestValidationError: If the body is not valid JSON, or not a valid message.
+    """
+    pool = ProcessingPool()
+    parser = JsonStreamParser(is_file_content, SpoolBudget())
+    message = None
+    try:
+        try:
+            async for chunk in request.stream():
+                await pool.run_async(
+                    "message_parsing", parser.feed, chunk, size=len(chunk)
+                )
+            body = parser.finish()
+        except JsonStreamError as e:
+            raise RequestValidationError(
+                [
+                    {
+                        "type": "json_invalid",
+                        "loc": ("body",),
+                        "msg": "JSON decode error",
+                        "input": {},
+                        "ctx": {"error": str(e)},
+                    }
+                ]
+            )
+
+        try:
+            message = Message.model_validate(body)
+        except ValidationError as e:
+            # The input is left out, as it can hold spooled contents
+            raise RequestValidationError(
+                [
+                    {**error, "loc": ("body", *error["loc"])}
+                    for error in e.errors(include_url=False, include_input=False)
+                ]
+            )
+        return message
+    finally:
+        # Without a message to own them, the spooled contents are released now
+        if message is None:
+            parser.close()
+
+
+def get_inline_schema(model: type) -> dict:
+    """
+    Returns the JSON schema of a model, with its definitions inlined, to document a body read from the request.
+
+    Parameters:
+        model (type): The Pydantic model.
+
+    Returns:
+        dict: The JSON schema.
+    """
+    schema = model.model_json_schema(by_alias=True, ref_template="{model}")
+    definitions = schema.pop("$defs", {})
+
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(definitions[node["$ref"]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(value) for value in node]
+        return node
+
+    return resolve(schema)
@@ -0,0 +1,135 @@
+import os
+import tempfile
+from typing import Iterator
+
+
+class SpoolBudget:
+    """
+    The memory that the spooled contents of a request can use together.
+
+    The budget, in bytes, is read from the `SPOOL_MAX_MEMORY_SIZE` environment variable.
+    A content that would exceed it is written to disk, so a request with many files uses no more memory than one large file.
+    """
+
+    DEFAULT_MAX_MEMORY_SIZE = 1024 * 1024
+
+    def __init__(self, max_memory_size: int = None):
+        """
+        Initializes the budget.
+
+        Parameters:
+            max_memory_size (int, optional): The size that the contents can keep in memory together.
+            Defaults to the `SPOOL_MAX_MEMORY_SIZE` environment variable.
+        """
+        if max_memory_size is None:
+            max_memory_size = int(
+                os.environ.get("SPOOL_MAX_MEMORY_SIZE", self.DEFAULT_MAX_MEMORY_SIZE)
+            )
+        self.available = max_memory_size
+
+    def reserve(self, size: int) -> bool:
+        """
+        Reserves memory for a content, if the budget allows it.
+
+        Parameters:
+            size (int): The size to reserve.
+
+        Returns:
+            bool: Whether the memory was reserved.
+        """
+        if size > self.available:
+            return False
+        self.available -= size
+        return True
+
+    def release(self, size: int):
+        """
+        Gives back memory reserved by a content, once written to disk or closed.
+
+        Parameters:
+            size (int): The size to release.
+        """
+        self.available += size
+
+
+class SpooledContent:
+    """
+    A large text received in a request body, kept in memory while its budget allows it and written to a temporary file beyond.
+
+    The temporary file is removed when the content is closed.
+    """
+
+    DEFAULT_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, max_memory_size: int = None, budget: SpoolBudget = None):
+        """
+        Initializes an empty content.
+
+        Parameters:
+            max_memory_size (int, optional): The size above which the content is written to disk, when it has no budget.
+            Defaults to the `SPOOL_MAX_MEMORY_SIZE` environment variable.
+            budget (SpoolBudget, optional): The memory shared with the other contents of the request.
+        """
+        self.budget = budget if budget is not None else SpoolBudget(max_memory_size)
+        # Never rolled over by its size, but when the budget is exhausted
+        self._file = tempfile.SpooledTemporaryFile(mode="w+", encoding="utf-8")
+        self._reserved = 0
+        self.length = 0
+
+    @property
+    def spooled(self) -> bool:
+        """
+        Returns whether the content was written to disk.
+        """
+        return self._file._rolled
+
+    def write(self, text: str):
+        """
+        Appends a part of the text.
+
+        Parameters:
+            text (str): The part of the text.
+        """
+        if not self.spooled:
+            if self.budget.reserve(len(text)):
+                self._reserved += len(text)
+            else:
+                self._file.rollover()
+                self.__release()
+        self._file.write(text)
+        self.length += len(text)
+
+    def iter_chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+        """
+        Yields the text, in parts of at most `chunk_size` characters.
+
+        Parameters:
+            chunk_size (int, optional): The maximum number of characters of a part.
+
+        Returns:
+            Iterator[str]: The parts of the text.
+        """
+        self._file.seek(0)
+        while chunk := self._file.read(chunk_size):
+            yield chunk
+        self._file.seek(0, os.SEEK_END)
+
+    def read(self) -> str:
+        """
+        Returns the whole text.
+        """
+        return "".join(self.iter_chunks())
+
+    def close(self):
+        """
+        Releases the memory or removes the temporary file holding the text.
+        """
+        self._file.close()
+        self.__release()
+
+    def __release(self):
+        self.budget.release(self._reserved)
+        self._reserved = 0
+
+    def __len__(self) -> int:
+        return self.length
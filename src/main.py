@@ -1,8 +1,96 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import APIRouter, FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+from src.concurrency.ConcurrencyLimiter import ConcurrencyLimiter
+from src.concurrency.ProcessingPool import ProcessingPool
+from src.configuration.configurationManager import ConfigurationManager
+from src.configuration.configurationWatcher import ConfigurationWatcher
+from src.handlers.Ollama.ModelResidency import ModelResidency
+from src.handlers.UpstreamSession import upstream_connections
+from src.monitoring.Logger import get_logger
+from src.monitoring.Metrics import registry
+from src.monitoring.MetricsDirectory import MetricsDirectory
+from src.monitoring.MetricsMiddleware import MetricsMiddleware
+from src.monitoring.RequestContextMiddleware import RequestContextMiddleware
 from src.routers import diagram, message, configuration
 
-app = FastAPI()
+logger = get_logger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Loads the last accepted configuration from the store (if any) before accepting requests,
+    then watches the store while the application runs, so that a configuration set on another worker is loaded by this one.
+
+    At shutdown, the server has already stopped accepting connections and waited for the in-flight requests
+    up to its graceful timeout: the requests still running are rejected and their calls to the AI cancelled.
+
+    The hot Ollama models are warmed up in the background while the application runs,
+    and the snapshots of the metrics are written to the metrics directory (if any).
+    The workers of the processing pool are stopped last, once the requests using them are done.
+    """
+    limiter = ConcurrencyLimiter()
+    limiter.open()
+    upstream_connections.reset()
+
+    start = time.perf_counter()
+    try:
+        snapshot = ConfigurationManager().load_from_store()
+    except Exception:
+        snapshot = None
+        logger.exception("Failed to load the stored configuration at startup")
+    if snapshot is not None:
+        logger.info(
+            "Configuration loaded from the store",
+            extra={
+                "fields": {
+                    "version": snapshot.version,
+                    "durationMs": (time.perf_counter() - start) * 1000,
+                }
+            },
+        )
+
+    watcher = ConfigurationWatcher.from_environment()
+    if watcher is not None:
+        watcher.start()
+    residency = ModelResidency()
+    residency.start()
+    metrics_directory = MetricsDirectory.from_environment()
+    if metrics_directory is not None:
+        metrics_directory.start()
+    yield
+    if metrics_directory is not None:
+        metrics_directory.stop()
+    residency.stop()
+    if watcher is not None:
+        watcher.stop()
+
+    limiter.close()
+    if limiter.active:
+        logger.warning(
+            "Cancelling the requests still running at shutdown",
+            extra={
+                "fields": {
+                    "active": limiter.active,
+                    "queued": limiter.queue_depth,
+                    "cancelledCalls": upstream_connections.cancel(),
+                }
+            },
+        )
+    else:
+        upstream_connections.cancel()
+    ProcessingPool().shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestContextMiddleware)
 
 # Create a parent router with the prefix "/api"
 api_router = APIRouter(prefix="/api")
@@ -26,5 +114,43 @@ async def root() -> dict:
 async def root() -> dict:
     """
     This endpoint is the entrypoint of the API and returns a diagnostic message.
+    It also returns the worker process and the version of its active configuration (0 if not set).
+    """
+    return {
+        "status": "ok",
+        "version": "1.0.0",
+        "worker": os.getpid(),
+        "configurationVersion": ConfigurationManager().current_version,
+    }
+
+
+@app.get("/ready")
+async def ready():
+    """
+    This endpoint returns whether the proxy is ready to handle requests, i.e whether its configuration is set.
+    It answers with a 503 status code while it is not ready.
+    """
+    version = ConfigurationManager().current_version
+    if not version:
+        return JSONResponse(
+            content={"status": "not ready", "configurationVersion": 0},
+            status_code=503,
+        )
+    return {"status": "ready", "configurationVersion": version}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """
+    This endpoint exports the metrics of the proxy in the Prometheus text format.
+    The metrics are kept by every worker process: with a metrics directory, those of all the workers are merged,
+    otherwise they are those of the worker answering.
     """
-    return {"status": "ok", "version": "1.0.0"}
+    metrics_directory = MetricsDirectory.from_environment()
+    if metrics_directory is None:
+        content = registry.render()
+    else:
+        content = await asyncio.to_thread(metrics_directory.render)
+    return PlainTextResponse(
+        content, media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
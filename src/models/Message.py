@@ -1,5 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field, WithJsonSchema
+from typing import Annotated, Iterator, List, Optional
+
+from src.ingestion.SpooledContent import SpooledContent
 
 
 class FileModel(BaseModel):
@@ -11,10 +13,35 @@ class FileModel(BaseModel):
 
     The path is the path of the file to send to the AI.
     The content is the content of the file to send to the AI.
+    When the message is parsed from a streamed request body, the content is a SpooledContent,
+    that must be read with `iter_content` or `read_content`.
     """
 
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     path: str
-    content: str
+    content: Annotated[str | SpooledContent, WithJsonSchema({"type": "string"})]
+
+    def iter_content(self) -> Iterator[str]:
+        """
+        Yields the content of the file, in parts, without loading a spooled content in memory.
+
+        Returns:
+            Iterator[str]: The parts of the content.
+        """
+        if isinstance(self.content, SpooledContent):
+            yield from self.content.iter_chunks()
+        else:
+            yield self.content
+
+    def read_content(self) -> str:
+        """
+        Returns the whole content of the file.
+
+        Returns:
+            str: The content of the file.
+        """
+        return "".join(self.iter_content())
 
 
 class Message(BaseModel):
@@ -34,3 +61,11 @@ class Message(BaseModel):
     files: Optional[List[FileModel]] = None
     message: Optional[str] = None
     context: Optional[str] = None
+
+    def close(self):
+        """
+        Releases the spooled contents of the files, once the message is handled.
+        """
+        for file in self.files or []:
+            if isinstance(file.content, SpooledContent):
+                file.content.close()
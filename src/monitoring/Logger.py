@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import hashlib
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+from src.monitoring.Metrics import registry
+from src.monitoring.RequestContext import RequestContext
+
+ROOT_LOGGER_NAME = "leto_ai_proxy"
+
+DROPPED_LOGS = registry.counter(
+    "leto_ai_proxy_dropped_logs_total",
+    "Number of log records dropped because the logging queue was full.",
+)
+
+_listener = None
+
+
+def summarize(value, max_length: int):
+    """
+    Replaces the strings longer than `max_length` by a summary, in the given value.
+
+    The summary holds the length of the string, its SHA-256 hash and its beginning,
+    so that large bodies can be identified without being written in the logs.
+
+    Parameters:
+        value: The value to summarize (string, list, dict or any other value).
+        max_length (int): The maximum length of the strings kept as is.
+
+    Returns:
+        The summarized value.
+    """
+    if isinstance(value, str) and len(value) > max_length:
+        return {
+            "length": len(value),
+            "sha256": hashlib.sha256(value.encode("utf-8")).hexdigest(),
+            "preview": value[:max_length],
+        }
+    if isinstance(value, dict):
+        return {key: summarize(item, max_length) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [summarize(item, max_length) for item in value]
+    return value
+
+
+def parse_sampling_rates(sampling_rates: str) -> dict:
+    """
+    Parses the per-route sampling rates, given as `route=rate` pairs separated by commas.
+
+    Parameters:
+        sampling_rates (str): The sampling rates, e.g `/api/diagram=0.1,/api/message=0.5`.
+
+    Returns:
+        dict: The sampling rate of every route.
+    """
+    rates = {}
+    for pair in filter(None, (sampling_rates or "").split(",")):
+        route, rate = pair.rsplit("=", 1)
+        rates[route.strip()] = float(rate)
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats the log records as JSON lines.
+
+    The fields given with `extra={"fields": {...}}` are added to the line, with their large strings summarized.
+    """
+
+    def __init__(self, max_field_length: int = 256):
+        """
+        Initializes the JsonFormatter.
+
+        Parameters:
+            max_field_length (int, optional): The maximum length of the string fields kept as is.
+        """
+        super().__init__()
+        self.max_field_length = max_field_length
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["requestId"] = record.request_id
+        if getattr(record, "fields", None):
+            entry.update(summarize(record.fields, self.max_field_length))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestFilter(logging.Filter):
+    """
+    Adds the ID of the request being processed to the log records, and samples them per route.
+
+    The route of a record is given with `extra={"route": ...}`. Records without route,
+    and warnings or errors, are always kept.
+    """
+
+    def __init__(self, sampling_rates: dict = None):
+        """
+        Initializes the RequestFilter.
+
+        Parameters:
+            sampling_rates (dict, optional): The ratio (between 0 and 1) of kept records per route.
+        """
+        super().__init__()
+        self.sampling_rates = sampling_rates or {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        route = getattr(record, "route", None)
+        if route in self.sampling_rates and record.levelno < logging.WARNING:
+            if random.random() >= self.sampling_rates[route]:
+                return False
+
+        context = RequestContext.current()
+        record.request_id = context.request_id if context else None
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    A QueueHandler that leaves the formatting to the listener thread, and drops the records when the queue is full.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The records stay in the process, so they do not need to be formatted before being enqueued
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED_LOGS.inc()
+
+
+def setup_logging():
+    """
+    Configures the logging of the proxy, once.
+
+    The records are written as JSON lines on the standard output by a background thread.
+    The configuration is read from the environment:
+        - `LOG_LEVEL`: The minimum level of the records (default: INFO).
+        - `LOG_SAMPLING_RATES`: The ratio of kept records per route (e.g `/api/diagram=0.1`).
+        - `LOG_MAX_FIELD_LENGTH`: The maximum length of the string fields kept as is (default: 256).
+        - `LOG_QUEUE_SIZE`: The maximum number of records waiting to be written (default: 10000).
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(int(os.environ.get("LOG_QUEUE_SIZE", 10000)))
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(
+        RequestFilter(parse_sampling_rates(os.environ.get("LOG_SAMPLING_RATES")))
+    )
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(
+        JsonFormatter(int(os.environ.get("LOG_MAX_FIELD_LENGTH", 256)))
+    )
+
+    logger = logging.getLogger(ROOT_LOGGER_NAME)
+    logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Returns the logger with the given name, under the logger of the proxy.
+
+    Parameters:
+        name (str): The name of the logger, usually the name of the module.
+
+    Returns:
+        logging.Logger: The logger.
+    """
+    setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name.removeprefix('src.')}")
@@ -0,0 +1,502 @@
+import math
+import threading
+from abc import ABC, abstractmethod
+
+
+def _format_labels(label_names: tuple, label_values: tuple, extra: dict = None) -> str:
+    """
+    Formats label pairs in the Prometheus text format, i.e `{name="value",...}`.
+
+    Parameters:
+        label_names (tuple): The names of the labels.
+        label_values (tuple): The values of the labels, in the same order as the names.
+        extra (dict, optional): Additional labels to append (for instance the `le` bucket label).
+
+    Returns:
+        str: The formatted labels, or an empty string if there are none.
+    """
+    pairs = list(zip(label_names, label_values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    """
+    Formats a sample value in the Prometheus text format.
+    """
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric(ABC):
+    """
+    Base class for all metrics.
+
+    A metric holds one sample (or one set of samples for histograms) per combination of label values.
+    """
+
+    type = None
+
+    def __init__(self, name: str, documentation: str, label_names: list[str] = None):
+        """
+        Initializes the metric.
+
+        Parameters:
+            name (str): The name of the metric.
+            documentation (str): The help text of the metric.
+            label_names (list[str], optional): The names of the labels of the metric.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names or [])
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        """
+        Returns the label values of the given labels, ordered as the label names.
+        Missing labels are exported as empty strings.
+        """
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def reset(self):
+        """
+        Removes all the samples of the metric.
+        """
+        with self._lock:
+            self._values = {}
+
+    def values(self) -> dict:
+        """
+        Returns a copy of the values of the metric, by label values.
+        """
+        with self._lock:
+            return dict(self._values)
+
+    @abstractmethod
+    def merge(self, value, other):
+        """
+        Combines two values of the same labels, kept by two worker processes.
+
+        Parameters:
+            value: The value kept by a worker.
+            other: The value kept by another worker.
+
+        Returns:
+            The value exported for both workers.
+        """
+        pass
+
+    @abstractmethod
+    def samples(self, values: dict = None) -> list[str]:
+        """
+        Returns the lines of the samples of the metric, in the Prometheus text format.
+
+        Parameters:
+            values (dict, optional): The values to export, by label values. Defaults to the values of the metric.
+
+        Returns:
+            list[str]: The lines of the samples.
+        """
+        pass
+
+    def render(self, values: dict = None) -> str:
+        """
+        Returns the metric in the Prometheus text format.
+
+        Parameters:
+            values (dict, optional): The values to export, by label values. Defaults to the values of the metric.
+
+        Returns:
+            str: The metric, with its help and type.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines.extend(self.samples(values))
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    A metric whose value only goes up.
+    """
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        Increments the counter.
+
+        Parameters:
+            amount (float, optional): The amount to add. Defaults to 1.
+            **labels: The label values.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """
+        Returns the current value of the counter for the given labels.
+        """
+        return self._values.get(self._key(labels), 0)
+
+    def merge(self, value: float, other: float) -> float:
+        return value + other
+
+    def samples(self, values: dict = None) -> list[str]:
+        values = self.values() if values is None else values
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(Counter):
+    """
+    A metric whose value can go up and down.
+    Across several workers, the highest value is exported.
+    """
+
+    type = "gauge"
+
+    def merge(self, value: float, other: float) -> float:
+        return max(value, other)
+
+    def set(self, value: float, **labels):
+        """
+        Sets the gauge to the given value.
+
+        Parameters:
+            value (float): The new value.
+            **labels: The label values.
+        """
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        """
+        Decrements the gauge.
+        """
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    A metric counting observations in configurable buckets.
+    """
+
+    type = "histogram"
+
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: list[str] = None,
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        """
+        Initializes the histogram.
+
+        Parameters:
+            name (str): The name of the metric.
+            documentation (str): The help text of the metric.
+            label_names (list[str], optional): The names of the labels of the metric.
+            buckets (tuple, optional): The upper bounds of the buckets, sorted.
+        """
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        """
+        Records an observation.
+
+        Parameters:
+            value (float): The observed value.
+            **labels: The label values.
+        """
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def get_count(self, **labels) -> int:
+        """
+        Returns the number of observations for the given labels.
+        """
+        counts, _ = self._values.get(self._key(labels), ([0] * len(self.buckets), 0))
+        return counts[-1]
+
+    def get_sum(self, **labels) -> float:
+        """
+        Returns the sum of the observations for the given labels.
+        """
+        return self._values.get(self._key(labels), (None, 0))[1]
+
+    def values(self) -> dict:
+        with self._lock:
+            return {
+                key: (list(counts), total)
+                for key, (counts, total) in self._values.items()
+            }
+
+    def merge(self, value: tuple, other: tuple) -> tuple:
+        counts, total = value
+        other_counts, other_total = other
+        return (
+            [count + other_count for count, other_count in zip(counts, other_counts)],
+            total + other_total,
+        )
+
+    def samples(self, values: dict = None) -> list[str]:
+        values = self.values() if values is None else values
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            for bound, count in zip(self.buckets, counts):
+                labels = _format_labels(
+                    self.label_names, key, {"le": _format_value(bound)}
+                )
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    A Singleton class holding all the metrics exported by the proxy.
+    The metrics live in the memory of the process: to export the metrics of several workers,
+    every worker writes a snapshot of its metrics (cf: MetricsDirectory), and the snapshots are merged.
+    """
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Create the unique instance of the class.
+
+        Returns:
+            MetricsRegistry: The unique instance of the class.
+        """
+        if not cls._instance:
+            cls._instance = super().__new__(cls)
+            cls._instance._metrics = {}
+        return cls._instance
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Registers a metric, or returns the already registered one with the same name.
+
+        Parameters:
+            metric (Metric): The metric to register.
+
+        Returns:
+            Metric: The registered metric.
+        """
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, label_names: list[str] = None):
+        """
+        Creates and registers a counter.
+        """
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: list[str] = None):
+        """
+        Creates and registers a gauge.
+        """
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: list[str] = None,
+        buckets: tuple = Histogram.DEFAULT_BUCKETS,
+    ):
+        """
+        Creates and registers a histogram.
+        """
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def reset(self):
+        """
+        Removes the samples of all the metrics, but keeps them registered.
+        """
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def snapshot(self) -> dict:
+        """
+        Returns the values of all the metrics, serializable in JSON.
+
+        Returns:
+            dict: The list of the `[label values, value]` pairs of every metric, by name.
+        """
+        return {
+            name: [[list(key), value] for key, value in metric.values().items()]
+            for name, metric in self._metrics.items()
+        }
+
+    def render(self, snapshots: list[dict] = None) -> str:
+        """
+        Returns all the metrics in the Prometheus text format.
+
+        Parameters:
+            snapshots (list[dict], optional): Snapshots of the metrics of several workers, to merge and export
+            instead of the metrics of this process. The metrics missing from the registry are ignored.
+
+        Returns:
+            str: The metrics.
+        """
+        if snapshots is None:
+            return (
+                "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+            )
+
+        merged = {name: {} for name in self._metrics}
+        for snapshot in snapshots:
+            for name, pairs in snapshot.items():
+                if name not in merged:
+                    continue
+                metric = self._metrics[name]
+                values = merged[name]
+                for key, value in pairs:
+                    key = tuple(key)
+                    values[key] = (
+                        metric.merge(values[key], value) if key in values else value
+                    )
+        return (
+            "\n".join(
+                metric.render(merged[name]) for name, metric in self._metrics.items()
+            )
+            + "\n"
+        )
+
+
+registry = MetricsRegistry()
+
+REQUEST_DURATION = registry.histogram(
+    "leto_ai_proxy_request_duration_seconds",
+    "Duration of the HTTP requests handled by the proxy.",
+    ["route", "method", "status"],
+)
+GENERATION_DURATION = registry.histogram(
+    "leto_ai_proxy_generation_duration_seconds",
+    "Duration of the calls to the AI, per handler, model and plugin.",
+    ["handler", "model", "plugin", "mode"],
+)
+UPSTREAM_TIME_TO_FIRST_BYTE = registry.histogram(
+    "leto_ai_proxy_upstream_time_to_first_byte_seconds",
+    "Time between sending a request to the AI and receiving the headers of its response.",
+    ["handler", "model"],
+)
+TIME_TO_FIRST_TOKEN = registry.histogram(
+    "leto_ai_proxy_time_to_first_token_seconds",
+    "Time between receiving a streaming request and sending the first generated text to the client.",
+    ["route", "handler"],
+)
+MODEL_LOAD_DURATION = registry.histogram(
+    "leto_ai_proxy_model_load_duration_seconds",
+    "Time spent by the AI loading the model before generating.",
+    ["handler", "model"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+MODEL_REQUESTS = registry.counter(
+    "leto_ai_proxy_model_requests_total",
+    "Number of requests per model, per residency: cold if the AI had to load the model first, warm otherwise.",
+    ["handler", "model", "residency"],
+)
+MODEL_ROUTES = registry.counter(
+    "leto_ai_proxy_model_routes_total",
+    "Number of generations per plugin and chosen model.",
+    ["handler", "plugin", "model"],
+)
+PROMPT_EVAL_DURATION = registry.histogram(
+    "leto_ai_proxy_prompt_eval_duration_seconds",
+    "Time spent by the AI evaluating the prompt.",
+    ["handler", "model"],
+)
+PROMPT_TOKENS = registry.counter(
+    "leto_ai_proxy_prompt_tokens_total",
+    "Number of prompt tokens sent to the AI.",
+    ["handler", "model", "plugin"],
+)
+OUTPUT_TOKENS = registry.counter(
+    "leto_ai_proxy_output_tokens_total",
+    "Number of tokens generated by the AI.",
+    ["handler", "model", "plugin"],
+)
+CACHED_PROMPT_TOKENS = registry.counter(
+    "leto_ai_proxy_cached_prompt_tokens_total",
+    "Number of prompt tokens read by the AI from a context cache instead of being sent.",
+    ["handler", "model", "plugin"],
+)
+TOKENS_PER_SECOND = registry.histogram(
+    "leto_ai_proxy_output_tokens_per_second",
+    "Generation speed of the AI, in output tokens per second.",
+    ["handler", "model"],
+    buckets=(1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500),
+)
+ERRORS = registry.counter(
+    "leto_ai_proxy_errors_total",
+    "Number of errors, per handler and type of error.",
+    ["handler", "type"],
+)
+ABANDONED_GENERATIONS = registry.counter(
+    "leto_ai_proxy_abandoned_generations_total",
+    "Number of calls to the AI cancelled because the client disconnected.",
+    ["handler", "mode"],
+)
+RESPONSE_CACHE_REQUESTS = registry.counter(
+    "leto_ai_proxy_response_cache_requests_total",
+    "Number of diagram generations looked up in the response cache, per tier (memory or disk) and result (hit or miss).",
+    ["tier", "result"],
+)
+SEMANTIC_CACHE_REQUESTS = registry.counter(
+    "leto_ai_proxy_semantic_cache_requests_total",
+    "Number of diagram generations looked up in the semantic cache, per result (hit or miss).",
+    ["plugin", "result"],
+)
+SEMANTIC_CACHE_SIMILARITY = registry.histogram(
+    "leto_ai_proxy_semantic_cache_similarity",
+    "Cosine similarity between a diagram description and the closest cached one.",
+    ["plugin"],
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.925, 0.95, 0.975, 0.99, 1),
+)
+SEMANTIC_CACHE_SAVED_SECONDS = registry.counter(
+    "leto_ai_proxy_semantic_cache_saved_seconds_total",
+    "Generation time saved by the semantic cache hits, measured when the cached diagrams were generated.",
+    ["plugin"],
+)
+PROCESSING_TASKS = registry.counter(
+    "leto_ai_proxy_processing_tasks_total",
+    "Number of CPU-heavy tasks, per task and execution (inline, thread or process).",
+    ["task", "execution"],
+)
+PROCESSING_QUEUE_TIME = registry.histogram(
+    "leto_ai_proxy_processing_queue_time_seconds",
+    "Time spent by the CPU-heavy tasks waiting for a worker of the processing pool.",
+    ["task", "executor"],
+)
+HANDLER_IMPORT_DURATION = registry.gauge(
+    "leto_ai_proxy_handler_import_duration_seconds",
+    "Time spent importing the module of a handler, the first time it was used.",
+    ["handler"],
+)
@@ -0,0 +1,141 @@
+import os
+import json
+import glob
+import threading
+
+from src.monitoring.Logger import get_logger
+from src.monitoring.Metrics import registry
+
+logger = get_logger(__name__)
+
+
+class MetricsDirectory:
+    """
+    Directory shared by the worker processes, where every worker writes a snapshot of its metrics (`<pid>.json`).
+
+    A scrape of `/metrics` reaches only one worker: it merges the snapshots of all the workers,
+    so the counters and histograms are the totals of the host, and do not jump between workers.
+    The snapshots are written every `interval` seconds, and by the worker answering the scrape just before.
+    The snapshots of the stopped workers are kept, so the totals never go down, until the directory is cleared
+    when the proxy starts.
+    """
+
+    DEFAULT_INTERVAL = 1.0
+
+    def __init__(self, path: str, interval: float = DEFAULT_INTERVAL):
+        """
+        Initializes the MetricsDirectory.
+
+        Parameters:
+            path (str): The directory of the snapshots, created if missing.
+            interval (float, optional): The delay between two snapshots of this worker, in seconds.
+        """
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def from_environment():
+        """
+        Creates the directory defined by the `METRICS_DIRECTORY` environment variable,
+        written every `METRICS_WRITE_INTERVAL` seconds.
+
+        Returns:
+            MetricsDirectory: The directory, or None if no directory is defined.
+        """
+        path = os.environ.get("METRICS_DIRECTORY")
+        if not path:
+            return None
+        return MetricsDirectory(
+            path,
+            float(
+                os.environ.get(
+                    "METRICS_WRITE_INTERVAL", MetricsDirectory.DEFAULT_INTERVAL
+                )
+            ),
+        )
+
+    def write(self):
+        """
+        Writes the snapshot of the metrics of this worker.
+        The file is replaced atomically, so the other workers never read a partial snapshot.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, f"{os.getpid()}.json")
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(registry.snapshot(), file)
+        os.replace(temporary_path, path)
+
+    def read(self) -> list[dict]:
+        """
+        Reads the snapshots of all the workers. The unreadable snapshots are skipped.
+
+        Returns:
+            list[dict]: The snapshots.
+        """
+        snapshots = []
+        for path in sorted(glob.glob(os.path.join(self.path, "*.json"))):
+            try:
+                with open(path, encoding="utf-8") as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                logger.warning(
+                    "Failed to read a snapshot of the metrics",
+                    extra={"fields": {"path": path}},
+                )
+        return snapshots
+
+    def clear(self):
+        """
+        Removes the snapshots of the previous runs. Called once, before the workers start.
+        """
+        for path in glob.glob(os.path.join(self.path, "*.json*")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def render(self) -> str:
+        """
+        Writes the snapshot of this worker, then returns the metrics of all the workers in the Prometheus text format.
+        """
+        self.write()
+        return registry.render(self.read())
+
+    def __run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.write()
+            except Exception:
+                logger.exception(
+                    "Failed to write the snapshot of the metrics",
+                    extra={"fields": {"path": self.path}},
+                )
+
+    def start(self):
+        """
+        Starts writing the snapshots of this worker in a background thread.
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self.__run, name="metrics-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops writing the snapshots, after writing the last one.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.write()
+        except OSError:
+            logger.exception(
+                "Failed to write the snapshot of the metrics",
+                extra={"fields": {"path": self.path}},
+            )
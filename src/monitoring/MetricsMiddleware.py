@@ -0,0 +1,48 @@
+import time
+
+from src.monitoring.Metrics import ERRORS, REQUEST_DURATION
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the duration of every HTTP request, per route.
+
+    The route is the path template of the matched route (e.g `/api/diagram`), so that
+    the number of exported series does not grow with the requested paths.
+    """
+
+    def __init__(self, app):
+        """
+        Initializes the middleware.
+
+        Parameters:
+            app: The ASGI application to wrap.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            ERRORS.inc(handler="proxy", type=e.__class__.__name__)
+            raise
+        finally:
+            route = scope.get("route")
+            REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                route=route.path if route else "unmatched",
+                method=scope["method"],
+                status=status["code"],
+            )
@@ -0,0 +1,139 @@
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+_current_context = contextvars.ContextVar("request_context", default=None)
+
+
+class RequestContext:
+    """
+    Holds the information about the request being processed: its ID, its deadline, whether its client
+    disconnected and the duration of its phases.
+
+    The context is shared by everything running for the request (including the threadpool),
+    so that any layer can record the time spent in a phase.
+    """
+
+    REQUEST_ID_HEADER = "X-Request-ID"
+    TIMEOUT_HEADER = "X-Request-Timeout"
+
+    def __init__(self, request_id: str = None, timeout: float = None):
+        """
+        Initializes the RequestContext.
+
+        Parameters:
+            request_id (str, optional): The ID of the request. A new one is generated if not given.
+            timeout (float, optional): The time given by the client to answer the request, in seconds. Defaults to None (no deadline).
+        """
+        self.request_id = request_id or uuid.uuid4().hex
+        self.start = time.perf_counter()
+        self.deadline = self.start + timeout if timeout is not None else None
+        self.disconnected = False
+        self.phases = {}
+        self._lock = threading.Lock()
+        self._disconnect_callbacks = []
+
+    @staticmethod
+    def current():
+        """
+        Returns the context of the request being processed.
+
+        Returns:
+            RequestContext: The context, or None if called outside of a request.
+        """
+        return _current_context.get()
+
+    def activate(self):
+        """
+        Sets the context as the one of the request being processed.
+
+        Returns:
+            contextvars.Token: The token to give to `deactivate` to restore the previous context.
+        """
+        return _current_context.set(self)
+
+    @staticmethod
+    def deactivate(token):
+        """
+        Restores the context that was active before `activate`.
+        """
+        _current_context.reset(token)
+
+    def remaining(self) -> float | None:
+        """
+        Returns the time left before the deadline of the request.
+
+        Returns:
+            float | None: The time left in seconds (negative once expired), or None if the request has no deadline.
+        """
+        if self.deadline is None:
+            return None
+        return self.deadline - time.perf_counter()
+
+    def on_disconnect(self, callback):
+        """
+        Registers a function to call when the client disconnects, or calls it now if it already has.
+
+        Parameters:
+            callback: The function, called without argument.
+        """
+        with self._lock:
+            if not self.disconnected:
+                self._disconnect_callbacks.append(callback)
+                return
+        callback()
+
+    def disconnect(self):
+        """
+        Marks the client as disconnected, and calls the functions registered with `on_disconnect`.
+        """
+        with self._lock:
+            if self.disconnected:
+                return
+            self.disconnected = True
+            callbacks, self._disconnect_callbacks = self._disconnect_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_phase(self, name: str, duration: float):
+        """
+        Records the duration of a phase. Durations of phases with the same name are summed.
+
+        Parameters:
+            name (str): The name of the phase.
+            duration (float): The duration of the phase, in seconds.
+        """
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0) + duration
+
+    def server_timing(self) -> str:
+        """
+        Returns the value of the `Server-Timing` header, with the duration of every phase
+        and the total duration of the request, in milliseconds.
+        """
+        with self._lock:
+            phases = dict(self.phases)
+        phases["total"] = time.perf_counter() - self.start
+        return ", ".join(
+            f"{name};dur={duration * 1000:.1f}" for name, duration in phases.items()
+        )
+
+
+@contextmanager
+def timed_phase(name: str):
+    """
+    Records the duration of the `with` block as a phase of the request being processed.
+    Does nothing if called outside of a request.
+
+    Parameters:
+        name (str): The name of the phase.
+    """
+    context = RequestContext.current()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if context is not None:
+            context.add_phase(name, time.perf_counter() - start)
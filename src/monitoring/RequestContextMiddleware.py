@@ -0,0 +1,97 @@
+import math
+import asyncio
+from http import HTTPStatus
+
+from fastapi.responses import JSONResponse
+
+from src.monitoring.RequestContext import RequestContext
+
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware creating the RequestContext of every HTTP request.
+
+    The request ID is taken from the `X-Request-ID` request header, or generated.
+    It is sent back in the `X-Request-ID` response header, along with the `Server-Timing` header.
+    The deadline of the request is read from the `X-Request-Timeout` request header, in seconds, if given.
+    A request whose timeout is not a finite number of seconds, or is negative, is rejected with a 400 status code.
+
+    The messages of the client are read as they arrive, so that a client disconnecting before the end of
+    the response is noticed while the request is processed (see `RequestContext.on_disconnect`).
+    At most one message waits for the application, so that a large body is only read as fast as it is consumed.
+    """
+
+    def __init__(self, app):
+        """
+        Initializes the middleware.
+
+        Parameters:
+            app: The ASGI application to wrap.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header_name = RequestContext.REQUEST_ID_HEADER.lower().encode("latin-1")
+        timeout_header_name = RequestContext.TIMEOUT_HEADER.lower().encode("latin-1")
+        request_id = None
+        timeout = None
+        for name, value in scope["headers"]:
+            if name == header_name:
+                request_id = value.decode("latin-1")
+            elif name == timeout_header_name:
+                try:
+                    timeout = float(value)
+                except ValueError:
+                    timeout = math.nan
+                if not math.isfinite(timeout) or timeout < 0:
+                    response = JSONResponse(
+                        status_code=HTTPStatus.BAD_REQUEST,
+                        content={
+                            "detail": f"Invalid {RequestContext.TIMEOUT_HEADER} header, "
+                            "expected a positive number of seconds"
+                        },
+                    )
+                    await response(scope, receive, send)
+                    return
+        context = RequestContext(request_id, timeout)
+        response_complete = False
+        # Bounded, so that the body is not read ahead of the application (see `MessageReader`)
+        messages = asyncio.Queue(maxsize=1)
+
+        async def read_messages():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    if not response_complete:
+                        await asyncio.to_thread(context.disconnect)
+                    await messages.put(message)
+                    return
+                await messages.put(message)
+
+        async def receive_wrapper():
+            return await messages.get()
+
+        async def send_wrapper(message):
+            nonlocal response_complete
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (header_name, context.request_id.encode("latin-1")),
+                    (b"server-timing", context.server_timing().encode("latin-1")),
+                ]
+            elif message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                response_complete = True
+            await send(message)
+
+        token = context.activate()
+        reader = asyncio.create_task(read_messages())
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            reader.cancel()
+            RequestContext.deactivate(token)
@@ -6,6 +6,9 @@ from fastapi.responses import JSONResponse
 
 from src.configuration.configurationManager import ConfigurationManager
 from src.handlers.Factory import Factory
+from src.monitoring.Logger import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter(
     prefix="/configurations",
@@ -53,7 +56,10 @@ async def save_configuration(request: Request):
     """
     try:
         encrypted_data: bytes = await request.body()  # Encrypted binary data
-        print("Received POST /api/configuration request with encrypted body")
+        logger.info(
+            "Received POST /api/configurations request with encrypted body",
+            extra={"route": "/api/configurations"},
+        )
 
         # Synchronously access the singleton with a lock to avoid race conditions
         configuration_manager = ConfigurationManager()
@@ -79,8 +85,12 @@ def initialize(handler: Annotated[set[str] | None, Query()] = None):
     Returns:
         str: The generated response from the API.
     """
-    print(
-        f"Receive POST /api/configuration/initialize request {'with body:' + str(handler) if handler else ''}"
+    logger.info(
+        "Receive POST /api/configurations/initialize request",
+        extra={
+            "route": "/api/configurations/initialize",
+            "fields": {"handlers": sorted(handler) if handler else None},
+        },
     )
 
     responses = Factory.initialize_models(handler)
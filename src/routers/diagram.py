@@ -1,7 +1,20 @@
-from fastapi import APIRouter
+import asyncio
+import json
+from typing import List
 
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from src.cache.ResponseCache import ResponseCache
+from src.cache.SemanticCache import SemanticCache
+from src.concurrency.ConcurrencyLimiter import ConcurrencyLimiter
 from src.models.Diagram import Diagram
 from src.handlers.Factory import Factory
+from src.monitoring.Logger import get_logger
+from src.routers.streaming import streaming_response
+
+logger = get_logger(__name__)
 
 router = APIRouter(
     prefix="/diagram",
@@ -10,6 +23,30 @@ router = APIRouter(
 )
 
 
+def generate_diagram(diagram: Diagram):
+    """
+    Generates code based on the provided `diagram` object, unless a cache already holds it.
+
+    The response cache is read first, without waiting for a free slot of the concurrency limiter.
+    The semantic cache, that computes an embedding with the AI, and the handler are called within the limiter.
+
+    Parameters:
+        diagram (Diagram): The diagram object containing the description of the diagram.
+
+    Returns:
+        The generated response, or the cached one.
+    """
+
+    def generate_with_handler():
+        with ConcurrencyLimiter().acquire():
+            return SemanticCache().generate(
+                diagram,
+                lambda: Factory.get_handler(diagram.plugin_name).generate(diagram),
+            )
+
+    return ResponseCache().generate(diagram, generate_with_handler)
+
+
 @router.post("")
 def generate(diagram: Diagram):
     """
@@ -26,5 +63,110 @@ def generate(diagram: Diagram):
         requests.exceptions.RequestException: If there is an error while making the API request.
     """
 
-    print(f"Receive POST /api/diagram request with body: {diagram.dict()}")
-    return Factory.get_handler(diagram.plugin_name).generate(diagram)
+    logger.info(
+        "Receive POST /api/diagram request",
+        extra={"route": "/api/diagram", "fields": {"body": diagram.model_dump()}},
+    )
+    return generate_diagram(diagram)
+
+
+@router.post("/stream")
+def generate_stream(diagram: Diagram):
+    """
+    Generates code based on the provided `diagram` object, streaming the generated text as it arrives.
+
+    The response is NDJSON: `{"type": "token", "text": ...}` lines for the generated text,
+    then a `{"type": "done", "response": ...}` line with the generated diagram,
+    or a `{"type": "error", "status": ..., "error": ...}` line if the generation failed.
+
+    Parameters:
+        diagram (Diagram): The diagram object containing the description of the diagram.
+
+    Returns:
+        StreamingResponse: The NDJSON stream of the events.
+    """
+
+    logger.info(
+        "Receive POST /api/diagram/stream request",
+        extra={
+            "route": "/api/diagram/stream",
+            "fields": {"body": diagram.model_dump()},
+        },
+    )
+    return streaming_response(
+        "/api/diagram/stream",
+        diagram.plugin_name,
+        lambda handler: handler.generate_stream(diagram),
+    )
+
+
+def generate_batch_item(index: int, diagram: Diagram) -> dict:
+    """
+    Generates one diagram of a batch and wraps the outcome in a result line.
+
+    Errors are reported in the result line instead of being raised, so that one failing diagram
+    does not interrupt the whole batch.
+
+    Parameters:
+        index (int): The position of the diagram in the batch.
+        diagram (Diagram): The diagram object containing the description of the diagram.
+
+    Returns:
+        dict: The result line, with the `index`, the HTTP `status` and either the `response` or the `error`.
+    """
+    try:
+        response = generate_diagram(diagram)
+    except HTTPException as e:
+        return {"index": index, "status": e.status_code, "error": e.detail}
+    except Exception as e:
+        return {"index": index, "status": 500, "error": str(e)}
+
+    if isinstance(response, Response):
+        return {
+            "index": index,
+            "status": response.status_code,
+            "response": json.loads(response.body),
+        }
+    return {"index": index, "status": 200, "response": response}
+
+
+@router.post("/batch")
+async def generate_batch(diagrams: List[Diagram]):
+    """
+    Generates code for several `diagram` objects concurrently.
+
+    The results are streamed as NDJSON, one line per diagram, in the order they finish.
+    Each line holds the `index` of the diagram in the request body.
+
+    Parameters:
+        diagrams (List[Diagram]): The diagram objects containing the descriptions of the diagrams.
+
+    Returns:
+        StreamingResponse: The NDJSON stream of the results.
+    """
+
+    logger.info(
+        "Receive POST /api/diagram/batch request",
+        extra={"route": "/api/diagram/batch", "fields": {"size": len(diagrams)}},
+    )
+
+    async def stream_results():
+        # Do not start more threads than the limiter would let through
+        semaphore = asyncio.Semaphore(ConcurrencyLimiter().limit)
+
+        async def run(index: int, diagram: Diagram):
+            async with semaphore:
+                return await run_in_threadpool(generate_batch_item, index, diagram)
+
+        tasks = [
+            asyncio.create_task(run(index, diagram))
+            for index, diagram in enumerate(diagrams)
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield json.dumps(await task) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
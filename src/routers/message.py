@@ -1,7 +1,15 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 
+from src.concurrency.ConcurrencyLimiter import ConcurrencyLimiter
+from src.ingestion.MessageReader import get_inline_schema, read_message
 from src.models.Message import Message
 from src.handlers.Factory import Factory
+from src.monitoring.Logger import get_logger
+from src.routers.streaming import streaming_response
+
+logger = get_logger(__name__)
 
 router = APIRouter(
     prefix="/message",
@@ -9,15 +17,59 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# The body is read by `read_message` instead of FastAPI, so its schema is documented here
+MESSAGE_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": get_inline_schema(Message)}},
+    }
+}
+
+
+def log_message(route: str, message: Message):
+    """
+    Logs a received message, without the contents of its files.
+
+    Parameters:
+        route (str): The route of the request.
+        message (Message): The received message.
+    """
+    logger.info(
+        f"Receive POST {route} request",
+        extra={
+            "route": route,
+            "fields": {
+                "body": message.model_dump(exclude={"files": {"__all__": {"content"}}})
+            },
+        },
+    )
+
 
-@router.post("")
-def message(message: Message):
+def send_message(message: Message):
+    """
+    Sends the message to the handler of its plugin, within the ConcurrencyLimiter.
+
+    Parameters:
+        message (Message): The message object containing the message to send to the AI.
+
+    Returns:
+        The response of the handler.
+    """
+    with ConcurrencyLimiter().acquire():
+        return Factory.get_handler(message.plugin_name).send_message(message=message)
+
+
+@router.post("", openapi_extra=MESSAGE_BODY)
+async def message(request: Request):
     """
     Generates code based on the provided `message` object.
     It is like a conversation with an AI.
 
+    The body is parsed as it is received, and the contents of the files are spooled to disk when they are large,
+    so that the memory used by a request does not grow with the size of its files.
+
     Parameters:
-        message (Message): The message object containing the message to send to the AI.
+        request (Request): The request, whose body is the message object containing the message to send to the AI.
 
     Returns:
         str: The generated response from the API.
@@ -26,6 +78,46 @@ def message(message: Message):
         KeyError: If the configuration file does not contain the required keys.
         requests.exceptions.RequestException: If there is an error while making the API request.
     """
+    message = await read_message(request)
+    try:
+        log_message("/api/message", message)
+        return await run_in_threadpool(send_message, message)
+    finally:
+        message.close()
+
+
+@router.post("/stream", openapi_extra=MESSAGE_BODY)
+async def message_stream(request: Request):
+    """
+    Sends the provided `message` object to the AI, streaming the answer as it arrives.
+
+    The response is NDJSON: `{"type": "token", "text": ...}` lines for the answer,
+    then a `{"type": "done", "message": ..., "context": ...}` line with the whole answer and the new context,
+    or a `{"type": "error", "status": ..., "error": ...}` line if the generation failed.
+
+    Parameters:
+        request (Request): The request, whose body is the message object containing the message to send to the AI.
+
+    Returns:
+        StreamingResponse: The NDJSON stream of the events.
+    """
+    message = await read_message(request)
+    try:
+        log_message("/api/message/stream", message)
+
+        def produce(handler):
+            try:
+                yield from handler.send_message_stream(message=message)
+            finally:
+                message.close()
 
-    print(f"Receive POST /api/message request with body: {message.dict()}")
-    return Factory.get_handler(message.plugin_name).send_message(message=message)
+        # The message is closed after the response too, in case the generation never started
+        return streaming_response(
+            "/api/message/stream",
+            message.plugin_name,
+            produce,
+            BackgroundTask(message.close),
+        )
+    except Exception:
+        message.close()
+        raise
@@ -0,0 +1,82 @@
+import json
+import time
+from typing import Callable, Iterator
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from src.concurrency.ConcurrencyLimiter import ConcurrencyLimiter
+from src.handlers.BaseHandler import BaseHandler
+from src.handlers.Factory import Factory
+from src.monitoring.Logger import get_logger
+from src.monitoring.Metrics import TIME_TO_FIRST_TOKEN
+
+logger = get_logger(__name__)
+
+
+def stream_events(
+    route: str, plugin_name: str, produce: Callable[[BaseHandler], Iterator[dict]]
+) -> Iterator[str]:
+    """
+    Runs a streaming generation under the ConcurrencyLimiter, and serializes its events as NDJSON lines.
+
+    The status code of the response being already sent when the generation starts, errors are sent
+    as a last `{"type": "error", "status": ..., "error": ...}` event.
+
+    Parameters:
+        route (str): The route of the request, to label the time to first token.
+        plugin_name (str): The name of the plugin, used to select the handler.
+        produce (Callable[[BaseHandler], Iterator[dict]]): Starts the generation with the handler, and returns its events.
+
+    Returns:
+        Iterator[str]: The NDJSON lines.
+    """
+    start = time.perf_counter()
+    first_token = True
+    try:
+        with ConcurrencyLimiter().acquire():
+            handler = Factory.get_handler(plugin_name)
+            for event in produce(handler):
+                if first_token and event["type"] == "token":
+                    first_token = False
+                    TIME_TO_FIRST_TOKEN.observe(
+                        time.perf_counter() - start,
+                        route=route,
+                        handler=handler.ai_name,
+                    )
+                yield json.dumps(event) + "\n"
+    except HTTPException as e:
+        yield json.dumps(
+            {"type": "error", "status": e.status_code, "error": e.detail}
+        ) + "\n"
+    except Exception as e:
+        logger.exception("Streaming generation failed", extra={"route": route})
+        yield json.dumps({"type": "error", "status": 500, "error": str(e)}) + "\n"
+
+
+def streaming_response(
+    route: str,
+    plugin_name: str,
+    produce: Callable[[BaseHandler], Iterator[dict]],
+    background: BackgroundTask = None,
+) -> StreamingResponse:
+    """
+    Returns the NDJSON response streaming the events of a generation.
+
+    Parameters:
+        route (str): The route of the request.
+        plugin_name (str): The name of the plugin, used to select the handler.
+        produce (Callable[[BaseHandler], Iterator[dict]]): Starts the generation with the handler, and returns its events.
+        background (BackgroundTask, optional): Run once the response is sent, even if the generation never started.
+
+    Returns:
+        StreamingResponse: The NDJSON stream of the events.
+    """
+    return StreamingResponse(
+        stream_events(route, plugin_name, produce),
+        media_type="application/x-ndjson",
+        # Prevent reverse proxies from buffering the stream
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"},
+        background=background,
+    )
@@ -0,0 +1,259 @@
+import os
+import copy
+import sys
+import time
+import signal
+import asyncio
+import importlib.util
+from functools import partial
+from multiprocessing import get_context
+from multiprocessing.connection import wait
+
+from hypercorn.asyncio.run import worker_serve
+from hypercorn.config import Config
+from hypercorn.utils import load_application
+
+from src.concurrency.ConcurrencyLimiter import ConcurrencyLimiter
+from src.handlers.UpstreamSession import upstream_connections
+from src.monitoring.Logger import get_logger
+from src.monitoring.MetricsDirectory import MetricsDirectory
+
+logger = get_logger("src.serve")
+
+APPLICATION_PATH = "src.main:app"
+
+DEFAULT_BIND = "0.0.0.0:8585"
+DEFAULT_WORKERS = 1
+DEFAULT_EVENT_LOOP = "auto"
+DEFAULT_KEEP_ALIVE_TIMEOUT = 5.0
+DEFAULT_BACKLOG = 100
+DEFAULT_GRACEFUL_TIMEOUT = 30.0
+
+# Delay given to the cancelled requests to send their response, after the graceful timeout
+CANCELLATION_DELAY = 5.0
+
+DRAIN_POLL_INTERVAL = 0.1
+
+EVENT_LOOPS = ("auto", "asyncio", "uvloop")
+
+SHUTDOWN_SIGNALS = ("SIGINT", "SIGTERM")
+
+
+def get_event_loop(name: str) -> str:
+    """
+    Resolves the event loop to use by the workers.
+
+    Parameters:
+        name (str): "asyncio", "uvloop", or "auto" to use uvloop when it is installed.
+
+    Returns:
+        str: The event loop, "asyncio" or "uvloop".
+
+    Raises:
+        ValueError: If the event loop is unknown, or if uvloop is required but not installed.
+    """
+    if name not in EVENT_LOOPS:
+        raise ValueError(
+            f"Unknown event loop: {name}, expected one of {', '.join(EVENT_LOOPS)}"
+        )
+
+    uvloop_installed = importlib.util.find_spec("uvloop") is not None
+    if name == "uvloop" and not uvloop_installed:
+        raise ValueError(
+            "The uvloop event loop is required but uvloop is not installed"
+        )
+    if name == "auto":
+        return "uvloop" if uvloop_installed else "asyncio"
+    return name
+
+
+def build_config(environment: dict = None) -> Config:
+    """
+    Builds the hypercorn configuration of the proxy from the environment.
+
+    Parameters:
+        environment (dict, optional): The environment variables. Defaults to `os.environ`.
+
+    Returns:
+        Config: The hypercorn configuration.
+    """
+    environment = os.environ if environment is None else environment
+
+    config = Config()
+    config.application_path = APPLICATION_PATH
+    config.bind = [environment.get("BIND", DEFAULT_BIND)]
+    config.workers = int(environment.get("WORKERS", DEFAULT_WORKERS))
+    config.worker_class = get_event_loop(
+        environment.get("EVENT_LOOP", DEFAULT_EVENT_LOOP)
+    )
+    config.keep_alive_timeout = float(
+        environment.get("KEEP_ALIVE_TIMEOUT", DEFAULT_KEEP_ALIVE_TIMEOUT)
+    )
+    config.backlog = int(environment.get("BACKLOG", DEFAULT_BACKLOG))
+    config.graceful_timeout = float(
+        environment.get("GRACEFUL_TIMEOUT", DEFAULT_GRACEFUL_TIMEOUT)
+    )
+    config.accesslog = None
+    config.errorlog = "-"
+    return config
+
+
+async def drain(timeout: float):
+    """
+    Waits up to `timeout` seconds for the requests holding a slot of the limiter,
+    then cancels the calls to the AI of the requests still running.
+    The cancelled requests answer with a 503 status code.
+
+    Parameters:
+        timeout (float): The maximum time to wait for the in-flight requests, in seconds.
+    """
+    limiter = ConcurrencyLimiter()
+    deadline = time.monotonic() + timeout
+    while limiter.active and time.monotonic() < deadline:
+        await asyncio.sleep(DRAIN_POLL_INTERVAL)
+
+    if limiter.active:
+        logger.warning(
+            "Cancelling the requests still running after the graceful timeout",
+            extra={
+                "fields": {
+                    "active": limiter.active,
+                    "cancelledCalls": upstream_connections.cancel(),
+                }
+            },
+        )
+
+
+async def wait_for_shutdown(config: Config, shutdown_event=None):
+    """
+    Waits for a shutdown request, then starts draining the worker.
+
+    The limiter is closed first, so the requests sent on kept-alive connections are rejected,
+    then the server stops accepting connections as soon as this function returns.
+
+    Parameters:
+        config (Config): The hypercorn configuration.
+        shutdown_event (multiprocessing.Event, optional): The event set by the main process to stop
+        the workers. If None, the worker waits for SIGINT or SIGTERM itself.
+    """
+    if shutdown_event is None:
+        loop = asyncio.get_running_loop()
+        signal_event = asyncio.Event()
+        for signal_name in SHUTDOWN_SIGNALS:
+            loop.add_signal_handler(getattr(signal, signal_name), signal_event.set)
+        await signal_event.wait()
+    else:
+        while not shutdown_event.is_set():
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+
+    logger.info(
+        "Shutting down",
+        extra={
+            "fields": {
+                "worker": os.getpid(),
+                "active": ConcurrencyLimiter().active,
+                "gracefulTimeout": config.graceful_timeout,
+            }
+        },
+    )
+    ConcurrencyLimiter().close()
+    asyncio.get_running_loop().create_task(drain(config.graceful_timeout))
+
+
+def run_worker(config: Config, sockets=None, shutdown_event=None):
+    """
+    Runs one worker serving the proxy until shutdown.
+
+    Parameters:
+        config (Config): The hypercorn configuration.
+        sockets (Sockets, optional): The sockets shared by the workers. If None, the worker binds its own.
+        shutdown_event (multiprocessing.Event, optional): The event set by the main process to stop the worker.
+    """
+    app = load_application(config.application_path, config.wsgi_max_body_size)
+
+    # Let the cancelled requests answer before hypercorn closes their connections
+    serving_config = copy.copy(config)
+    serving_config.graceful_timeout = config.graceful_timeout + CANCELLATION_DELAY
+
+    loop_factory = None
+    if config.worker_class == "uvloop":
+        import uvloop
+
+        loop_factory = uvloop.new_event_loop
+
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(
+            worker_serve(
+                app,
+                serving_config,
+                sockets=sockets,
+                shutdown_trigger=partial(wait_for_shutdown, config, shutdown_event),
+            )
+        )
+
+
+def run(config: Config) -> int:
+    """
+    Serves the proxy with `config.workers` worker processes, or in the current process for a single worker.
+
+    On SIGINT or SIGTERM, every worker stops accepting requests, waits up to `config.graceful_timeout` seconds
+    for the in-flight requests, then cancels their calls to the AI and exits.
+    The snapshots of the metrics left by a previous run are removed first.
+
+    Parameters:
+        config (Config): The hypercorn configuration.
+
+    Returns:
+        int: The exit code.
+    """
+    metrics_directory = MetricsDirectory.from_environment()
+    if metrics_directory is not None:
+        metrics_directory.clear()
+
+    if config.workers <= 1:
+        run_worker(config)
+        return 0
+
+    sockets = config.create_sockets()
+    context = get_context("spawn")
+    shutdown_event = context.Event()
+
+    # The workers ignore SIGINT, the main process stops them through the shutdown event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    processes = []
+    for _ in range(config.workers):
+        process = context.Process(
+            target=run_worker,
+            kwargs={
+                "config": config,
+                "sockets": sockets,
+                "shutdown_event": shutdown_event,
+            },
+        )
+        process.start()
+        processes.append(process)
+
+    for signal_name in SHUTDOWN_SIGNALS:
+        signal.signal(getattr(signal, signal_name), lambda *_: shutdown_event.set())
+
+    # Stop all the workers as soon as one of them exits
+    wait([process.sentinel for process in processes])
+    shutdown_event.set()
+    for process in processes:
+        process.join()
+
+    for sock in sockets.secure_sockets + sockets.insecure_sockets:
+        sock.close()
+
+    return max(abs(process.exitcode or 0) for process in processes)
+
+
+def main() -> int:
+    """
+    Serves the proxy, configured from the environment.
+    """
+    return run(build_config())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
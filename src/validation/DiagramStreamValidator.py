@@ -0,0 +1,166 @@
+import os
+
+
+class InvalidOutputError(Exception):
+    """
+    Raised when a streamed output can no longer hold a valid diagram.
+    """
+
+
+CLOSING = {"}": "{", "]": "["}
+
+
+class DiagramStreamValidator:
+    """
+    Checks a generated diagram while it is streamed, to stop the generation as soon as it is clearly invalid.
+
+    The validator is fed with the parts of the generated text as they arrive, with their number of tokens,
+    and raises an InvalidOutputError when:
+    - the JSON (or, in `fenced` mode, the code block holding it) does not start within the first tokens,
+    - the JSON does not start with an object or an array, or its brackets do not match,
+    - text other than whitespace follows the JSON (in `json` mode),
+    - the output is longer than the maximum size, or has more tokens than the maximum number of tokens.
+
+    The modes are `json` for an AI answering raw JSON, `fenced` for an AI answering a JSON code block
+    among some text, and `text` to only check the size of the output.
+
+    The limits are read from the `STREAM_MAX_PREAMBLE_TOKENS` and `STREAM_MAX_OUTPUT_SIZE` environment variables.
+    """
+
+    DEFAULT_MAX_PREAMBLE_TOKENS = 64
+    DEFAULT_MAX_OUTPUT_SIZE = 262144
+
+    def __init__(
+        self,
+        mode: str = "json",
+        max_preamble_tokens: int = DEFAULT_MAX_PREAMBLE_TOKENS,
+        max_output_size: int = DEFAULT_MAX_OUTPUT_SIZE,
+        max_tokens: int = None,
+    ):
+        """
+        Initializes the validator.
+
+        Parameters:
+            mode (str): `json`, `fenced` or `text`.
+            max_preamble_tokens (int): Number of tokens after which the JSON must have started.
+            max_output_size (int): Maximum number of characters of the output.
+            max_tokens (int, optional): Maximum number of tokens of the output.
+        """
+        self.mode = mode
+        self.max_preamble_tokens = max_preamble_tokens
+        self.max_output_size = max_output_size
+        self.max_tokens = max_tokens
+        self.tokens = 0
+        self.size = 0
+        self._state = "text" if mode == "text" else "preamble"
+        self._backticks = 0
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+
+    @classmethod
+    def from_environment(
+        cls, mode: str = "json", max_tokens: int = None
+    ) -> "DiagramStreamValidator":
+        """
+        Creates a validator with the limits read from the environment.
+
+        Parameters:
+            mode (str): `json`, `fenced` or `text`.
+            max_tokens (int, optional): Maximum number of tokens of the output.
+
+        Returns:
+            DiagramStreamValidator: The validator.
+        """
+        return cls(
+            mode,
+            int(
+                os.environ.get(
+                    "STREAM_MAX_PREAMBLE_TOKENS", cls.DEFAULT_MAX_PREAMBLE_TOKENS
+                )
+            ),
+            int(os.environ.get("STREAM_MAX_OUTPUT_SIZE", cls.DEFAULT_MAX_OUTPUT_SIZE)),
+            max_tokens,
+        )
+
+    def feed(self, text: str, tokens: int = 1):
+        """
+        Checks the next part of the output.
+
+        Parameters:
+            text (str): The part of the generated text.
+            tokens (int, optional): The number of tokens of the part. Defaults to 1.
+
+        Raises:
+            InvalidOutputError: If the output can no longer hold a valid diagram.
+        """
+        self.tokens += tokens
+        self.size += len(text)
+        if self.size > self.max_output_size:
+            raise InvalidOutputError(
+                f"The output exceeds {self.max_output_size} characters"
+            )
+        if self.max_tokens is not None and self.tokens > self.max_tokens:
+            raise InvalidOutputError(f"The output exceeds {self.max_tokens} tokens")
+
+        for character in text:
+            self.__feed_character(character)
+
+        if self._state in ("preamble", "fence") and (
+            self.tokens >= self.max_preamble_tokens
+        ):
+            raise InvalidOutputError(
+                f"No JSON within the first {self.max_preamble_tokens} tokens"
+            )
+
+    def __feed_character(self, character: str):
+        """
+        Advances the state of the validator by one character.
+        The states are `preamble` (before the JSON or the code block), `fence` (between the opening backticks
+        of the code block and the JSON), `value` (in the JSON), `after` (once the JSON is complete),
+        and `text` (nothing more to check).
+        """
+        if self._state == "preamble":
+            if self.mode == "fenced":
+                self._backticks = self._backticks + 1 if character == "`" else 0
+                if self._backticks == 3:
+                    self._state = "fence"
+            elif not character.isspace():
+                self.__start_value(character)
+        elif self._state == "fence":
+            # Skip the language of the code block (e.g. "json") and the whitespace before the JSON
+            if not (character.isalnum() or character == "_" or character.isspace()):
+                self.__start_value(character)
+        elif self._state == "value":
+            self.__feed_value(character)
+        elif self._state == "after":
+            if self.mode == "json" and not character.isspace():
+                raise InvalidOutputError("Unexpected text after the JSON")
+
+    def __start_value(self, character: str):
+        if character not in "{[":
+            raise InvalidOutputError(
+                f"The JSON starts with {character!r} instead of an object or an array"
+            )
+        self._state = "value"
+        self._stack.append(character)
+
+    def __feed_value(self, character: str):
+        if self._in_string:
+            if self._escaped:
+                self._escaped = False
+            elif character == "\\":
+                self._escaped = True
+            elif character == '"':
+                self._in_string = False
+        elif character == '"':
+            self._in_string = True
+        elif character in "{[":
+            self._stack.append(character)
+        elif character in CLOSING:
+            if self._stack.pop() != CLOSING[character]:
+                raise InvalidOutputError(f"Unexpected {character!r} in the JSON")
+            if not self._stack:
+                self._state = "after" if self.mode == "json" else "text"
+        elif character == "`":
+            raise InvalidOutputError("The code block ends before the JSON")
@@ -0,0 +1,443 @@
+import re
+import json
+from typing import Any, Callable
+
+
+class SchemaError(Exception):
+    """
+    Raised when a JSON schema is invalid or uses unsupported keywords.
+    """
+
+
+class ValidationError(Exception):
+    """
+    Raised when a value does not match a JSON schema.
+    """
+
+    def __init__(self, path: str, message: str):
+        """
+        Initializes the error.
+
+        Parameters:
+            path (str): The JSON path of the invalid value, e.g `$.spec.containers[0]`.
+            message (str): The reason why the value is invalid.
+        """
+        super().__init__(f"{path}: {message}")
+        self.path = path
+        self.message = message
+
+
+TYPES = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: (
+        isinstance(value, int) or (isinstance(value, float) and value.is_integer())
+    )
+    and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float))
+    and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+
+# Keywords kept in the schema given to Gemini, whose `response_schema` only supports a subset of OpenAPI
+OPENAPI_KEYWORDS = {
+    "type",
+    "format",
+    "title",
+    "description",
+    "nullable",
+    "enum",
+    "properties",
+    "required",
+    "items",
+    "anyOf",
+    "minItems",
+    "maxItems",
+    "minLength",
+    "maxLength",
+    "minimum",
+    "maximum",
+    "pattern",
+}
+
+
+class JsonSchema:
+    """
+    A JSON schema, compiled once into a validator.
+
+    The schema is turned into a tree of closures when the object is created, so validating a value
+    never interprets the schema again. The supported keywords are: `type`, `enum`, `const`, `properties`,
+    `required`, `additionalProperties`, `items`, `minItems`, `maxItems`, `minLength`, `maxLength`, `pattern`,
+    `minimum`, `maximum`, `exclusiveMinimum`, `exclusiveMaximum`, `allOf`, `anyOf`, `oneOf`, `nullable`
+    and local `$ref` (to `#/$defs/...` or `#/definitions/...`). Other keywords are ignored.
+
+    The schema is also converted to the OpenAPI subset accepted by Gemini (`openapi_schema`).
+    """
+
+    def __init__(self, schema: dict):
+        """
+        Compiles the schema.
+
+        Parameters:
+            schema (dict): The JSON schema.
+
+        Raises:
+            SchemaError: If the schema is invalid.
+        """
+        if not isinstance(schema, dict):
+            raise SchemaError("The schema must be an object")
+
+        self.schema = schema
+        self._definitions = {
+            **schema.get("definitions", {}),
+            **schema.get("$defs", {}),
+        }
+        self._references = {}
+        self._validate = self.__compile(schema)
+        self.openapi_schema = self.__to_openapi(schema, ())
+
+    @classmethod
+    def from_json(cls, text: str) -> "JsonSchema":
+        """
+        Compiles a schema given as a JSON string.
+
+        Parameters:
+            text (str): The JSON schema.
+
+        Returns:
+            JsonSchema: The compiled schema.
+
+        Raises:
+            SchemaError: If the text is not valid JSON or the schema is invalid.
+        """
+        try:
+            return cls(json.loads(text))
+        except json.JSONDecodeError as e:
+            raise SchemaError(f"The schema is not valid JSON: {e}")
+
+    def validate(self, value: Any):
+        """
+        Validates a value against the schema.
+
+        Parameters:
+            value (Any): The value, as decoded from JSON.
+
+        Raises:
+            ValidationError: If the value does not match the schema.
+        """
+        self._validate(value, "$")
+
+    def is_valid(self, value: Any) -> bool:
+        """
+        Returns whether a value matches the schema.
+        """
+        try:
+            self.validate(value)
+        except ValidationError:
+            return False
+        return True
+
+    def __resolve(self, reference: str) -> tuple[str, dict]:
+        """
+        Resolves a local reference.
+
+        Parameters:
+            reference (str): The reference, e.g `#/$defs/container`.
+
+        Returns:
+            tuple[str, dict]: The name of the definition and its schema.
+
+        Raises:
+            SchemaError: If the reference is not a local definition.
+        """
+        match = re.fullmatch(r"#/(?:\$defs|definitions)/([^/]+)", reference)
+        if match is None or match.group(1) not in self._definitions:
+            raise SchemaError(f"Unsupported or unknown reference: {reference}")
+        return match.group(1), self._definitions[match.group(1)]
+
+    def __compile_reference(self, reference: str) -> Callable:
+        """
+        Compiles a reference once, allowing recursive definitions.
+        """
+        name, definition = self.__resolve(reference)
+        if name not in self._references:
+            # Set before compiling, so that a recursive reference finds it
+            self._references[name] = None
+            self._references[name] = self.__compile(definition)
+        return lambda value, path: self._references[name](value, path)
+
+    def __compile(self, schema: dict) -> Callable:
+        """
+        Compiles a schema into a function raising a ValidationError for an invalid value.
+
+        Parameters:
+            schema (dict): The schema, or a sub-schema.
+
+        Returns:
+            Callable: The validation function, taking the value and its path.
+        """
+        if schema is True or schema == {}:
+            return lambda value, path: None
+        if schema is False:
+
+            def reject(value, path):
+                raise ValidationError(path, "no value is allowed")
+
+            return reject
+        if not isinstance(schema, dict):
+            raise SchemaError(f"Invalid schema: {schema!r}")
+
+        checks = []
+
+        if "$ref" in schema:
+            checks.append(self.__compile_reference(schema["$ref"]))
+
+        if "type" in schema:
+            names = (
+                schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+            )
+            if schema.get("nullable"):
+                names = names + ["null"]
+            unknown = [name for name in names if name not in TYPES]
+            if unknown:
+                raise SchemaError(f"Unknown type: {unknown[0]}")
+            predicates = [TYPES[name] for name in names]
+            expected = " or ".join(names)
+
+            def check_type(value, path):
+                if not any(predicate(value) for predicate in predicates):
+                    raise ValidationError(path, f"expected {expected}")
+
+            checks.append(check_type)
+
+        if "enum" in schema:
+            allowed = schema["enum"]
+
+            def check_enum(value, path):
+                if value not in allowed:
+                    raise ValidationError(path, f"expected one of {allowed}")
+
+            checks.append(check_enum)
+
+        if "const" in schema:
+            constant = schema["const"]
+
+            def check_const(value, path):
+                if value != constant:
+                    raise ValidationError(path, f"expected {constant!r}")
+
+            checks.append(check_const)
+
+        checks.extend(self.__compile_object(schema))
+        checks.extend(self.__compile_array(schema))
+        checks.extend(self.__compile_string(schema))
+        checks.extend(self.__compile_number(schema))
+        checks.extend(self.__compile_combinations(schema))
+
+        if schema.get("nullable") and "type" not in schema:
+            inner = checks
+
+            def check_nullable(value, path):
+                if value is not None:
+                    for check in inner:
+                        check(value, path)
+
+            return check_nullable
+
+        if len(checks) == 1:
+            return checks[0]
+
+        def check_all(value, path):
+            for check in checks:
+                check(value, path)
+
+        return check_all
+
+    def __compile_object(self, schema: dict) -> list[Callable]:
+        checks = []
+        properties = {
+            name: self.__compile(subschema)
+            for name, subschema in schema.get("properties", {}).items()
+        }
+        required = schema.get("required", [])
+        additional = schema.get("additionalProperties", True)
+        additional_check = (
+            None if additional in (True, False) else self.__compile(additional)
+        )
+
+        if properties or required or additional is not True:
+
+            def check_object(value, path):
+                if not isinstance(value, dict):
+                    return
+                for name in required:
+                    if name not in value:
+                        raise ValidationError(path, f"missing property {name!r}")
+                for name, item in value.items():
+                    check = properties.get(name)
+                    if check is not None:
+                        check(item, f"{path}.{name}")
+                    elif additional is False:
+                        raise ValidationError(path, f"unexpected property {name!r}")
+                    elif additional_check is not None:
+                        additional_check(item, f"{path}.{name}")
+
+            checks.append(check_object)
+        return checks
+
+    def __compile_array(self, schema: dict) -> list[Callable]:
+        checks = []
+        items = self.__compile(schema["items"]) if "items" in schema else None
+        min_items = schema.get("minItems")
+        max_items = schema.get("maxItems")
+
+        if items is not None or min_items is not None or max_items is not None:
+
+            def check_array(value, path):
+                if not isinstance(value, list):
+                    return
+                if min_items is not None and len(value) < min_items:
+                    raise ValidationError(path, f"expected at least {min_items} items")
+                if max_items is not None and len(value) > max_items:
+                    raise ValidationError(path, f"expected at most {max_items} items")
+                if items is not None:
+                    for index, item in enumerate(value):
+                        items(item, f"{path}[{index}]")
+
+            checks.append(check_array)
+        return checks
+
+    def __compile_string(self, schema: dict) -> list[Callable]:
+        checks = []
+        min_length = schema.get("minLength")
+        max_length = schema.get("maxLength")
+        try:
+            pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+        except re.error as e:
+            raise SchemaError(f"Invalid pattern {schema['pattern']!r}: {e}")
+
+        if pattern is not None or min_length is not None or max_length is not None:
+
+            def check_string(value, path):
+                if not isinstance(value, str):
+                    return
+                if min_length is not None and len(value) < min_length:
+                    raise ValidationError(
+                        path, f"expected at least {min_length} characters"
+                    )
+                if max_length is not None and len(value) > max_length:
+                    raise ValidationError(
+                        path, f"expected at most {max_length} characters"
+                    )
+                if pattern is not None and pattern.search(value) is None:
+                    raise ValidationError(
+                        path, f"does not match the pattern {pattern.pattern!r}"
+                    )
+
+            checks.append(check_string)
+        return checks
+
+    def __compile_number(self, schema: dict) -> list[Callable]:
+        bounds = [
+            (schema.get("minimum"), lambda value, bound: value >= bound, ">="),
+            (schema.get("maximum"), lambda value, bound: value <= bound, "<="),
+            (schema.get("exclusiveMinimum"), lambda value, bound: value > bound, ">"),
+            (schema.get("exclusiveMaximum"), lambda value, bound: value < bound, "<"),
+        ]
+        bounds = [bound for bound in bounds if bound[0] is not None]
+        if not bounds:
+            return []
+
+        def check_number(value, path):
+            if not TYPES["number"](value):
+                return
+            for bound, compare, operator in bounds:
+                if not compare(value, bound):
+                    raise ValidationError(path, f"expected a number {operator} {bound}")
+
+        return [check_number]
+
+    def __compile_combinations(self, schema: dict) -> list[Callable]:
+        checks = []
+        for subschema in schema.get("allOf", []):
+            checks.append(self.__compile(subschema))
+
+        for keyword, exactly_one in (("anyOf", False), ("oneOf", True)):
+            if keyword not in schema:
+                continue
+            alternatives = [self.__compile(subschema) for subschema in schema[keyword]]
+
+            def check_alternatives(
+                value, path, alternatives=alternatives, exactly_one=exactly_one
+            ):
+                matches = 0
+                for alternative in alternatives:
+                    try:
+                        alternative(value, path)
+                    except ValidationError:
+                        continue
+                    matches += 1
+                    if not exactly_one:
+                        return
+                if matches == 0:
+                    raise ValidationError(path, "matches none of the alternatives")
+                if matches > 1:
+                    raise ValidationError(path, "matches several alternatives")
+
+            checks.append(check_alternatives)
+        return checks
+
+    def __to_openapi(self, schema: dict, references: tuple) -> dict:
+        """
+        Converts a schema to the OpenAPI subset accepted by Gemini.
+
+        References are inlined, `const` becomes a single-value `enum`, `oneOf` becomes `anyOf`,
+        a nullable type list becomes `nullable`, and unsupported keywords are dropped.
+        A recursive reference is replaced by an unconstrained object, Gemini schemas being finite.
+
+        Parameters:
+            schema (dict): The schema, or a sub-schema.
+            references (tuple): The names of the references being inlined, to detect recursion.
+
+        Returns:
+            dict: The OpenAPI schema.
+        """
+        if not isinstance(schema, dict):
+            return {}
+
+        if "$ref" in schema:
+            name, definition = self.__resolve(schema["$ref"])
+            if name in references:
+                return {"type": "OBJECT"}
+            return self.__to_openapi(
+                {**definition, **{k: v for k, v in schema.items() if k != "$ref"}},
+                references + (name,),
+            )
+
+        converted = {}
+        for key, value in schema.items():
+            if key == "type":
+                names = value if isinstance(value, list) else [value]
+                if "null" in names:
+                    converted["nullable"] = True
+                    names = [name for name in names if name != "null"]
+                if names:
+                    converted["type"] = names[0].upper()
+            elif key == "const":
+                converted["enum"] = [value]
+            elif key == "properties":
+                converted["properties"] = {
+                    name: self.__to_openapi(subschema, references)
+                    for name, subschema in value.items()
+                }
+            elif key == "items":
+                converted["items"] = self.__to_openapi(value, references)
+            elif key in ("anyOf", "oneOf"):
+                converted["anyOf"] = [
+                    self.__to_openapi(subschema, references) for subschema in value
+                ]
+            elif key in OPENAPI_KEYWORDS:
+                converted[key] = value
+        return converted
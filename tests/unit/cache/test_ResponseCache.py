@@ -0,0 +1,98 @@
+import os
+import json
+import sqlite3
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from fastapi.responses import JSONResponse
+
+from src.cache.ResponseCache import ResponseCache
+from src.cache.ResponseStore import ResponseStore
+from src.configuration.configurationManager import ConfigurationManager
+from src.models.Diagram import Diagram
+from src.monitoring.Metrics import RESPONSE_CACHE_REQUESTS
+
+
+class TestResponseCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.environment = {
+            "RESPONSE_CACHE_SIZE": "10",
+            "RESPONSE_CACHE_PATH": os.path.join(self.directory.name, "responses.db"),
+        }
+        ConfigurationManager().reset()
+        ConfigurationManager().publish({"ollama": {"defaultModel": "mistral"}})
+        ResponseCache().reset()
+        RESPONSE_CACHE_REQUESTS.reset()
+        self.generations = 0
+
+    def tearDown(self):
+        ConfigurationManager().reset()
+        ResponseCache().reset()
+        self.directory.cleanup()
+
+    def generate(self, description: str = "a pod running nginx"):
+        def generate_diagram():
+            self.generations += 1
+            return JSONResponse(content={"generation": self.generations})
+
+        with patch.dict(os.environ, self.environment):
+            response = ResponseCache().generate(
+                Diagram(pluginName="default", description=description),
+                generate_diagram,
+            )
+        return json.loads(response.body)
+
+    def test_memory_tier_fills_from_disk_tier(self):
+        assert self.generate() == {"generation": 1}
+        assert self.generate() == {"generation": 1}
+        assert RESPONSE_CACHE_REQUESTS.get(tier="memory", result="hit") == 1
+
+        # Another worker, or a restart, only has the disk tier
+        ResponseCache().reset()
+        assert self.generate() == {"generation": 1}
+        assert self.generate() == {"generation": 1}
+        assert RESPONSE_CACHE_REQUESTS.get(tier="disk", result="hit") == 1
+        assert RESPONSE_CACHE_REQUESTS.get(tier="memory", result="hit") == 2
+        assert self.generate("a postgres database") == {"generation": 2}
+
+    def test_new_configuration_changes_the_keys(self):
+        self.generate()
+        ConfigurationManager().publish({"ollama": {"defaultModel": "llama3"}})
+
+        assert self.generate() == {"generation": 2}
+
+    def test_disabled_by_default(self):
+        self.environment = {}
+        self.generate()
+
+        assert self.generate() == {"generation": 2}
+        assert not ResponseCache().enabled
+
+    def test_errors_are_not_cached(self):
+        with patch.dict(os.environ, self.environment):
+            diagram = Diagram(pluginName="default", description="a pod")
+            ResponseCache().generate(
+                diagram, lambda: JSONResponse(content={}, status_code=530)
+            )
+            response = ResponseCache().generate(diagram, lambda: {"generated": True})
+
+        assert response == {"generated": True}
+
+    def test_disk_tier_errors_fall_back_to_the_generation(self):
+        """
+        Test that a locked or corrupted SQLite file does not fail the requests, which are generated as on a miss.
+        """
+        self.environment["RESPONSE_CACHE_SIZE"] = "0"
+        self.generate()
+        error = sqlite3.OperationalError("database is locked")
+
+        with patch.object(ResponseStore, "get", side_effect=error), patch.object(
+            ResponseStore, "set", side_effect=error
+        ):
+            assert self.generate() == {"generation": 2}
+            assert self.generate("a postgres database") == {"generation": 3}
+
+        assert RESPONSE_CACHE_REQUESTS.get(tier="disk", result="miss") == 3
@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from src.cache.ResponseStore import ResponseStore
+
+
+class TestResponseStore(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "responses.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_shared_between_stores(self):
+        """
+        Test that a response stored by a worker is read by another one, or after a restart.
+        """
+        ResponseStore(self.path, 1000).set("key", '{"diagram": 1}')
+
+        store = ResponseStore(self.path, 1000)
+        assert store.get("key") == '{"diagram": 1}'
+        assert store.get("other") is None
+        assert store.size() == 14
+
+    def test_least_recently_read_responses_are_removed(self):
+        store = ResponseStore(self.path, 30)
+        store.set("first", "a" * 10)
+        store.set("second", "b" * 10)
+        store.get("first")
+        store.set("third", "c" * 15)
+
+        assert store.get("first") == "a" * 10
+        assert store.get("second") is None
+        assert store.get("third") == "c" * 15
+        assert store.size() == 25
+
+        store.set("too big", "d" * 31)
+        assert store.get("too big") is None
+
+    def test_total_size_is_kept_on_writes(self):
+        """
+        Test that the total size kept by the triggers follows the replaced and removed responses,
+        and is computed once for a database created without it.
+        """
+        connection = sqlite3.connect(self.path)
+        connection.execute(
+            "CREATE TABLE responses (key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, read_at REAL NOT NULL)"
+        )
+        connection.execute("INSERT INTO responses VALUES ('old', 'aaaaa', 5, 0)")
+        connection.commit()
+        connection.close()
+
+        store = ResponseStore(self.path, 20)
+        assert store.size() == 5
+
+        store.set("old", "a" * 8)
+        store.set("new", "b" * 10)
+        assert store.size() == 18
+
+        store.set("last", "c" * 4)
+        assert store.get("old") is None
+        assert store.size() == 14
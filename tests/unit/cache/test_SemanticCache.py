@@ -0,0 +1,119 @@
+import json
+import pytest
+import requests
+from unittest import TestCase
+from unittest.mock import patch
+
+from fastapi.responses import JSONResponse
+
+pytest.importorskip("numpy")
+
+from src.cache.SemanticCache import SemanticCache
+from src.configuration.configurationManager import ConfigurationManager
+from src.models.Diagram import Diagram
+from src.monitoring.Metrics import SEMANTIC_CACHE_REQUESTS, SEMANTIC_CACHE_SIMILARITY
+
+EMBEDDINGS = {
+    "a pod running nginx on port 80": [1.0, 0.1, 0.0],
+    "nginx pod exposing 80": [0.98, 0.12, 0.01],
+    "a postgres database": [0.0, 0.2, 1.0],
+}
+
+
+def embed(url, json=None, **kwargs):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = (
+        '{"embeddings": %s}' % [EMBEDDINGS[text] for text in json["input"]]
+    ).encode()
+    return response
+
+
+class TestSemanticCache(TestCase):
+
+    def setUp(self):
+        ConfigurationManager().reset()
+        SemanticCache().reset()
+        SEMANTIC_CACHE_REQUESTS.reset()
+        SEMANTIC_CACHE_SIMILARITY.reset()
+        self.generations = 0
+
+    def tearDown(self):
+        ConfigurationManager().reset()
+        SemanticCache().reset()
+
+    def publish(self, semantic_cache: dict = None):
+        ollama = {"base_url": "http://localhost", "defaultModel": "mistral"}
+        if semantic_cache is not None:
+            ollama["semanticCache"] = semantic_cache
+        ConfigurationManager().publish({"ollama": ollama})
+
+    def generate(self, description: str, plugin_name: str = "default"):
+        def generate_diagram():
+            self.generations += 1
+            return JSONResponse(content={"generation": self.generations})
+
+        with patch(
+            "src.handlers.BaseHandler.upstream_session.post", side_effect=embed
+        ) as mock_post:
+            response = SemanticCache().generate(
+                Diagram(pluginName=plugin_name, description=description),
+                generate_diagram,
+            )
+        self.embed_calls = mock_post.call_count
+        return json.loads(response.body)
+
+    def test_similar_description_hits_the_cache(self):
+        self.publish({"embeddingModel": "nomic-embed-text", "threshold": "0.99"})
+
+        assert self.generate("a pod running nginx on port 80") == {"generation": 1}
+        assert self.generate("nginx pod exposing 80") == {"generation": 1}
+        assert self.generate("a postgres database") == {"generation": 2}
+        assert self.generate("nginx pod exposing 80", "other-plugin") == {
+            "generation": 3
+        }
+
+        assert SEMANTIC_CACHE_REQUESTS.get(plugin="default", result="hit") == 1
+        assert SEMANTIC_CACHE_REQUESTS.get(plugin="default", result="miss") == 2
+        assert SEMANTIC_CACHE_SIMILARITY.get_count(plugin="default") == 2
+
+    def test_missing_numpy_is_logged(self):
+        self.publish({"embeddingModel": "nomic-embed-text"})
+        SemanticCache().available = False
+
+        with patch("src.cache.SemanticCache.logger.warning") as mock_warning:
+            assert self.generate("a pod running nginx on port 80") == {"generation": 1}
+            assert self.generate("nginx pod exposing 80") == {"generation": 2}
+
+        assert self.embed_calls == 0
+        mock_warning.assert_called_once()
+
+    def test_new_configuration_empties_the_cache(self):
+        self.publish({"embeddingModel": "nomic-embed-text"})
+        self.generate("a pod running nginx on port 80")
+        self.publish({"embeddingModel": "nomic-embed-text"})
+
+        assert self.generate("a pod running nginx on port 80") == {"generation": 2}
+
+    def test_disabled_without_embedding_model(self):
+        self.publish()
+
+        self.generate("a pod running nginx on port 80")
+        self.generate("a pod running nginx on port 80")
+
+        assert self.generations == 2
+        assert self.embed_calls == 0
+
+    def test_embedding_error_only_generates(self):
+        self.publish({"embeddingModel": "nomic-embed-text"})
+
+        with patch(
+            "src.handlers.BaseHandler.upstream_session.post",
+            side_effect=requests.exceptions.ConnectionError(),
+        ):
+            response = SemanticCache().generate(
+                Diagram(pluginName="default", description="a postgres database"),
+                lambda: {"generated": True},
+            )
+
+        assert response == {"generated": True}
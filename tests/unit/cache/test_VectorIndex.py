@@ -0,0 +1,68 @@
+import pytest
+from unittest import TestCase
+
+pytest.importorskip("numpy")
+
+from src.cache.VectorIndex import VectorIndex
+
+
+class TestVectorIndex(TestCase):
+
+    def test_search(self):
+        index = VectorIndex(10)
+        assert index.search([[1, 0]]) == [(0.0, None)]
+
+        index.add([1, 0], "east")
+        index.add([0, 2], "north")
+
+        results = index.search([[3, 0.1], [0, -1], [1, 1]])
+        assert results[0][1] == "east"
+        assert results[0][0] == pytest.approx(0.9994, abs=1e-4)
+        assert results[1][0] == pytest.approx(0)
+        assert results[2][0] == pytest.approx(0.7071, abs=1e-4)
+
+    def test_least_recently_used_entry_is_replaced(self):
+        index = VectorIndex(2)
+        index.add([1, 0], "east")
+        index.add([0, 1], "north")
+        index.search([[1, 0]])
+        index.add([-1, 0], "west")
+
+        assert len(index) == 2
+        assert index.search([[0, 1]])[0][1] != "north"
+        assert index.search([[1, 0]])[0] == (pytest.approx(1), "east")
+
+    def test_other_dimension_empties_the_index(self):
+        index = VectorIndex(2)
+        index.add([1, 0], "east")
+        index.add([1, 0, 0], "other model")
+
+        assert len(index) == 1
+        assert index.search([[1, 0]]) == [(0.0, None)]
+
+    def test_other_dimension_resets_the_eviction_order(self):
+        index = VectorIndex(2)
+        index.add([1, 0], "east")
+        index.add([0, 1], "north")
+        index.search([[0, 1]])
+        index.add([1, 0, 0], "x")
+        index.add([0, 1, 0], "y")
+        index.search([[1, 0, 0]])
+        index.add([0, 0, 1], "z")
+
+        assert len(index) == 2
+        assert index._clock == 4
+        assert index.search([[0, 1, 0]])[0][1] != "y"
+        assert index.search([[1, 0, 0]])[0] == (pytest.approx(1), "x")
+        assert index.search([[0, 0, 1]])[0] == (pytest.approx(1), "z")
+
+    def test_misses_do_not_keep_entries(self):
+        index = VectorIndex(2)
+        index.add([1, 0], "east")
+        index.add([0, 1], "north")
+        # The closest entry is east, but too far to be a hit
+        index.search([[1, -1]], threshold=0.9)
+        index.add([-1, 0], "west")
+
+        assert index.search([[1, 0]])[0][1] != "east"
+        assert index.search([[0, 1]])[0] == (pytest.approx(1), "north")
@@ -0,0 +1,150 @@
+import threading
+import pytest
+from fastapi import HTTPException
+from unittest import TestCase
+
+from src.concurrency.ConcurrencyLimiter import ConcurrencyLimiter
+from src.monitoring.RequestContext import RequestContext
+
+
+class TestConcurrencyLimiter(TestCase):
+
+    def setUp(self) -> None:
+        ConcurrencyLimiter().reset()
+        self.limiter = ConcurrencyLimiter()
+        self.limiter.limit = 1
+
+    def tearDown(self) -> None:
+        ConcurrencyLimiter().reset()
+
+    def test_singleton(self):
+        self.assertIs(ConcurrencyLimiter(), self.limiter)
+
+    def test_acquire_counts_active_requests(self):
+        with self.limiter.acquire():
+            assert self.limiter.active == 1
+        assert self.limiter.active == 0
+
+    def test_acquire_timeout(self):
+        """
+        Tests that a request waiting longer than its timeout is rejected, and is not counted as queued anymore.
+        """
+        with self.limiter.acquire():
+            with pytest.raises(HTTPException, match="Too many concurrent requests"):
+                with self.limiter.acquire(timeout=0.01):
+                    pass
+            assert self.limiter.queue_depth == 0
+
+    def test_acquire_deadline(self):
+        """
+        Tests that a request is dropped if its deadline has expired, and waits for a slot until its deadline at most.
+        """
+        token = RequestContext(timeout=-1).activate()
+        try:
+            with pytest.raises(
+                HTTPException, match="deadline of the request has expired"
+            ):
+                with self.limiter.acquire():
+                    pass
+        finally:
+            RequestContext.deactivate(token)
+
+        with self.limiter.acquire():
+            token = RequestContext(timeout=0.01).activate()
+            try:
+                with pytest.raises(HTTPException) as error:
+                    with self.limiter.acquire(timeout=10):
+                        pass
+            finally:
+                RequestContext.deactivate(token)
+        assert error.value.status_code == 504
+        assert self.limiter.queue_depth == 0
+
+    def test_acquire_client_disconnect(self):
+        """
+        Tests that a queued request leaves the queue when its client disconnects.
+        """
+        context = RequestContext()
+        errors = []
+
+        def worker():
+            token = context.activate()
+            try:
+                with self.limiter.acquire():
+                    pass
+            except HTTPException as e:
+                errors.append(e.status_code)
+            finally:
+                RequestContext.deactivate(token)
+
+        with self.limiter.acquire():
+            thread = threading.Thread(target=worker)
+            thread.start()
+            while self.limiter.queue_depth == 0:
+                pass
+            context.disconnect()
+            thread.join(1)
+            assert errors == [499]
+            assert self.limiter.queue_depth == 0
+
+    def test_acquire_waits_for_release(self):
+        entered = threading.Event()
+
+        def worker():
+            with self.limiter.acquire():
+                entered.set()
+
+        with self.limiter.acquire():
+            thread = threading.Thread(target=worker)
+            thread.start()
+            assert not entered.wait(0.05)
+            assert self.limiter.queue_depth == 1
+
+        thread.join(1)
+        assert entered.is_set()
+
+    def test_close_rejects_queued_and_new_requests(self):
+        errors = []
+
+        def worker():
+            try:
+                with self.limiter.acquire():
+                    pass
+            except HTTPException as e:
+                errors.append(e.status_code)
+
+        with self.limiter.acquire():
+            thread = threading.Thread(target=worker)
+            thread.start()
+            while self.limiter.queue_depth == 0:
+                pass
+            self.limiter.close()
+            thread.join(1)
+            assert errors == [503]
+
+        with pytest.raises(HTTPException, match="shutting down"):
+            with self.limiter.acquire():
+                pass
+
+        self.limiter.open()
+        with self.limiter.acquire():
+            assert self.limiter.active == 1
+
+    def test_wait_idle(self):
+        assert self.limiter.wait_idle(0)
+        with self.limiter.acquire():
+            assert not self.limiter.wait_idle(0.01)
+
+        released = threading.Event()
+
+        def worker():
+            with self.limiter.acquire():
+                released.wait(1)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        while self.limiter.active == 0:
+            pass
+        released.set()
+        assert self.limiter.wait_idle(1)
+        thread.join(1)
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.concurrency.ProcessingPool import ProcessingPool
+from src.monitoring.Metrics import PROCESSING_QUEUE_TIME, PROCESSING_TASKS
+
+
+def current_thread_name(_):
+    return threading.current_thread().name
+
+
+class TestProcessingPool(TestCase):
+
+    def setUp(self) -> None:
+        ProcessingPool().reset()
+        PROCESSING_TASKS.reset()
+        PROCESSING_QUEUE_TIME.reset()
+        self.pool = ProcessingPool()
+        self.pool.inline_threshold = 10
+
+    def tearDown(self) -> None:
+        ProcessingPool().reset()
+
+    def test_singleton(self):
+        self.assertIs(ProcessingPool(), self.pool)
+
+    def test_configuration(self):
+        ProcessingPool().reset()
+        environment = {
+            "PROCESSING_POOL": "process",
+            "PROCESSING_POOL_WORKERS": "3",
+            "PROCESSING_INLINE_THRESHOLD": "100",
+        }
+        with patch.dict(os.environ, environment):
+            pool = ProcessingPool()
+
+        assert (pool.kind, pool.workers, pool.inline_threshold) == ("process", 3, 100)
+
+    def test_run_async_small_tasks_inline(self):
+        name = asyncio.run(
+            self.pool.run_async("test", current_thread_name, None, size=5)
+        )
+
+        assert name == threading.current_thread().name
+        assert PROCESSING_TASKS.get(task="test", execution="inline") == 1
+        assert PROCESSING_QUEUE_TIME.get_count(task="test", executor="thread") == 0
+
+    def test_run_async_large_tasks_in_threads(self):
+        """
+        Tests that large tasks are run by the thread pool, even portable ones when the pool has no processes.
+        """
+        name = asyncio.run(
+            self.pool.run_async(
+                "test", current_thread_name, None, size=50, portable=True
+            )
+        )
+
+        assert name.startswith("processing")
+        assert PROCESSING_TASKS.get(task="test", execution="thread") == 1
+        assert PROCESSING_QUEUE_TIME.get_count(task="test", executor="thread") == 1
+
+    def test_run_from_threads_inline(self):
+        """
+        Tests that tasks run from a worker thread are not handed over to another thread.
+        """
+        assert self.pool.run("test", current_thread_name, None, size=50) == (
+            threading.current_thread().name
+        )
+        assert PROCESSING_TASKS.get(task="test", execution="inline") == 1
+
+    def test_run_in_processes(self):
+        self.pool.kind = "process"
+        self.pool.workers = 1
+
+        assert self.pool.run(
+            "test", json.loads, '{"a": [1, 2]}', size=50, portable=True
+        ) == {"a": [1, 2]}
+        assert self.pool.run("test", json.loads, "[1]", size=50) == [1]
+
+        assert PROCESSING_TASKS.get(task="test", execution="process") == 1
+        assert PROCESSING_TASKS.get(task="test", execution="inline") == 1
+        assert PROCESSING_QUEUE_TIME.get_count(task="test", executor="process") == 1
+
+    def test_errors_are_raised_to_the_caller(self):
+        self.pool.kind = "process"
+        self.pool.workers = 1
+
+        with self.assertRaises(json.JSONDecodeError):
+            self.pool.run("test", json.loads, "{" * 20, size=50, portable=True)
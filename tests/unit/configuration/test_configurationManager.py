@@ -114,3 +114,101 @@ class TestAsyncConfigurationManager(IsolatedAsyncioTestCase):
         await config_manager.set_configuration(encrypted_config, key)
         config = config_manager.get_configuration()
         self.assertEqual(config, json.loads(original_config))
+
+    async def test_set_configuration_publishes_new_snapshot(self):
+        """
+        Tests that every set configuration is published as a new snapshot with a greater version,
+        and that a snapshot already read is not modified by the next configuration.
+        """
+        config_manager = ConfigurationManager()
+        key = "123456789"
+
+        first_snapshot = await config_manager.set_configuration(
+            encrypt_test_function(key, '{"ollama.defaultModel": "mistral"}'), key
+        )
+        second_snapshot = await config_manager.set_configuration(
+            encrypt_test_function(key, '{"ollama.defaultModel": "llama3"}'), key
+        )
+
+        self.assertGreater(second_snapshot.version, first_snapshot.version)
+        self.assertIs(config_manager.get_snapshot(), second_snapshot)
+        self.assertEqual(
+            first_snapshot.configuration, {"ollama": {"defaultModel": "mistral"}}
+        )
+        self.assertEqual(
+            second_snapshot.configuration, {"ollama": {"defaultModel": "llama3"}}
+        )
+
+    async def test_set_configuration_compiles_schemas(self):
+        """
+        Tests that the schemas of the plugins are compiled in the snapshot,
+        and that a configuration with an invalid schema is rejected without being published.
+        """
+        config_manager = ConfigurationManager()
+        key = "123456789"
+
+        snapshot = await config_manager.set_configuration(
+            encrypt_test_function(
+                key,
+                json.dumps(
+                    {
+                        "ollama.defaultModel": "mistral",
+                        "pluginSchemas.default": '{"type": "object"}',
+                    }
+                ),
+            ),
+            key,
+        )
+        self.assertTrue(snapshot.get_schema("other-plugin").is_valid({}))
+        self.assertFalse(snapshot.get_schema("other-plugin").is_valid([]))
+
+        with pytest.raises(
+            HTTPException, match="Invalid schema for the plugin default"
+        ):
+            await config_manager.set_configuration(
+                encrypt_test_function(
+                    key, json.dumps({"pluginSchemas.default": '{"type": "unknown"}'})
+                ),
+                key,
+            )
+        self.assertIs(config_manager.get_snapshot(), snapshot)
+
+    async def test_set_configuration_compiles_profiles(self):
+        """
+        Tests that the generation profiles are compiled in the snapshot, by mode and plugin,
+        and that a configuration with an invalid profile is rejected without being published.
+        """
+        config_manager = ConfigurationManager()
+        key = "123456789"
+
+        snapshot = await config_manager.set_configuration(
+            encrypt_test_function(
+                key,
+                json.dumps(
+                    {
+                        "ollama.defaultModel": "mistral",
+                        "generationProfiles.generate.default": '{"maxOutputTokens": 512}',
+                        "generationProfiles.generate.plugin": '{"temperature": 0}',
+                    }
+                ),
+            ),
+            key,
+        )
+        self.assertEqual(
+            snapshot.get_profile("other-plugin", "generate").max_output_tokens, 512
+        )
+        self.assertEqual(snapshot.get_profile("plugin", "generate").temperature, 0)
+        self.assertEqual(snapshot.get_profile("plugin", "message").ollama_options(), {})
+
+        with pytest.raises(
+            HTTPException,
+            match="Invalid generation profile for the plugin default in message mode",
+        ):
+            await config_manager.set_configuration(
+                encrypt_test_function(
+                    key,
+                    json.dumps({"generationProfiles.message.default": '{"seed": 1}'}),
+                ),
+                key,
+            )
+        self.assertIs(config_manager.get_snapshot(), snapshot)
@@ -0,0 +1,54 @@
+import os
+from unittest import TestCase
+from tempfile import TemporaryDirectory
+
+from src.configuration.configurationStore import ConfigurationStore
+
+
+class TestConfigurationStore(TestCase):
+
+    def setUp(self) -> None:
+        self.directory = TemporaryDirectory()
+        self.store = ConfigurationStore(
+            os.path.join(self.directory.name, "shared", "configuration")
+        )
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_read_without_file(self):
+        assert self.store.read() is None
+        assert self.store.signature() is None
+
+    def test_write_and_read(self):
+        version = self.store.write(b"encrypted")
+
+        assert version == 1
+        assert self.store.read() == (1, b"encrypted")
+        assert os.stat(self.store.path).st_mode & 0o777 == 0o600
+
+    def test_write_increments_version(self):
+        """
+        Tests that a new version is greater than both the stored version and the given minimum version.
+        """
+        self.store.write(b"first")
+        assert self.store.write(b"second") == 2
+        assert self.store.write(b"third", minimum_version=10) == 11
+        assert self.store.read() == (11, b"third")
+
+    def test_signature_changes_on_write(self):
+        self.store.write(b"first")
+        signature = self.store.signature()
+        self.store.write(b"second")
+
+        assert self.store.signature() != signature
+
+    def test_from_environment(self):
+        os.environ.pop("CONFIGURATION_STORE_PATH", None)
+        assert ConfigurationStore.from_environment() is None
+
+        os.environ["CONFIGURATION_STORE_PATH"] = self.store.path
+        try:
+            assert ConfigurationStore.from_environment().path == self.store.path
+        finally:
+            del os.environ["CONFIGURATION_STORE_PATH"]
@@ -0,0 +1,79 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import IsolatedAsyncioTestCase
+
+from src.configuration.configurationManager import ConfigurationManager
+from src.configuration.configurationStore import ConfigurationStore
+from src.configuration.configurationWatcher import ConfigurationWatcher
+from tests.unit.configuration.test_configurationManager import encrypt_test_function
+
+KEY = "123456789"
+
+
+class TestConfigurationWatcher(IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.directory = TemporaryDirectory()
+        self.store = ConfigurationStore(os.path.join(self.directory.name, "store"))
+        self.configuration_manager = ConfigurationManager()
+        self.configuration_manager._store = self.store
+        os.environ["DECRYPTION_KEY"] = KEY
+
+    def tearDown(self) -> None:
+        self.configuration_manager._store = None
+        self.configuration_manager.reset()
+        del os.environ["DECRYPTION_KEY"]
+        self.directory.cleanup()
+
+    async def test_set_configuration_writes_store(self):
+        encrypted = encrypt_test_function(KEY, '{"ollama.defaultModel": "mistral"}')
+
+        snapshot = await self.configuration_manager.set_configuration(encrypted)
+
+        assert self.store.read() == (snapshot.version, encrypted)
+
+    async def test_poll_publishes_newer_configuration(self):
+        """
+        Tests that a configuration written by another worker is published with the same version.
+        """
+        await self.configuration_manager.set_configuration(
+            encrypt_test_function(KEY, '{"ollama.defaultModel": "mistral"}')
+        )
+        watcher = ConfigurationWatcher(self.store)
+        # The configuration of this worker is already active
+        assert watcher.poll() is None
+
+        version = self.store.write(
+            encrypt_test_function(KEY, '{"ollama.defaultModel": "llama3"}'),
+            self.configuration_manager.current_version,
+        )
+        snapshot = watcher.poll()
+
+        assert snapshot.version == version
+        assert self.configuration_manager.current_version == version
+        assert snapshot.configuration == {"ollama": {"defaultModel": "llama3"}}
+        # Nothing changed since the last check
+        assert watcher.poll() is None
+
+    async def test_load_from_store(self):
+        """
+        Tests that the last accepted configuration is loaded back, e.g. after a restart.
+        """
+        version = self.store.write(
+            encrypt_test_function(KEY, '{"ollama.defaultModel": "mistral"}'),
+            self.configuration_manager.current_version,
+        )
+
+        snapshot = self.configuration_manager.load_from_store()
+
+        assert snapshot.version == version
+        assert self.configuration_manager.get_configuration() == {
+            "ollama": {"defaultModel": "mistral"}
+        }
+        # Already loaded
+        assert self.configuration_manager.load_from_store() is None
+
+    async def test_poll_ignores_invalid_configuration(self):
+        self.store.write(b"not encrypted", self.configuration_manager.current_version)
+
+        assert ConfigurationWatcher(self.store).poll() is None
@@ -0,0 +1,45 @@
+import pytest
+from unittest import TestCase
+
+from src.configuration.generationProfile import GenerationProfile, ProfileError
+
+
+class TestGenerationProfile(TestCase):
+
+    def test_from_json(self):
+        profile = GenerationProfile.from_json(
+            '{"maxOutputTokens": "512", "contextSize": 4096, "temperature": "0.2"}'
+        )
+        assert profile == GenerationProfile(
+            max_output_tokens=512, context_size=4096, temperature=0.2
+        )
+        assert GenerationProfile.from_json({"topK": 40}).top_k == 40
+
+    def test_from_json_invalid(self):
+        cases = [
+            ("not json", "Invalid JSON"),
+            ("[1]", "must be a JSON object"),
+            ('{"seed": 1}', "Unknown option seed"),
+            ('{"temperature": "hot"}', "temperature must be a number"),
+            ('{"maxOutputTokens": -1}', "maxOutputTokens must be positive"),
+        ]
+        for value, message in cases:
+            with pytest.raises(ProfileError, match=message):
+                GenerationProfile.from_json(value)
+
+    def test_options(self):
+        profile = GenerationProfile(
+            max_output_tokens=512, context_size=4096, temperature=0.2, top_p=0.9
+        )
+        assert profile.ollama_options() == {
+            "num_predict": 512,
+            "num_ctx": 4096,
+            "temperature": 0.2,
+            "top_p": 0.9,
+        }
+        assert profile.gemini_config() == {
+            "maxOutputTokens": 512,
+            "temperature": 0.2,
+            "topP": 0.9,
+        }
+        assert GenerationProfile().ollama_options() == {}
@@ -0,0 +1,82 @@
+import os
+import time
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.handlers.Gemini.ConversationStore import ConversationStore
+
+
+class TestConversationStore(TestCase):
+
+    def setUp(self) -> None:
+        ConversationStore().reset()
+        self.store = ConversationStore()
+
+    def tearDown(self) -> None:
+        ConversationStore().reset()
+
+    def test_singleton(self):
+        self.assertIs(ConversationStore(), self.store)
+
+    def test_create_and_get(self):
+        conversation = self.store.create("plugin", "prefix", "cachedContents/1", 10.0)
+
+        stored = self.store.get(conversation.conversation_id)
+        assert stored == conversation
+        assert stored.history == []
+        assert self.store.get("unknown") is None
+
+    def test_add_turns(self):
+        conversation = self.store.create("plugin")
+        self.store.add_turns(conversation.conversation_id, [{"role": "user"}])
+        self.store.add_turns(
+            conversation.conversation_id, [{"role": "model"}, {"role": "user"}]
+        )
+
+        assert self.store.get(conversation.conversation_id).history == [
+            {"role": "user"},
+            {"role": "model"},
+            {"role": "user"},
+        ]
+
+    def test_set_cache(self):
+        conversation = self.store.create(
+            "plugin", "prefix", "cachedContents/1", 10.0, "key-1"
+        )
+        assert self.store.get(conversation.conversation_id).key_id == "key-1"
+
+        self.store.set_cache(conversation.conversation_id, "cachedContents/2", 20.0)
+        assert self.store.get(conversation.conversation_id).key_id is None
+
+        self.store.set_cache(conversation.conversation_id, None, None)
+        assert self.store.get(conversation.conversation_id).cached_content is None
+
+    def test_expired_conversations(self):
+        conversation = self.store.create("plugin")
+        self.store.add_turns(conversation.conversation_id, [{"role": "user"}])
+
+        with patch(
+            "src.handlers.Gemini.ConversationStore.time.time",
+            return_value=time.time() + self.store.ttl + 1,
+        ):
+            assert self.store.get(conversation.conversation_id) is None
+            self.store.create("plugin")
+
+        (count,) = self.store._connection.execute(
+            "SELECT COUNT(*) FROM turns"
+        ).fetchone()
+        assert count == 0
+
+    def test_shared_between_instances_through_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "conversations.sqlite")
+            with patch.dict(os.environ, {"GEMINI_CONVERSATION_STORE_PATH": path}):
+                ConversationStore().reset()
+                conversation = ConversationStore().create("plugin", "prefix")
+                ConversationStore()._connection.close()
+                ConversationStore().reset()
+
+                stored = ConversationStore().get(conversation.conversation_id)
+                ConversationStore()._connection.close()
+                assert stored.prefix == "prefix"
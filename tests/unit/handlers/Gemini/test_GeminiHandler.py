@@ -1,3 +1,4 @@
+import io
 import json
 import requests
 import pytest
@@ -6,36 +7,55 @@ from unittest import TestCase
 
 from fastapi.exceptions import HTTPException
 
+from benchmarks.stubs import DIAGRAM, GeminiStubHandler, StubServer, StubSettings
+from src.configuration.configurationSnapshot import ConfigurationSnapshot
+from src.configuration.generationProfile import GenerationProfile
+from src.handlers.Gemini.ConversationStore import ConversationStore
 from src.handlers.Gemini.GeminiHandler import GeminiHandler
+from src.handlers.Gemini.KeyPool import KeyPool
+from src.monitoring.Metrics import CACHED_PROMPT_TOKENS
 from src.models.Diagram import Diagram
 from src.models.Message import Message
+from src.validation.JsonSchema import JsonSchema
 
 
 class TestGeminiHandler(TestCase):
 
     def setUp(self) -> None:
+        ConversationStore().reset()
+        KeyPool.reset()
         with patch(
-            "src.handlers.BaseHandler.ConfigurationManager.get_configuration"
-        ) as mock_get_configuration:
-
-            mock_get_configuration.return_value = {
-                "gemini": {
-                    "base_url": "https://localhost",
-                    "key": "coucou",
-                    "system_instruction": {
-                        "generate": {
-                            "default": '{"system_instruction":{"parts":{"text": "test"}}}'
-                        },
-                        "message": {
-                            "default": '{"system_instruction":{"parts":{"text": "test2"}}}'
+            "src.handlers.BaseHandler.ConfigurationManager.get_snapshot"
+        ) as mock_get_snapshot:
+
+            mock_get_snapshot.return_value = ConfigurationSnapshot(
+                1,
+                {
+                    "gemini": {
+                        "base_url": "https://localhost",
+                        "key": "coucou",
+                        "system_instruction": {
+                            "generate": {
+                                "default": '{"system_instruction":{"parts":{"text": "test"}}}'
+                            },
+                            "message": {
+                                "default": '{"system_instruction":{"parts":{"text": "test2"}}}'
+                            },
                         },
-                    },
-                }
-            }
+                    }
+                },
+            )
 
             self.handler = GeminiHandler()
             self.handler.initialize_configuration()
 
+    def generated_response(self, text: str) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        chunk = {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+        response.raw = io.BytesIO(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        return response
+
     def test_initialize(self):
         """
         Since the initialiaze return always true, nothing more to test.
@@ -45,12 +65,8 @@ class TestGeminiHandler(TestCase):
     def test_generate(self):
         diagram = Diagram(pluginName="default", description="Generate code")
 
-        with patch("src.handlers.Gemini.GeminiHandler.requests.post") as mock_post:
-            mock_post.return_value = requests.Response()
-            mock_post.return_value.status_code = 200
-            mocked_response = b'{"candidates": [{"content": {"parts": [{"text": "{\\"random\\": 5}"}]}}]}'
-            mock_post.return_value._content = mocked_response
-            mock_post.return_value.encoding = "utf-8"
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.generated_response('{"random": 5}')
 
             response = self.handler.generate(diagram)
             assert json.loads(response.body.decode("utf-8")) == {"random": 5}
@@ -58,25 +74,144 @@ class TestGeminiHandler(TestCase):
     def test_generate_not_json(self):
         """
         Test if the response is not in the correct format.
-        I.E, the returned code is not a json formatted.
+        I.E, the returned code is not a json formatted, so the generation is aborted.
         """
         diagram = Diagram(pluginName="default", description="Generate code")
 
-        with patch("src.handlers.Gemini.GeminiHandler.requests.post") as mock_post:
-            mock_post.return_value = requests.Response()
-            mock_post.return_value.status_code = 200
-            mocked_response = (
-                b'{"candidates": [{"content": {"parts": [{"text": "coucou"}]}}]}'
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.generated_response("coucou")
+
+            with pytest.raises(
+                HTTPException, match="The generation was aborted"
+            ) as error:
+                self.handler.generate(diagram)
+            assert error.value.status_code == 530
+
+    def test_generate_with_schema(self):
+        """
+        Test that the schema of the plugin is given as the response schema,
+        and that the generated diagram is validated against it.
+        """
+        schema = JsonSchema({"type": "object", "required": ["random"]})
+        self.handler.initialize_configuration(
+            ConfigurationSnapshot(
+                2,
+                {"gemini": self.handler.configuration},
+                {"default": schema},
+                {"generate": {"default": GenerationProfile(max_output_tokens=256)}},
+            )
+        )
+        diagram = Diagram(pluginName="default", description="Generate code")
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.generated_response('{"random": 5}')
+
+            response = self.handler.generate(diagram)
+            assert json.loads(response.body.decode("utf-8")) == {"random": 5}
+            assert mock_post.call_args.kwargs["json"]["generationConfig"] == {
+                "response_mime_type": "application/json",
+                "response_schema": {"type": "OBJECT", "required": ["random"]},
+                "maxOutputTokens": 256,
+            }
+
+            mock_post.return_value = self.generated_response("[]")
+            with pytest.raises(HTTPException, match="expected object"):
+                self.handler.generate(diagram)
+
+    def test_rate_limited_key_is_parked(self):
+        """
+        Test that a request answered with a 429 status code is sent again with another key,
+        and that the next requests do not use the parked key.
+        """
+        self.handler.configuration = {
+            **self.handler.configuration,
+            "keys": '["other", "last"]',
+        }
+        diagram = Diagram(pluginName="default", description="Generate code")
+        rate_limited = requests.Response()
+        rate_limited.status_code = 429
+        rate_limited._content = b'{"error": {"details": [{"retryDelay": "30s"}]}}'
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.side_effect = [
+                rate_limited,
+                self.generated_response("{}"),
+                self.generated_response("{}"),
+            ]
+            self.handler.generate(diagram)
+            self.handler.generate(diagram)
+
+        keys = [call.kwargs["params"]["key"] for call in mock_post.call_args_list]
+        assert keys[0] != keys[1]
+        assert keys[2] != keys[0]
+
+    def test_streamed_usage_is_recorded_in_the_key_budget(self):
+        """
+        Test that the estimated input tokens of a streamed request are corrected with the count given by Gemini.
+        """
+        self.handler.configuration = {
+            **self.handler.configuration,
+            "tokens_per_minute": "100000",
+        }
+        response = self.generated_response("{}")
+        response.raw = io.BytesIO(
+            response.raw.read().replace(
+                b"data: {", b'data: {"usageMetadata": {"promptTokenCount": 5000}, ', 1
+            )
+        )
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = response
+            self.handler.generate(
+                Diagram(pluginName="default", description="Generate code")
             )
-            mock_post.return_value._content = mocked_response
-            mock_post.return_value.encoding = "utf-8"
 
-            with pytest.raises(HTTPException, match="Invalid response from Gemini API"):
+        key = KeyPool.get(self.handler.configuration).keys[0]
+        assert 94000 < key.tokens.tokens < 95100
+
+    def test_all_keys_rate_limited(self):
+        """
+        Test that a request answered with a 429 status code by every key is rejected with a Retry-After header.
+        """
+        diagram = Diagram(pluginName="default", description="Generate code")
+        rate_limited = requests.Response()
+        rate_limited.status_code = 429
+        rate_limited._content = b'{"error": {"details": [{"retryDelay": "30s"}]}}'
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = rate_limited
+            with pytest.raises(HTTPException) as error:
                 self.handler.generate(diagram)
 
+        assert error.value.status_code == 429
+        assert 29 <= int(error.value.headers["Retry-After"]) <= 30
+
+    def test_error_response(self):
+        """
+        Test that an error of the Gemini API is answered with a 502 status code, for diagrams and messages.
+        """
+        failed = requests.Response()
+        failed.status_code = 500
+        failed._content = b'{"error": "internal"}'
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = failed
+            with pytest.raises(HTTPException, match="Error 500") as error:
+                self.handler.generate(
+                    Diagram(pluginName="default", description="Generate code")
+                )
+            assert error.value.status_code == 502
+
+            with pytest.raises(HTTPException, match="Error 500") as error:
+                self.handler.send_message(
+                    Message(pluginName="default", message="Hello")
+                )
+            assert error.value.status_code == 502
+
     def test_send_message_with_files(self):
         """
-        Test if files are given, it returns a response with a "no context" context.
+        Test if files are given, a conversation is started and its ID returned as context.
+        Small files are not cached, so they are sent inline with the message.
         """
         message = Message(
             pluginName="@ditrit/githubator-plugin",
@@ -89,36 +224,112 @@ class TestGeminiHandler(TestCase):
             ],
         )
 
-        response_final = self.handler.send_message(message)
-        response_final = json.loads(response_final.body.decode("utf-8"))
-        assert response_final["context"] == "no context"
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.generated_response("hey you !")
+
+            response_final = self.handler.send_message(message)
+            response_final = json.loads(response_final.body.decode("utf-8"))
+
+            assert mock_post.call_count == 1
+            body = mock_post.call_args.kwargs["json"]
+            assert "cachedContent" not in body
+            assert "path/to/file: content of the file" in (
+                body["contents"][0]["parts"][0]["text"]
+            )
+            assert body["contents"][1]["parts"][0]["text"] == "Generate code"
+            assert response_final["message"] == "hey you !"
+
+        conversation = ConversationStore().get(response_final["context"])
+        assert len(conversation.history) == 2
 
     def test_send_message_without_files(self):
-        """Test if no files are given, it returns a context ("no context") and a message."""
+        """Test if no files are given, it returns a new conversation as context and a message."""
         message = Message(
             pluginName="@ditrit/githubator-plugin",
             message="Generate code",
         )
 
-        with patch("src.handlers.Gemini.GeminiHandler.requests.post") as mock_post:
-            mock_post.return_value = requests.Response()
-            mock_post.return_value.status_code = 200
-            mocked_response = (
-                b'{"candidates": [{"content": {"parts": [{"text": "hey you !"}]}}]}'
-            )
-            mock_post.return_value._content = mocked_response
-            mock_post.return_value.encoding = "utf-8"
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.generated_response("hey you !")
 
             response_final = self.handler.send_message(message)
             response_final = json.loads(response_final.body.decode("utf-8"))
 
             assert mock_post.call_count == 1
             assert response_final["message"] == "hey you !"
-            assert response_final["context"] == "no context"
+            assert ConversationStore().get(response_final["context"]) is not None
+
+    def test_message_exceeding_max_output_tokens(self):
+        """
+        Test that an answer longer than the `maxOutputTokens` of the plugin is stopped,
+        counting the tokens given by Gemini in every chunk, and else estimated from the text.
+        """
+        self.handler.initialize_configuration(
+            ConfigurationSnapshot(
+                2,
+                {"gemini": self.handler.configuration},
+                profiles={
+                    "message": {"default": GenerationProfile(max_output_tokens=9)}
+                },
+            )
+        )
+        chunks = [
+            {
+                "candidates": [{"content": {"parts": [{"text": "hey"}]}}],
+                "usageMetadata": {"candidatesTokenCount": 8},
+            },
+            {"candidates": [{"content": {"parts": [{"text": " you !"}]}}]},
+        ]
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = requests.Response()
+            mock_post.return_value.status_code = 200
+            mock_post.return_value.raw = io.BytesIO(
+                "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks).encode()
+            )
+            with pytest.raises(HTTPException, match="after 10 tokens") as error:
+                self.handler.send_message(Message(pluginName="default", message="Hi"))
+
+        assert error.value.status_code == 530
+        assert (
+            mock_post.call_args.kwargs["json"]["generationConfig"]["maxOutputTokens"]
+            == 9
+        )
+
+    def test_diagram_exceeding_max_output_tokens(self):
+        """
+        Test that a single chunk holding more tokens than the `maxOutputTokens` of the plugin stops the generation.
+        """
+        self.handler.initialize_configuration(
+            ConfigurationSnapshot(
+                2,
+                {"gemini": self.handler.configuration},
+                profiles={
+                    "generate": {"default": GenerationProfile(max_output_tokens=256)}
+                },
+            )
+        )
+        chunk = {
+            "candidates": [{"content": {"parts": [{"text": '{"a": 1'}]}}],
+            "usageMetadata": {"candidatesTokenCount": 300},
+        }
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = requests.Response()
+            mock_post.return_value.status_code = 200
+            mock_post.return_value.raw = io.BytesIO(
+                f"data: {json.dumps(chunk)}\n\n".encode()
+            )
+            with pytest.raises(HTTPException, match="exceeds 256 tokens") as error:
+                self.handler.generate(
+                    Diagram(pluginName="default", description="Generate code")
+                )
+
+        assert error.value.status_code == 530
 
     def test_send_message_without_message_and_context(self):
         """
-        Test if the message is empty, it should return only a context ("no context").
+        Test if the message is empty, it should return only a context.
         Because its only providing files in order to ask questions about the files on a next call.
         """
         message = Message(
@@ -131,6 +342,140 @@ class TestGeminiHandler(TestCase):
             ],
         )
 
-        response_final = self.handler.send_message(message)
-        response_final = json.loads(response_final.body.decode("utf-8"))
-        assert response_final["context"] == "no context"
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            response_final = self.handler.send_message(message)
+            response_final = json.loads(response_final.body.decode("utf-8"))
+
+            assert mock_post.call_count == 0
+            assert list(response_final) == ["context"]
+            assert ConversationStore().get(response_final["context"]).prefix
+
+
+class TestGeminiHandlerWithStub(TestCase):
+    """
+    Conversations against the local Gemini stub, with cached files.
+    """
+
+    def setUp(self) -> None:
+        ConversationStore().reset()
+        self.stub = StubServer(GeminiStubHandler, StubSettings()).__enter__()
+        self.handler = GeminiHandler()
+        self.handler.initialize_configuration(
+            ConfigurationSnapshot(
+                1,
+                {
+                    "gemini": {
+                        "base_url": f"{self.stub.url}/v1beta/models/gemini-stub:generateContent",
+                        "key": "key",
+                        "context_cache_min_tokens": "10",
+                        "system_instruction": {
+                            "generate": {
+                                "default": '{"system_instruction":{"parts":{"text": "test"}}}'
+                            },
+                            "message": {
+                                "default": '{"system_instruction":{"parts":{"text": "test2"}}}'
+                            },
+                        },
+                    }
+                },
+            )
+        )
+
+    def tearDown(self) -> None:
+        self.stub.__exit__()
+        ConversationStore().reset()
+
+    def send(self, **kwargs) -> dict:
+        response = self.handler.send_message(
+            Message(pluginName="@ditrit/githubator-plugin", **kwargs)
+        )
+        return json.loads(response.body.decode("utf-8"))
+
+    def test_conversation_with_cached_files(self):
+        files = [{"path": "main.tf", "content": "resource {}" * 100}]
+        context = self.send(files=files)["context"]
+
+        conversation = ConversationStore().get(context)
+        assert conversation.cached_content in self.stub.server.RequestHandlerClass.state
+
+        cached_tokens = CACHED_PROMPT_TOKENS.get(
+            handler="gemini", model="gemini-stub", plugin="@ditrit/githubator-plugin"
+        )
+        first = self.send(message="What does it do?", context=context)
+        second = self.send(message="And then?", context=context)
+
+        assert first["context"] == second["context"] == context
+        assert len(ConversationStore().get(context).history) == 4
+        assert (
+            CACHED_PROMPT_TOKENS.get(
+                handler="gemini",
+                model="gemini-stub",
+                plugin="@ditrit/githubator-plugin",
+            )
+            > cached_tokens
+        )
+
+    def test_deleted_cache_falls_back_to_inline_files(self):
+        files = [{"path": "main.tf", "content": "resource {}" * 100}]
+        context = self.send(files=files)["context"]
+        self.stub.server.RequestHandlerClass.state.clear()
+
+        response = self.send(message="What does it do?", context=context)
+
+        assert response["context"] == context
+        assert ConversationStore().get(context).cached_content is None
+
+    def test_server_error_keeps_the_cache(self):
+        files = [{"path": "main.tf", "content": "resource {}" * 100}]
+        context = self.send(files=files)["context"]
+        cached_content = ConversationStore().get(context).cached_content
+
+        with patch.object(
+            GeminiStubHandler,
+            "generate",
+            lambda stub, body, stream: stub.send_json(
+                {"error": {"code": 500, "message": "internal"}}, 500
+            ),
+        ):
+            with self.assertRaises(HTTPException) as error:
+                self.send(message="What does it do?", context=context)
+
+        assert error.exception.status_code == 502
+        assert ConversationStore().get(context).cached_content == cached_content
+
+    def test_unknown_context_starts_a_new_conversation(self):
+        response = self.send(message="What does it do?", context="[1, 2, 3]")
+
+        assert response["context"] != "[1, 2, 3]"
+        assert len(ConversationStore().get(response["context"]).history) == 2
+
+    def test_generate_stream(self):
+        events = list(
+            self.handler.generate_stream(
+                Diagram(pluginName="@ditrit/githubator-plugin", description="nginx")
+            )
+        )
+
+        assert all(event["type"] == "token" for event in events[:-1])
+        assert len(events) > 2
+        assert events[-1] == {"type": "done", "response": DIAGRAM}
+
+    def test_conversation_stream_with_cached_files(self):
+        files = [{"path": "main.tf", "content": "resource {}" * 100}]
+        context = self.send(files=files)["context"]
+
+        events = list(
+            self.handler.send_message_stream(
+                Message(
+                    pluginName="@ditrit/githubator-plugin",
+                    message="What does it do?",
+                    context=context,
+                )
+            )
+        )
+
+        assert events[-1]["type"] == "done"
+        assert events[-1]["context"] == context
+        assert events[-1]["message"] == "".join(event["text"] for event in events[:-1])
+        history = ConversationStore().get(context).history
+        assert history[-1]["parts"][0]["text"] == events[-1]["message"]
@@ -0,0 +1,106 @@
+import os
+import pytest
+import requests
+from unittest import TestCase
+from unittest.mock import patch
+
+from fastapi.exceptions import HTTPException
+
+from src.handlers.Gemini.KeyPool import KeyPool, TokenBucket
+
+
+class TestKeyPool(TestCase):
+
+    def setUp(self):
+        KeyPool.reset()
+
+    def tearDown(self):
+        KeyPool.reset()
+
+    def test_read_keys(self):
+        keys = KeyPool.read_keys(
+            {
+                "key": "first",
+                "keys": '["second", {"key": "third", "requests_per_minute": "5"}, "first"]',
+                "requests_per_minute": "10",
+                "tokens_per_minute": "",
+            }
+        )
+
+        assert keys == [
+            {"key": "first", "requests_per_minute": 10, "tokens_per_minute": None},
+            {"key": "second", "requests_per_minute": 10, "tokens_per_minute": None},
+            {"key": "third", "requests_per_minute": 5, "tokens_per_minute": None},
+        ]
+
+    def test_pool_is_kept_while_the_keys_do_not_change(self):
+        pool = KeyPool.get({"key": "first"})
+
+        assert KeyPool.get({"key": "first", "base_url": "other"}) is pool
+        assert KeyPool.get({"keys": ["first", "second"]}) is not pool
+        with pytest.raises(KeyError):
+            KeyPool.get({})
+
+    def test_budgets_are_divided_between_the_workers(self):
+        configuration = {"key": "first", "requests_per_minute": "10"}
+        assert KeyPool.get(configuration).keys[0].requests.per_minute == 10
+
+        with patch.dict(os.environ, {"WORKERS": "4"}):
+            pool = KeyPool.get(configuration)
+
+        assert pool.keys[0].requests.per_minute == 2.5
+        assert pool.keys[0].tokens.per_minute is None
+
+    def test_acquire_uses_the_key_with_most_headroom(self):
+        pool = KeyPool.get(
+            {
+                "keys": [
+                    {"key": "small", "tokens_per_minute": 1000},
+                    {"key": "large", "tokens_per_minute": 10000},
+                ],
+                "key_wait_timeout": 0,
+            }
+        )
+        small, large = pool.keys
+
+        assert pool.acquire(900) is small
+        assert pool.acquire(900) is large
+        # The preferred key is used while it is available
+        assert pool.acquire(100, small.id) is small
+        # The small key does not have any token left
+        assert pool.acquire(500) is large
+
+        pool.record_usage(large, 500, 10000)
+        with pytest.raises(HTTPException, match="rate limited") as error:
+            pool.acquire(500)
+        assert error.value.status_code == 429
+        assert int(error.value.headers["Retry-After"]) >= 1
+
+    def test_park_with_the_delay_asked_by_gemini(self):
+        pool = KeyPool.get({"keys": ["first", "second"], "key_wait_timeout": 0})
+        response = requests.Response()
+        response.status_code = 429
+        response._content = (
+            b'{"error": {"code": 429, "details": [{"@type": '
+            b'"type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "37s"}]}}'
+        )
+
+        assert pool.get_retry_delay(response) == 37
+
+        first, second = pool.keys
+        pool.park(first, response)
+        assert pool.acquire(10, first.id) is second
+        assert pool.acquire(10) is second
+
+        pool.park(second, response)
+        with pytest.raises(HTTPException):
+            pool.acquire(10)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(60)
+        bucket.take(60, bucket.updated_at)
+
+        assert bucket.wait_time(30, bucket.updated_at) == 30
+        assert bucket.wait_time(30, bucket.updated_at + 10) == 20
+        assert bucket.headroom(bucket.updated_at + 120) == 1
+        assert TokenBucket().wait_time(10**9, 0) == 0
@@ -0,0 +1,103 @@
+import time
+import requests
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from src.handlers.Ollama.ModelResidency import ModelResidency
+from src.monitoring.Metrics import MODEL_REQUESTS
+
+CONFIGURATION = {
+    "residency": {"minKeepAlive": "300", "maxKeepAlive": "3600", "hotRequests": "3"}
+}
+
+
+class TestModelResidency(TestCase):
+
+    def setUp(self):
+        ModelResidency().reset()
+        MODEL_REQUESTS.reset()
+
+    def tearDown(self):
+        ModelResidency().reset()
+
+    def track(self, model: str, *times: float) -> list[str]:
+        keep_alives = []
+        for now in times:
+            with patch("src.handlers.Ollama.ModelResidency.time.time") as mock_time:
+                mock_time.return_value = now
+                keep_alives.append(ModelResidency().track(model, CONFIGURATION))
+        return keep_alives
+
+    def test_get_settings_defaults(self):
+        assert ModelResidency.get_settings({}) == {
+            "window": 3600,
+            "minKeepAlive": 300,
+            "maxKeepAlive": 3600,
+            "hotRequests": 3,
+        }
+
+    def test_track_keep_alive_follows_usage(self):
+        """
+        Test that the keep alive is three times the mean delay between the requests, within the bounds.
+        """
+        assert self.track("often", 1000, 1010, 1020) == ["300s", "300s", "300s"]
+        assert self.track("regular", 1000, 1200, 1400) == ["300s", "600s", "600s"]
+        assert self.track("hourly", 1000, 2000, 3000) == ["300s", "3000s", "3000s"]
+        assert self.track("rare", 1000, 2000 + 3600) == ["300s", "300s"]
+
+    def test_get_hot_models(self):
+        self.track("hot", 1000, 1100, 1200, 1300)
+        self.track("warm", 1000, 1100, 1200)
+        self.track("cold", 1000, 1100)
+        self.track("old", 0, 10, 20)
+
+        with patch("src.handlers.Ollama.ModelResidency.time.time") as mock_time:
+            mock_time.return_value = 3700
+            hot = ModelResidency().get_hot_models(CONFIGURATION)
+
+        assert hot == [("hot", "300s"), ("warm", "300s")]
+
+    def test_record_load(self):
+        ModelResidency().record_load("mistral", 2.5)
+        ModelResidency().record_load("mistral", 0.01)
+        ModelResidency().record_load("mistral", 0.02)
+
+        labels = {"handler": "ollama", "model": "mistral"}
+        assert MODEL_REQUESTS.get(residency="cold", **labels) == 1
+        assert MODEL_REQUESTS.get(residency="warm", **labels) == 2
+
+    def test_warm_up_loads_missing_hot_models(self):
+        now = time.time()
+        self.track("hot", now - 2, now - 1, now)
+        self.track("loaded", now - 2, now - 1, now)
+        handler = MagicMock()
+        handler.configuration = CONFIGURATION
+        handler.get_loaded_models.return_value = {"loaded"}
+
+        assert ModelResidency().warm_up(handler) == ["hot"]
+        handler.preload.assert_called_once_with("hot", "300s")
+
+    def test_warm_up_default_model(self):
+        handler = MagicMock()
+        handler.configuration = {}
+        handler.get_model.return_value = "default_generate"
+        handler.get_loaded_models.return_value = set()
+
+        assert ModelResidency().warm_up(handler) == ["default_generate"]
+        handler.get_model.assert_called_once_with("default", "generate")
+        handler.preload.assert_called_once_with("default_generate", "300s")
+
+    def test_warm_up_ignores_errors(self):
+        handler = MagicMock()
+        handler.configuration = {}
+        handler.get_loaded_models.side_effect = requests.exceptions.ConnectionError()
+
+        assert ModelResidency().warm_up(handler) == []
+        handler.preload.assert_not_called()
+
+    def test_start_disabled(self):
+        with patch.dict("os.environ", {"OLLAMA_WARMUP_INTERVAL": "0"}):
+            ModelResidency().start()
+
+        assert ModelResidency()._thread is None
+        ModelResidency().stop()
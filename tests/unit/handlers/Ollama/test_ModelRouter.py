@@ -0,0 +1,74 @@
+import pytest
+from unittest import TestCase
+from unittest.mock import patch
+
+from src.concurrency.ConcurrencyLimiter import ConcurrencyLimiter
+from src.handlers.Ollama.ModelRouter import ModelRouter, parse_rules
+from src.monitoring.Metrics import MODEL_ROUTES
+
+RULES = (
+    '[{"model": "small", "maxPromptLength": 10},'
+    ' {"model": "light", "minQueueDepth": 2},'
+    ' {"model": "fast", "maxLatency": 5}]'
+)
+
+
+class TestModelRouter(TestCase):
+
+    def setUp(self):
+        ModelRouter().reset()
+        MODEL_ROUTES.reset()
+
+    def tearDown(self):
+        ModelRouter().reset()
+
+    def select(self, prompt: str, queue_depth: int = 0, configuration=None) -> str:
+        configuration = configuration or {"routing": {"plugin": RULES}}
+        with patch.object(
+            ConcurrencyLimiter, "queue_depth", new_callable=lambda: queue_depth
+        ):
+            return ModelRouter().select(
+                configuration, "plugin", len(prompt), "plugin_generate"
+            )
+
+    def test_parse_rules(self):
+        assert parse_rules('[{"model": "a", "maxPromptLength": "10"}]') == (
+            {"model": "a", "maxPromptLength": 10.0},
+        )
+        with pytest.raises(ValueError):
+            parse_rules('{"model": "a"}')
+        with pytest.raises(ValueError):
+            parse_rules('[{"maxPromptLength": 10}]')
+
+    def test_select_by_prompt_length(self):
+        assert self.select("short") == "small"
+
+    def test_select_by_queue_depth(self):
+        assert self.select("a longer description", queue_depth=2) == "light"
+
+    def test_select_by_latency(self):
+        assert self.select("a longer description") == "fast"
+
+        ModelRouter().observe("fast", 10)
+        assert self.select("a longer description") == "plugin_generate"
+
+        # The latency goes back under the limit after faster generations
+        for _ in range(10):
+            ModelRouter().observe("fast", 1)
+        assert ModelRouter().get_latency("fast") < 5
+        assert self.select("a longer description") == "fast"
+
+    def test_select_without_rules(self):
+        assert self.select("short", configuration={"routing": {}}) == "plugin_generate"
+        assert (
+            MODEL_ROUTES.get(handler="ollama", plugin="plugin", model="plugin_generate")
+            == 1
+        )
+
+    def test_select_default_rules(self):
+        configuration = {"routing": {"default": '[{"model": "everyone"}]'}}
+        assert self.select("short", configuration=configuration) == "everyone"
+
+    def test_select_invalid_rules(self):
+        configuration = {"routing": {"plugin": "not json"}}
+        assert self.select("short", configuration=configuration) == "plugin_generate"
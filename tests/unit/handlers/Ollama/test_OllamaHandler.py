@@ -1,3 +1,5 @@
+import io
+import os
 import json
 import requests
 import pytest
@@ -6,36 +8,54 @@ from unittest import TestCase
 
 from fastapi.exceptions import HTTPException
 
+from src.configuration.configurationSnapshot import ConfigurationSnapshot
+from src.configuration.generationProfile import GenerationProfile
+from src.handlers.Ollama.ModelResidency import ModelResidency
+from src.handlers.Ollama.ModelRouter import ModelRouter
 from src.handlers.Ollama.OllamaHandler import OllamaHandler
+from src.ingestion.SpooledContent import SpooledContent
 from src.models.Diagram import Diagram
 from src.models.Message import Message
+from src.monitoring.Metrics import (
+    ABANDONED_GENERATIONS,
+    MODEL_LOAD_DURATION,
+    OUTPUT_TOKENS,
+    PROMPT_TOKENS,
+)
+from src.monitoring.RequestContext import RequestContext
+from src.validation.JsonSchema import JsonSchema
 
 
 class TestOllamaHandler(TestCase):
 
     def setUp(self) -> None:
+        ModelResidency().reset()
+        ModelRouter().reset()
         with patch(
-            "src.handlers.BaseHandler.ConfigurationManager.get_configuration"
-        ) as mock_get_configuration:
-
-            mock_get_configuration.return_value = {
-                "ollama": {
-                    "base_url": "http://localhost",
-                    "defaultModel": "mistral",
-                    "modelFiles": {
-                        "generate": {
-                            "default": 'FROM mistral SYSTEM """ test generate """',
-                            "@ditrit/kubernator-plugin": 'FROM mistral SYSTEM """ test 2 generate """',
-                            "@ditrit/githubator-plugin": 'FROM mistral SYSTEM """ test 3 generate """',
-                        },
-                        "message": {
-                            "default": 'FROM mistral SYSTEM """ test message """',
-                            "@ditrit/kubernator-plugin": 'FROM mistral SYSTEM """ test 2 message """',
-                            "@ditrit/githubator-plugin": 'FROM mistral SYSTEM """ test 3 message """',
+            "src.handlers.BaseHandler.ConfigurationManager.get_snapshot"
+        ) as mock_get_snapshot:
+
+            mock_get_snapshot.return_value = ConfigurationSnapshot(
+                1,
+                {
+                    "ollama": {
+                        "base_url": "http://localhost",
+                        "defaultModel": "mistral",
+                        "modelFiles": {
+                            "generate": {
+                                "default": 'FROM mistral SYSTEM """ test generate """',
+                                "@ditrit/kubernator-plugin": 'FROM mistral SYSTEM """ test 2 generate """',
+                                "@ditrit/githubator-plugin": 'FROM mistral SYSTEM """ test 3 generate """',
+                            },
+                            "message": {
+                                "default": 'FROM mistral SYSTEM """ test message """',
+                                "@ditrit/kubernator-plugin": 'FROM mistral SYSTEM """ test 2 message """',
+                                "@ditrit/githubator-plugin": 'FROM mistral SYSTEM """ test 3 message """',
+                            },
                         },
-                    },
-                }
-            }
+                    }
+                },
+            )
 
             self.handler = OllamaHandler()
             self.handler.initialize_configuration()
@@ -54,13 +74,29 @@ class TestOllamaHandler(TestCase):
             mock_open.return_value.__enter__.return_value.read.side_effect = (
                 mock_modelfiles_content
             )
-            with patch("src.handlers.Ollama.OllamaHandler.requests.post") as mock_post:
+            with (
+                patch("src.handlers.BaseHandler.upstream_session.post") as mock_post,
+                patch(
+                    "src.handlers.Ollama.OllamaHandler.upstream_session.get"
+                ) as mock_get,
+            ):
                 mock_post.return_value = requests.Response()
                 mock_post.return_value.status_code = 200
                 mock_post.return_value._content = b'{"response": "success"}'
                 mock_post.return_value.encoding = "utf-8"
+                mock_get.return_value = requests.Response()
+                mock_get.return_value.status_code = 200
+                mock_get.return_value._content = (
+                    b'{"models": [{"name": "mistral:latest"}]}'
+                )
 
                 responses = self.handler.initialize()
+                # The default model is warmed up once the model files are created
+                assert mock_post.call_args.kwargs["json"] == {
+                    "model": "default_generate",
+                    "keep_alive": "300s",
+                    "stream": False,
+                }
                 assert responses == [
                     {"response": "success"},
                     {"response": "success"},
@@ -73,16 +109,208 @@ class TestOllamaHandler(TestCase):
     def test_generate(self):
         diagram = Diagram(pluginName="default", description="Generate code")
 
-        with patch("src.handlers.Ollama.OllamaHandler.requests.post") as mock_post:
-            mock_post.return_value = requests.Response()
-            mock_post.return_value.status_code = 200
-            mock_post.return_value._content = (
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.generated_response(
                 b'{"response": "```json {\\"random\\": 5}```"}'
             )
-            mock_post.return_value.encoding = "utf-8"
 
             response = self.handler.generate(diagram)
             assert json.loads(response.body.decode("utf-8")) == {"random": 5}
+            assert mock_post.call_args.kwargs["json"]["keep_alive"] == "300s"
+            assert response.headers["X-Model"] == "default_generate"
+
+    def test_generate_with_routing(self):
+        """
+        Test that the model is chosen with the routing rules of the plugin, and reported in the response.
+        """
+        self.handler.configuration["routing"] = {
+            "default": '[{"model": "phi3", "maxPromptLength": 20}]'
+        }
+        diagram = Diagram(pluginName="default", description="Generate code")
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.generated_response(
+                b'{"response": "```json {}```", "total_duration": 3000000000}'
+            )
+
+            response = self.handler.generate(diagram)
+
+        assert mock_post.call_args.kwargs["json"]["model"] == "phi3"
+        assert response.headers["X-Model"] == "phi3"
+        assert ModelRouter().get_latency("phi3") == 3
+
+    def test_message_with_routing(self):
+        """
+        Test that a new conversation is routed, and that the next messages go on with its model, kept in the context.
+        """
+        self.handler.configuration["routing"] = {
+            "default": '[{"model": "phi3", "maxPromptLength": 20}]'
+        }
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.generated_response(
+                b'{"response": "Hi", "context": [1, 2]}'
+            )
+            response = self.handler.send_message(
+                Message(pluginName="default", message="Hello")
+            )
+            context = json.loads(response.body)["context"]
+
+            assert mock_post.call_args.kwargs["json"]["model"] == "phi3"
+            assert response.headers["X-Model"] == "phi3"
+            assert json.loads(context) == {"model": "phi3", "context": [1, 2]}
+
+            mock_post.return_value = self.generated_response(
+                b'{"response": "Hi", "context": [3]}'
+            )
+            events = list(
+                self.handler.send_message_stream(
+                    Message(
+                        pluginName="default",
+                        message="A message too long for the small model",
+                        context=context,
+                    )
+                )
+            )
+
+        assert mock_post.call_args.kwargs["json"]["model"] == "phi3"
+        assert mock_post.call_args.kwargs["json"]["context"] == [1, 2]
+        assert events[0] == {"type": "model", "model": "phi3"}
+        assert json.loads(events[-1]["context"]) == {"model": "phi3", "context": [3]}
+
+    def test_generate_records_statistics(self):
+        """
+        Test that the statistics returned by Ollama are recorded in the metrics.
+        """
+        diagram = Diagram(pluginName="stats-plugin", description="Generate code")
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.generated_response(
+                b'{"response": "```json {}```", "load_duration": 2000000000,'
+                b' "prompt_eval_count": 12, "eval_count": 30, "eval_duration": 1500000000}'
+            )
+
+            self.handler.generate(diagram)
+
+        labels = {"handler": "ollama", "model": "default_generate"}
+        assert PROMPT_TOKENS.get(plugin="stats-plugin", **labels) == 12
+        assert OUTPUT_TOKENS.get(plugin="stats-plugin", **labels) == 30
+        assert MODEL_LOAD_DURATION.get_sum(**labels) >= 2
+
+    def test_generate_propagates_request_id_and_phases(self):
+        """
+        Test that the request ID is sent to Ollama, and that the Ollama durations are added to the request phases.
+        """
+        diagram = Diagram(pluginName="default", description="Generate code")
+        context = RequestContext("my-request")
+        token = context.activate()
+
+        try:
+            with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+                mock_post.return_value = self.generated_response(
+                    b'{"response": "```json {}```", "load_duration": 1000000,'
+                    b' "eval_duration": 3000000}'
+                )
+
+                self.handler.generate(diagram)
+        finally:
+            RequestContext.deactivate(token)
+
+        assert mock_post.call_args.kwargs["headers"] == {"X-Request-ID": "my-request"}
+        assert context.phases["load"] == 0.001
+        assert context.phases["generation"] == 0.003
+        assert {"upstream", "parse"} <= set(context.phases)
+
+    def test_generate_timeouts(self):
+        """
+        Test that the calls are bounded by the timeouts of the configuration and by the deadline of the request,
+        and that a timed out call is answered with a 504 status code.
+        """
+        self.handler.configuration["timeouts"] = {"connect": "2", "firstByte": "30"}
+        diagram = Diagram(pluginName="default", description="Generate code")
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.side_effect = requests.exceptions.ReadTimeout()
+            with pytest.raises(HTTPException) as error:
+                self.handler.generate(diagram)
+            assert error.value.status_code == 504
+            assert mock_post.call_args.kwargs["timeout"] == (2, 30)
+
+            token = RequestContext(timeout=5).activate()
+            try:
+                with pytest.raises(HTTPException):
+                    self.handler.generate(diagram)
+                assert mock_post.call_args.kwargs["timeout"][1] <= 5
+
+                mock_post.reset_mock()
+                RequestContext.current().deadline = 0
+                with pytest.raises(HTTPException, match="deadline"):
+                    self.handler.generate(diagram)
+                mock_post.assert_not_called()
+            finally:
+                RequestContext.deactivate(token)
+
+    def test_invalid_timeouts_use_the_defaults(self):
+        self.handler.configuration["timeouts"] = {
+            "connect": "ten",
+            "firstByte": "-1",
+            "total": "0",
+        }
+
+        assert self.handler.get_timeouts() == {
+            "connect": self.handler.DEFAULT_CONNECT_TIMEOUT,
+            "firstByte": self.handler.DEFAULT_FIRST_BYTE_TIMEOUT,
+            "total": None,
+        }
+
+    def test_generate_client_disconnect(self):
+        """
+        Test that the call to Ollama is cancelled when the client disconnects, and counted as abandoned.
+        """
+        diagram = Diagram(pluginName="default", description="Generate code")
+        context = RequestContext()
+        abandoned = ABANDONED_GENERATIONS.get(handler="ollama", mode="generate")
+
+        def disconnect(*args, **kwargs):
+            # The socket shut down by the cancellation makes the call fail
+            context.disconnect()
+            raise requests.exceptions.ConnectionError()
+
+        token = context.activate()
+        try:
+            with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+                mock_post.side_effect = disconnect
+                with pytest.raises(HTTPException) as error:
+                    self.handler.generate(diagram)
+                assert error.value.status_code == 499
+
+                mock_post.reset_mock()
+                with pytest.raises(HTTPException, match="client closed"):
+                    self.handler.generate(diagram)
+                mock_post.assert_not_called()
+        finally:
+            RequestContext.deactivate(token)
+
+        assert (
+            ABANDONED_GENERATIONS.get(handler="ollama", mode="generate")
+            == abandoned + 1
+        )
+
+    def test_generate_upstream_error(self):
+        """
+        Test that an error of the call to Ollama is answered with a 502 status code.
+        """
+        diagram = Diagram(pluginName="default", description="Generate code")
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.side_effect = requests.exceptions.ChunkedEncodingError()
+            with pytest.raises(HTTPException) as error:
+                self.handler.generate(diagram)
+
+        assert error.value.status_code == 502
+        assert (
+            error.value.detail == "Failed to call the ollama API: ChunkedEncodingError"
+        )
 
     def test_generate_not_correct_format(self):
         """
@@ -91,11 +319,10 @@ class TestOllamaHandler(TestCase):
         """
         diagram = Diagram(pluginName="default", description="Generate code")
 
-        with patch("src.handlers.Ollama.OllamaHandler.requests.post") as mock_post:
-            mock_post.return_value = requests.Response()
-            mock_post.return_value.status_code = 200
-            mock_post.return_value._content = b'{"response": "{\\"random\\": 5}"}'
-            mock_post.return_value.encoding = "utf-8"
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.generated_response(
+                b'{"response": "{\\"random\\": 5}"}'
+            )
 
             with pytest.raises(HTTPException, match="Invalid response from Ollama API"):
                 self.handler.generate(diagram)
@@ -107,15 +334,42 @@ class TestOllamaHandler(TestCase):
         """
         diagram = Diagram(pluginName="default", description="Generate code")
 
-        with patch("src.handlers.Ollama.OllamaHandler.requests.post") as mock_post:
-            mock_post.return_value = requests.Response()
-            mock_post.return_value.status_code = 200
-            mock_post.return_value._content = b'{"response": "random"}'
-            mock_post.return_value.encoding = "utf-8"
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.generated_response(b'{"response": "random"}')
 
             with pytest.raises(HTTPException, match="Invalid response from Ollama API"):
                 self.handler.generate(diagram)
 
+    def test_generate_with_schema(self):
+        """
+        Test that the schema of the plugin is given as the format of the answer,
+        and that the raw JSON answer is validated against it.
+        """
+        schema = {"type": "object", "required": ["random"]}
+        self.handler.initialize_configuration(
+            ConfigurationSnapshot(
+                2,
+                {"ollama": self.handler.configuration},
+                {"default": JsonSchema(schema)},
+            )
+        )
+        diagram = Diagram(pluginName="default", description="Generate code")
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.generated_response(
+                b'{"response": "{\\"random\\": 5}"}'
+            )
+
+            response = self.handler.generate(diagram)
+            assert json.loads(response.body.decode("utf-8")) == {"random": 5}
+            assert mock_post.call_args.kwargs["json"]["format"] == schema
+
+            mock_post.return_value = self.generated_response(
+                b'{"response": "{\\"other\\": 5}"}'
+            )
+            with pytest.raises(HTTPException, match="missing property 'random'"):
+                self.handler.generate(diagram)
+
     def test_send_message_with_files_and_context(self):
         """
         Test if files, context, and message are given, it returns a context and a message.
@@ -133,16 +387,15 @@ class TestOllamaHandler(TestCase):
             context="[123,456,789]",
         )
 
-        with patch("src.handlers.Ollama.OllamaHandler.requests.post") as mock_post:
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
             response1 = requests.Response()
             response1.status_code = 200
             response1._content = b'{"response": "success", "context": [1,2,3]}'
             response1.encoding = "utf-8"
 
-            response2 = requests.Response()
-            response2.status_code = 200
-            response2._content = b'{"response": "success2", "context": [4,5,6]}'
-            response2.encoding = "utf-8"
+            response2 = self.generated_response(
+                b'{"response": "success2", "context": [4,5,6]}'
+            )
 
             mock_post.side_effect = [response1, response2]
 
@@ -154,6 +407,31 @@ class TestOllamaHandler(TestCase):
             assert response_final["message"] == "success2"
             assert response_final["context"] == "[4, 5, 6]"
 
+    def test_send_files_streams_the_body(self):
+        """Test that the files are sent in a streamed body, whose prompt holds the escaped contents."""
+        content = SpooledContent()
+        content.write('{"key": "value"}\n')
+        message = Message(
+            pluginName="default",
+            files=[{"path": "a.json", "content": content}],
+            context="[1]",
+        )
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = requests.Response()
+            mock_post.return_value.status_code = 200
+            mock_post.return_value._content = b'{"response": "ok", "context": [2]}'
+            mock_post.return_value.encoding = "utf-8"
+
+            self.handler.send_message(message)
+
+            kwargs = mock_post.call_args.kwargs
+            body = json.loads(b"".join(kwargs["data"]))
+
+        assert kwargs["headers"]["Content-Type"] == "application/json"
+        assert body["context"] == [1]
+        assert body["prompt"].endswith('\n a.json: {"key": "value"}\n')
+
     def test_send_message_without_files_and_context(self):
         """Test if no files and no context are given, it returns a context and a message."""
         message = Message(
@@ -161,13 +439,10 @@ class TestOllamaHandler(TestCase):
             message="Generate code",
         )
 
-        with patch("src.handlers.Ollama.OllamaHandler.requests.post") as mock_post:
-            response1 = requests.Response()
-            response1.status_code = 200
-            response1._content = b'{"response": "success", "context": [1,2,3]}'
-            response1.encoding = "utf-8"
-
-            mock_post.side_effect = [response1]
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.side_effect = [
+                self.generated_response(b'{"response": "success", "context": [1,2,3]}')
+            ]
 
             response_final = self.handler.send_message(message)
 
@@ -192,7 +467,7 @@ class TestOllamaHandler(TestCase):
             ],
         )
 
-        with patch("src.handlers.Ollama.OllamaHandler.requests.post") as mock_post:
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
             response1 = requests.Response()
             response1.status_code = 200
             response1._content = b'{"response": "success", "context": [1,2,3]}'
@@ -207,3 +482,176 @@ class TestOllamaHandler(TestCase):
             assert mock_post.call_count == 1
             assert "message" not in response_final
             assert response_final["context"] == "[1, 2, 3]"
+
+    def generated_response(self, content: bytes) -> requests.Response:
+        """
+        Returns a streamed Ollama response holding a single line, the whole generation.
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(content)
+        return response
+
+    def streamed_response(self, lines: list[dict]) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(
+            b"".join(json.dumps(line).encode() + b"\n" for line in lines)
+        )
+        return response
+
+    def test_generate_stream(self):
+        diagram = Diagram(pluginName="default", description="Generate code")
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.streamed_response(
+                [
+                    {"response": "```json\n{", "done": False},
+                    {"response": '"random": 5}\n```', "done": False},
+                    {"response": "", "done": True, "eval_count": 2},
+                ]
+            )
+
+            events = list(self.handler.generate_stream(diagram))
+
+            assert mock_post.call_args.kwargs["stream"] is True
+            assert mock_post.call_args.kwargs["json"]["stream"] is True
+            assert events == [
+                {"type": "model", "model": "default_generate"},
+                {"type": "token", "text": "```json\n{"},
+                {"type": "token", "text": '"random": 5}\n```'},
+                {"type": "done", "response": {"random": 5}},
+            ]
+
+    def test_generate_stream_aborts_invalid_output(self):
+        """
+        Test that a generation without code block is stopped after the maximum number of tokens.
+        """
+        diagram = Diagram(pluginName="default", description="Generate code")
+        response = self.streamed_response(
+            [{"response": "blah ", "done": False}] * 100
+            + [{"response": "", "done": True}]
+        )
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = response
+            with patch.dict(os.environ, {"STREAM_MAX_PREAMBLE_TOKENS": "3"}):
+                with pytest.raises(HTTPException, match="aborted after 3 tokens"):
+                    list(self.handler.generate_stream(diagram))
+
+        assert response.raw.closed
+
+    def test_generation_profiles(self):
+        """
+        Test that the profiles of the plugin are sent as options, and that the output cap is enforced.
+        """
+        self.handler.initialize_configuration(
+            ConfigurationSnapshot(
+                2,
+                {"ollama": self.handler.configuration},
+                profiles={
+                    "generate": {"default": GenerationProfile(max_output_tokens=2)},
+                    "message": {
+                        "default": GenerationProfile(
+                            max_output_tokens=2, context_size=8192
+                        )
+                    },
+                },
+            )
+        )
+        message = Message(pluginName="default", message="Hello")
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.generated_response(
+                b'{"response": "Hi", "context": [1]}'
+            )
+
+            self.handler.send_message(message)
+            assert mock_post.call_args.kwargs["json"]["options"] == {
+                "num_predict": 2,
+                "num_ctx": 8192,
+            }
+
+            mock_post.return_value = self.streamed_response(
+                [{"response": part, "done": False} for part in ["Hi", ", how", " are"]]
+                + [{"response": "", "done": True, "context": [1]}]
+            )
+            with pytest.raises(HTTPException, match="exceeds 2 tokens") as error:
+                self.handler.send_message(message)
+            assert error.value.status_code == 530
+
+            mock_post.return_value = self.streamed_response(
+                [{"response": part, "done": False} for part in ["{", '"a"', ": 1}"]]
+                + [{"response": "", "done": True}]
+            )
+            with pytest.raises(HTTPException, match="exceeds 2 tokens"):
+                list(
+                    self.handler.generate_stream(
+                        Diagram(pluginName="default", description="Generate code")
+                    )
+                )
+            assert mock_post.call_args.kwargs["json"]["options"] == {"num_predict": 2}
+
+    def test_generate_stream_retries_invalid_output(self):
+        diagram = Diagram(pluginName="default", description="Generate code")
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.side_effect = [
+                self.streamed_response([{"response": "```yaml\nkind: Pod"}]),
+                self.streamed_response(
+                    [{"response": '```json\n{"random": 5}```', "done": True}]
+                ),
+            ]
+            with patch.dict(os.environ, {"STREAM_RETRIES": "1"}):
+                events = list(self.handler.generate_stream(diagram))
+
+        assert events == [
+            {"type": "model", "model": "default_generate"},
+            {
+                "type": "retry",
+                "reason": "The JSON starts with ':' instead of an object or an array",
+            },
+            {"type": "token", "text": '```json\n{"random": 5}```'},
+            {"type": "done", "response": {"random": 5}},
+        ]
+
+    def test_generate_stream_upstream_error(self):
+        diagram = Diagram(pluginName="default", description="Generate code")
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = requests.Response()
+            mock_post.return_value.status_code = 404
+            mock_post.return_value._content = b'{"error": "model not found"}'
+
+            with pytest.raises(HTTPException, match="Error 404 from the AI"):
+                list(self.handler.generate_stream(diagram))
+
+    def test_send_message_stream(self):
+        message = Message(
+            pluginName="@ditrit/githubator-plugin",
+            message="Generate code",
+            context="[1,2,3]",
+        )
+
+        with patch("src.handlers.BaseHandler.upstream_session.post") as mock_post:
+            mock_post.return_value = self.streamed_response(
+                [
+                    {"response": "hello", "done": False},
+                    {"response": " you", "done": False},
+                    {"response": "", "done": True, "context": [4, 5, 6]},
+                ]
+            )
+
+            events = list(self.handler.send_message_stream(message))
+
+            assert mock_post.call_args.kwargs["json"]["context"] == [1, 2, 3]
+            assert events[-1] == {
+                "type": "done",
+                "message": "hello you",
+                "context": "[4, 5, 6]",
+            }
+            assert events[0] == {
+                "type": "model",
+                "model": "@ditrit/githubator-plugin_message",
+            }
+            assert len(events) == 4
@@ -1,7 +1,10 @@
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
+
+from fastapi import HTTPException
 
 from src.configuration.configurationManager import ConfigurationManager
+from src.configuration.configurationSnapshot import ConfigurationSnapshot
 from src.handlers.Factory import Factory
 from src.handlers.Ollama.OllamaHandler import OllamaHandler
 from src.handlers.Gemini.GeminiHandler import GeminiHandler
@@ -60,23 +63,30 @@ def test_get_all_handlers():
 )
 def test_get_handler(plugin_name, configuration, expected_ai):
 
-    # Mock the get_configuration function
+    # Mock the get_snapshot function
     config_manager1 = ConfigurationManager()
-    config_manager1.get_configuration = MagicMock()
-    config_manager1.get_configuration.return_value = configuration
+    config_manager1.get_snapshot = MagicMock()
+    config_manager1.get_snapshot.return_value = ConfigurationSnapshot(1, configuration)
 
-    # Mock the get_all_handlers function in order to avoir calling initialize_configuration
+    # Mock the create_handler function in order to avoir calling initialize_configuration
     mocked_ollama_handler = OllamaHandler()
     mocked_ollama_handler.initialize_configuration = MagicMock()
     mocked_gemini_handler = GeminiHandler()
     mocked_gemini_handler.initialize_configuration = MagicMock()
-    Factory.get_all_handlers = MagicMock()
-    Factory.get_all_handlers.return_value = {
+    mocked_handlers = {
         "ollama": mocked_ollama_handler,
         "gemini": mocked_gemini_handler,
     }
 
-    assert type(Factory.get_handler(plugin_name)) == expected_ai
+    with patch.object(Factory, "create_handler", side_effect=mocked_handlers.get):
+        assert type(Factory.get_handler(plugin_name)) == expected_ai
+
+
+def test_create_handler_with_unknown_handler():
+    with pytest.raises(HTTPException) as e:
+        Factory.create_handler("unknown")
+    assert e.value.status_code == 500
+    assert e.value.detail == "Unknown handler: unknown"
 
 
 def test_intialize_models_with_given_handlers():
@@ -99,7 +109,7 @@ def test_intialize_models_with_given_handlers():
 
 def test_intialize_all_models():
 
-    # Mock the get_all_handlers function in order to avoir calling initialize_configuration
+    # Mock the create_handler function in order to avoir calling initialize_configuration
     mocked_ollama_handler = OllamaHandler()
     mocked_ollama_handler.initialize_configuration = MagicMock()
     mocked_ollama_handler.initialize = MagicMock()
@@ -108,14 +118,31 @@ def test_intialize_all_models():
     mocked_gemini_handler.initialize_configuration = MagicMock()
     mocked_gemini_handler.initialize = MagicMock()
     mocked_gemini_handler.initialize.return_value = "response2"
-    Factory.get_all_handlers = MagicMock()
-    Factory.get_all_handlers.return_value = {
+    mocked_handlers = {
         "ollama": mocked_ollama_handler,
         "gemini": mocked_gemini_handler,
     }
 
-    res = Factory.initialize_models()
+    snapshot = ConfigurationSnapshot(1, {"ollama": {}, "gemini": {}})
+    with patch.object(ConfigurationManager(), "get_snapshot", return_value=snapshot):
+        with patch.object(Factory, "create_handler", side_effect=mocked_handlers.get):
+            res = Factory.initialize_models()
     assert res == ["response1", "response2"]
+    mocked_ollama_handler.initialize_configuration.assert_called_once_with(snapshot)
+
+
+def test_intialize_models_only_initializes_configured_handlers():
+    mocked_handler = MagicMock()
+    mocked_handler.initialize.return_value = "response1"
+
+    snapshot = ConfigurationSnapshot(1, {"plugin": {}, "ollama": {}})
+    with patch.object(ConfigurationManager(), "get_snapshot", return_value=snapshot):
+        with patch.object(
+            Factory, "create_handler", return_value=mocked_handler
+        ) as create_handler:
+            res = Factory.initialize_models()
+    assert res == ["response1"]
+    create_handler.assert_called_once_with("ollama")
 
 
 def test_get_all_configuration_descriptions():
@@ -0,0 +1,67 @@
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from src.handlers.HandlerRegistry import HandlerRegistry
+from src.handlers.Ollama.OllamaHandler import OllamaHandler
+
+
+@pytest.fixture(autouse=True)
+def reset_registry():
+    HandlerRegistry.reset()
+    yield
+    HandlerRegistry.reset()
+
+
+class FakeHandler:
+    pass
+
+
+def test_builtin_handlers_are_registered():
+    assert HandlerRegistry.names()[:2] == ["ollama", "gemini"]
+
+
+def test_get_handler_class_imports_on_first_use():
+    assert not HandlerRegistry.is_loaded("ollama")
+    assert HandlerRegistry.get_handler_class("ollama") is OllamaHandler
+    assert HandlerRegistry.is_loaded("ollama")
+    assert not HandlerRegistry.is_loaded("gemini")
+
+
+def test_register_with_path_and_class():
+    HandlerRegistry.register("path", "src.handlers.Ollama.OllamaHandler:OllamaHandler")
+    HandlerRegistry.register("class", FakeHandler)
+
+    assert HandlerRegistry.get_handler_class("path") is OllamaHandler
+    assert HandlerRegistry.get_handler_class("class") is FakeHandler
+
+
+def test_get_handler_class_with_unknown_handler():
+    with pytest.raises(KeyError):
+        HandlerRegistry.get_handler_class("unknown")
+
+
+def test_entry_points_are_discovered():
+    class FakeEntryPoint:
+        name = "plugin"
+
+        def load(self):
+            return FakeHandler
+
+    with patch(
+        "src.handlers.HandlerRegistry.entry_points", return_value=[FakeEntryPoint()]
+    ), patch("src.handlers.HandlerRegistry.EntryPoint", FakeEntryPoint):
+        assert "plugin" in HandlerRegistry.names()
+        assert HandlerRegistry.get_handler_class("plugin") is FakeHandler
+
+
+def test_factory_does_not_import_handlers():
+    code = (
+        "import sys\n"
+        "from src.handlers.Factory import Factory\n"
+        "assert 'src.handlers.Ollama.OllamaHandler' not in sys.modules\n"
+        "assert 'src.handlers.Gemini.GeminiHandler' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
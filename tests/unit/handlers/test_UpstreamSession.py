@@ -0,0 +1,128 @@
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from src.handlers.UpstreamSession import (
+    UpstreamCall,
+    UpstreamConnections,
+    UpstreamDeadlines,
+    upstream_connections,
+    upstream_deadlines,
+    upstream_session,
+)
+
+
+@pytest.fixture
+def silent_server():
+    """
+    A server accepting connections but never answering.
+    """
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    connections = []
+
+    def accept():
+        try:
+            while True:
+                connections.append(server.accept()[0])
+        except OSError:
+            pass
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield f"http://127.0.0.1:{server.getsockname()[1]}"
+    server.close()
+    for connection in connections:
+        connection.close()
+    upstream_connections.reset()
+
+
+def test_cancel_interrupts_calls_in_progress(silent_server):
+    errors = []
+
+    def call():
+        try:
+            upstream_session.post(silent_server, timeout=5)
+        except requests.exceptions.RequestException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    while upstream_connections.in_use == 0:
+        pass
+    while not any(
+        getattr(connection, "sock", None)
+        for connection in list(upstream_connections._in_use)
+    ):
+        pass
+
+    assert upstream_connections.cancel() == 1
+    thread.join(1)
+    assert not thread.is_alive()
+    assert isinstance(errors[0], requests.exceptions.ConnectionError)
+
+
+def test_deadline_cancels_only_its_call(silent_server):
+    errors = {}
+
+    def call(name: str, deadline: float = None):
+        upstream_call = UpstreamCall(deadline)
+        if deadline is not None:
+            upstream_deadlines.watch(upstream_call)
+        token = upstream_call.activate()
+        try:
+            upstream_session.post(silent_server, timeout=5)
+        except requests.exceptions.RequestException as e:
+            errors[name] = (e, upstream_call.expired)
+        finally:
+            UpstreamCall.deactivate(token)
+
+    other = threading.Thread(target=call, args=("other",))
+    other.start()
+    expiring = threading.Thread(
+        target=call, args=("expiring", time.perf_counter() + 0.2)
+    )
+    expiring.start()
+
+    expiring.join(2)
+    assert not expiring.is_alive()
+    assert isinstance(errors["expiring"][0], requests.exceptions.ConnectionError)
+    assert errors["expiring"][1]
+    assert other.is_alive()
+
+    upstream_connections.cancel()
+    other.join(1)
+    assert not errors["other"][1]
+
+
+def test_cancelled_connections_refuse_new_calls():
+    connections = UpstreamConnections()
+    connections.cancel()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        connections.track(object())
+
+    connections.reset()
+    assert not connections.cancelled
+
+
+def test_finished_calls_are_removed_from_the_deadlines():
+    deadlines = UpstreamDeadlines()
+    calls = [UpstreamCall(time.perf_counter() + 3600) for _ in range(10)]
+    for call in calls:
+        deadlines.watch(call)
+
+    for call in calls[:4]:
+        call.finish()
+    assert len(deadlines._calls) == 10
+
+    calls[4].finish()
+    calls[4].finish()
+    assert [entry[2] for entry in sorted(deadlines._calls)] == calls[5:]
+
+    UpstreamCall().finish()
+    for call in calls[5:]:
+        call.finish()
+    assert deadlines._calls == []
@@ -0,0 +1,91 @@
+import json
+import pytest
+
+from src.ingestion.JsonStreamParser import JsonStreamError, JsonStreamParser
+from src.ingestion.SpooledContent import SpoolBudget, SpooledContent
+
+
+def parse(raw: bytes, chunk_size: int, spool_path=None, spool_budget=None):
+    parser = JsonStreamParser(spool_path, spool_budget)
+    for index in range(0, len(raw), chunk_size):
+        parser.feed(raw[index : index + chunk_size])
+    return parser.finish()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1024])
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_parse_like_json_loads(chunk_size, ensure_ascii):
+    document = {
+        "a": [1, -2.5, 3e2, True, False, None, 'q"\\/\n\té😀'],
+        "b": {"c": {}, "d": []},
+        "": "",
+    }
+    raw = json.dumps(document, ensure_ascii=ensure_ascii).encode()
+
+    assert parse(raw, chunk_size) == document
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1024])
+def test_spool_chosen_strings(chunk_size):
+    content = "line é😀\n" * 1000
+    raw = json.dumps(
+        {"files": [{"path": "a", "content": content}, {"path": "b", "content": ""}]}
+    ).encode()
+
+    document = parse(
+        raw,
+        chunk_size,
+        lambda path: path[:1] == ("files",) and path[2:] == ("content",),
+    )
+
+    assert document["files"][0]["path"] == "a"
+    assert isinstance(document["files"][0]["content"], SpooledContent)
+    assert document["files"][0]["content"].read() == content
+    assert document["files"][1]["content"].read() == ""
+
+
+def test_spool_to_disk():
+    content = SpooledContent(max_memory_size=10)
+    content.write("12345")
+    assert not content.spooled
+    content.write("67890abcdef")
+    assert content.spooled
+    assert len(content) == 16
+    assert list(content.iter_chunks(10)) == ["1234567890", "abcdef"]
+    content.close()
+
+
+def test_spooled_strings_share_the_budget():
+    budget = SpoolBudget(max_memory_size=10)
+    raw = json.dumps({"files": ["12345678", "abcdef", "12"]}).encode()
+
+    document = parse(raw, 3, lambda path: path[:1] == ("files",), budget)
+    first, second, third = document["files"]
+
+    assert not first.spooled
+    assert second.spooled
+    assert not third.spooled
+    assert budget.available == 0
+    first.close()
+    second.close()
+    third.close()
+    assert budget.available == 10
+
+
+@pytest.mark.parametrize(
+    "raw, error",
+    [
+        ('{"a" 1}', "Expected ':'"),
+        ("[1 2]", "Expected ',' or ']'"),
+        ("[1,]", "Invalid value"),
+        ("{,}", "Expected a key"),
+        ("tru", "Invalid value"),
+        ('"\\x"', "Invalid escape"),
+        ('{"a": 1} 2', "after the JSON document"),
+        ('{"a": [1', "Unexpected end"),
+        ("[" * 100, "too deep"),
+    ],
+)
+def test_invalid_documents(raw, error):
+    with pytest.raises(JsonStreamError, match=error):
+        parse(raw.encode(), 2)
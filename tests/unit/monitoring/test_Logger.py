@@ -0,0 +1,79 @@
+import json
+import queue
+import logging
+
+from src.monitoring.Logger import (
+    DROPPED_LOGS,
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    RequestFilter,
+    parse_sampling_rates,
+    summarize,
+)
+from src.monitoring.RequestContext import RequestContext
+
+
+def make_record(level=logging.INFO, **extra):
+    record = logging.LogRecord("test", level, __file__, 1, "hello %s", ("you",), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_summarize():
+    content = "a" * 20
+    summary = summarize({"files": [{"path": "main.tf", "content": content}]}, 10)
+
+    assert summary["files"][0]["path"] == "main.tf"
+    assert summary["files"][0]["content"]["length"] == 20
+    assert summary["files"][0]["content"]["preview"] == "a" * 10
+    assert len(summary["files"][0]["content"]["sha256"]) == 64
+
+
+def test_parse_sampling_rates():
+    assert parse_sampling_rates(None) == {}
+    assert parse_sampling_rates("/api/diagram=0.1, /api/message=1") == {
+        "/api/diagram": 0.1,
+        "/api/message": 1.0,
+    }
+
+
+def test_json_formatter():
+    record = make_record(request_id="my-request", fields={"body": "b" * 10})
+
+    entry = json.loads(JsonFormatter(max_field_length=4).format(record))
+
+    assert entry["level"] == "INFO"
+    assert entry["message"] == "hello you"
+    assert entry["requestId"] == "my-request"
+    assert entry["body"]["length"] == 10
+
+
+def test_request_filter_adds_request_id():
+    context = RequestContext("my-request")
+    token = context.activate()
+    try:
+        record = make_record()
+        assert RequestFilter().filter(record)
+    finally:
+        RequestContext.deactivate(token)
+
+    assert record.request_id == "my-request"
+
+
+def test_request_filter_samples_per_route():
+    request_filter = RequestFilter({"/api/diagram": 0})
+
+    assert not request_filter.filter(make_record(route="/api/diagram"))
+    assert request_filter.filter(make_record(route="/api/message"))
+    assert request_filter.filter(make_record(logging.ERROR, route="/api/diagram"))
+
+
+def test_queue_handler_drops_records_when_full():
+    handler = NonBlockingQueueHandler(queue.Queue(1))
+    dropped = DROPPED_LOGS.get()
+
+    handler.handle(make_record())
+    handler.handle(make_record())
+
+    assert handler.queue.qsize() == 1
+    assert DROPPED_LOGS.get() == dropped + 1
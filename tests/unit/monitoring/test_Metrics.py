@@ -0,0 +1,98 @@
+import pytest
+
+from src.monitoring.Metrics import Counter, Gauge, Histogram, Metric, MetricsRegistry
+
+
+def test_counter():
+    counter = Counter("test_total", "A test counter.", ["handler"])
+    counter.inc(handler="ollama")
+    counter.inc(2, handler="ollama")
+    counter.inc(handler="gemini")
+
+    assert counter.get(handler="ollama") == 3
+    assert counter.render() == "\n".join(
+        [
+            "# HELP test_total A test counter.",
+            "# TYPE test_total counter",
+            'test_total{handler="gemini"} 1',
+            'test_total{handler="ollama"} 3',
+        ]
+    )
+
+
+def test_gauge():
+    gauge = Gauge("test_gauge", "A test gauge.")
+    gauge.set(5)
+    gauge.dec(2)
+
+    assert gauge.get() == 3
+    assert gauge.render().endswith("test_gauge 3")
+
+
+def test_histogram():
+    histogram = Histogram("test_seconds", "A test histogram.", ["model"], (1, 5))
+    histogram.observe(0.5, model="mistral")
+    histogram.observe(3, model="mistral")
+    histogram.observe(10, model="mistral")
+
+    assert histogram.get_count(model="mistral") == 3
+    assert histogram.get_sum(model="mistral") == 13.5
+    assert histogram.samples() == [
+        'test_seconds_bucket{model="mistral",le="1"} 1',
+        'test_seconds_bucket{model="mistral",le="5"} 2',
+        'test_seconds_bucket{model="mistral",le="+Inf"} 3',
+        'test_seconds_sum{model="mistral"} 13.5',
+        'test_seconds_count{model="mistral"} 3',
+    ]
+
+
+def test_label_values_are_escaped():
+    counter = Counter("test_total", "A test counter.", ["plugin"])
+    counter.inc(plugin='my "plugin"')
+
+    assert counter.samples() == ['test_total{plugin="my \\"plugin\\""} 1']
+
+
+def test_registry_returns_registered_metric():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_registry_total", "A test counter.")
+
+    assert registry.counter("test_registry_total", "Another help.") is counter
+    assert "# TYPE test_registry_total counter" in registry.render()
+
+
+def test_metric_requires_samples():
+    class Incomplete(Metric):
+        type = "untyped"
+
+    with pytest.raises(TypeError):
+        Incomplete("test_incomplete", "An incomplete metric.")
+
+
+def test_registry_merges_snapshots():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_merged_total", "A test counter.", ["handler"])
+    gauge = registry.gauge("test_merged_version", "A test gauge.")
+    histogram = registry.histogram(
+        "test_merged_seconds", "A test histogram.", buckets=(1,)
+    )
+    counter.reset()
+    gauge.reset()
+    histogram.reset()
+    counter.inc(2, handler="ollama")
+    gauge.set(3)
+    histogram.observe(0.5)
+    worker = registry.snapshot()
+    counter.inc(handler="gemini")
+    gauge.set(4)
+    histogram.observe(2)
+
+    rendered = registry.render([worker, registry.snapshot(), {"test_unknown": []}])
+
+    assert 'test_merged_total{handler="ollama"} 4' in rendered
+    assert 'test_merged_total{handler="gemini"} 1' in rendered
+    assert "test_merged_version 4" in rendered
+    assert 'test_merged_seconds_bucket{le="1"} 2' in rendered
+    assert 'test_merged_seconds_bucket{le="+Inf"} 3' in rendered
+    assert "test_merged_seconds_sum 3" in rendered
+    assert "test_unknown" not in rendered
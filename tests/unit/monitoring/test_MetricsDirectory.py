@@ -0,0 +1,56 @@
+import os
+import json
+from unittest.mock import patch
+
+from src.monitoring.Metrics import registry
+from src.monitoring.MetricsDirectory import MetricsDirectory
+
+COUNTER = registry.counter(
+    "test_directory_total", "A test counter shared between workers."
+)
+
+
+def test_from_environment():
+    with patch.dict(os.environ, {}, clear=True):
+        assert MetricsDirectory.from_environment() is None
+
+    with patch.dict(
+        os.environ,
+        {"METRICS_DIRECTORY": "/tmp/metrics", "METRICS_WRITE_INTERVAL": "5"},
+    ):
+        directory = MetricsDirectory.from_environment()
+
+    assert directory.path == "/tmp/metrics"
+    assert directory.interval == 5
+
+
+def test_render_merges_the_workers(tmp_path):
+    COUNTER.reset()
+    COUNTER.inc(3)
+    (tmp_path / "1.json").write_text(json.dumps({"test_directory_total": [[[], 2]]}))
+    (tmp_path / "2.json").write_text("{")
+
+    rendered = MetricsDirectory(str(tmp_path)).render()
+
+    assert "test_directory_total 5" in rendered
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+
+
+def test_stop_writes_the_last_snapshot(tmp_path):
+    COUNTER.reset()
+    directory = MetricsDirectory(str(tmp_path / "metrics"), interval=60)
+    directory.start()
+    COUNTER.inc()
+    directory.stop()
+
+    snapshot = json.loads((tmp_path / "metrics" / f"{os.getpid()}.json").read_text())
+    assert snapshot["test_directory_total"] == [[[], 1]]
+
+
+def test_clear(tmp_path):
+    (tmp_path / "1.json").write_text("{}")
+    (tmp_path / "2.json.tmp").write_text("{")
+
+    MetricsDirectory(str(tmp_path)).clear()
+
+    assert list(tmp_path.iterdir()) == []
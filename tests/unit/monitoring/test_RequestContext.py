@@ -0,0 +1,80 @@
+import re
+import threading
+
+from src.monitoring.RequestContext import RequestContext, timed_phase
+
+
+def test_generated_request_id():
+    assert re.fullmatch(r"[0-9a-f]{32}", RequestContext().request_id)
+    assert RequestContext("my-id").request_id == "my-id"
+
+
+def test_remaining():
+    assert RequestContext().remaining() is None
+    assert 9 < RequestContext(timeout=10).remaining() <= 10
+    assert RequestContext(timeout=0).remaining() <= 0
+
+
+def test_on_disconnect():
+    context = RequestContext()
+    calls = []
+    context.on_disconnect(lambda: calls.append("before"))
+    assert calls == []
+
+    context.disconnect()
+    context.disconnect()
+    assert calls == ["before"]
+
+    context.on_disconnect(lambda: calls.append("after"))
+    assert calls == ["before", "after"]
+
+
+def test_current_context():
+    context = RequestContext()
+    assert RequestContext.current() is None
+
+    token = context.activate()
+    try:
+        assert RequestContext.current() is context
+    finally:
+        RequestContext.deactivate(token)
+
+    assert RequestContext.current() is None
+
+
+def test_timed_phase_sums_phases_with_same_name():
+    context = RequestContext()
+    token = context.activate()
+    try:
+        with timed_phase("upstream"):
+            pass
+        with timed_phase("upstream"):
+            pass
+        context.add_phase("load", 0.25)
+    finally:
+        RequestContext.deactivate(token)
+
+    assert list(context.phases) == ["upstream", "load"]
+    assert re.fullmatch(
+        r"upstream;dur=\d+\.\d, load;dur=250\.0, total;dur=\d+\.\d",
+        context.server_timing(),
+    )
+
+
+def test_timed_phase_without_context():
+    with timed_phase("upstream"):
+        pass
+
+
+def test_add_phase_from_threads():
+    context = RequestContext()
+    threads = [
+        threading.Thread(target=context.add_phase, args=("upstream", 1))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert context.phases["upstream"] == 10
@@ -0,0 +1,116 @@
+import asyncio
+
+from src.monitoring.RequestContext import RequestContext
+from src.monitoring.RequestContextMiddleware import RequestContextMiddleware
+
+
+def run(app, client_messages: list[dict]) -> list[dict]:
+    """
+    Runs the wrapped app with the given client messages, the client waiting between every message.
+    """
+    sent = []
+
+    async def receive():
+        if len(client_messages) > 1:
+            return client_messages.pop(0)
+        await asyncio.sleep(0.05)
+        return client_messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "headers": [(b"x-request-id", b"my-request"), (b"x-request-timeout", b"10")],
+    }
+    asyncio.run(RequestContextMiddleware(app)(scope, receive, send))
+    return sent
+
+
+def test_client_disconnect_during_request():
+    contexts = []
+
+    async def app(scope, receive, send):
+        context = RequestContext.current()
+        contexts.append(context)
+        assert (await receive())["type"] == "http.request"
+        disconnected = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        context.on_disconnect(lambda: loop.call_soon_threadsafe(disconnected.set))
+        await asyncio.wait_for(disconnected.wait(), 1)
+
+    run(
+        app,
+        [
+            {"type": "http.request", "body": b"", "more_body": False},
+            {"type": "http.disconnect"},
+        ],
+    )
+
+    assert contexts[0].request_id == "my-request"
+    assert contexts[0].deadline is not None
+    assert contexts[0].disconnected
+
+
+def test_client_disconnect_after_response():
+    contexts = []
+
+    async def app(scope, receive, send):
+        contexts.append(RequestContext.current())
+        await receive()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+        await asyncio.sleep(0.1)
+
+    sent = run(
+        app,
+        [
+            {"type": "http.request", "body": b"", "more_body": False},
+            {"type": "http.disconnect"},
+        ],
+    )
+
+    assert (b"x-request-id", b"my-request") in sent[0]["headers"]
+    assert not contexts[0].disconnected
+
+
+def test_invalid_timeout_is_rejected():
+    async def app(scope, receive, send):
+        raise AssertionError("The request should not be processed")
+
+    for timeout in [b"nan", b"-1", b"inf", b"soon"]:
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "headers": [(b"x-request-timeout", timeout)]}
+        asyncio.run(RequestContextMiddleware(app)(scope, None, send))
+
+        assert sent[0]["status"] == 400
+        assert b"X-Request-Timeout" in sent[1]["body"]
+
+
+def test_body_is_read_as_fast_as_the_app_reads_it():
+    received = []
+    chunks = [
+        {"type": "http.request", "body": b"x" * 65536, "more_body": True}
+        for _ in range(200)
+    ] + [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        received.append(chunks[len(received)])
+        return received[-1]
+
+    async def app(scope, receive, send):
+        for _ in range(5):
+            await receive()
+            await asyncio.sleep(0.01)
+        read_ahead.append(len(received))
+
+    read_ahead = []
+    scope = {"type": "http", "headers": []}
+    asyncio.run(RequestContextMiddleware(app)(scope, receive, lambda message: None))
+
+    # The message waiting in the queue, and the one waiting to be put in it
+    assert read_ahead[0] <= 7
@@ -1,7 +1,10 @@
+import json
 import pytest
 import requests_mock
 from unittest.mock import patch
 
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
 from fastapi.testclient import TestClient
 
 from src.main import app
@@ -37,6 +40,39 @@ def test_generate_diagram(plugin_name, description, expected_response, client):
         assert response.json() == expected_response
 
 
+def test_generate_diagram_timing_headers(client):
+    """
+    Tests that the request ID is sent back, and that the phases of the request are in the Server-Timing header.
+    """
+
+    with patch("src.routers.diagram.Factory.get_handler") as mock_get_handler:
+        mock_get_handler.return_value.generate.return_value = {}
+
+        body = {"pluginName": "default", "description": "description"}
+        response = client.post(
+            "/api/diagram", json=body, headers={"X-Request-ID": "my-request"}
+        )
+
+    assert response.headers["X-Request-ID"] == "my-request"
+    assert "queue;dur=" in response.headers["Server-Timing"]
+    assert "total;dur=" in response.headers["Server-Timing"]
+
+
+def test_generate_diagram_expired_deadline(client):
+    """
+    Tests that a request whose deadline has expired is dropped before calling the AI.
+    """
+
+    with patch("src.routers.diagram.Factory.get_handler") as mock_get_handler:
+        body = {"pluginName": "default", "description": "description"}
+        response = client.post(
+            "/api/diagram", json=body, headers={"X-Request-Timeout": "0"}
+        )
+
+    assert response.status_code == 504
+    mock_get_handler.return_value.generate.assert_not_called()
+
+
 def test_404(client):
     """
     A test function for handling a 404 response status code.
@@ -45,3 +81,129 @@ def test_404(client):
 
     response = client.get("/nope/oupsie")
     assert response.status_code == 404
+
+
+def test_generate_diagram_batch(client):
+    """
+    Tests that every diagram of a batch gets a result line tagged with its index,
+    and that a failing diagram does not fail the whole batch.
+    """
+
+    def generate(diagram):
+        if diagram.description == "fail":
+            raise HTTPException(status_code=530, detail="Invalid response")
+        return {"description": diagram.description}
+
+    with patch("src.routers.diagram.Factory.get_handler") as mock_get_handler:
+        mock_get_handler.return_value.generate.side_effect = generate
+
+        body = [
+            {"pluginName": "default", "description": "first"},
+            {"pluginName": "default", "description": "fail"},
+            {"pluginName": "default", "description": "third"},
+        ]
+        response = client.post("/api/diagram/batch", json=body)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    results = [json.loads(line) for line in response.text.splitlines()]
+    results = {result["index"]: result for result in results}
+    assert len(results) == 3
+    assert results[0] == {
+        "index": 0,
+        "status": 200,
+        "response": {"description": "first"},
+    }
+    assert results[1] == {"index": 1, "status": 530, "error": "Invalid response"}
+    assert results[2]["response"] == {"description": "third"}
+
+
+def test_generate_diagram_batch_with_json_response(client):
+    """
+    Tests that the body of the JSONResponse returned by the handlers is inlined in the result line.
+    """
+
+    with patch("src.routers.diagram.Factory.get_handler") as mock_get_handler:
+        mock_get_handler.return_value.generate.return_value = JSONResponse(
+            content={"random": 5}
+        )
+
+        body = [{"pluginName": "default", "description": "first"}]
+        response = client.post("/api/diagram/batch", json=body)
+
+    assert json.loads(response.text) == {
+        "index": 0,
+        "status": 200,
+        "response": {"random": 5},
+    }
+
+
+def test_generate_diagram_stream(client):
+    """
+    Tests that the events of the handler are streamed as NDJSON lines, and that errors end the stream with an error event.
+    """
+
+    def generate_stream(diagram):
+        yield {"type": "token", "text": '{"a": '}
+        yield {"type": "token", "text": "1}"}
+        if diagram.description == "fail":
+            raise HTTPException(status_code=530, detail="Invalid response")
+        yield {"type": "done", "response": {"a": 1}}
+
+    with patch("src.routers.streaming.Factory.get_handler") as mock_get_handler:
+        mock_get_handler.return_value.ai_name = "ollama"
+        mock_get_handler.return_value.generate_stream.side_effect = generate_stream
+
+        response = client.post(
+            "/api/diagram/stream",
+            json={"pluginName": "default", "description": "description"},
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert [json.loads(line) for line in response.text.splitlines()] == [
+            {"type": "token", "text": '{"a": '},
+            {"type": "token", "text": "1}"},
+            {"type": "done", "response": {"a": 1}},
+        ]
+
+        response = client.post(
+            "/api/diagram/stream",
+            json={"pluginName": "default", "description": "fail"},
+        )
+        assert json.loads(response.text.splitlines()[-1]) == {
+            "type": "error",
+            "status": 530,
+            "error": "Invalid response",
+        }
+
+
+def test_generate_diagram_stream_without_streaming_handler(client):
+    """
+    Tests that a handler without streaming support answers with a single done event.
+    """
+    from src.handlers.BaseHandler import BaseHandler
+
+    class NonStreamingHandler(BaseHandler):
+        def initialize(self):
+            pass
+
+        def generate(self, diagram):
+            return JSONResponse(content={"a": 1})
+
+        def send_message(self, message):
+            return JSONResponse(content={"message": "hello", "context": "[]"})
+
+    with patch("src.routers.streaming.Factory.get_handler") as mock_get_handler:
+        mock_get_handler.return_value = NonStreamingHandler("custom")
+
+        response = client.post(
+            "/api/diagram/stream",
+            json={"pluginName": "default", "description": "description"},
+        )
+        assert response.json() == {"type": "done", "response": {"a": 1}}
+
+        response = client.post(
+            "/api/message/stream", json={"pluginName": "default", "message": "hi"}
+        )
+        assert response.json() == {"type": "done", "message": "hello", "context": "[]"}
@@ -1,5 +1,8 @@
 from fastapi.testclient import TestClient
 
+from unittest.mock import patch
+
+from src.configuration.configurationManager import ConfigurationManager
 from src.main import app
 
 client = TestClient(app)
@@ -15,3 +18,26 @@ def test_read_health():
     response = client.get("health/")
     assert response.status_code == 200
     assert response.json()["status"] == "ok"
+
+
+def test_read_metrics():
+    client.get("/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert (
+        'leto_ai_proxy_request_duration_seconds_count{route="/",method="GET",status="200"}'
+        in response.text
+    )
+
+
+def test_ready():
+    with patch.object(ConfigurationManager, "current_version", 0):
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "not ready"
+
+    with patch.object(ConfigurationManager, "current_version", 3):
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json() == {"status": "ready", "configurationVersion": 3}
@@ -0,0 +1,113 @@
+import pytest
+from unittest.mock import patch
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from src.ingestion.SpooledContent import SpooledContent
+from src.main import app
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def test_message_with_spooled_files(client):
+    received = {}
+
+    def send_message(message):
+        file = message.files[0]
+        received["spooled"] = isinstance(file.content, SpooledContent)
+        received["content"] = file.read_content()
+        return JSONResponse(content={"message": "hello", "context": "[]"})
+
+    with patch("src.routers.message.Factory.get_handler") as mock_get_handler:
+        mock_get_handler.return_value.send_message.side_effect = send_message
+
+        response = client.post(
+            "/api/message",
+            json={
+                "pluginName": "default",
+                "message": "hi",
+                "files": [{"path": "main.tf", "content": "resource {}\n" * 1000}],
+            },
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {"message": "hello", "context": "[]"}
+        assert received == {"spooled": True, "content": "resource {}\n" * 1000}
+
+
+def test_message_with_invalid_body(client):
+    response = client.post("/api/message", content=b'{"pluginName": "default"')
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["type"] == "json_invalid"
+
+    response = client.post(
+        "/api/message", json={"files": [{"path": "a", "content": "b"}]}
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "pluginName"]
+
+
+def test_message_body_is_documented(client):
+    schema = client.get("/openapi.json").json()["paths"]["/api/message"]["post"]
+    body = schema["requestBody"]["content"]["application/json"]["schema"]
+
+    assert body["required"] == ["pluginName"]
+    assert body["properties"]["files"]["anyOf"][0]["items"]["properties"][
+        "content"
+    ] == {
+        "title": "Content",
+        "type": "string",
+    }
+
+
+def test_message_with_invalid_body_releases_the_files(client):
+    with patch("src.ingestion.JsonStreamParser.SpooledContent.close") as mock_close:
+        response = client.post(
+            "/api/message",
+            content=b'{"pluginName": "default", "files": [{"path": "a", "content": "b"}',
+        )
+
+    assert response.status_code == 422
+    mock_close.assert_called()
+
+
+def test_message_stream_releases_the_files_when_the_generation_never_starts(client):
+    with patch("src.routers.streaming.Factory.get_handler") as mock_get_handler:
+        mock_get_handler.side_effect = HTTPException(404, "Unknown handler")
+        with patch("src.ingestion.JsonStreamParser.SpooledContent.close") as mock_close:
+            response = client.post(
+                "/api/message/stream",
+                json={
+                    "pluginName": "default",
+                    "files": [{"path": "a", "content": "b"}],
+                },
+            )
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "type": "error",
+        "status": 404,
+        "error": "Unknown handler",
+    }
+    mock_close.assert_called()
+
+
+def test_message_stream_releases_the_files_when_the_response_fails(client):
+    with patch("src.routers.message.streaming_response") as mock_streaming_response:
+        mock_streaming_response.side_effect = RuntimeError("failed")
+        with patch("src.ingestion.JsonStreamParser.SpooledContent.close") as mock_close:
+            with pytest.raises(RuntimeError):
+                client.post(
+                    "/api/message/stream",
+                    json={
+                        "pluginName": "default",
+                        "files": [{"path": "a", "content": "b"}],
+                    },
+                )
+
+    mock_close.assert_called()
@@ -0,0 +1,59 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from src.concurrency.ConcurrencyLimiter import ConcurrencyLimiter
+from src.serve import build_config, drain, get_event_loop
+
+
+def test_build_config_defaults():
+    config = build_config({"EVENT_LOOP": "asyncio"})
+    assert config.application_path == "src.main:app"
+    assert config.bind == ["0.0.0.0:8585"]
+    assert config.workers == 1
+    assert config.worker_class == "asyncio"
+    assert config.keep_alive_timeout == 5.0
+    assert config.backlog == 100
+    assert config.graceful_timeout == 30.0
+
+
+def test_build_config_from_environment():
+    config = build_config(
+        {
+            "BIND": "127.0.0.1:9000",
+            "WORKERS": "4",
+            "EVENT_LOOP": "asyncio",
+            "KEEP_ALIVE_TIMEOUT": "75",
+            "BACKLOG": "2048",
+            "GRACEFUL_TIMEOUT": "120",
+        }
+    )
+    assert config.bind == ["127.0.0.1:9000"]
+    assert config.workers == 4
+    assert config.keep_alive_timeout == 75.0
+    assert config.backlog == 2048
+    assert config.graceful_timeout == 120.0
+
+
+def test_get_event_loop():
+    with patch("src.serve.importlib.util.find_spec", return_value=None):
+        assert get_event_loop("auto") == "asyncio"
+        with pytest.raises(ValueError, match="uvloop is not installed"):
+            get_event_loop("uvloop")
+    with patch("src.serve.importlib.util.find_spec", return_value=object()):
+        assert get_event_loop("auto") == "uvloop"
+    with pytest.raises(ValueError, match="Unknown event loop"):
+        get_event_loop("trio")
+
+
+def test_drain_cancels_requests_still_running_after_timeout():
+    ConcurrencyLimiter().reset()
+    with patch("src.serve.upstream_connections") as connections:
+        asyncio.run(drain(0))
+        connections.cancel.assert_not_called()
+
+        with ConcurrencyLimiter().acquire():
+            asyncio.run(drain(0.05))
+        connections.cancel.assert_called_once()
+    ConcurrencyLimiter().reset()
@@ -0,0 +1,62 @@
+import pytest
+from unittest import TestCase
+
+from src.validation.DiagramStreamValidator import (
+    DiagramStreamValidator,
+    InvalidOutputError,
+)
+
+
+class TestDiagramStreamValidator(TestCase):
+
+    def feed(self, validator: DiagramStreamValidator, parts: list[str]):
+        for part in parts:
+            validator.feed(part)
+
+    def test_valid_outputs(self):
+        self.feed(
+            DiagramStreamValidator("json"),
+            ["\n", '{"a": [1, {"b": "}]`"', "}]}", "\n"],
+        )
+        self.feed(
+            DiagramStreamValidator("fenced"),
+            ["Here is the diagram:\n`", "``json\n", '{"a": "\\"["}', "\n```\nDone!"],
+        )
+        self.feed(DiagramStreamValidator("fenced"), ['```json {"random": 5}```'])
+        self.feed(DiagramStreamValidator("text", 1), ["anything", "goes"])
+
+    def test_invalid_outputs(self):
+        """
+        Test that the output is rejected as soon as it can no longer hold a diagram.
+        """
+        cases = [
+            ("json", ["Sure! ", "{}"], "The JSON starts with 'S'"),
+            ("json", ['{"a": [1}'], "Unexpected '}'"),
+            ("json", ["{}", " and more"], "Unexpected text after the JSON"),
+            ("fenced", ["```yaml\n", "kind: Pod"], "The JSON starts with ':'"),
+            ("fenced", ['```json\n{"a": 1', "```"], "The code block ends before"),
+        ]
+        for mode, parts, message in cases:
+            with pytest.raises(InvalidOutputError, match=message):
+                self.feed(DiagramStreamValidator(mode), parts)
+
+    def test_limits(self):
+        validator = DiagramStreamValidator("fenced", max_preamble_tokens=3)
+        self.feed(validator, ["Let", " me"])
+        with pytest.raises(InvalidOutputError, match="No JSON within the first 3"):
+            validator.feed(" think")
+
+        validator = DiagramStreamValidator("json", max_output_size=10)
+        validator.feed('{"a": ')
+        with pytest.raises(InvalidOutputError, match="exceeds 10 characters"):
+            validator.feed('"long"}')
+
+        validator = DiagramStreamValidator("json", max_tokens=2)
+        self.feed(validator, ['{"a"', ": 1"])
+        with pytest.raises(InvalidOutputError, match="exceeds 2 tokens"):
+            validator.feed("}")
+
+        validator = DiagramStreamValidator("json", max_tokens=10)
+        validator.feed('{"a"', 6)
+        with pytest.raises(InvalidOutputError, match="exceeds 10 tokens"):
+            validator.feed(": 1}", 5)
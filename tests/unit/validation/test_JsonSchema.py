@@ -0,0 +1,133 @@
+import pytest
+from unittest import TestCase
+
+from src.validation.JsonSchema import JsonSchema, SchemaError, ValidationError
+
+POD_SCHEMA = {
+    "type": "object",
+    "required": ["kind", "spec"],
+    "additionalProperties": False,
+    "properties": {
+        "kind": {"enum": ["Pod"]},
+        "apiVersion": {"const": "v1"},
+        "replicas": {"type": ["integer", "null"], "minimum": 1},
+        "spec": {"$ref": "#/$defs/spec"},
+    },
+    "$defs": {
+        "spec": {
+            "type": "object",
+            "properties": {
+                "containers": {
+                    "type": "array",
+                    "minItems": 1,
+                    "items": {"$ref": "#/$defs/container"},
+                }
+            },
+        },
+        "container": {
+            "type": "object",
+            "required": ["name"],
+            "properties": {
+                "name": {"type": "string", "pattern": "^[a-z]+$"},
+                "sidecars": {"type": "array", "items": {"$ref": "#/$defs/container"}},
+            },
+        },
+    },
+}
+
+
+class TestJsonSchema(TestCase):
+
+    def setUp(self):
+        self.schema = JsonSchema(POD_SCHEMA)
+
+    def test_valid_value(self):
+        value = {
+            "kind": "Pod",
+            "replicas": None,
+            "spec": {"containers": [{"name": "web", "sidecars": [{"name": "log"}]}]},
+        }
+        self.schema.validate(value)
+        assert self.schema.is_valid(value)
+
+    def test_invalid_values(self):
+        """
+        Test that the error gives the path of the invalid value and the reason.
+        """
+        cases = [
+            ({"kind": "Pod"}, "$: missing property 'spec'"),
+            ({"kind": "Job", "spec": {}}, "$.kind: expected one of ['Pod']"),
+            ({"kind": "Pod", "spec": {}, "other": 1}, "$: unexpected property 'other'"),
+            (
+                {"kind": "Pod", "spec": {}, "replicas": 0},
+                "$.replicas: expected a number >= 1",
+            ),
+            (
+                {"kind": "Pod", "spec": {}, "replicas": True},
+                "$.replicas: expected integer or null",
+            ),
+            (
+                {"kind": "Pod", "spec": {"containers": []}},
+                "$.spec.containers: expected at least 1 items",
+            ),
+            (
+                {
+                    "kind": "Pod",
+                    "spec": {"containers": [{"name": "web", "sidecars": [{}]}]},
+                },
+                "$.spec.containers[0].sidecars[0]: missing property 'name'",
+            ),
+        ]
+        for value, message in cases:
+            with pytest.raises(ValidationError) as error:
+                self.schema.validate(value)
+            assert str(error.value) == message
+            assert not self.schema.is_valid(value)
+
+    def test_alternatives(self):
+        schema = JsonSchema(
+            {"oneOf": [{"type": "integer"}, {"type": "number", "maximum": 10}]}
+        )
+        assert schema.is_valid(20)
+        assert schema.is_valid(0.5)
+        assert not schema.is_valid(5)
+        assert not schema.is_valid("5")
+
+    def test_invalid_schemas(self):
+        for schema in [
+            "not a schema",
+            {"type": "unknown"},
+            {"$ref": "#/$defs/missing"},
+            {"$ref": "http://example.com/schema.json"},
+            {"type": "string", "pattern": "("},
+        ]:
+            with pytest.raises(SchemaError):
+                JsonSchema(schema)
+
+        with pytest.raises(SchemaError, match="not valid JSON"):
+            JsonSchema.from_json("{")
+
+    def test_openapi_schema(self):
+        """
+        Test that the schema given to Gemini has its references inlined and only keeps the supported keywords.
+        """
+        openapi_schema = self.schema.openapi_schema
+        container = openapi_schema["properties"]["spec"]["properties"]["containers"]
+
+        assert openapi_schema["type"] == "OBJECT"
+        assert "additionalProperties" not in openapi_schema
+        assert "$defs" not in openapi_schema
+        assert openapi_schema["properties"]["apiVersion"] == {"enum": ["v1"]}
+        assert openapi_schema["properties"]["replicas"] == {
+            "type": "INTEGER",
+            "nullable": True,
+            "minimum": 1,
+        }
+        assert container["items"]["properties"]["name"] == {
+            "type": "STRING",
+            "pattern": "^[a-z]+$",
+        }
+        # The recursive reference can not be inlined
+        assert container["items"]["properties"]["sidecars"]["items"] == {
+            "type": "OBJECT"
+        }